@@ -0,0 +1,187 @@
+# Fixtures shared by the tests in this directory
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from switchboard import (PyUmiPacket, UmiTxRx, UmiCmd, UmiAtomic, umi_pack, umi_opcode, umi_atype,
+    umi_size, umi_len)
+
+
+class UmiMemory:
+    def __init__(self, req_uri, resp_uri, size=1 << 16, split=None, reorder=False,
+        dstaddr_offset=0, start_delay=0):
+        """
+        UMI memory model that runs in a background thread, so that UMI
+        transactions can be tested without a simulator.  Requests are
+        received from "req_uri" and responses are sent to "resp_uri".
+
+        Parameters
+        ----------
+        size: int
+            Size of the memory in bytes, starting at address 0.
+        split: int, optional
+            If provided, each response carries at most this many elements,
+            so that responses to longer requests are split up.
+        reorder: bool
+            If True, responses to requests that arrive together are sent
+            in reverse order.
+        dstaddr_offset: int
+            Added to the dstaddr of each response, to test responses that
+            don't match their requests.
+        start_delay: float
+            Seconds to wait before responding to anything, to test calls
+            that block while waiting for responses.
+        """
+
+        self.mem = np.zeros((size,), dtype=np.uint8)
+        self.split = split
+        self.reorder = reorder
+        self.dstaddr_offset = dstaddr_offset
+        self.start_delay = start_delay
+
+        # (cmd, dstaddr, srcaddr) of each request received
+        self.requests = []
+
+        self.umi = UmiTxRx(resp_uri, req_uri)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        if self.stopped.wait(self.start_delay):
+            return
+
+        held = []
+
+        while not self.stopped.is_set():
+            req = self.umi.recv(False)
+
+            if req is not None:
+                held.append(self._respond(req))
+                if self.reorder:
+                    continue
+
+            # the pieces of a split response stay in order, even if the
+            # responses to different requests are reordered
+            for resps in (reversed(held) if self.reorder else held):
+                for resp in resps:
+                    while not self.umi.send(resp, False):
+                        if self.stopped.is_set():
+                            return
+                        time.sleep(1e-4)
+            held = []
+
+            if req is None:
+                time.sleep(1e-4)
+
+    def _respond(self, req):
+        self.requests.append((req.cmd, req.dstaddr, req.srcaddr))
+
+        opcode = umi_opcode(req.cmd)
+        size = umi_size(req.cmd)
+        num = umi_len(req.cmd) + 1
+        nbytes = num << size
+        addr = req.dstaddr
+
+        if opcode in (UmiCmd.UMI_REQ_WRITE, UmiCmd.UMI_REQ_POSTED):
+            self.mem[addr:addr + nbytes] = np.asarray(req.data).view(np.uint8)[:nbytes]
+            if opcode == UmiCmd.UMI_REQ_POSTED:
+                return []
+            resp_opcode = UmiCmd.UMI_RESP_WRITE
+        elif opcode == UmiCmd.UMI_REQ_READ:
+            resp_opcode = UmiCmd.UMI_RESP_READ
+        elif opcode == UmiCmd.UMI_REQ_ATOMIC:
+            nbytes = 1 << size
+            old = self.mem[addr:addr + nbytes].copy()
+            operand = np.asarray(req.data).view(np.uint8)[:nbytes]
+            self.mem[addr:addr + nbytes] = atomic_op(umi_atype(req.cmd), old, operand)
+            return [PyUmiPacket(umi_pack(int(UmiCmd.UMI_RESP_READ), 0, size, 0, 1, 1),
+                req.srcaddr + self.dstaddr_offset, addr, old)]
+        else:
+            raise ValueError(f'Unsupported opcode: {opcode}')
+
+        # split up the response if needed, with the dstaddr of each piece
+        # advancing by the number of bytes responded to before it
+        step = num if self.split is None else self.split
+        resps = []
+        for offset in range(0, num, step):
+            length = min(step, num - offset)
+            eom = 1 if (offset + length) == num else 0
+            cmd = umi_pack(int(resp_opcode), 0, size, length - 1, eom, 1)
+            start = addr + (offset << size)
+            data = None
+            if resp_opcode == UmiCmd.UMI_RESP_READ:
+                data = self.mem[start:start + (length << size)].copy()
+            resps.append(PyUmiPacket(cmd, req.srcaddr + (offset << size) + self.dstaddr_offset,
+                start, data))
+        return resps
+
+
+def atomic_op(atype, old, operand):
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32, 8: np.int64}[old.size]
+    a = int(old.view(dtype)[0])
+    b = int(operand.view(dtype)[0])
+    mask = (1 << (8 * old.size)) - 1
+
+    if atype == UmiAtomic.UMI_REQ_ATOMICADD:
+        value = a + b
+    elif atype == UmiAtomic.UMI_REQ_ATOMICAND:
+        value = a & b
+    elif atype == UmiAtomic.UMI_REQ_ATOMICOR:
+        value = a | b
+    elif atype == UmiAtomic.UMI_REQ_ATOMICXOR:
+        value = a ^ b
+    elif atype == UmiAtomic.UMI_REQ_ATOMICMAX:
+        value = max(a, b)
+    elif atype == UmiAtomic.UMI_REQ_ATOMICMIN:
+        value = min(a, b)
+    elif atype == UmiAtomic.UMI_REQ_ATOMICMAXU:
+        value = max(a & mask, b & mask)
+    elif atype == UmiAtomic.UMI_REQ_ATOMICMINU:
+        value = min(a & mask, b & mask)
+    elif atype == UmiAtomic.UMI_REQ_ATOMICSWAP:
+        value = b
+    else:
+        raise ValueError(f'Unsupported atomic operation: {atype}')
+
+    return np.frombuffer((value & mask).to_bytes(old.size, 'little'), dtype=np.uint8)
+
+
+@pytest.fixture
+def umi_memory(tmp_path):
+    """
+    Returns a function that starts a UmiMemory with the given keyword
+    arguments, returning a UmiTxRx connected to it and the UmiMemory.
+    Extra keyword arguments starting with "umi_" are passed on to the
+    UmiTxRx, without the prefix.
+    """
+
+    memories = []
+
+    def start(**kwargs):
+        n = len(memories)
+        req_uri = str(tmp_path / f'req{n}.q')
+        resp_uri = str(tmp_path / f'resp{n}.q')
+
+        umi_kwargs = {k[4:]: kwargs.pop(k) for k in list(kwargs) if k.startswith('umi_')}
+        umi = UmiTxRx(req_uri, resp_uri, fresh=True, **umi_kwargs)
+
+        memory = UmiMemory(req_uri, resp_uri, **kwargs)
+        memories.append(memory)
+
+        return umi, memory
+
+    yield start
+
+    for memory in memories:
+        memory.stop()
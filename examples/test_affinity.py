@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Tests of CPU affinity planning and NUMA-aware queue placement
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import switchboard.network
+import switchboard.util
+from switchboard import PySbPacket, PySbRx, PySbTx, SbNetwork
+from switchboard.autowrap import create_intf_objs
+from switchboard.util import parse_cpu_list, resolve_affinity
+
+
+def make_inst(uris, external=False, threads=None, intf_defs=None):
+    # stands in for an SbInst, with "uris" mapping interface names to URIs
+    mapping = {name: dict(uri=uri, wire=None, capacity=None, tap=None)
+        for name, uri in uris.items()}
+    block = SimpleNamespace(threads=threads, intf_defs=intf_defs or {})
+    return SimpleNamespace(mapping=mapping, external={'x'} if external else set(), block=block)
+
+
+def make_network(insts, tcp_intfs=None):
+    # stands in for an SbNetwork, so that affinity planning can be tested
+    # without building simulators
+    for name, inst in insts.items():
+        inst.name = name
+    net = SimpleNamespace(single_netlist=False, insts=insts, tcp_intfs=tcp_intfs or {})
+    net.auto_affinity = lambda driver=False: SbNetwork.auto_affinity(net, driver=driver)
+    return net
+
+
+def chain():
+    # a (external, two threads) -> b -> c, and d on its own
+    return make_network(dict(
+        d=make_inst({}),
+        c=make_inst({'in': 'b_c.q'}),
+        b=make_inst({'in': 'a_b.q', 'out': 'b_c.q'}),
+        a=make_inst({'out': 'a_b.q'}, external=True, threads=2)
+    ))
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list('0-3,8,10-11') == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpu_list(' 1 , 2 ') == [1, 2]
+    assert parse_cpu_list('7\n') == [7]
+    assert parse_cpu_list('') == []
+    assert parse_cpu_list(5) == [5]
+
+
+def test_resolve_affinity(monkeypatch):
+    monkeypatch.setattr(switchboard.util, 'numa_nodes', lambda: {0: [0, 1], 1: [2, 3]})
+
+    assert resolve_affinity(None) is None
+    assert resolve_affinity(3) == [3]
+    assert resolve_affinity('0-2,5') == [0, 1, 2, 5]
+    assert resolve_affinity([1, '2']) == [1, 2]
+    assert resolve_affinity('node:1') == [2, 3]
+
+    with pytest.raises(ValueError):
+        resolve_affinity('node:2')
+
+
+def test_auto_affinity(monkeypatch):
+    monkeypatch.setattr(switchboard.network, 'cpu_order', lambda: [0, 1, 2, 3, 4])
+
+    # processes connected by a queue get neighboring CPUs, starting from
+    # the one that talks to the driver, wrapping around when CPUs run out
+    assert chain().auto_affinity(driver=True) == {
+        None: [0], 'a': [1, 2], 'b': [3], 'c': [4], 'd': [0]}
+
+    assert chain().auto_affinity() == {'a': [0, 1], 'b': [2], 'c': [3], 'd': [4]}
+
+
+def test_plan_affinity(monkeypatch):
+    monkeypatch.setattr(switchboard.network, 'cpu_order', lambda: [0, 1, 2, 3, 4])
+    monkeypatch.setattr(switchboard.util, 'numa_nodes', lambda: {0: [0, 1], 1: [2, 3]})
+
+    net = chain()
+    net.tcp_intfs[('localhost', 5555, 'server')] = {}
+
+    plan = SbNetwork.plan_affinity(net, affinity={'a': '0-1', '*': 2, 'tcp': [3]},
+        driver_affinity='node:1')
+    assert plan == {'a': [0, 1], 'b': [2], 'c': [2], 'd': [2],
+        ('localhost', 5555, 'server'): [3], None: [2, 3]}
+
+    # processes without CPUs are left out of the plan
+    assert SbNetwork.plan_affinity(net) == {}
+    assert SbNetwork.plan_affinity(net, affinity={'b': 1}) == {'b': [1]}
+
+    assert SbNetwork.plan_affinity(chain(), affinity='auto', driver_affinity='auto')[None] == [0]
+
+    with pytest.raises(ValueError):
+        SbNetwork.plan_affinity(net, affinity=0, driver_affinity='auto')
+
+
+def test_place_queues(monkeypatch, tmp_path):
+    cpus = sorted(os.sched_getaffinity(0))
+    intf_defs = {
+        'in': dict(type='sb', direction='input', dw=32),
+        'out': dict(type='sb', direction='output', dw=32)
+    }
+    net = make_network(dict(b=make_inst({'in': str(tmp_path / 'in.q'),
+        'out': str(tmp_path / 'out.q')}, intf_defs=intf_defs)))
+
+    # queues are only placed on hosts with more than one NUMA node
+    monkeypatch.setattr(switchboard.network, 'numa_nodes', lambda: {0: cpus})
+    assert SbNetwork.place_queues(net, {'b': cpus}) == set()
+
+    # only the queues received by a simulator are placed
+    monkeypatch.setattr(switchboard.network, 'numa_nodes', lambda: {0: cpus, 1: cpus})
+    assert SbNetwork.place_queues(net, {'b': cpus}) == {str(tmp_path / 'in.q')}
+    assert os.path.exists(tmp_path / 'in.q')
+    assert not os.path.exists(tmp_path / 'out.q')
+
+
+def test_create_placed(tmp_path):
+    uris = {name: str(tmp_path / f'{name}.q') for name in ['kept', 'fresh', 'umi_tx', 'umi_rx']}
+
+    # leave a packet in each queue, to see which queues are created again
+    for uri in uris.values():
+        assert PySbTx(uri, fresh=True).send(PySbPacket(destination=1, flags=1), False)
+
+    intf_defs = {
+        'kept': dict(type='sb', direction='input', dw=32, uri=uris['kept']),
+        'fresh': dict(type='sb', direction='input', dw=32, uri=uris['fresh']),
+        'umi_tx': dict(type='umi', direction='input', txrx='umi', uri=uris['umi_tx']),
+        'umi_rx': dict(type='umi', direction='output', txrx='umi', uri=uris['umi_rx'])
+    }
+
+    objs = create_intf_objs(intf_defs, placed={uris['kept'], uris['umi_tx']})
+    assert set(objs) == {'kept', 'fresh', 'umi'}
+
+    for name, uri in uris.items():
+        packet = PySbRx(uri).recv(False)
+        assert (packet is not None) == (name in ['kept', 'umi_tx'])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
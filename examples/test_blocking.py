@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+# Tests that blocking calls let other Python threads run while they wait,
+# and that they can be interrupted with Ctrl-C
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from switchboard import PySbPacket, PySbRx, PySbTx
+
+DELAY = 0.3
+
+
+class Counter:
+    # counts as fast as it can in a background thread, to measure how much
+    # another thread holding the GIL gets in the way
+
+    def __init__(self):
+        self.count = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped:
+            self.count += 1
+
+    def rate(self, func):
+        start_count, start = self.count, time.time()
+        result = func()
+        return (self.count - start_count) / (time.time() - start), result
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+
+def check_releases_gil(func):
+    # runs func(), which blocks for about DELAY seconds, checking that the
+    # counter runs at a good fraction of the rate it reaches while this
+    # thread sleeps, which releases the GIL
+
+    counter = Counter()
+    try:
+        rate, result = counter.rate(func)
+        baseline, _ = counter.rate(lambda: time.sleep(DELAY))
+    finally:
+        counter.stop()
+
+    assert rate > (0.25 * baseline)
+    return result
+
+
+def test_sb_recv(tmp_path):
+    uri = str(tmp_path / 'sb.q')
+    tx = PySbTx(uri, fresh=True)
+    rx = PySbRx(uri)
+
+    threading.Timer(DELAY, lambda: tx.send(PySbPacket(destination=3, flags=1))).start()
+
+    assert check_releases_gil(rx.recv).destination == 3
+
+
+def test_sb_send(tmp_path):
+    uri = str(tmp_path / 'sb.q')
+    tx = PySbTx(uri, fresh=True, capacity=4)
+    rx = PySbRx(uri)
+
+    while tx.send(PySbPacket(), False):
+        pass
+
+    threading.Timer(DELAY, rx.recv).start()
+
+    assert check_releases_gil(lambda: tx.send(PySbPacket(destination=4)))
+
+
+def test_umi(umi_memory):
+    umi, memory = umi_memory(start_delay=DELAY)
+    memory.mem[:0x10] = np.arange(0x10)
+
+    data = check_releases_gil(lambda: umi.read(0x0, 0x10))
+    assert np.array_equal(data, np.arange(0x10))
+
+    umi, memory = umi_memory(start_delay=DELAY)
+    check_releases_gil(lambda: umi.write(0x0, np.arange(0x40, dtype=np.uint8)))
+    assert np.array_equal(memory.mem[:0x40], np.arange(0x40))
+
+    umi, memory = umi_memory(start_delay=DELAY)
+    memory.mem[0x100:0x110] = np.arange(0x10)
+    data = check_releases_gil(lambda: umi.read_many([0x100, 0x108], np.uint64))
+    assert np.array_equal(data, memory.mem[0x100:0x110].view(np.uint64))
+
+
+def run_threads(*funcs):
+    # runs each function in its own thread, re-raising the first error
+
+    errors = []
+
+    def wrap(func):
+        try:
+            func()
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrap, args=(func,)) for func in funcs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def test_umi_shared(umi_memory):
+    # one thread streams large writes and reads while another polls a
+    # register, both through the same UmiTxRx
+
+    umi, memory = umi_memory()
+    memory.mem[0x8000:0x8008] = np.arange(8)
+
+    def dma():
+        for i in range(20):
+            data = np.random.randint(0, 256, 0x1000, dtype=np.uint8)
+            umi.write(0x0, data)
+            assert np.array_equal(umi.read(0x0, 0x1000), data)
+
+    def csr():
+        for _ in range(200):
+            assert np.array_equal(umi.read(0x8000, 8), np.arange(8))
+
+    run_threads(dma, csr)
+
+
+def test_sb_shared(tmp_path):
+    # two threads send through the same PySbTx, while two more receive
+    # through the same PySbRx
+
+    uri = str(tmp_path / 'sb.q')
+    tx = PySbTx(uri, fresh=True, capacity=64)
+    rx = PySbRx(uri)
+
+    n = 50000
+    received = [[], []]
+
+    # a queue that has been corrupted by concurrent access can look full or
+    # empty forever, so the threads give up after a while
+    deadline = time.time() + 30
+
+    def send(destination):
+        packets = np.zeros(n, dtype=tx.dtype)
+        packets['destination'] = destination
+        packets['data'][:, :8] = np.arange(n, dtype=np.uint64).view(np.uint8).reshape(n, 8)
+        count = 0
+        while (count < n) and (time.time() < deadline):
+            count += tx.send_many(packets[count:count + 100], blocking=False)
+
+    def recv(k):
+        # the receivers stop once they have 2*n packets between them
+        while (sum(len(p) for r in received for p in r) < (2 * n)) and (time.time() < deadline):
+            packets = rx.recv_many(100, blocking=False)
+            if len(packets) > 0:
+                received[k].append(packets)
+            else:
+                time.sleep(1e-4)
+
+    run_threads(lambda: send(0), lambda: send(1), lambda: recv(0), lambda: recv(1))
+
+    # each packet arrives once and intact, in order for each sender
+    for k in range(2):
+        packets = np.concatenate(received[k] or [rx.recv_many(0)])
+        for d in range(2):
+            seq = packets['data'][packets['destination'] == d][:, :8].copy().view(np.uint64)
+            assert np.all(np.diff(seq[:, 0].astype(np.int64)) > 0)
+
+    packets = np.concatenate(received[0] + received[1])
+    assert sorted(packets['destination'].tolist()) == ([0] * n) + ([1] * n)
+
+
+def interrupt_after(delay):
+    threading.Timer(delay, lambda: os.kill(os.getpid(), signal.SIGINT)).start()
+
+
+def test_interrupt_sb_recv(tmp_path):
+    rx = PySbRx(str(tmp_path / 'sb.q'), fresh=True)
+
+    interrupt_after(DELAY)
+
+    start = time.time()
+    with pytest.raises(KeyboardInterrupt):
+        rx.recv()
+    assert (time.time() - start) < (DELAY + 2)
+
+
+def test_interrupt_umi_read(umi_memory):
+    # nothing responds before the interrupt
+    umi, memory = umi_memory(start_delay=60)
+
+    interrupt_after(DELAY)
+
+    start = time.time()
+    with pytest.raises(KeyboardInterrupt):
+        umi.read(0x0, 4)
+    assert (time.time() - start) < (DELAY + 2)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
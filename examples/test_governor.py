@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+# Tests of configure_governor() and governor_info() (the members joining
+# and waiting on a governor are tested in tests/torture.c)
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import pytest
+
+from switchboard import configure_governor, governor_info
+
+
+def test_governor_info(tmp_path):
+    uri = str(tmp_path / 'governor')
+
+    assert governor_info(uri) is None
+
+    configure_governor(uri, max_rate=1.5e6, max_lag=100)
+    assert governor_info(uri) == {'max_rate': 1500000, 'max_lag': 100, 'members': {}}
+
+    # the budget of an existing governor can be changed, and values that
+    # aren't positive mean no limit
+    configure_governor(uri, max_rate=2.4e3)
+    assert governor_info(uri) == {'max_rate': 2400, 'max_lag': 0, 'members': {}}
+
+    configure_governor(uri, max_rate=0, max_lag=-5)
+    info = governor_info(uri)
+    assert (info['max_rate'], info['max_lag']) == (0, 0)
+
+
+def test_not_a_governor(tmp_path):
+    (tmp_path / 'other').write_bytes(bytes(1 << 16))
+    assert governor_info(str(tmp_path / 'other')) is None
+
+    with pytest.raises(RuntimeError, match='Could not configure'):
+        configure_governor(str(tmp_path / 'missing' / 'governor'), max_rate=1)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
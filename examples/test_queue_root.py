@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Tests of where queues with relative URIs are created (SB_QUEUE_ROOT)
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from switchboard import PySbPacket, PySbRx, PySbTx, delete_queue, queue_info, queue_path
+from switchboard.util import QUEUE_ROOT_ENV, default_queue_root, queue_root, set_queue_root
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # runs the test in an empty working directory, restoring SB_QUEUE_ROOT
+    # afterwards
+    monkeypatch.setenv(QUEUE_ROOT_ENV, '')
+    (tmp_path / 'cwd').mkdir()
+    monkeypatch.chdir(tmp_path / 'cwd')
+    return tmp_path
+
+
+def run_python(code):
+    # runs Python code in a child process that can import the same modules
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+        check=True, timeout=60).stdout
+
+
+def test_queue_path(workdir, monkeypatch):
+    root = str(workdir / 'root')
+
+    monkeypatch.setenv(QUEUE_ROOT_ENV, root)
+    assert queue_root() == root
+    assert queue_path('a.q') == os.path.join(root, 'a.q')
+    assert queue_path('/abs/b.q') == '/abs/b.q'
+
+    # an empty value, like no value, means the working directory
+    monkeypatch.setenv(QUEUE_ROOT_ENV, '')
+    assert queue_root() is None
+    assert queue_path('a.q') == 'a.q'
+
+    monkeypatch.delenv(QUEUE_ROOT_ENV)
+    assert queue_root() is None
+    assert queue_path('a.q') == 'a.q'
+
+
+def test_queues_under_root(workdir):
+    root = set_queue_root(workdir / 'root', namespace=False)
+    assert root == str(workdir / 'root')
+    assert os.environ[QUEUE_ROOT_ENV] == root
+
+    tx = PySbTx('a.q', fresh=True)
+    assert tx.send(PySbPacket(destination=9))
+    assert os.path.exists(os.path.join(root, 'a.q'))
+    assert not os.path.exists('a.q')
+    assert queue_info('a.q')['capacity'] > 0
+
+    # absolute URIs aren't moved under the root
+    PySbTx(str(workdir / 'abs.q'), fresh=True)
+    assert os.path.exists(workdir / 'abs.q')
+    assert not os.path.exists(os.path.join(root, str(workdir / 'abs.q').lstrip('/')))
+
+    # processes started afterwards find the same queues
+    assert run_python('from switchboard import PySbRx;'
+        ' print(PySbRx("a.q").recv().destination)').strip() == '9'
+
+    del tx
+    delete_queue('a.q')
+    assert not os.path.exists(os.path.join(root, 'a.q'))
+
+
+def test_empty_root(workdir):
+    # queues go in the working directory, and an empty value is not
+    # replaced with a default
+    assert default_queue_root() is None
+
+    PySbTx('c.q', fresh=True).send(PySbPacket(destination=1))
+    assert os.path.exists(workdir / 'cwd' / 'c.q')
+    assert PySbRx('c.q').recv().destination == 1
+
+
+def test_existing_root(workdir, monkeypatch):
+    root = str(workdir / 'parent')
+    monkeypatch.setenv(QUEUE_ROOT_ENV, root)
+
+    # a root chosen by a parent process is kept
+    assert default_queue_root() == root
+
+
+def test_namespace(workdir):
+    root = set_queue_root(workdir, namespace=True)
+    assert os.path.dirname(root) == str(workdir)
+    assert os.path.basename(root).startswith(f'switchboard-{os.getpid()}-')
+    assert os.path.isdir(root)
+
+    # each call gets its own directory
+    assert set_queue_root(workdir, namespace=True) != root
+
+
+def test_namespace_cleanup(workdir):
+    # the namespace, and the queues in it, are removed when the process exits
+    root = run_python(
+        'from switchboard import PySbTx, set_queue_root\n'
+        f'root = set_queue_root({str(workdir)!r})\n'
+        'PySbTx("a.q", fresh=True)\n'
+        'print(root)\n'
+    ).strip()
+
+    assert root.startswith(str(workdir))
+    assert not os.path.exists(root)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
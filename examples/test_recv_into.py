@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Tests of PySbRx.recv_into(), PyUmi.recv_into(), and read_into(), which
+# reuse existing objects rather than allocating new ones
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import numpy as np
+import pytest
+
+from switchboard import PySbPacket, PySbRx, PySbTx, PyUmiPacket, UmiCmd, UmiTxRx, umi_pack
+
+
+def test_sb_recv_into(tmp_path):
+    uri = str(tmp_path / 'sb.q')
+    tx = PySbTx(uri, fresh=True)
+    rx = PySbRx(uri)
+
+    p = PySbPacket()
+    assert not rx.recv_into(p, False)
+
+    for i in range(3):
+        tx.send(PySbPacket(destination=i, flags=1, data=np.full(52, i, dtype=np.uint8)))
+
+    assert rx.recv_into(p, False)
+    assert (p.destination, p.flags) == (0, 1)
+    data = p.data
+
+    # the data array is reused once it has the right size
+    assert rx.recv_into(p)
+    assert p.destination == 1
+    assert np.shares_memory(p.data, data)
+    assert np.array_equal(data, np.full(52, 1))
+
+    assert rx.recv_into(p)
+    assert p.destination == 2
+
+    # arrays that can't be reused are replaced, leaving the original alone
+    for array in [np.zeros(10, dtype=np.uint8), np.zeros(104, dtype=np.uint8)[::2]]:
+        q = PySbPacket(data=array)
+        tx.send(PySbPacket(destination=5, data=np.full(52, 5, dtype=np.uint8)))
+        assert rx.recv_into(q)
+        assert np.array_equal(q.data, np.full(52, 5))
+        assert not array.any()
+
+
+def umi_pair(tmp_path):
+    uri = str(tmp_path / 'umi.q')
+    return UmiTxRx(uri, fresh=True), UmiTxRx(rx_uri=uri)
+
+
+def posted(dstaddr, data):
+    cmd = umi_pack(int(UmiCmd.UMI_REQ_POSTED), 0, 0, data.size - 1, 1, 1)
+    return PyUmiPacket(cmd, dstaddr, 0, data)
+
+
+def test_umi_recv_into(tmp_path):
+    tx, rx = umi_pair(tmp_path)
+
+    p = PyUmiPacket()
+    assert not rx.recv_into(p, False)
+
+    tx.send(posted(0x10, np.arange(16, dtype=np.uint8)))
+    tx.send(posted(0x20, np.arange(16, 24, dtype=np.uint8)))
+
+    # a packet without a data array is given one that fits any packet
+    assert rx.recv_into(p)
+    assert p.dstaddr == 0x10
+    assert np.array_equal(p.data[:16], np.arange(16))
+    data = p.data
+
+    assert rx.recv_into(p)
+    assert p.dstaddr == 0x20
+    assert np.shares_memory(p.data, data)
+    assert np.array_equal(data[:8], np.arange(16, 24))
+
+    # a data array of another type receives the same bytes
+    q = PyUmiPacket(data=np.zeros(8, dtype=np.uint32))
+    tx.send(posted(0x30, np.arange(16, dtype=np.uint8)))
+    assert rx.recv_into(q)
+    assert np.array_equal(q.data[:4].view(np.uint8), np.arange(16))
+
+
+def test_umi_recv_into_errors(tmp_path):
+    tx, rx = umi_pair(tmp_path)
+
+    # too small for the packet received
+    tx.send(posted(0x10, np.arange(16, dtype=np.uint8)))
+    with pytest.raises(RuntimeError, match='data size'):
+        rx.recv_into(PyUmiPacket(data=np.zeros(4, dtype=np.uint8)))
+
+    # not contiguous, or not writeable
+    readonly = np.zeros(32, dtype=np.uint8)
+    readonly.flags.writeable = False
+    for array in [np.zeros(64, dtype=np.uint8)[::2], readonly]:
+        with pytest.raises(RuntimeError, match='writeable and contiguous'):
+            rx.recv_into(PyUmiPacket(data=array), False)
+        assert not array.any()
+
+
+def test_read_into(umi_memory):
+    umi, memory = umi_memory(split=2)
+    memory.mem[:0x100] = np.arange(0x100)
+
+    out = np.zeros(16, dtype=np.uint32)
+    umi.read_into(0x40, out)
+    assert np.array_equal(out.view(np.uint8), np.arange(0x40, 0x80))
+
+    # the same array can be read into again
+    umi.read_into(0x80, out, max_bytes=8)
+    assert np.array_equal(out.view(np.uint8), np.arange(0x80, 0xc0))
+
+    # reading into part of an array, if that part is contiguous
+    big = np.zeros(8, dtype=np.uint16)
+    umi.read_into(0x10, big[2:4])
+    assert np.array_equal(big, [0, 0, 0x1110, 0x1312, 0, 0, 0, 0])
+
+    umi.read_into(0x0, np.zeros(0, dtype=np.uint8))
+    assert len(memory.requests) == 2 + 8 + 1
+
+
+def test_read_into_errors(umi_memory):
+    umi, memory = umi_memory()
+
+    with pytest.raises(RuntimeError, match='writeable and contiguous'):
+        umi.read_into(0x0, np.zeros(8, dtype=np.uint32)[::2])
+
+    readonly = np.zeros(4, dtype=np.uint8)
+    readonly.flags.writeable = False
+    with pytest.raises(RuntimeError, match='writeable and contiguous'):
+        umi.read_into(0x0, readonly)
+
+    with pytest.raises(RuntimeError, match='bytes_per_elem'):
+        umi.read_into(0x0, np.zeros(2, dtype=np.complex128))
+
+    with pytest.raises(ValueError, match='misaligned'):
+        umi.read_into(0x2, np.zeros(2, dtype=np.uint32))
+
+    assert memory.requests == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
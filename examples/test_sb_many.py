@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Tests of PySbTx.send_many(), PySbRx.recv_many(), and sb_packet_dtype()
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import threading
+
+import numpy as np
+import pytest
+
+from switchboard import PySbPacket, PySbRx, PySbTx, sb_packet_dtype, sb_packet_size
+
+
+def random_packets(n, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    packets = np.zeros((n,), dtype=dtype)
+    packets['destination'] = rng.integers(0, 1 << 32, n, dtype=np.uint32)
+    packets['flags'] = rng.integers(0, 2, n, dtype=np.uint32)
+    packets['data'] = rng.integers(0, 256, packets['data'].shape, dtype=np.uint8)
+    return packets
+
+
+def test_dtype(tmp_path):
+    dtype = sb_packet_dtype()
+    assert dtype.names == ('destination', 'flags', 'data')
+    assert dtype['data'].shape == (52,)
+    assert dtype.itemsize == 60
+
+    assert sb_packet_dtype(1000)['data'].shape == (1000,)
+
+    assert PySbTx(str(tmp_path / 'a.q'), fresh=True).dtype == dtype
+    assert PySbRx(str(tmp_path / 'a.q')).dtype == dtype
+
+
+@pytest.mark.parametrize('data_size', [52, 1024])
+def test_loopback(tmp_path, data_size):
+    uri = str(tmp_path / 'loop.q')
+    packet_size = sb_packet_size(data_size)
+    tx = PySbTx(uri, fresh=True, packet_size=packet_size, capacity=1024)
+    rx = PySbRx(uri, packet_size=packet_size)
+    assert tx.dtype == rx.dtype
+    assert tx.dtype['data'].shape[0] >= data_size
+
+    packets = random_packets(500, tx.dtype)
+    assert tx.send_many(packets) == 500
+
+    received = rx.recv_many(1000)
+    assert received.dtype == rx.dtype
+    assert np.array_equal(received, packets)
+
+    # nothing left to receive
+    assert rx.recv_many(10, False).size == 0
+    assert rx.recv_many(0).size == 0
+
+
+def test_mixed_with_single_packets(tmp_path):
+    uri = str(tmp_path / 'mixed.q')
+    tx = PySbTx(uri, fresh=True)
+    rx = PySbRx(uri)
+
+    assert tx.send(PySbPacket(destination=7, flags=1, data=np.arange(52, dtype=np.uint8)))
+    assert tx.send_many(random_packets(3, tx.dtype)) == 3
+
+    received = rx.recv_many(10)
+    assert received.size == 4
+    assert received[0]['destination'] == 7
+    assert np.array_equal(received[0]['data'], np.arange(52))
+
+    tx.send_many(random_packets(1, tx.dtype, seed=1))
+    p = rx.recv()
+    assert p.destination == random_packets(1, tx.dtype, seed=1)[0]['destination']
+
+
+def test_full_queue(tmp_path):
+    uri = str(tmp_path / 'full.q')
+    tx = PySbTx(uri, fresh=True, capacity=16)
+    rx = PySbRx(uri)
+
+    packets = random_packets(100, tx.dtype)
+
+    # without blocking, only the packets that fit are sent
+    sent = tx.send_many(packets, False)
+    assert 0 < sent < 100
+
+    received = rx.recv_many(100)
+    assert np.array_equal(received, packets[:sent])
+
+    # with blocking, the rest are sent as a receiver in another thread
+    # makes room for them
+    chunks = []
+
+    def receiver():
+        n = sent
+        while n < 100:
+            chunk = rx.recv_many(100 - n)
+            chunks.append(chunk)
+            n += chunk.size
+
+    thread = threading.Thread(target=receiver)
+    thread.start()
+    assert tx.send_many(packets[sent:]) == 100 - sent
+    thread.join()
+
+    assert np.array_equal(np.concatenate(chunks), packets[sent:])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Tests of taps, which copy the traffic sent over a queue to another queue
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import threading
+
+import numpy as np
+
+from switchboard import PySbPacket, PySbRx, PySbTx, sb_packet_dtype
+
+
+def test_tap(tmp_path):
+    tx = PySbTx(str(tmp_path / 'link.q'), fresh=True, capacity=64)
+    rx = PySbRx(str(tmp_path / 'link.q'))
+
+    tx.add_tap(str(tmp_path / 'tap.q'), capacity=64)
+    tap = PySbRx(str(tmp_path / 'tap.q'))
+
+    for i in range(10):
+        assert tx.send(PySbPacket(destination=i, flags=1, data=np.arange(32, dtype=np.uint8)),
+            False)
+
+    # the tap gets a copy of each packet, without taking it from the link
+    for i in range(10):
+        p = rx.recv(False)
+        q = tap.recv(False)
+        assert p.destination == q.destination == i
+        assert np.array_equal(p.data, q.data)
+
+    assert tap.recv(False) is None
+
+
+def test_tap_falls_behind(tmp_path):
+    tx = PySbTx(str(tmp_path / 'link.q'), fresh=True, capacity=256)
+    rx = PySbRx(str(tmp_path / 'link.q'))
+
+    # nothing reads from the tap, so it fills up after a few packets
+    tx.add_tap(str(tmp_path / 'tap.q'), capacity=4)
+    tap = PySbRx(str(tmp_path / 'tap.q'))
+
+    for i in range(100):
+        assert tx.send(PySbPacket(destination=i, flags=1), False)
+
+    packets = np.zeros((100,), dtype=sb_packet_dtype())
+    packets['destination'] = np.arange(100, 200)
+    packets['flags'] = 1
+    assert tx.send_many(packets, False) == 100
+
+    # every packet still goes over the link...
+    received = [rx.recv(False).destination for _ in range(200)]
+    assert received == list(range(200))
+    assert rx.recv(False) is None
+
+    # ...while the tap keeps the first packets and drops the rest
+    tapped = []
+    while (p := tap.recv(False)) is not None:
+        tapped.append(p.destination)
+    assert 0 < len(tapped) <= 4
+    assert tapped == list(range(len(tapped)))
+
+    # once the monitor catches up, it sees new traffic again
+    assert tx.send(PySbPacket(destination=200, flags=1), False)
+    assert tap.recv(False).destination == 200
+
+
+def test_tap_multiple_producers(tmp_path):
+    # several producers share a link, and each of them copies its packets
+    # to the same tap
+
+    n = 10000
+    producers = 4
+
+    rx = PySbRx(str(tmp_path / 'link.q'), fresh=True, capacity=1024)
+    tap = PySbRx(str(tmp_path / 'tap.q'), fresh=True, capacity=(producers * n) + 1)
+
+    txs = []
+    for _ in range(producers):
+        tx = PySbTx(str(tmp_path / 'link.q'), mpsc=True)
+        tx.add_tap(str(tmp_path / 'tap.q'))
+        txs.append(tx)
+
+    # the producers start together and send in small bursts, so that their
+    # packets are interleaved
+    barrier = threading.Barrier(producers)
+
+    def send(k):
+        packets = np.zeros((n,), dtype=sb_packet_dtype())
+        packets['destination'] = k
+        packets['data'][:, :4] = np.arange(n, dtype=np.uint32).view(np.uint8).reshape(n, 4)
+        barrier.wait()
+        for i in range(0, n, 16):
+            assert txs[k].send_many(packets[i:i + 16]) == len(packets[i:i + 16])
+
+    def recv():
+        count = 0
+        while count < (producers * n):
+            count += len(rx.recv_many(256))
+
+    threads = [threading.Thread(target=send, args=(k,)) for k in range(producers)]
+    threads.append(threading.Thread(target=recv))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the tap has room for everything, so it gets every packet once, intact,
+    # and in order for each producer
+    tapped = tap.recv_many(producers * n, False)
+    assert len(tapped) == producers * n
+    assert tap.recv(False) is None
+
+    for k in range(producers):
+        seq = tapped['data'][tapped['destination'] == k][:, :4].copy().view(np.uint32)[:, 0]
+        assert np.array_equal(seq, np.arange(n, dtype=np.uint32))
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# Tests of concurrent coroutines on a single interface
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from switchboard import AxiLiteTxRx, PySbPacket, PySbRx, PySbTx, UmiAtomic
+
+
+def test_concurrent_reads(umi_memory):
+    umi, memory = umi_memory(reorder=True)
+    memory.mem[0x500:0x528].view(np.uint32)[:] = np.arange(10)
+
+    async def main():
+        return await asyncio.gather(*[umi.read_async(0x500 + 4 * i, np.uint32)
+            for i in range(10)])
+
+    assert asyncio.run(main()) == list(range(10))
+
+
+def test_concurrent_mixed(umi_memory):
+    umi, memory = umi_memory(split=2)
+
+    async def reader(addr, n):
+        return await umi.read_async(addr, n, np.uint16)
+
+    async def writer(addr, data):
+        await umi.write_async(addr, data)
+        return await umi.read_async(addr, data.size, data.dtype)
+
+    async def main():
+        memory.mem[0x100:0x140] = np.arange(0x40)
+        return await asyncio.gather(
+            reader(0x100, 32),
+            writer(0x200, np.arange(20, dtype=np.uint32)),
+            umi.atomic_async(0x300, np.uint64(5), UmiAtomic.UMI_REQ_ATOMICADD),
+            writer(0x400, np.arange(3, dtype=np.uint8)),
+            reader(0x100, 1)
+        )
+
+    read, written, atomic, written_bytes, first = asyncio.run(main())
+
+    assert np.array_equal(read, np.arange(0x40, dtype=np.uint8).view(np.uint16))
+    assert np.array_equal(written, np.arange(20, dtype=np.uint32))
+    assert atomic == 0
+    assert memory.mem[0x300:0x308].view(np.uint64)[0] == 5
+    assert np.array_equal(written_bytes, np.arange(3, dtype=np.uint8))
+    assert first[0] == 0x0100
+
+
+def test_read_async_with_pending_future(umi_memory):
+    umi, memory = umi_memory(reorder=True)
+    memory.mem[:0x100] = np.arange(0x100)
+
+    future = umi.umi.start_read(0x80, 16)
+
+    async def main():
+        return await umi.read_async(0x10, 4, np.uint8)
+
+    assert np.array_equal(asyncio.run(main()), np.arange(0x10, 0x14, dtype=np.uint8))
+    assert np.array_equal(future.result(), np.arange(0x80, 0x90, dtype=np.uint8))
+
+
+class AxiLiteReadResponder:
+    def __init__(self, uri, latency=1e-3):
+        # answers AXI-Lite reads with the address read from, after a delay
+        # that gives other coroutines a chance to send their requests
+
+        self.ar = PySbRx(f'{uri}-ar.q')
+        self.r = PySbTx(f'{uri}-r.q')
+        self.latency = latency
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            p = self.ar.recv(False)
+            if p is None:
+                time.sleep(1e-4)
+                continue
+            time.sleep(self.latency)
+            addr = int.from_bytes(p.data[:2].tobytes(), 'little')
+            data = np.zeros((5,), dtype=np.uint8)
+            data[:4] = np.frombuffer(addr.to_bytes(4, 'little'), dtype=np.uint8)
+            while not self.r.send(PySbPacket(data=data, flags=1, destination=0), False):
+                time.sleep(1e-4)
+
+
+def test_axil_concurrent_reads(tmp_path):
+    uri = str(tmp_path / 'axil')
+    axil = AxiLiteTxRx(uri, data_width=32, addr_width=16)
+    responder = AxiLiteReadResponder(uri)
+
+    async def main():
+        return await asyncio.gather(*[axil.read_async(4 * i, np.uint32) for i in range(8)])
+
+    try:
+        assert asyncio.run(main()) == [4 * i for i in range(8)]
+    finally:
+        responder.stop()
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
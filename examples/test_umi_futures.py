@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Tests of transactions started with start_read(), start_write(), and start_atomic()
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import numpy as np
+import pytest
+
+from switchboard import PyUmiPacket
+
+
+def test_out_of_order(umi_memory):
+    umi, memory = umi_memory(reorder=True, split=1, umi_max_outstanding=4)
+    memory.mem[:0x400] = np.arange(0x400) % 251
+
+    futures = [umi.start_read(0x10 * i, 16) for i in range(32)]
+    write = umi.start_write(0x800, np.arange(100, dtype=np.uint16))
+
+    for i, future in enumerate(futures):
+        assert np.array_equal(future.result(), memory.mem[0x10 * i:0x10 * (i + 1)])
+
+    write.result()
+    assert np.array_equal(memory.mem[0x800:0x8c8].view(np.uint16), np.arange(100))
+
+
+def test_mismatched_error(umi_memory):
+    umi, memory = umi_memory(dstaddr_offset=0x10000)
+
+    futures = [umi.start_read(0x100, 4, error=True) for _ in range(3)]
+
+    # each response is taken to be for the oldest outstanding request, so
+    # every transaction completes, with the mismatch raised from result()
+    for future in futures:
+        with pytest.raises(RuntimeError, match='dstaddr'):
+            future.result()
+
+
+def test_mismatched_warning(umi_memory, capfd):
+    umi, memory = umi_memory(dstaddr_offset=0x10000)
+    memory.mem[0x100:0x104] = [1, 2, 3, 4]
+
+    futures = [umi.start_read(0x100, 4, error=False) for _ in range(3)]
+    for future in futures:
+        assert np.array_equal(future.result(), [1, 2, 3, 4])
+
+    assert 'dstaddr' in capfd.readouterr().err
+
+
+def test_raw_recv_waits(umi_memory):
+    umi, memory = umi_memory()
+    memory.mem[0x20:0x24] = [5, 6, 7, 8]
+
+    future = umi.start_read(0x20, 4)
+
+    # a raw receive doesn't take the response to the started read
+    assert umi.recv(False) is None
+    assert future.done()
+    assert np.array_equal(future.result(), [5, 6, 7, 8])
+
+    assert not umi.umi.recv_into(PyUmiPacket(), False)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Tests of PyUmiGenerator
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import time
+
+import numpy as np
+
+from switchboard import (PyUmiGenerator, UmiCmd, UmiTxRx, umi_atype, umi_len, umi_opcode,
+    umi_size, umi_packet_dtype)
+
+
+def test_defaults():
+    packets = PyUmiGenerator(seed=1).fill(10000)
+    assert packets.dtype == umi_packet_dtype()
+
+    opcodes = [umi_opcode(int(cmd)) for cmd in packets['cmd']]
+    assert set(opcodes) == {int(UmiCmd.UMI_REQ_WRITE), int(UmiCmd.UMI_REQ_POSTED),
+        int(UmiCmd.UMI_REQ_READ), int(UmiCmd.UMI_RESP_WRITE), int(UmiCmd.UMI_RESP_READ),
+        int(UmiCmd.UMI_REQ_ATOMIC)}
+
+    # as with random_umi_packet(), atomics are always ATOMICADD by default
+    atomics = [int(cmd) for cmd, opcode in zip(packets['cmd'], opcodes)
+        if opcode == UmiCmd.UMI_REQ_ATOMIC]
+    assert all(umi_atype(cmd) == 0 for cmd in atomics)
+
+
+def test_atypes():
+    gen = PyUmiGenerator(seed=2, opcodes={UmiCmd.UMI_REQ_ATOMIC: 1}, atypes=[0, 1, 0, 1],
+        dstaddr_min=0x1000, dstaddr_max=0x10ff, align=8)
+    packets = gen.fill(1000)
+
+    atypes = {umi_atype(int(cmd)) for cmd in packets['cmd']}
+    assert atypes == {1, 3}
+
+    # the ATYPE isn't mistaken for LEN when fitting atomics in the range, so
+    # that atomics can be placed all the way up to the end of the range
+    ends = [int(addr) + (1 << umi_size(int(cmd))) - 1
+        for cmd, addr in zip(packets['cmd'], packets['dstaddr'])]
+    assert max(ends) <= 0x10ff
+    assert max(packets['dstaddr']) == 0x10f8
+
+
+def test_seed():
+    a = PyUmiGenerator(seed=3, max_bytes=8).fill(100)
+    b = PyUmiGenerator(seed=3, max_bytes=8).fill(100)
+    assert np.array_equal(a, b)
+
+    assert all(((umi_len(int(cmd)) + 1) << umi_size(int(cmd))) <= 8 for cmd in a['cmd']
+        if umi_opcode(int(cmd)) != UmiCmd.UMI_REQ_ATOMIC)
+
+
+def test_send_rate(tmp_path):
+    umi = UmiTxRx(str(tmp_path / 'tx.q'), fresh=True, capacity=1024)
+    gen = PyUmiGenerator(seed=4)
+
+    start = time.time()
+    cpu_start = time.process_time()
+    assert gen.send(umi.umi, 200, rate=2000) == 200
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+
+    # the rate is kept by sleeping rather than spinning
+    assert elapsed > 0.09
+    assert cpu < (0.5 * elapsed)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Tests of load_image() and dump_image()
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import struct
+
+import numpy as np
+import pytest
+
+PT_LOAD = 1
+PT_NOTE = 4
+
+
+def make_elf(path, segments, is64=True):
+    # writes a minimal little-endian ELF executable with the given
+    # (p_type, paddr, data, memsz) program headers and no sections
+
+    if is64:
+        ehdr_fmt, phdr_fmt = '<HHIQQQIHHHHHH', '<IIQQQQQQ'
+    else:
+        ehdr_fmt, phdr_fmt = '<HHIIIIIHHHHHH', '<IIIIIIII'
+
+    ehsize = 16 + struct.calcsize(ehdr_fmt)
+    phentsize = struct.calcsize(phdr_fmt)
+
+    ident = b'\x7fELF' + bytes([2 if is64 else 1, 1, 1]) + bytes(9)
+    header = ident + struct.pack(ehdr_fmt, 2, 0xf3, 1, 0, ehsize, 0, 0, ehsize, phentsize,
+        len(segments), 0, 0, 0)
+
+    offset = ehsize + len(segments) * phentsize
+    phdrs = b''
+    contents = b''
+
+    for p_type, paddr, data, memsz in segments:
+        if is64:
+            phdrs += struct.pack(phdr_fmt, p_type, 5, offset, paddr, paddr, len(data), memsz, 8)
+        else:
+            phdrs += struct.pack(phdr_fmt, p_type, offset, paddr, paddr, len(data), memsz, 5, 8)
+        contents += data
+        offset += len(data)
+
+    with open(path, 'wb') as f:
+        f.write(header + phdrs + contents)
+
+
+def test_raw_round_trip(umi_memory, tmp_path, capsys):
+    umi, memory = umi_memory()
+
+    data = np.random.default_rng(1).integers(0, 256, 5000, dtype=np.uint8)
+    data.tofile(tmp_path / 'image.bin')
+
+    assert umi.load_image(tmp_path / 'image.bin', base=0x1000, max_bytes=16, verbose=True) == 5000
+    assert 'Loaded 5000 bytes' in capsys.readouterr().out
+
+    # the posted writes are known to be done once the reads that follow them are
+    assert umi.dump_image(0x1000, 5000, tmp_path / 'dump.bin', verbose=True) == 5000
+    assert np.array_equal(np.fromfile(tmp_path / 'dump.bin', dtype=np.uint8), data)
+    assert np.array_equal(memory.mem[0x1000:0x1000 + 5000], data)
+    assert 'Dumped 5000 bytes' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('is64', [True, False])
+def test_elf(umi_memory, tmp_path, is64):
+    umi, memory = umi_memory()
+
+    # memory that the .bss should clear
+    memory.mem[:] = 0xaa
+
+    text = bytes(range(64))
+    data = bytes(range(100, 116))
+
+    make_elf(tmp_path / 'prog.elf', [
+        (PT_LOAD, 0x100, text, len(text)),
+        (PT_NOTE, 0x400, b'note', 4),
+        (PT_LOAD, 0x800, data, 0x100)
+    ], is64=is64)
+
+    assert umi.load_image(tmp_path / 'prog.elf', base=0x2000, posted=False) == 64 + 0x100
+
+    assert memory.mem[0x2100:0x2140].tobytes() == text
+    assert memory.mem[0x2800:0x2810].tobytes() == data
+    assert not memory.mem[0x2810:0x2900].any()
+
+    # only the loadable segments are written
+    assert memory.mem[0x2400:0x2404].tobytes() == b'\xaa' * 4
+    assert memory.mem[0x2900] == 0xaa
+
+    # the ELF headers aren't mistaken for a raw image
+    umi.dump_image(0x2100, 64, tmp_path / 'text.bin')
+    assert (tmp_path / 'text.bin').read_bytes() == text
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Tests of read_many(), write_many(), gather(), and scatter()
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import numpy as np
+import pytest
+
+
+def test_read_many(umi_memory):
+    umi, memory = umi_memory(reorder=True, split=1)
+    memory.mem[:0x200] = np.arange(0x200) % 256
+
+    addrs = [0x100, 0x10, 0x40]
+
+    # one element of a datatype from each address
+    assert np.array_equal(umi.read_many(addrs, np.uint32),
+        [memory.mem[addr:addr + 4].view(np.uint32)[0] for addr in addrs])
+
+    # the same number of elements from each address, one row per address
+    result = umi.read_many(addrs, 4, np.uint16)
+    assert result.shape == (3, 4)
+    for row, addr in zip(result, addrs):
+        assert np.array_equal(row, memory.mem[addr:addr + 8].view(np.uint16))
+
+    # a different number of elements from each address, including none
+    result = umi.read_many(addrs, [3, 0, 40], max_bytes=16)
+    assert [r.size for r in result] == [3, 0, 40]
+    for r, addr in zip(result, addrs):
+        assert np.array_equal(r, memory.mem[addr:addr + r.size])
+
+
+def test_write_many(umi_memory):
+    umi, memory = umi_memory(split=2)
+
+    # one element to each address
+    umi.write_many([0x10, 0x0, 0x20], np.array([1, 2, 3], dtype=np.uint32))
+    assert list(memory.mem[[0x10, 0x0, 0x20]]) == [1, 2, 3]
+
+    # a row to each address
+    umi.write_many([0x100, 0x180], np.arange(16, dtype=np.uint16).reshape(2, 8), posted=True)
+    assert np.array_equal(umi.read_many([0x100, 0x180], 8, np.uint16),
+        np.arange(16).reshape(2, 8))
+
+    # arrays of different lengths, but with the same element size
+    umi.write_many([0x200, 0x300], [np.arange(5, dtype=np.uint8), np.int8(-1)], max_bytes=4)
+    assert np.array_equal(memory.mem[0x200:0x205], np.arange(5))
+    assert memory.mem[0x300] == 0xff
+
+
+def test_write_many_errors(umi_memory):
+    umi, memory = umi_memory()
+
+    with pytest.raises(ValueError, match='2 addresses'):
+        umi.write_many([0x0, 0x10], np.arange(3, dtype=np.uint8))
+
+    with pytest.raises(ValueError, match='same element size'):
+        umi.write_many([0x0, 0x10], [np.uint8(1), np.uint16(2)])
+
+    with pytest.raises(ValueError, match='ndim=3'):
+        umi.write_many([0x0], np.zeros((1, 1, 1), dtype=np.uint8))
+
+    with pytest.raises(ValueError, match='integer'):
+        umi.write_many([0x0], np.zeros((1,), dtype=np.float32))
+
+    assert memory.requests == []
+
+
+def test_check_alignment(umi_memory):
+    umi, memory = umi_memory()
+    memory.mem[:0x10] = np.arange(0x10)
+
+    with pytest.raises(ValueError, match='addr=0x6 misaligned'):
+        umi.read_many([0x4, 0x6], np.uint32)
+
+    with pytest.raises(ValueError, match='addr=0x3 misaligned'):
+        umi.write_many([0x3], np.array([0], dtype=np.uint16))
+
+    assert memory.requests == []
+
+    result = umi.read_many([0x4, 0x6], np.uint32, check_alignment=False)
+    assert np.array_equal(result, [memory.mem[a:a + 4].view(np.uint32)[0] for a in [0x4, 0x6]])
+
+
+def test_srcaddr(umi_memory):
+    umi, memory = umi_memory()
+
+    # each request has its own source address, counting up across addresses
+    umi.read_many([0x100, 0x200], [2, 3], np.uint32, srcaddr=0x1000, max_bytes=8)
+    assert [(dstaddr, srcaddr) for _, dstaddr, srcaddr in memory.requests] == [
+        (0x100, 0x1000), (0x200, 0x1008), (0x208, 0x1010)]
+
+
+def test_gather_scatter(umi_memory):
+    umi, memory = umi_memory(reorder=True)
+
+    values = np.array([0x1111, 0x2222, 0x3333], dtype=np.uint16)
+    umi.scatter(0x400, [7, 0, 3], values)
+    assert np.array_equal(memory.mem[0x400:0x410].view(np.uint16),
+        [0x2222, 0, 0, 0x3333, 0, 0, 0, 0x1111])
+
+    assert np.array_equal(umi.gather(0x400, [3, 7, 0, 1], np.uint16),
+        [0x3333, 0x1111, 0x2222, 0])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
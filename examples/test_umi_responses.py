@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Tests of how blocking reads and writes match up responses with requests
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import numpy as np
+import pytest
+
+
+def test_read_reordered(umi_memory):
+    # requests are sent back to back, so responses to several of them come
+    # back together, in reverse order and split into pieces
+    umi, memory = umi_memory(reorder=True, split=2)
+    memory.mem[:0x400] = np.arange(0x400) % 251
+
+    assert np.array_equal(umi.read(0x10, 0x300, max_bytes=16), memory.mem[0x10:0x310])
+    assert np.array_equal(umi.read(0x20, 40, np.uint64), memory.mem[0x20:0x160].view(np.uint64))
+    assert len(memory.requests) > 2
+
+
+def test_write_reordered(umi_memory):
+    umi, memory = umi_memory(reorder=True, split=1)
+
+    data = np.arange(200, dtype=np.uint16)
+    umi.write(0x1000, data, max_bytes=32)
+
+    assert np.array_equal(memory.mem[0x1000:0x1190].view(np.uint16), data)
+    assert len(memory.requests) == 13
+
+
+def test_read_mismatched_warning(umi_memory, capfd):
+    umi, memory = umi_memory(dstaddr_offset=0x10000)
+    memory.mem[0x100:0x140] = np.arange(0x40)
+
+    # each response is taken to be for the oldest request still waiting
+    assert np.array_equal(umi.read(0x100, 0x40, max_bytes=8, error=False), np.arange(0x40))
+    assert 'dstaddr' in capfd.readouterr().err
+
+
+def test_write_mismatched_warning(umi_memory, capfd):
+    umi, memory = umi_memory(dstaddr_offset=0x10000)
+
+    umi.write(0x200, np.arange(32, dtype=np.uint8), max_bytes=8, error=False)
+    assert 'dstaddr' in capfd.readouterr().err
+
+    # the next transaction isn't confused by the mismatched responses
+    assert np.array_equal(umi.read(0x200, 32, error=False), np.arange(32))
+
+
+def test_read_mismatched_error(umi_memory):
+    umi, memory = umi_memory(dstaddr_offset=0x10000)
+
+    with pytest.raises(RuntimeError, match='dstaddr'):
+        umi.read(0x100, 4, error=True)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
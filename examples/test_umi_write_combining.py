@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Tests of write combining for posted UMI writes
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+import gc
+import time
+
+import numpy as np
+
+from switchboard import PyUmiPacket, UmiCmd, UmiTxRx, umi_len, umi_pack
+
+
+def wait_for(condition, timeout=5):
+    start = time.time()
+    while not condition():
+        assert (time.time() - start) < timeout, 'timed out'
+        time.sleep(1e-3)
+
+
+def test_adjacent(umi_memory):
+    umi, memory = umi_memory(umi_write_combining=64)
+
+    for i in range(8):
+        umi.write(0x100 + 4 * i, np.uint32(i), posted=True)
+    assert memory.requests == []
+
+    umi.flush()
+    wait_for(lambda: len(memory.requests) == 1)
+
+    assert umi_len(memory.requests[0][0]) == 7
+    assert np.array_equal(memory.mem[0x100:0x120].view(np.uint32), np.arange(8))
+
+
+def test_overlapping(umi_memory):
+    umi, memory = umi_memory(umi_write_combining=64)
+
+    umi.write(0x300, np.uint32(7), posted=True)
+    umi.write(0x300, np.uint32(9), posted=True)
+    umi.flush()
+
+    # both writes are delivered, in order
+    wait_for(lambda: len(memory.requests) == 2)
+    assert memory.mem[0x300:0x304].view(np.uint32)[0] == 9
+
+
+def test_timeout(umi_memory):
+    umi, memory = umi_memory(umi_write_combining=64, umi_write_combining_timeout=0.01)
+
+    umi.write(0x200, np.uint32(42), posted=True)
+    time.sleep(0.05)
+
+    # any use of the UmiTxRx sends writes that have been held for too long
+    assert umi.recv(False) is None
+    wait_for(lambda: len(memory.requests) == 1)
+    assert memory.mem[0x200:0x204].view(np.uint32)[0] == 42
+
+
+def test_exit_with_full_queue(tmp_path):
+    # nothing is on the other side of the queue, so the destructor has to
+    # give up on the held writes rather than wait for room forever
+
+    umi = UmiTxRx(str(tmp_path / 'tx.q'), fresh=True, write_combining=64)
+
+    p = PyUmiPacket(umi_pack(int(UmiCmd.UMI_REQ_POSTED), 0, 0, 0, 1, 1), 0, 0,
+        np.zeros((1,), dtype=np.uint8))
+    while umi.send(p, blocking=False):
+        pass
+    umi.write(0x100, np.uint32(1), posted=True)
+
+    start = time.time()
+    del umi
+    gc.collect()
+    assert (time.time() - start) < 5
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -3,13 +3,26 @@
 // Copyright (c) 2024 Zero ASIC Corporation
 // This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+#include <algorithm>
+#include <chrono>
 #include <cstring>
+#include <deque>
+#include <errno.h>
 #include <exception>
+#include <fcntl.h>
 #include <iostream>
+#include <map>
 #include <memory>
+#include <mutex>
 #include <optional>
+#include <random>
 #include <stdexcept>
 #include <stdio.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <unordered_map>
+#include <vector>
 
 #include <pybind11/numpy.h>
 #include <pybind11/operators.h>
@@ -315,6 +328,52 @@ void check_signals() {
     }
 }
 
+// SignalPoller is used instead by loops that run with the GIL released, so
+// that other Python threads can run while the loop waits on a queue.  poll()
+// should be called on every iteration; it only reacquires the GIL to check
+// for signals once every SB_SIGNAL_POLL_US, so that a waiting thread doesn't
+// contend for the GIL with the threads that are doing work.
+
+#define SB_SIGNAL_POLL_US 10000
+
+class SignalPoller {
+  public:
+    SignalPoller() {
+        m_next = std::chrono::steady_clock::now() + std::chrono::microseconds(SB_SIGNAL_POLL_US);
+    }
+
+    void poll() {
+        auto now = std::chrono::steady_clock::now();
+        if (now >= m_next) {
+            py::gil_scoped_acquire acquire;
+            check_signals();
+            m_next = now + std::chrono::microseconds(SB_SIGNAL_POLL_US);
+        }
+    }
+
+  private:
+    std::chrono::steady_clock::time_point m_next;
+};
+
+// ObjectLock is taken at the start of each method of an object that uses a
+// queue, so that Python threads sharing the object take turns with it, as
+// they did when the GIL was held throughout.  the mutex is only ever waited
+// on with the GIL released, so a thread holding the mutex can always get the
+// GIL back.  it is recursive, since some methods call others.
+
+class ObjectLock {
+  public:
+    ObjectLock(std::recursive_mutex& mutex) : m_lock(mutex, std::try_to_lock) {
+        if (!m_lock.owns_lock()) {
+            py::gil_scoped_release release;
+            m_lock.lock();
+        }
+    }
+
+  private:
+    std::unique_lock<std::recursive_mutex> m_lock;
+};
+
 // PySbTxPcie / PySbRxPcie: these objects must be created to initialize Switchboard
 // queues that are accessed over PCIe.  Care must be taken to ensure that they
 // don't go out of scope, since that will invoke destructors that deinitialize
@@ -358,17 +417,67 @@ struct PySbRxPcie {
 
 // fpga_init_tx: initialize an FPGA TX queue
 
+// converts queue performance counters to a Python dictionary
+
+static inline py::dict stats_to_dict(const spsc_queue_stats& stats) {
+    py::dict retval;
+    retval["enqueued"] = stats.enqueued;
+    retval["dequeued"] = stats.dequeued;
+    retval["full"] = stats.full;
+    retval["empty"] = stats.empty;
+    retval["high_water"] = stats.high_water;
+    return retval;
+}
+
+// NumPy structured type laid out like an sb_packet with "data_size" bytes
+// of data, so that arrays of packets can be copied to and from queues
+// without creating a PySbPacket for each one
+
+static py::dtype sb_packet_dtype(size_t data_size = SB_DATA_SIZE) {
+    py::list fields;
+    fields.append(py::make_tuple("destination", "<u4"));
+    fields.append(py::make_tuple("flags", "<u4"));
+    fields.append(py::make_tuple("data", "u1", py::make_tuple(data_size)));
+    return py::dtype::from_args(fields);
+}
+
+// umi_packet_dtype() is the NumPy structured type matching umi_packet, which
+// is used for batches of UMI packets, such as those checked by PyUmiLoopback
+
+static py::dtype umi_packet_dtype() {
+    py::list fields;
+    fields.append(py::make_tuple("cmd", "<u4"));
+    fields.append(py::make_tuple("dstaddr", "<u8"));
+    fields.append(py::make_tuple("srcaddr", "<u8"));
+    fields.append(py::make_tuple("data", "u1", py::make_tuple(UMI_PACKET_DATA_BYTES)));
+    return py::dtype::from_args(fields);
+}
+
+// largest burst that can be passed to send_burst() / recv_burst()
+
+static inline int sb_burst_size(size_t n) {
+    return (int)std::min<size_t>(n, INT_MAX);
+}
+
 // PySbTx: pybind-friendly version of SBTX that works with PySbPacket
 
 class PySbTx {
   public:
-    PySbTx(std::string uri = "", bool fresh = false, double max_rate = -1) {
-        init(uri, fresh, max_rate);
+    PySbTx(std::string uri = "", bool fresh = false, double max_rate = -1, size_t packet_size = 0,
+        int spin_budget = -1, size_t capacity = 0, bool hugepages = false, bool mpsc = false)
+        : m_buf(spsc_packet_size(0)) {
+        init(uri, fresh, max_rate, packet_size, spin_budget, capacity, hugepages, mpsc);
     }
 
-    void init(std::string uri, bool fresh = false, double max_rate = -1) {
+    void init(std::string uri, bool fresh = false, double max_rate = -1, size_t packet_size = 0,
+        int spin_budget = -1, size_t capacity = 0, bool hugepages = false, bool mpsc = false) {
+        ObjectLock lock(m_mutex);
+
         if (uri != "") {
-            m_tx.init(uri, 0, fresh, max_rate);
+            m_tx.set_multi_producer(mpsc);
+            m_tx.init(uri, capacity, fresh, max_rate, packet_size, hugepages);
+            m_tx.set_spin_budget(spin_budget);
+            m_buf.resize(m_tx.get_packet_size());
         }
     }
 
@@ -379,55 +488,158 @@ class PySbTx {
         // attempted once, and the boolean value returned indicates
         // whether that send was successful.
 
-        // make sure "data" is formatted correctly.  workaround for accessing bytes
-        // is discussed here: https://github.com/pybind/pybind11/issues/2517#issuecomment-696900575
+        ObjectLock lock(m_mutex);
 
-        py::buffer_info info = py::buffer(py_packet.data).request();
+        if (m_tx.is_multi_producer()) {
+            // slots can't be reserved with multiple producers, so the packet
+            // is built in a separate buffer and copied into the queue
 
-        pybind11::ssize_t len = info.size;
-        if (len > SB_DATA_SIZE) {
-            len = SB_DATA_SIZE;
+            sb_packet* p = (sb_packet*)m_buf.data();
+            fill(p, py_packet);
+
+            if (m_tx.send(p, m_buf.size())) {
+                return true;
+            } else if (!blocking) {
+                return false;
+            }
+
+            py::gil_scoped_release release;
+            SignalPoller signals;
+
+            int spins = 0;
+            do {
+                signals.poll();
+                m_tx.wait(spins);
+            } while (!m_tx.send(p, m_buf.size()));
+
+            return true;
         }
 
-        // convert data to be sent to an sb_packet
-        // TODO: try to avoid copying data
+        // otherwise, build the packet in place in the queue
 
-        sb_packet p;
-        p.destination = py_packet.destination;
-        p.flags = py_packet.flags;
-        if (len > 0) {
-            memcpy(p.data, info.ptr, len);
+        sb_packet* p = m_tx.reserve();
+
+        if (!p) {
+            if (!blocking) {
+                return false;
+            }
+
+            py::gil_scoped_release release;
+            SignalPoller signals;
+
+            int spins = 0;
+            while (!p) {
+                signals.poll();
+                m_tx.wait(spins);
+                p = m_tx.reserve();
+            }
         }
 
-        // try to send the packet once or multiple times depending
-        // on the "blocking" argument
+        fill(p, py_packet);
+        m_tx.commit();
 
-        if (!blocking) {
-            return m_tx.send(p);
-        } else {
-            while (!m_tx.send(p)) {
-                check_signals();
+        return true;
+    }
+
+    size_t send_many(py::array packets, bool blocking = true) {
+        // sends the packets in a NumPy array of type dtype(), copying them
+        // into the queue in bursts with the GIL released.  returns the
+        // number of packets sent, which is less than the length of the
+        // array only if blocking=false and the queue filled up.
+
+        ObjectLock lock(m_mutex);
+
+        py::array arr = py::module_::import("numpy").attr("ascontiguousarray")(packets, dtype());
+
+        const uint8_t* p = (const uint8_t*)arr.data();
+        size_t size = arr.itemsize();
+        size_t n = arr.size();
+
+        size_t count = 0;
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        while (true) {
+            int sent;
+            while ((count < n) && ((sent = m_tx.send_burst(p + (count * size), size,
+                                        sb_burst_size(n - count))) > 0)) {
+                count += sent;
+                spins = 0;
             }
 
-            return true;
+            if (!blocking || (count >= n)) {
+                return count;
+            }
+
+            signals.poll();
+            m_tx.wait(spins);
         }
     }
 
+    py::dtype dtype() {
+        return sb_packet_dtype(sb_data_size(m_buf.size()));
+    }
+
+    py::dict stats() {
+        return stats_to_dict(m_tx.get_stats());
+    }
+
+    void add_tap(std::string uri, size_t capacity = 0) {
+        ObjectLock lock(m_mutex);
+
+        m_tx.add_tap(uri, capacity);
+    }
+
   private:
+    friend class PySbQueueSet;
+
+    void fill(sb_packet* p, const PySbPacket& py_packet) {
+        // converts "py_packet" to an sb_packet, which may be longer than
+        // sizeof(sb_packet) if the queue was created with a larger packet
+        // size.  data beyond the packet size is dropped.  workaround for
+        // accessing bytes is discussed here:
+        // https://github.com/pybind/pybind11/issues/2517#issuecomment-696900575
+
+        py::buffer_info info = py::buffer(py_packet.data).request();
+
+        pybind11::ssize_t len = info.size;
+        pybind11::ssize_t max_len = sb_data_size(m_buf.size());
+        if (len > max_len) {
+            len = max_len;
+        }
+
+        p->destination = py_packet.destination;
+        p->flags = py_packet.flags;
+        if (len > 0) {
+            memcpy(p->data, info.ptr, len);
+        }
+    }
+
     SBTX m_tx;
+    std::vector<uint8_t> m_buf;
+    std::recursive_mutex m_mutex;
 };
 
 // PySbTx: pybind-friendly version of SBTX that works with PySbPacket
 
 class PySbRx {
   public:
-    PySbRx(std::string uri = "", bool fresh = false, double max_rate = -1) {
-        init(uri, fresh, max_rate);
+    PySbRx(std::string uri = "", bool fresh = false, double max_rate = -1, size_t packet_size = 0,
+        int spin_budget = -1, size_t capacity = 0, bool hugepages = false)
+        : m_packet_size(spsc_packet_size(0)) {
+        init(uri, fresh, max_rate, packet_size, spin_budget, capacity, hugepages);
     }
 
-    void init(std::string uri, bool fresh = false, double max_rate = -1) {
+    void init(std::string uri, bool fresh = false, double max_rate = -1, size_t packet_size = 0,
+        int spin_budget = -1, size_t capacity = 0, bool hugepages = false) {
+        ObjectLock lock(m_mutex);
+
         if (uri != "") {
-            m_rx.init(uri, 0, fresh, max_rate);
+            m_rx.init(uri, capacity, fresh, max_rate, packet_size, hugepages);
+            m_rx.set_spin_budget(spin_budget);
+            m_packet_size = m_rx.get_packet_size();
         }
     }
 
@@ -437,33 +649,195 @@ class PySbRx {
         // a PySbPacket.  otherwise, it will try just once, returning
         // a PySbPacket if successful, and None otherwise
 
-        sb_packet p;
-        if (!blocking) {
-            if (!m_rx.recv(p)) {
-                return nullptr;
+        ObjectLock lock(m_mutex);
+
+        sb_packet* p = peek(blocking);
+        if (!p) {
+            return nullptr;
+        }
+
+        // copy the packet straight out of the queue into a new PySbPacket
+        size_t data_size = sb_data_size(m_packet_size);
+        py::array_t<uint8_t> data(data_size);
+        memcpy(data.mutable_data(), p->data, data_size);
+        std::unique_ptr<PySbPacket> py_packet(new PySbPacket(p->destination, p->flags, data));
+        m_rx.release();
+
+        return py_packet;
+    }
+
+    bool recv_into(PySbPacket& py_packet, bool blocking = true) {
+        // same as recv(), but stores the packet in an existing PySbPacket,
+        // reusing its data array if it is a writeable, contiguous array of
+        // the right size, so that a polling loop doesn't allocate anything.
+        // returns false if blocking=false and there was no packet.
+
+        ObjectLock lock(m_mutex);
+
+        sb_packet* p = peek(blocking);
+        if (!p) {
+            return false;
+        }
+
+        size_t data_size = sb_data_size(m_packet_size);
+        if (((size_t)py_packet.data.size() != data_size) || !py_packet.data.writeable() ||
+            !(py_packet.data.flags() & py::array::c_style)) {
+            py_packet.data = py::array_t<uint8_t>(data_size);
+        }
+
+        py_packet.destination = p->destination;
+        py_packet.flags = p->flags;
+        memcpy(py_packet.data.mutable_data(), p->data, data_size);
+        m_rx.release();
+
+        return true;
+    }
+
+    py::array recv_many(size_t max_n, bool blocking = true) {
+        // receives up to "max_n" packets into a NumPy array of type dtype(),
+        // copying them out of the queue in bursts with the GIL released.  if
+        // blocking=true, waits until there is at least one packet; otherwise,
+        // the array returned may be empty.
+
+        ObjectLock lock(m_mutex);
+
+        py::array arr(dtype(), std::vector<py::ssize_t>{(py::ssize_t)max_n});
+
+        uint8_t* p = (uint8_t*)arr.mutable_data();
+        size_t size = arr.itemsize();
+
+        size_t count = 0;
+
+        {
+            py::gil_scoped_release release;
+            SignalPoller signals;
+
+            int spins = 0;
+            while (true) {
+                int received;
+                while ((count < max_n) && ((received = m_rx.recv_burst(p + (count * size), size,
+                                                sb_burst_size(max_n - count))) > 0)) {
+                    count += received;
+                }
+
+                if (!blocking || (count > 0) || (max_n == 0)) {
+                    break;
+                }
+
+                signals.poll();
+                m_rx.wait(spins);
             }
-        } else {
-            while (!m_rx.recv(p)) {
-                check_signals();
+        }
+
+        return arr[py::slice(0, (py::ssize_t)count, 1)];
+    }
+
+    py::dtype dtype() {
+        return sb_packet_dtype(sb_data_size(m_packet_size));
+    }
+
+    py::dict stats() {
+        return stats_to_dict(m_rx.get_stats());
+    }
+
+  private:
+    friend class PySbQueueSet;
+
+    sb_packet* peek(bool blocking) {
+        // returns the oldest packet in the queue, to be read in place until
+        // m_rx.release() is called, waiting for one if blocking=true.
+        // returns NULL if blocking=false and the queue is empty.
+
+        sb_packet* p = m_rx.peek();
+
+        if (p || !blocking) {
+            return p;
+        }
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        while (!p) {
+            signals.poll();
+            m_rx.wait(spins);
+            p = m_rx.peek();
+        }
+
+        return p;
+    }
+
+    SBRX m_rx;
+    size_t m_packet_size;
+    std::recursive_mutex m_mutex;
+};
+
+// PySbQueueSet: pybind-friendly version of SBQueueSet that works with PySbRx,
+// PySbTx, and PyUmi.  The GIL is released while waiting, so that other Python
+// threads can run.
+
+class PyUmi;
+
+class PySbQueueSet {
+  public:
+    int add_rx(PySbRx& rx) {
+        return m_set.add(rx.m_rx);
+    }
+
+    int add_tx(PySbTx& tx) {
+        return m_set.add(tx.m_tx);
+    }
+
+    int add_umi(PyUmi& umi, bool tx);
+
+    bool wait(double timeout = -1) {
+        // waits in short intervals so that Ctrl-C is noticed promptly
+
+        long remaining_us = timeout * 1.0e6;
+
+        while (true) {
+            long wait_us = SB_WAIT_TIMEOUT_US;
+            if ((timeout >= 0) && (remaining_us < wait_us)) {
+                wait_us = remaining_us;
+            }
+
+            bool ready;
+            {
+                py::gil_scoped_release release;
+                ready = m_set.wait(wait_us);
+            }
+
+            if (ready) {
+                return true;
+            } else if (timeout >= 0) {
+                remaining_us -= wait_us;
+                if (remaining_us <= 0) {
+                    return false;
+                }
             }
+
+            check_signals();
         }
+    }
 
-        // if we get to this point, there is valid data in "p"
+    std::vector<int> ready() {
+        return m_set.ready();
+    }
 
-        // create "py_packet" to hold received data in a pybind-friendly manner
-        std::unique_ptr<PySbPacket> py_packet(new PySbPacket(p.destination, p.flags));
+    void clear() {
+        m_set.clear();
+    }
 
-        // copy data from "p" to "py_packet"
-        // TODO: can this be avoided?
-        py::buffer_info info = py::buffer(py_packet->data).request();
-        memcpy(info.ptr, p.data, SB_DATA_SIZE);
+    int fileno() {
+        return m_set.fileno();
+    }
 
-        // return the packet
-        return py_packet;
+    void rearm() {
+        m_set.rearm();
     }
 
   private:
-    SBRX m_rx;
+    SBQueueSet m_set;
 };
 
 // Functions to show a progress bar.
@@ -489,6 +863,214 @@ static inline void progressbar_done(void) {
     putchar('\n');
 }
 
+// default number of requests that transactions started with PyUmi::start_read(),
+// start_write(), and start_atomic() can have outstanding at once, and default
+// position of the tag added to the source address of each of those requests,
+// which tells apart the responses to requests that are outstanding at once.
+
+#define PYUMI_MAX_OUTSTANDING 64
+#define PYUMI_TAG_SHIFT 8
+
+// how long the PyUmi destructor tries to send writes held for write combining
+// before giving up on them, so that exiting doesn't hang if the other side of
+// the TX queue is gone
+
+#define PYUMI_EXIT_FLUSH_US 100000
+
+// state of a UMI transaction started with PyUmi::start_read(), start_write(), or
+// start_atomic().  it doesn't refer to any Python objects, so that it can be
+// updated with the GIL released.
+
+struct UmiFutureState {
+    uint32_t opcode;
+    uint32_t atype;
+    uint32_t resp_opcode;
+    uint32_t size;
+    uint32_t max_len;
+    uint32_t qos;
+    uint32_t prot;
+    bool error;
+
+    uint64_t addr;    // address of the next request
+    uint64_t srcaddr; // source address of the requests, before the tag is added
+    uint32_t to_send; // elements that haven't been requested yet
+    uint32_t to_recv; // elements that haven't been responded to yet
+    size_t offset;    // offset into "data" of the next request
+
+    std::vector<uint8_t> data; // data written, or data read
+    std::string errmsg;        // first error found in a response
+
+    bool done() {
+        return (to_send == 0) && (to_recv == 0);
+    }
+};
+
+// PyUmiFuture: result of a transaction started with PyUmi::start_read(),
+// start_write(), or start_atomic(), which is available once all of the
+// responses to the transaction have arrived.
+
+class PyUmiFuture {
+  public:
+    PyUmiFuture(PyUmi* umi, std::shared_ptr<UmiFutureState> state);
+
+    bool done();
+    py::object result();
+
+  private:
+    py::object m_owner; // keeps the PyUmi alive as long as the future
+    PyUmi* m_umi;
+    std::shared_ptr<UmiFutureState> m_state;
+};
+
+// UmiResponseTracker: keeps track of the requests of a UMI transaction that
+// are waiting for responses, so that responses can be matched up with the
+// requests that they are for even if they arrive out of order (e.g., from
+// several memory banks behind a UMI splitter).  a response is matched by its
+// dstaddr, which is the srcaddr of the request it is for, plus the number of
+// bytes already responded to, if the response to a request is split up.
+
+class UmiResponseTracker {
+  public:
+    void expect(uint64_t srcaddr, uint32_t len, size_t offset) {
+        // called when a request for "len" elements is sent, with "offset"
+        // giving the position of its data within the transaction
+        m_requests[offset] = Request{srcaddr, len};
+        m_offsets[srcaddr] = offset;
+    }
+
+    bool empty() {
+        return m_requests.empty();
+    }
+
+    size_t match(UmiTransaction& resp, uint32_t opcode, uint32_t size, bool error, uint32_t& len) {
+        // finds the request that "resp" is for and checks the response,
+        // returning the offset of the data in the response within the
+        // transaction, and setting "len" to the number of elements that it
+        // responded to.  must only be called if there are requests that
+        // are waiting for responses.
+
+        std::map<size_t, Request>::iterator req;
+
+        auto it = m_offsets.find(resp.dstaddr);
+        if (it != m_offsets.end()) {
+            req = m_requests.find(it->second);
+            m_offsets.erase(it);
+        } else {
+            // the response doesn't match any request, which is reported
+            // below as a mismatch with the oldest request.  if that is only
+            // a warning, the response is taken to be for that request.
+            req = m_requests.begin();
+            m_offsets.erase(req->second.expected_addr);
+        }
+
+        umisb_check_resp<UmiTransaction>(resp, opcode, size, req->second.to_recv,
+            req->second.expected_addr, error);
+
+        size_t offset = req->first;
+        len = std::min(umi_len(resp.cmd) + 1, req->second.to_recv);
+
+        Request rest{req->second.expected_addr + (len << size), req->second.to_recv - len};
+        m_requests.erase(req);
+
+        if (rest.to_recv > 0) {
+            expect(rest.expected_addr, rest.to_recv, offset + (len << size));
+        }
+
+        return offset;
+    }
+
+  private:
+    struct Request {
+        uint64_t expected_addr;
+        uint32_t to_recv;
+    };
+
+    // requests indexed by offset, so that the oldest one comes first
+    std::map<size_t, Request> m_requests;
+
+    // offsets of requests indexed by the dstaddr of the next response
+    std::unordered_map<uint64_t, size_t> m_offsets;
+};
+
+// MappedFile: maps "nbytes" bytes of a file, starting at "offset", into memory
+// for PyUmi::load_file() and dump_file(), so that large memory images don't
+// have to be read into memory first.  if "create" is true, the file is created
+// (or truncated) with a size of "nbytes"; otherwise, a negative "nbytes" maps
+// the rest of the file.  the mapping is removed when the object is destroyed.
+
+#define PYUMI_FILE_CHUNK_BYTES (1 << 30)
+
+class MappedFile {
+  public:
+    MappedFile(std::string path, uint64_t offset, int64_t nbytes, bool create) {
+        int fd = open(path.c_str(), create ? (O_RDWR | O_CREAT | O_TRUNC) : O_RDONLY, 0644);
+        if (fd < 0) {
+            throw std::runtime_error("Could not open " + path + ": " + strerror(errno));
+        }
+
+        if (create) {
+            if (ftruncate(fd, offset + nbytes) < 0) {
+                close(fd);
+                throw std::runtime_error("Could not resize " + path + ": " + strerror(errno));
+            }
+        } else {
+            struct stat st;
+            if (fstat(fd, &st) < 0) {
+                close(fd);
+                throw std::runtime_error("Could not stat " + path + ": " + strerror(errno));
+            }
+
+            uint64_t file_size = st.st_size;
+            if ((offset > file_size) || ((nbytes >= 0) && ((offset + nbytes) > file_size))) {
+                close(fd);
+                throw std::runtime_error("Range to be loaded is past the end of " + path + ".");
+            }
+
+            if (nbytes < 0) {
+                nbytes = file_size - offset;
+            }
+        }
+
+        m_size = nbytes;
+        m_map = NULL;
+
+        // mmap() needs an offset that is a multiple of the page size
+        m_pad = offset % sysconf(_SC_PAGESIZE);
+
+        if (m_size > 0) {
+            void* p = mmap(NULL, m_size + m_pad, create ? (PROT_READ | PROT_WRITE) : PROT_READ,
+                MAP_SHARED, fd, offset - m_pad);
+            if (p == MAP_FAILED) {
+                close(fd);
+                throw std::runtime_error("Could not map " + path + ": " + strerror(errno));
+            }
+            madvise(p, m_size + m_pad, MADV_SEQUENTIAL);
+            m_map = (uint8_t*)p;
+        }
+
+        close(fd);
+    }
+
+    ~MappedFile() {
+        if (m_map) {
+            munmap(m_map, m_size + m_pad);
+        }
+    }
+
+    uint8_t* ptr() {
+        return m_map + m_pad;
+    }
+
+    uint64_t size() {
+        return m_size;
+    }
+
+  private:
+    uint8_t* m_map;
+    uint64_t m_size;
+    uint64_t m_pad;
+};
+
 // PyUmi: Higher-level than PySbTx and PySbRx, this class works with two SB queues,
 // one TX and one RX, to issue write requests and read requests according to the UMI
 // specification.
@@ -496,16 +1078,32 @@ static inline void progressbar_done(void) {
 class PyUmi {
   public:
     PyUmi(std::string tx_uri = "", std::string rx_uri = "", bool fresh = false,
-        double max_rate = -1) {
-        init(tx_uri, rx_uri, fresh, max_rate);
+        double max_rate = -1, int spin_budget = -1, size_t capacity = 0, bool hugepages = false) {
+        init(tx_uri, rx_uri, fresh, max_rate, spin_budget, capacity, hugepages);
+        set_max_outstanding(PYUMI_MAX_OUTSTANDING, PYUMI_TAG_SHIFT);
+    }
+
+    ~PyUmi() {
+        // writes held for write combining would otherwise be lost
+        try {
+            if (!flush_for(PYUMI_EXIT_FLUSH_US)) {
+                fprintf(stderr, "WARNING: PyUmi dropped writes held for write combining, since"
+                                " the TX queue stayed full\n");
+            }
+        } catch (...) {}
     }
 
-    void init(std::string tx_uri, std::string rx_uri, bool fresh = false, double max_rate = -1) {
+    void init(std::string tx_uri, std::string rx_uri, bool fresh = false, double max_rate = -1,
+        int spin_budget = -1, size_t capacity = 0, bool hugepages = false) {
+        ObjectLock lock(m_mutex);
+
         if (tx_uri != "") {
-            m_tx.init(tx_uri, 0, fresh, max_rate);
+            m_tx.init(tx_uri, capacity, fresh, max_rate, 0, hugepages);
+            m_tx.set_spin_budget(spin_budget);
         }
         if (rx_uri != "") {
-            m_rx.init(rx_uri, 0, fresh, max_rate);
+            m_rx.init(rx_uri, capacity, fresh, max_rate, 0, hugepages);
+            m_rx.set_spin_budget(spin_budget);
         }
     }
 
@@ -516,13 +1114,38 @@ class PyUmi {
         // containing the beginning of the data, followed by the rest in
         // subsequent burst packets.
 
-        return umisb_send<PyUmiPacket>(py_packet, m_tx, blocking, &check_signals);
+        ObjectLock lock(m_mutex);
+
+        // the packet is sent through a UmiTransaction that refers to its
+        // data, so that the GIL doesn't have to be held while waiting
+
+        UmiTransaction x(py_packet.cmd, py_packet.dstaddr, py_packet.srcaddr,
+            py_packet.storage() ? py_packet.ptr() : NULL,
+            py_packet.storage() ? py_packet.nbytes() : 0);
+
+        // transactions started with start_read(), start_write(), or
+        // start_atomic() go out first, and writes held for write combining
+        // are sent after them
+        wait_all();
+        flush();
+
+        return send_transaction(x, blocking);
     }
 
     std::unique_ptr<PyUmiPacket> recv(bool blocking = true) {
+        ObjectLock lock(m_mutex);
+
+        // responses to transactions started with start_read(), start_write(),
+        // or start_atomic() would otherwise be taken from them
+        wait_all();
+        flush_expired();
+
         // try to receive a transaction
         std::unique_ptr<PyUmiPacket> resp = std::unique_ptr<PyUmiPacket>(new PyUmiPacket());
-        bool success = umisb_recv<PyUmiPacket>(*resp.get(), m_rx, blocking, &check_signals);
+        if (blocking) {
+            wait_recv();
+        }
+        bool success = umisb_recv<PyUmiPacket>(*resp.get(), m_rx, false);
 
         // if we got something, return it, otherwise return a null pointer
         if (success) {
@@ -532,6 +1155,31 @@ class PyUmi {
         }
     }
 
+    bool recv_into(PyUmiPacket& py_packet, bool blocking = true) {
+        // same as recv(), but stores the transaction in an existing
+        // PyUmiPacket, reusing its data array, so that a polling loop
+        // doesn't allocate anything.  if the packet doesn't have a data
+        // array yet, it is given one that can hold any UMI packet.
+        // returns false if blocking=false and there was no transaction.
+
+        ObjectLock lock(m_mutex);
+
+        if (!py_packet.storage()) {
+            py_packet.allocate(0, UMI_PACKET_DATA_BYTES - 1);
+        } else if (!py_packet.data.writeable() || !(py_packet.data.flags() & py::array::c_style)) {
+            throw std::runtime_error("Array received into must be writeable and contiguous.");
+        }
+
+        // as in recv(), don't take responses from started transactions
+        wait_all();
+        flush_expired();
+
+        if (blocking) {
+            wait_recv();
+        }
+        return umisb_recv<PyUmiPacket>(py_packet, m_rx, false);
+    }
+
     void write(uint64_t addr, py::array data, uint64_t srcaddr = 0,
         uint32_t max_bytes = UMI_PACKET_DATA_BYTES, bool posted = false, uint32_t qos = 0,
         uint32_t prot = 0, bool progressbar = false, bool error = true) {
@@ -540,6 +1188,8 @@ class PyUmi {
         // including greater than the length of a header packet and
         // values that are not powers of two.  this function is blocking.
 
+        ObjectLock lock(m_mutex);
+
         // get access to the data
         py::buffer_info info = py::buffer(data).request();
 
@@ -572,10 +1222,6 @@ class PyUmi {
             return;
         }
 
-        // fields only used if expecting a write response
-        uint32_t to_ack = total_len;
-        uint64_t expected_addr = srcaddr;
-
         // otherwise get the data pointer and decompose the data into
         // power-of-two chunks, with the size of each chunk being the
         // largest that is possible while remaining aligned, and
@@ -583,182 +1229,1724 @@ class PyUmi {
 
         uint8_t* ptr = (uint8_t*)info.ptr;
 
-        // determine the opcode to use
-        uint32_t opcode = posted ? UMI_REQ_POSTED : UMI_REQ_WRITE;
-
         // determine the size of individual items
         uint32_t size = highest_bit(info.itemsize);
 
-        // determine the maximum length of an individual packet
-        uint32_t max_len = max_bytes / info.itemsize;
-        int pb_state = 0;
+        // small posted writes can be held back to be combined with others
+        if (posted && (!progressbar) &&
+            combine_write(addr, ptr, total_len << size, srcaddr, size, max_bytes, qos, prot)) {
+            return;
+        }
 
-        // send all of the data
-        while ((total_len > 0) || ((!posted) && (to_ack > 0))) {
-            if (total_len > 0) {
-                // try to send a write request
-                uint32_t len = std::min(total_len, max_len);
+        write_ptr(addr, ptr, total_len, size, srcaddr, max_bytes, posted, qos, prot, progressbar,
+            error);
+    }
+
+    py::array read(uint64_t addr, uint32_t num, size_t bytes_per_elem, uint64_t srcaddr = 0,
+        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, uint32_t qos = 0, uint32_t prot = 0,
+        bool error = true) {
+
+        // read "num" bytes from the given address.  "num" may be any value,
+        // including greater than the length of a header packet, and values
+        // that are not powers of two.  the optional "srcaddr" argument is
+        // the source address to which responses should be sent.  this
+        // function is blocking.
+
+        ObjectLock lock(m_mutex);
+
+        // create a buffer to hold the result
+        py::array result = alloc_pybind_array(num, bytes_per_elem);
+
+        read_into(addr, result, srcaddr, max_bytes, qos, prot, error);
+
+        return result;
+    }
+
+    void read_into(uint64_t addr, py::array out, uint64_t srcaddr = 0,
+        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, uint32_t qos = 0, uint32_t prot = 0,
+        bool error = true) {
+
+        // same as read(), but reads into an existing array, with one element
+        // read per entry of "out".  this lets a polling loop reuse the same
+        // array rather than allocating a new one for every read.
+
+        ObjectLock lock(m_mutex);
+
+        size_t bytes_per_elem = out.itemsize();
+        uint32_t num = out.size();
+
+        if ((bytes_per_elem != 1) && (bytes_per_elem != 2) && (bytes_per_elem != 4) &&
+            (bytes_per_elem != 8)) {
+            throw std::runtime_error("Unsupported value for bytes_per_elem.");
+        }
+
+        if (!out.writeable() || !(out.flags() & py::array::c_style)) {
+            throw std::runtime_error("Array read into must be writeable and contiguous.");
+        }
+
+        if (max_bytes < bytes_per_elem) {
+            throw std::runtime_error("max_bytes must be greater than or equal to bytes_per_elem.");
+        }
+
+        if (num == 0) {
+            // nothing to read
+            return;
+        }
+
+        // otherwise get the data pointer and read the data in
+        // power-of-two chunks, with the size of each chunk being the
+        // largest that is possible while remaining aligned, and
+        // without exceeding the number of remaining bytes.
+
+        uint8_t* ptr = (uint8_t*)out.mutable_data();
+
+        // determine the size of individual items
+        uint32_t size = highest_bit(bytes_per_elem);
+
+        read_ptr(addr, ptr, num, size, srcaddr, max_bytes, qos, prot, error);
+    }
+
+    py::array read_many(py::array_t<uint64_t, py::array::c_style | py::array::forcecast> addrs,
+        py::array_t<uint32_t, py::array::c_style | py::array::forcecast> counts,
+        size_t bytes_per_elem = 1, uint64_t srcaddr = 0, uint32_t max_bytes = UMI_PACKET_DATA_BYTES,
+        uint32_t qos = 0, uint32_t prot = 0, bool error = true) {
+
+        // reads counts[i] elements from each address addrs[i], returning
+        // all of the elements read in a single flat array.  the requests
+        // for all of the addresses are sent back to back, rather than
+        // waiting for the responses to one address before moving on.
+
+        ObjectLock lock(m_mutex);
+
+        if (addrs.size() != counts.size()) {
+            throw std::runtime_error("addrs and counts must have the same length.");
+        }
+
+        uint64_t total = 0;
+        for (py::ssize_t i = 0; i < counts.size(); i++) {
+            total += counts.data()[i];
+        }
+
+        py::array result = alloc_pybind_array(total, bytes_per_elem);
+
+        transact_many(false, addrs.data(), counts.data(), addrs.size(),
+            (uint8_t*)result.mutable_data(), bytes_per_elem, srcaddr, max_bytes, false, qos, prot,
+            error);
+
+        return result;
+    }
+
+    uint64_t load_file(std::string path, uint64_t addr, uint64_t offset = 0, int64_t nbytes = -1,
+        uint64_t srcaddr = 0, uint32_t max_bytes = UMI_PACKET_DATA_BYTES, bool posted = true,
+        uint32_t qos = 0, uint32_t prot = 0, bool progressbar = false, bool error = true) {
+
+        // writes "nbytes" bytes of a file, starting at "offset" (or the rest
+        // of the file, if nbytes is negative), to the given address.  the
+        // file is memory-mapped and streamed out in pieces, so that loading
+        // a large image doesn't need a copy of it in memory.  returns the
+        // number of bytes written.
+
+        ObjectLock lock(m_mutex);
+
+        check_elem_size(1, max_bytes);
+
+        MappedFile file(path, offset, nbytes, false);
+
+        for (uint64_t done = 0; done < file.size(); done += PYUMI_FILE_CHUNK_BYTES) {
+            uint32_t len = std::min(file.size() - done, (uint64_t)PYUMI_FILE_CHUNK_BYTES);
+            write_ptr(addr + done, file.ptr() + done, len, 0, srcaddr + done, max_bytes, posted,
+                qos, prot, progressbar, error);
+        }
+
+        return file.size();
+    }
+
+    uint64_t dump_file(std::string path, uint64_t addr, uint64_t nbytes, uint64_t srcaddr = 0,
+        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, uint32_t qos = 0, uint32_t prot = 0,
+        bool error = true) {
+
+        // reads "nbytes" bytes from the given address into a file, which is
+        // created (or overwritten) and memory-mapped, so that the data read
+        // goes straight to the file.  returns the number of bytes read.
+
+        ObjectLock lock(m_mutex);
+
+        check_elem_size(1, max_bytes);
+
+        MappedFile file(path, 0, nbytes, true);
+
+        for (uint64_t done = 0; done < file.size(); done += PYUMI_FILE_CHUNK_BYTES) {
+            uint32_t len = std::min(file.size() - done, (uint64_t)PYUMI_FILE_CHUNK_BYTES);
+            read_ptr(addr + done, file.ptr() + done, len, 0, srcaddr + done, max_bytes, qos, prot,
+                error);
+        }
+
+        return file.size();
+    }
+
+    void write_many(py::array_t<uint64_t, py::array::c_style | py::array::forcecast> addrs,
+        py::array_t<uint32_t, py::array::c_style | py::array::forcecast> counts, py::array data,
+        uint64_t srcaddr = 0, uint32_t max_bytes = UMI_PACKET_DATA_BYTES, bool posted = false,
+        uint32_t qos = 0, uint32_t prot = 0, bool error = true) {
+
+        // writes counts[i] elements to each address addrs[i], with the
+        // elements taken in turn from the flat array "data".  as with
+        // read_many(), the requests are sent back to back.
+
+        ObjectLock lock(m_mutex);
+
+        if (addrs.size() != counts.size()) {
+            throw std::runtime_error("addrs and counts must have the same length.");
+        }
+
+        if (!(data.flags() & py::array::c_style)) {
+            throw std::runtime_error("Array written from must be contiguous.");
+        }
+
+        uint64_t total = 0;
+        for (py::ssize_t i = 0; i < counts.size(); i++) {
+            total += counts.data()[i];
+        }
+
+        if (total != (uint64_t)data.size()) {
+            throw std::runtime_error("The total of counts must match the size of data.");
+        }
+
+        transact_many(true, addrs.data(), counts.data(), addrs.size(), (uint8_t*)data.data(),
+            data.itemsize(), srcaddr, max_bytes, posted, qos, prot, error);
+    }
+
+    py::array atomic(uint64_t addr, py::array_t<uint8_t> data, uint32_t opcode,
+        uint64_t srcaddr = 0, uint32_t qos = 0, uint32_t prot = 0, bool error = true) {
+        ObjectLock lock(m_mutex);
+
+        // input validation
+
+        uint32_t num = data.nbytes();
+
+        if (num == 0) {
+            // nothing to read, so just return the empty array
+            return py::array_t<uint8_t>(0);
+        }
+
+        uint32_t size = highest_bit(num);
+
+        if (size > 3) {
+            throw std::runtime_error("Atomic operand must be 8 bytes or fewer.");
+        }
+
+        if (num != (1 << size)) {
+            throw std::runtime_error(
+                "Width of atomic operand must be a power of two number of bytes.");
+        }
+
+        // as in write_ptr(), wait for transactions started with start_read(),
+        // start_write(), or start_atomic() to complete, and send writes held
+        // for write combining, first
+        wait_all();
+        flush();
+
+        // format the request
+        uint32_t cmd = umi_pack(UMI_REQ_ATOMIC, opcode, size, 0, 1, 1, qos, prot);
+        UmiTransaction request(cmd, addr, srcaddr, (uint8_t*)data.data(), num);
+
+        // send the request
+        send_transaction(request, true);
+
+        // get the response
+        PyUmiPacket resp;
+        wait_recv();
+        umisb_recv<PyUmiPacket>(resp, m_rx, false);
+
+        // check that the response makes sense
+        umisb_check_resp(resp, UMI_RESP_READ, size, 1, srcaddr, error);
+
+        // return the result of the operation
+        return resp.data;
+    }
+
+    PyUmiFuture start_read(uint64_t addr, uint32_t num, size_t bytes_per_elem, uint64_t srcaddr = 0,
+        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, uint32_t qos = 0, uint32_t prot = 0,
+        bool error = true) {
+
+        // starts reading "num" elements from the given address, returning a
+        // future that holds the data read once all of the responses have
+        // arrived.  unlike read(), this doesn't wait for the responses, so
+        // that several transactions can be outstanding at once.
+
+        ObjectLock lock(m_mutex);
+
+        check_elem_size(bytes_per_elem, max_bytes);
+
+        return start_future(UMI_REQ_READ, 0, highest_bit(bytes_per_elem),
+            max_bytes / bytes_per_elem, addr, srcaddr, num, NULL, qos, prot, error);
+    }
+
+    PyUmiFuture start_write(uint64_t addr, py::array data, uint64_t srcaddr = 0,
+        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, bool posted = false, uint32_t qos = 0,
+        uint32_t prot = 0, bool error = true) {
+
+        // starts writing data to the given address, returning a future that
+        // completes once all of the write responses have arrived (or right
+        // away, for posted writes, once the requests have been sent).  the
+        // data is copied, so the array can be reused right away.
+
+        ObjectLock lock(m_mutex);
+
+        if (!(data.flags() & py::array::c_style)) {
+            throw std::runtime_error("Array written from must be contiguous.");
+        }
+
+        check_elem_size(data.itemsize(), max_bytes);
+
+        return start_future(posted ? UMI_REQ_POSTED : UMI_REQ_WRITE, 0,
+            highest_bit(data.itemsize()), max_bytes / data.itemsize(), addr, srcaddr, data.size(),
+            (const uint8_t*)data.data(), qos, prot, error);
+    }
+
+    PyUmiFuture start_atomic(uint64_t addr, py::array_t<uint8_t> data, uint32_t opcode,
+        uint64_t srcaddr = 0, uint32_t qos = 0, uint32_t prot = 0, bool error = true) {
+
+        // starts an atomic operation, returning a future that holds the
+        // original value at the address once the response has arrived
+
+        ObjectLock lock(m_mutex);
+
+        uint32_t num = data.nbytes();
+        uint32_t size = highest_bit(num);
+
+        if ((num == 0) || (size > 3) || (num != (1 << size))) {
+            throw std::runtime_error(
+                "Atomic operand must be a power of two number of bytes, up to 8 bytes.");
+        }
+
+        return start_future(UMI_REQ_ATOMIC, opcode, size, 1, addr, srcaddr, 1, data.data(), qos,
+            prot, error);
+    }
+
+    void set_max_outstanding(uint32_t max_outstanding, uint32_t tag_shift = PYUMI_TAG_SHIFT) {
+        // sets the number of requests that transactions started with
+        // start_read(), start_write(), and start_atomic() can have outstanding
+        // at once.  each of those requests gets a tag from 0 to
+        // max_outstanding-1, which is shifted left by "tag_shift" and added
+        // to its source address, so that responses can be matched up with
+        // requests even if they arrive out of order.
+
+        ObjectLock lock(m_mutex);
+
+        if (max_outstanding == 0) {
+            throw std::runtime_error("max_outstanding must be at least 1.");
+        }
+
+        if (!m_pending.empty() || !m_expected.empty()) {
+            throw std::runtime_error(
+                "max_outstanding can't be changed while transactions are outstanding.");
+        }
+
+        m_slots.assign(max_outstanding, UmiSlot());
+        m_free_slots.clear();
+        for (uint32_t i = max_outstanding; i > 0; i--) {
+            m_free_slots.push_back(i - 1);
+        }
+        m_tag_shift = tag_shift;
+        m_blocked_on_tx = false;
+    }
+
+    void wait_all() {
+        // waits for all of the transactions started with start_read(),
+        // start_write(), and start_atomic() to complete
+
+        ObjectLock lock(m_mutex);
+
+        if (m_pending.empty() && m_expected.empty()) {
+            return;
+        }
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        while (!m_pending.empty() || !m_expected.empty()) {
+            if (!pump_futures()) {
+                wait_futures(spins);
+            }
+            signals.poll();
+        }
+    }
+
+    py::tuple futures_waiting() {
+        // says whether the transactions started with start_read(),
+        // start_write(), and start_atomic() are waiting for room in the TX
+        // queue and for responses from the RX queue, as of the last time that
+        // they were checked on, which tells asyncio code what to wait for
+
+        ObjectLock lock(m_mutex);
+
+        return py::make_tuple(m_blocked_on_tx, !m_expected.empty());
+    }
+
+    void set_write_combining(size_t buffer_bytes, double timeout = -1) {
+        // enables write combining if "buffer_bytes" is nonzero.  posted writes
+        // of up to that many bytes to adjacent addresses are then held in a
+        // buffer and combined, so that they are sent in as few UMI packets as
+        // possible.  the buffer is sent when it fills up, when a write that
+        // can't be combined with it comes in (including one that overlaps
+        // it), before any other transaction, and when flush() is called.  if
+        // timeout is positive, the buffer is also sent once it is older than
+        // that many seconds, which is checked whenever the PyUmi is used.
+
+        ObjectLock lock(m_mutex);
+
+        flush();
+
+        m_wc_limit = buffer_bytes;
+        m_wc_timeout_us = (timeout > 0) ? (long)(timeout * 1e6) : -1;
+    }
+
+    void flush() {
+        // sends the writes held for write combining, after the requests of
+        // any transactions started before them
+
+        ObjectLock lock(m_mutex);
+
+        flush_for(-1);
+    }
+
+    bool flush_for(long timeout_us) {
+        // same as flush(), but if "timeout_us" is nonnegative, gives up after
+        // that many microseconds, dropping the writes that haven't been sent.
+        // returns false if it gave up.
+
+        if (m_wc_data.empty()) {
+            return true;
+        }
+
+        auto start = std::chrono::steady_clock::now();
+
+        uint32_t size = m_wc_size;
+        uint32_t max_len = m_wc_max_bytes >> size;
+        uint32_t total_len = m_wc_data.size() >> size;
+        uint64_t addr = m_wc_addr;
+        uint64_t srcaddr = m_wc_srcaddr;
+        uint8_t* ptr = m_wc_data.data();
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        // responses to started transactions are received along the way, so
+        // that a device waiting to send them doesn't hold up the writes
+        int spins = 0;
+        while (!m_pending.empty() || (total_len > 0)) {
+            bool progress = pump_futures();
+
+            if (m_pending.empty() && (total_len > 0)) {
+                uint32_t len = std::min(total_len, max_len);
                 uint32_t eom = (len == total_len) ? 1 : 0;
-                uint32_t cmd = umi_pack(opcode, 0, size, len - 1, eom, 1, qos, prot);
+                uint32_t cmd =
+                    umi_pack(UMI_REQ_POSTED, 0, size, len - 1, eom, 1, m_wc_qos, m_wc_prot);
                 UmiTransaction req(cmd, addr, srcaddr, ptr, len << size);
                 if (umisb_send<UmiTransaction>(req, m_tx, false)) {
-                    // update pointers
                     total_len -= len;
                     ptr += len << size;
                     addr += len << size;
                     srcaddr += len << size;
+                    progress = true;
+                } else {
+                    m_blocked_on_tx = true;
+                }
+            }
 
-                    if (posted && progressbar) {
-                        progressbar_show(pb_state, info.size - total_len, info.size);
-                    }
+            if (!progress) {
+                if ((timeout_us >= 0) && (std::chrono::duration_cast<std::chrono::microseconds>(
+                                              std::chrono::steady_clock::now() - start)
+                                                 .count() > timeout_us)) {
+                    m_wc_data.clear();
+                    return false;
                 }
+                wait_futures(spins);
             }
+            signals.poll();
+        }
 
-            if ((!posted) && (to_ack > 0)) {
-                UmiTransaction resp(0, 0, 0, NULL, 0);
-                if (umisb_recv<UmiTransaction>(resp, m_rx, false)) {
-                    // check that the response makes sense
-                    umisb_check_resp(resp, UMI_RESP_WRITE, size, to_ack, expected_addr, error);
+        m_wc_data.clear();
+        return true;
+    }
 
-                    // update ack status
-                    to_ack -= (umi_len(resp.cmd) + 1);
-                    expected_addr += (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
+  private:
+    friend class PySbQueueSet;
+    friend class PyUmiFuture;
+    friend class PyUmiLoopback;
+    friend class PyUmiGenerator;
 
-                    if (!posted && progressbar) {
-                        progressbar_show(pb_state, info.size - to_ack, info.size);
-                    }
-                }
-            }
+    bool send_transaction(UmiTransaction& x, bool blocking) {
+        // sends (or tries to send, if blocking=false) a UMI transaction,
+        // waiting for room in the queue with the GIL released
 
-            // make sure there aren't outside signals trying to interrupt
-            check_signals();
+        if (umisb_send<UmiTransaction>(x, m_tx, false)) {
+            return true;
+        } else if ((!blocking) || (!m_tx.is_active())) {
+            return false;
         }
-        if (progressbar) {
-            progressbar_done();
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        do {
+            signals.poll();
+            m_tx.wait(spins);
+        } while (!umisb_send<UmiTransaction>(x, m_tx, false));
+
+        return true;
+    }
+
+    void wait_recv() {
+        // waits with the GIL released until there is a UMI transaction to
+        // receive, so that it can then be received without blocking
+
+        if ((!m_rx.is_active()) || m_rx.can_recv()) {
+            return;
         }
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        do {
+            signals.poll();
+            m_rx.wait(spins);
+        } while (!m_rx.can_recv());
     }
 
-    py::array read(uint64_t addr, uint32_t num, size_t bytes_per_elem, uint64_t srcaddr = 0,
-        uint32_t max_bytes = UMI_PACKET_DATA_BYTES, uint32_t qos = 0, uint32_t prot = 0,
-        bool error = true) {
+    void write_ptr(uint64_t addr, uint8_t* ptr, uint32_t total_len, uint32_t size, uint64_t srcaddr,
+        uint32_t max_bytes, bool posted, uint32_t qos, uint32_t prot, bool progressbar,
+        bool error) {
 
-        // read "num" bytes from the given address.  "num" may be any value,
-        // including greater than the length of a header packet, and values
-        // that are not powers of two.  the optional "srcaddr" argument is
-        // the source address to which responses should be sent.  this
-        // function is blocking.
+        // does the work of write() for "total_len" elements of 2^size bytes
+        // at "ptr", which is also used to write from memory-mapped files
+
+        uint8_t* start = ptr;
+        uint32_t total = total_len;
+
+        // fields only used if expecting a write response
+        uint32_t to_ack = total_len;
+        UmiResponseTracker tracker;
+
+        // determine the opcode to use
+        uint32_t opcode = posted ? UMI_REQ_POSTED : UMI_REQ_WRITE;
+
+        // determine the maximum length of an individual packet
+        uint32_t max_len = max_bytes >> size;
+        int pb_state = 0;
+
+        // responses to transactions started with start_read(), start_write(),
+        // or start_atomic() can't be told apart from the responses to this
+        // transaction, so wait for those transactions to complete first.
+        // writes held for write combining are also sent first, so that
+        // transactions stay in order.
+        wait_all();
+        flush();
+
+        // the rest doesn't touch Python objects, so other Python threads can
+        // run while waiting on the queues
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        // send all of the data
+        while ((total_len > 0) || ((!posted) && (to_ack > 0))) {
+            if (total_len > 0) {
+                // try to send a write request
+                uint32_t len = std::min(total_len, max_len);
+                uint32_t eom = (len == total_len) ? 1 : 0;
+                uint32_t cmd = umi_pack(opcode, 0, size, len - 1, eom, 1, qos, prot);
+                UmiTransaction req(cmd, addr, srcaddr, ptr, len << size);
+                if (umisb_send<UmiTransaction>(req, m_tx, false)) {
+                    if (!posted) {
+                        tracker.expect(srcaddr, len, ptr - start);
+                    }
+
+                    // update pointers
+                    total_len -= len;
+                    ptr += len << size;
+                    addr += len << size;
+                    srcaddr += len << size;
+
+                    if (posted && progressbar) {
+                        progressbar_show(pb_state, total - total_len, total);
+                    }
+                }
+            }
+
+            if (!tracker.empty()) {
+                UmiTransaction resp(0, 0, 0, NULL, 0);
+                if (umisb_recv<UmiTransaction>(resp, m_rx, false)) {
+                    // match the response with its request, checking that it
+                    // makes sense
+                    uint32_t len;
+                    tracker.match(resp, UMI_RESP_WRITE, size, error, len);
+
+                    // update ack status
+                    to_ack -= len;
+
+                    if (!posted && progressbar) {
+                        progressbar_show(pb_state, total - to_ack, total);
+                    }
+                }
+            }
+
+            // make sure there aren't outside signals trying to interrupt
+            signals.poll();
+        }
+        if (progressbar) {
+            progressbar_done();
+        }
+    }
+
+    void read_ptr(uint64_t addr, uint8_t* ptr, uint32_t num, uint32_t size, uint64_t srcaddr,
+        uint32_t max_bytes, uint32_t qos, uint32_t prot, bool error) {
+
+        // does the work of read_into() for "num" elements of 2^size bytes
+        // at "ptr", which is also used to read into memory-mapped files
+
+        // determine the maximum length of an individual packet
+        uint32_t max_len = max_bytes >> size;
+
+        // used to keep track of responses
+        uint32_t to_recv = num;
+        size_t requested = 0;
+        UmiResponseTracker tracker;
+
+        // as in write_ptr(), wait for transactions started with start_read(),
+        // start_write(), or start_atomic() to complete, and send writes held
+        // for write combining, first
+        wait_all();
+        flush();
+
+        // the rest doesn't touch Python objects, so other Python threads can
+        // run while waiting on the queues
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        while ((num > 0) || (to_recv > 0)) {
+            if (num > 0) {
+                // send read request
+                uint32_t len = std::min(num, max_len);
+                uint32_t eom = (len == num) ? 1 : 0;
+                uint32_t cmd = umi_pack(UMI_REQ_READ, 0, size, len - 1, eom, 1, qos, prot);
+                UmiTransaction request(cmd, addr, srcaddr);
+                if (umisb_send<UmiTransaction>(request, m_tx, false)) {
+                    tracker.expect(srcaddr, len, requested);
+
+                    // update pointers
+                    num -= len;
+                    addr += len << size;
+                    srcaddr += len << size;
+                    requested += len << size;
+                }
+            }
+
+            if (!tracker.empty()) {
+                // get read response, which is received into a buffer first,
+                // since where its data goes depends on which request it is for
+                uint8_t buf[UMI_PACKET_DATA_BYTES];
+                UmiTransaction resp(0, 0, 0, buf, sizeof(buf));
+                if (umisb_recv<UmiTransaction>(resp, m_rx, false)) {
+                    // match the response with its request, checking that it
+                    // makes sense
+                    uint32_t len;
+                    size_t offset = tracker.match(resp, UMI_RESP_READ, size, error, len);
+
+                    // copy the data, but no more than was requested
+                    size_t nbytes = (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
+                    memcpy(ptr + offset, buf, std::min(nbytes, (size_t)len << size));
+                    to_recv -= len;
+                }
+            }
+
+            // make sure there aren't outside signals trying to interrupt
+            signals.poll();
+        }
+    }
+
+    void transact_many(bool write, const uint64_t* addrs, const uint32_t* counts, size_t n,
+        uint8_t* ptr, size_t bytes_per_elem, uint64_t srcaddr, uint32_t max_bytes, bool posted,
+        uint32_t qos, uint32_t prot, bool error) {
+
+        // issues the requests for read_many() and write_many().  requests are
+        // sent whenever there is room in the TX queue, and responses are
+        // matched up with them as they arrive, in the same way as read_into()
+        // and write() do for a single address.  the source address keeps
+        // counting up from "srcaddr" across all of the addresses, so that
+        // each request has its own.
+
+        if ((bytes_per_elem != 1) && (bytes_per_elem != 2) && (bytes_per_elem != 4) &&
+            (bytes_per_elem != 8)) {
+            throw std::runtime_error("Unsupported value for bytes_per_elem.");
+        }
+
+        if (max_bytes > UMI_PACKET_DATA_BYTES) {
+            max_bytes = UMI_PACKET_DATA_BYTES;
+        }
+
+        if (max_bytes < bytes_per_elem) {
+            throw std::runtime_error("max_bytes must be greater than or equal to bytes_per_elem.");
+        }
+
+        uint32_t opcode = write ? (posted ? UMI_REQ_POSTED : UMI_REQ_WRITE) : UMI_REQ_READ;
+        uint32_t resp_opcode = write ? UMI_RESP_WRITE : UMI_RESP_READ;
+        bool expect_resp = !(write && posted);
+
+        // determine the size of individual items
+        uint32_t size = highest_bit(bytes_per_elem);
+
+        // determine the maximum length of an individual packet
+        uint32_t max_len = max_bytes / bytes_per_elem;
+
+        // state of the requests being sent, skipping over addresses that
+        // don't have anything to transfer
+        size_t tx_idx = 0;
+        while ((tx_idx < n) && (counts[tx_idx] == 0)) {
+            tx_idx++;
+        }
+        uint32_t tx_left = (tx_idx < n) ? counts[tx_idx] : 0;
+        uint64_t tx_addr = (tx_idx < n) ? addrs[tx_idx] : 0;
+        uint8_t* tx_ptr = ptr;
+
+        // state of the responses being received
+        uint64_t to_recv = 0;
+        if (expect_resp) {
+            for (size_t i = 0; i < n; i++) {
+                to_recv += counts[i];
+            }
+        }
+        UmiResponseTracker tracker;
+
+        // as in write_ptr(), wait for transactions started with start_read(),
+        // start_write(), or start_atomic() to complete, and send writes held
+        // for write combining, first
+        wait_all();
+        flush();
+
+        // the rest doesn't touch Python objects, so other Python threads can
+        // run while waiting on the queues
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        while ((tx_idx < n) || (to_recv > 0)) {
+            if (tx_idx < n) {
+                // try to send a request
+                uint32_t len = std::min(tx_left, max_len);
+                uint32_t eom = (len == tx_left) ? 1 : 0;
+                uint32_t cmd = umi_pack(opcode, 0, size, len - 1, eom, 1, qos, prot);
+                UmiTransaction req(cmd, tx_addr, srcaddr, write ? tx_ptr : NULL,
+                    write ? (len << size) : 0);
+                if (umisb_send<UmiTransaction>(req, m_tx, false)) {
+                    if (expect_resp) {
+                        tracker.expect(srcaddr, len, tx_ptr - ptr);
+                    }
+
+                    // update pointers
+                    tx_left -= len;
+                    tx_addr += len << size;
+                    srcaddr += len << size;
+                    tx_ptr += len << size;
+
+                    if (tx_left == 0) {
+                        // move on to the next address
+                        do {
+                            tx_idx++;
+                        } while ((tx_idx < n) && (counts[tx_idx] == 0));
+                        if (tx_idx < n) {
+                            tx_left = counts[tx_idx];
+                            tx_addr = addrs[tx_idx];
+                        }
+                    }
+                }
+            }
+
+            if (!tracker.empty()) {
+                // try to receive a response
+                uint8_t buf[UMI_PACKET_DATA_BYTES];
+                UmiTransaction resp(0, 0, 0, buf, sizeof(buf));
+                if (umisb_recv<UmiTransaction>(resp, m_rx, false)) {
+                    // match the response with its request, checking that it
+                    // makes sense
+                    uint32_t len;
+                    size_t offset = tracker.match(resp, resp_opcode, size, error, len);
+
+                    if (!write) {
+                        size_t nbytes = (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
+                        memcpy(ptr + offset, buf, std::min(nbytes, (size_t)len << size));
+                    }
+                    to_recv -= len;
+                }
+            }
+
+            // make sure there aren't outside signals trying to interrupt
+            signals.poll();
+        }
+    }
+
+    // state of a request that is waiting for responses.  the key of the
+    // request in "m_expected" is the dstaddr of the next response to it.
+
+    struct UmiSlot {
+        std::shared_ptr<UmiFutureState> state;
+        uint64_t expected_addr;
+        uint32_t to_recv;
+        size_t offset;
+        uint64_t seq; // order in which the requests were sent
+    };
+
+    void check_elem_size(size_t bytes_per_elem, uint32_t& max_bytes) {
+        if ((bytes_per_elem != 1) && (bytes_per_elem != 2) && (bytes_per_elem != 4) &&
+            (bytes_per_elem != 8)) {
+            throw std::runtime_error("Unsupported value for bytes_per_elem.");
+        }
+
+        if (max_bytes > UMI_PACKET_DATA_BYTES) {
+            max_bytes = UMI_PACKET_DATA_BYTES;
+        }
+
+        if (max_bytes < bytes_per_elem) {
+            throw std::runtime_error("max_bytes must be greater than or equal to bytes_per_elem.");
+        }
+    }
+
+    PyUmiFuture start_future(uint32_t opcode, uint32_t atype, uint32_t size, uint32_t max_len,
+        uint64_t addr, uint64_t srcaddr, uint32_t num, const uint8_t* data, uint32_t qos,
+        uint32_t prot, bool error) {
+
+        std::shared_ptr<UmiFutureState> state = std::make_shared<UmiFutureState>();
+
+        state->opcode = opcode;
+        state->atype = atype;
+        state->resp_opcode = (opcode == UMI_REQ_WRITE) ? UMI_RESP_WRITE : UMI_RESP_READ;
+        state->size = size;
+        state->max_len = max_len;
+        state->qos = qos;
+        state->prot = prot;
+        state->error = error;
+        state->addr = addr;
+        state->srcaddr = srcaddr;
+        state->to_send = num;
+        state->to_recv = (opcode == UMI_REQ_POSTED) ? 0 : num;
+        state->offset = 0;
+
+        if (data) {
+            state->data.assign(data, data + (num << size));
+        } else {
+            state->data.resize(num << size);
+        }
+
+        if (num > 0) {
+            // writes held for write combining go out first
+            flush();
+
+            m_pending.push_back(state);
+            pump_futures();
+        }
+
+        return PyUmiFuture(this, state);
+    }
+
+    void flush_expired() {
+        // sends the writes held for write combining if they have been held
+        // for longer than the timeout given to set_write_combining()
+
+        if (!m_wc_data.empty() && (m_wc_timeout_us >= 0) &&
+            (std::chrono::duration_cast<std::chrono::microseconds>(
+                 std::chrono::steady_clock::now() - m_wc_start)
+                    .count() > m_wc_timeout_us)) {
+            flush();
+        }
+    }
+
+    bool combine_write(uint64_t addr, const uint8_t* data, size_t nbytes, uint64_t srcaddr,
+        uint32_t size, uint32_t max_bytes, uint32_t qos, uint32_t prot) {
+
+        // tries to add a posted write to the write-combining buffer,
+        // returning false if it should be sent right away instead.  writes
+        // are combined if they could be merged into the same UMI packets by
+        // PyUmiPacket::merge(): they must have the same SIZE, QOS, and PROT,
+        // and cover adjacent addresses.  a write that overlaps the buffer
+        // isn't combined with it, since that would drop the earlier write to
+        // the overlapping addresses.  since posted writes aren't responded
+        // to, they only need the same srcaddr, rather than consecutive ones.
+
+        if ((m_wc_limit == 0) || (nbytes > m_wc_limit)) {
+            return false;
+        }
+
+        flush_expired();
+
+        if (!m_wc_data.empty()) {
+            uint64_t start = m_wc_addr;
+            uint64_t end = m_wc_addr + m_wc_data.size();
+
+            if ((srcaddr == m_wc_srcaddr) && (size == m_wc_size) && (max_bytes == m_wc_max_bytes) &&
+                (qos == m_wc_qos) && (prot == m_wc_prot) &&
+                (((addr == end) || ((addr + nbytes) == start))) &&
+                ((m_wc_data.size() + nbytes) <= m_wc_limit)) {
+                if (addr == end) {
+                    m_wc_data.insert(m_wc_data.end(), data, data + nbytes);
+                } else {
+                    m_wc_data.insert(m_wc_data.begin(), data, data + nbytes);
+                    m_wc_addr = addr;
+                }
+
+                if (m_wc_data.size() >= m_wc_limit) {
+                    flush();
+                }
+                return true;
+            }
+
+            flush();
+        }
+
+        // start a new buffer with this write
+        m_wc_addr = addr;
+        m_wc_srcaddr = srcaddr;
+        m_wc_size = size;
+        m_wc_max_bytes = max_bytes;
+        m_wc_qos = qos;
+        m_wc_prot = prot;
+        m_wc_start = std::chrono::steady_clock::now();
+        m_wc_data.assign(data, data + nbytes);
+
+        if (m_wc_data.size() >= m_wc_limit) {
+            flush();
+        }
+        return true;
+    }
+
+    bool pump_futures() {
+        // sends as many of the requests of started transactions as there is
+        // room for, and matches up the responses that have arrived with the
+        // requests that they are for.  returns true if anything was sent or
+        // received.  doesn't touch Python objects, so it can be called with
+        // the GIL released.
+
+        bool progress = false;
+        m_blocked_on_tx = false;
+
+        while (!m_pending.empty()) {
+            UmiFutureState& st = *m_pending.front();
+
+            uint32_t len = std::min(st.to_send, st.max_len);
+            uint32_t eom = (len == st.to_send) ? 1 : 0;
+            uint32_t cmd = umi_pack(st.opcode, st.atype, st.size, len - 1, eom, 1, st.qos, st.prot);
+
+            // requests that will be responded to are tagged with a free slot
+            uint64_t srcaddr = st.srcaddr;
+            bool tagged = (st.opcode != UMI_REQ_POSTED);
+            uint32_t slot = 0;
+            if (tagged) {
+                if (m_free_slots.empty()) {
+                    break;
+                }
+                slot = m_free_slots.back();
+                srcaddr += (uint64_t)slot << m_tag_shift;
+                if (m_expected.count(srcaddr) > 0) {
+                    // the tagged address clashes with a request that is still
+                    // outstanding, so wait until that one completes
+                    break;
+                }
+            }
+
+            bool has_data = (st.opcode != UMI_REQ_READ);
+            UmiTransaction req(cmd, st.addr, srcaddr, has_data ? &st.data[st.offset] : NULL,
+                has_data ? (len << st.size) : 0);
+            if (!umisb_send<UmiTransaction>(req, m_tx, false)) {
+                m_blocked_on_tx = true;
+                break;
+            }
+
+            if (tagged) {
+                m_free_slots.pop_back();
+                m_slots[slot].state = m_pending.front();
+                m_slots[slot].expected_addr = srcaddr;
+                m_slots[slot].to_recv = len;
+                m_slots[slot].offset = st.offset;
+                m_slots[slot].seq = m_next_seq++;
+                m_expected[srcaddr] = slot;
+            }
+
+            st.to_send -= len;
+            st.addr += len << st.size;
+            st.offset += len << st.size;
+            progress = true;
+
+            if (st.to_send == 0) {
+                m_pending.pop_front();
+            }
+        }
+
+        while (!m_expected.empty()) {
+            uint8_t buf[UMI_PACKET_DATA_BYTES];
+            UmiTransaction resp(0, 0, 0, buf, sizeof(buf));
+            if (!umisb_recv<UmiTransaction>(resp, m_rx, false)) {
+                break;
+            }
+            progress = true;
+
+            auto it = m_expected.find(resp.dstaddr);
+            if (it == m_expected.end()) {
+                // as in UmiResponseTracker, a response that doesn't match any
+                // request is taken to be for the oldest one, and the mismatch
+                // is reported below as an error (or a warning, if error=false)
+                // on that request's transaction
+                it = std::min_element(m_expected.begin(), m_expected.end(),
+                    [this](const auto& a, const auto& b) {
+                        return m_slots[a.second].seq < m_slots[b.second].seq;
+                    });
+            }
+
+            uint32_t slot = it->second;
+            m_expected.erase(it);
+
+            UmiSlot& s = m_slots[slot];
+            UmiFutureState& st = *s.state;
+
+            // errors are reported when the result of the future is requested
+            try {
+                umisb_check_resp<UmiTransaction>(resp, st.resp_opcode, st.size, s.to_recv,
+                    s.expected_addr, st.error);
+            } catch (std::runtime_error& e) {
+                if (st.errmsg.empty()) {
+                    st.errmsg = e.what();
+                }
+            }
+
+            uint32_t len = std::min(umi_len(resp.cmd) + 1, s.to_recv);
+            size_t nbytes = len << st.size;
+
+            if (st.opcode != UMI_REQ_WRITE) {
+                size_t resp_bytes = (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
+                memcpy(&st.data[s.offset], buf,
+                    std::min(nbytes, std::min(resp_bytes, sizeof(buf))));
+            }
+
+            s.to_recv -= len;
+            s.expected_addr += nbytes;
+            s.offset += nbytes;
+            st.to_recv -= len;
+
+            if (s.to_recv == 0) {
+                s.state.reset();
+                m_free_slots.push_back(slot);
+            } else {
+                m_expected[s.expected_addr] = slot;
+            }
+        }
+
+        return progress;
+    }
+
+    void wait_futures(int& spins) {
+        // called when pump_futures() couldn't make progress, to wait for
+        // room in the TX queue if that is what held it up, and otherwise
+        // for a response
+
+        if (m_blocked_on_tx) {
+            m_tx.wait(spins);
+        } else {
+            m_rx.wait(spins);
+        }
+    }
+
+    void wait_future(UmiFutureState* state) {
+        // waits with the GIL released until the given transaction completes
+
+        pump_futures();
+        if (state->done()) {
+            return;
+        }
+
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        int spins = 0;
+        while (!state->done()) {
+            if (!pump_futures()) {
+                wait_futures(spins);
+            }
+            signals.poll();
+        }
+    }
+
+    // transactions that have requests that haven't been sent yet, in order
+    std::deque<std::shared_ptr<UmiFutureState>> m_pending;
+
+    // requests that are waiting for responses, indexed by their tag
+    std::vector<UmiSlot> m_slots;
+    std::vector<uint32_t> m_free_slots;
+    std::unordered_map<uint64_t, uint32_t> m_expected;
+
+    uint32_t m_tag_shift;
+    bool m_blocked_on_tx;
+    uint64_t m_next_seq = 0;
+
+    // write-combining buffer, which holds the data for addresses starting
+    // at "m_wc_addr", and the fields shared by the writes combined in it
+    size_t m_wc_limit = 0;
+    long m_wc_timeout_us = -1;
+    std::vector<uint8_t> m_wc_data;
+    uint64_t m_wc_addr;
+    uint64_t m_wc_srcaddr;
+    uint32_t m_wc_size;
+    uint32_t m_wc_max_bytes;
+    uint32_t m_wc_qos;
+    uint32_t m_wc_prot;
+    std::chrono::steady_clock::time_point m_wc_start;
+
+    SBTX m_tx;
+    SBRX m_rx;
+    std::recursive_mutex m_mutex;
+};
+
+// defined here, rather than in PySbQueueSet, since it needs the definition of PyUmi
+
+int PySbQueueSet::add_umi(PyUmi& umi, bool tx) {
+    if (tx) {
+        return m_set.add(umi.m_tx);
+    } else {
+        return m_set.add(umi.m_rx);
+    }
+}
+
+// PyUmiFuture methods, which need the definition of PyUmi
+
+PyUmiFuture::PyUmiFuture(PyUmi* umi, std::shared_ptr<UmiFutureState> state)
+    : m_owner(py::cast(umi, py::return_value_policy::reference)), m_umi(umi), m_state(state) {}
+
+bool PyUmiFuture::done() {
+    // checks for responses without waiting
+    ObjectLock lock(m_umi->m_mutex);
+    m_umi->flush_expired();
+    if (!m_state->done()) {
+        m_umi->pump_futures();
+    }
+    return m_state->done();
+}
+
+py::object PyUmiFuture::result() {
+    // waits for the transaction to complete, and then returns the data
+    // read (for reads and atomics) or None (for writes)
+
+    ObjectLock lock(m_umi->m_mutex);
+
+    m_umi->wait_future(m_state.get());
+
+    if (!m_state->errmsg.empty()) {
+        throw std::runtime_error(m_state->errmsg);
+    }
+
+    if ((m_state->opcode == UMI_REQ_WRITE) || (m_state->opcode == UMI_REQ_POSTED)) {
+        return py::none();
+    }
+
+    py::array result =
+        alloc_pybind_array(m_state->data.size() >> m_state->size, 1 << m_state->size);
+    memcpy(result.mutable_data(), m_state->data.data(), m_state->data.size());
+
+    return result;
+}
+
+// UmiLoopbackEntry: a UMI transaction built by merging packets, which is used
+// by PyUmiLoopback for both the packets sent and the packets received.  it
+// follows the same rules as PyUmiPacket::merge() and PyUmiPacket::operator==,
+// but keeps its data in a vector, so that it can be used with the GIL released.
+
+struct UmiLoopbackEntry {
+    void assign(const umi_packet& p) {
+        cmd = p.cmd;
+        dstaddr = p.dstaddr;
+        srcaddr = p.srcaddr;
+        data.assign(p.data, p.data + data_nbytes(p.cmd));
+    }
+
+    bool can_merge(const umi_packet& p) {
+        uint32_t opcode = umi_opcode(cmd);
+
+        if (!allows_umi_merge(opcode) || (umi_ex(cmd) != 0) || umi_eom(cmd)) {
+            return false;
+        }
+
+        // check that all fields except EOM and LEN match
+        uint32_t mask = 0xffffffff;
+        set_umi_eom(&mask, 0);
+        set_umi_len(&mask, 0);
+        if ((cmd & mask) != (p.cmd & mask)) {
+            return false;
+        }
+
+        // addresses must be next sequentially
+        uint32_t nbytes = (umi_len(cmd) + 1) << umi_size(cmd);
+        return (p.dstaddr == (dstaddr + nbytes)) && (p.srcaddr == (srcaddr + nbytes));
+    }
+
+    bool merge(const umi_packet& p) {
+        if (!can_merge(p)) {
+            return false;
+        }
+
+        data.insert(data.end(), p.data, p.data + data_nbytes(p.cmd));
+
+        set_umi_len(&cmd, umi_len(cmd) + umi_len(p.cmd) + 1);
+        set_umi_eom(&cmd, umi_eom(p.cmd));
+
+        return true;
+    }
+
+    bool closed() {
+        // true if no more packets can be merged into this one
+        return !allows_umi_merge(umi_opcode(cmd)) || (umi_ex(cmd) != 0) || umi_eom(cmd);
+    }
+
+    bool matches(UmiLoopbackEntry& other) {
+        if (((cmd & 0xff) == 0) && ((other.cmd & 0xff) == 0)) {
+            // both are invalid
+            return true;
+        }
+
+        if (cmd != other.cmd) {
+            return false;
+        }
+
+        uint32_t opcode = umi_opcode(cmd);
+
+        if ((opcode == UMI_REQ_LINK) || (opcode == UMI_RESP_LINK)) {
+            return true;
+        }
+
+        if (dstaddr != other.dstaddr) {
+            return false;
+        }
+
+        if (is_umi_req(opcode) && (srcaddr != other.srcaddr)) {
+            return false;
+        }
+
+        return data == other.data;
+    }
+
+    static uint32_t data_nbytes(uint32_t cmd) {
+        if (has_umi_data(umi_opcode(cmd))) {
+            return std::min((umi_len(cmd) + 1) << umi_size(cmd), (uint32_t)UMI_PACKET_DATA_BYTES);
+        } else {
+            return 0;
+        }
+    }
+
+    // used by umi_transaction_as_str()
+
+    size_t nbytes() {
+        return data.size();
+    }
+
+    uint8_t* ptr() {
+        return data.data();
+    }
+
+    uint32_t cmd;
+    uint64_t dstaddr;
+    uint64_t srcaddr;
+    std::vector<uint8_t> data;
+};
+
+// PyUmiGenerator: generates random UMI packets in C++, so that stress and
+// performance tests can run without Python in the per-packet loop.  opcodes,
+// sizes, and lengths are drawn with the given weights, and addresses are drawn
+// uniformly from the given (inclusive) ranges, aligned to "align" bytes, or to
+// the word size if align is negative, so that the whole packet fits in the
+// range.  ATYPE is 0 unless weights are given for it.  with the default
+// arguments, fields have the same distribution as with random_umi_packet(),
+// except that addresses at which the packet wouldn't fit are left out.
+// packets can be sent straight to a PyUmi, optionally at a target rate, or
+// returned as a NumPy batch.
+
+class PyUmiGenerator {
+  public:
+    PyUmiGenerator(uint64_t seed = 0, uint32_t max_bytes = UMI_PACKET_DATA_BYTES,
+        py::dict opcodes = py::dict(), std::vector<double> sizes = {},
+        std::vector<double> lens = {}, std::vector<double> atypes = {}, uint64_t dstaddr_min = 0,
+        uint64_t dstaddr_max = UINT64_MAX, uint64_t srcaddr_min = 0,
+        uint64_t srcaddr_max = UINT64_MAX, int64_t align = -1, uint32_t qos = 0, uint32_t prot = 0,
+        uint32_t eom = 1, uint32_t eof = 1, uint32_t ex = 0)
+        : m_rng(seed) {
+
+        if (opcodes.size() == 0) {
+            for (uint32_t opcode : {UMI_REQ_WRITE, UMI_REQ_POSTED, UMI_REQ_READ, UMI_RESP_WRITE,
+                     UMI_RESP_READ, UMI_REQ_ATOMIC}) {
+                m_opcodes.push_back(opcode);
+                m_opcode_weights.push_back(1);
+            }
+        } else {
+            for (auto item : opcodes) {
+                // keys may be UmiCmd values or plain integers
+                m_opcodes.push_back(py::int_(py::reinterpret_borrow<py::object>(item.first)));
+                m_opcode_weights.push_back(item.second.cast<double>());
+            }
+        }
+
+        m_sizes = sizes.empty() ? std::vector<double>(4, 1) : sizes;
+        m_lens = lens;
+
+        // ATYPE is 8 bits wide, and is always 0 unless weights are given
+        std::vector<double> atype_weights = atypes.empty() ? std::vector<double>(1, 1) : atypes;
+        m_atype_dist =
+            make_dist(atype_weights, std::min(atype_weights.size(), (size_t)256), "atype");
+
+        if ((align > 0) && ((align & (align - 1)) != 0)) {
+            throw std::runtime_error("align must be a power of two.");
+        }
+
+        m_dstaddr_min = dstaddr_min;
+        m_dstaddr_max = dstaddr_max;
+        m_srcaddr_min = srcaddr_min;
+        m_srcaddr_max = srcaddr_max;
+        m_align = align;
+
+        m_qos = qos;
+        m_prot = prot;
+        m_eom = eom;
+        m_eof = eof;
+        m_ex = ex;
+
+        set_max_bytes(max_bytes);
+    }
+
+    void set_max_bytes(uint32_t max_bytes) {
+        // sets up the distributions of opcodes, sizes, and lengths, leaving
+        // out sizes and lengths that don't fit in max_bytes
+
+        if ((max_bytes < 1) || (max_bytes > UMI_PACKET_DATA_BYTES)) {
+            throw std::runtime_error("max_bytes must be between 1 and 32.");
+        }
+
+        m_opcode_dist = make_dist(m_opcode_weights, m_opcode_weights.size(), "opcode");
+
+        std::vector<double> sizes(m_sizes);
+        for (uint32_t size = 0; size < sizes.size(); size++) {
+            if ((size > 3) || ((1u << size) > max_bytes)) {
+                sizes[size] = 0;
+            }
+        }
+        m_size_dist = make_dist(sizes, sizes.size(), "size");
+
+        // lengths are drawn uniformly unless weights are given
+        m_len_dists.clear();
+        for (uint32_t size = 0; size < sizes.size(); size++) {
+            uint32_t max_len = (size <= 3) ? (max_bytes >> size) : 0;
+            if (sizes[size] == 0) {
+                m_len_dists.emplace_back();
+            } else if (m_lens.empty()) {
+                m_len_dists.push_back(make_dist(std::vector<double>(max_len, 1), max_len, "len"));
+            } else {
+                m_len_dists.push_back(make_dist(m_lens, max_len, "len"));
+            }
+        }
+
+        m_max_bytes = max_bytes;
+    }
+
+    void next(umi_packet& p) {
+        uint32_t opcode = m_opcodes[m_opcode_dist(m_rng)];
+        uint32_t size = m_size_dist(m_rng);
+        uint32_t len = m_len_dists[size](m_rng);
+        uint32_t atype = m_atype_dist(m_rng);
+
+        p.cmd = umi_pack(opcode, atype, size, len, m_eom, m_eof, m_qos, m_prot, m_ex);
+
+        // packets must fit in the address ranges.  atomics hold a single
+        // word, and their ATYPE takes the place of LEN in the command.
+        uint32_t nbytes = (opcode == UMI_REQ_ATOMIC) ? (1u << size) : ((len + 1) << size);
+        uint64_t align = (m_align > 0) ? m_align : (1ull << size);
+        p.dstaddr = random_addr(m_dstaddr_min, m_dstaddr_max, nbytes, align, "dstaddr");
+        p.srcaddr = random_addr(m_srcaddr_min, m_srcaddr_max, nbytes, align, "srcaddr");
+
+        for (size_t i = 0; i < UMI_PACKET_DATA_BYTES; i += 8) {
+            uint64_t r = m_rng();
+            memcpy(p.data + i, &r, 8);
+        }
+    }
+
+    py::array fill(size_t n) {
+        // returns a NumPy array of "n" packets of type umi_packet_dtype()
+
+        py::array arr = py::module_::import("numpy").attr("empty")(n, umi_packet_dtype());
+        umi_packet* p = (umi_packet*)arr.mutable_data();
+
+        {
+            py::gil_scoped_release release;
+
+            for (size_t i = 0; i < n; i++) {
+                next(p[i]);
+            }
+        }
+
+        return arr;
+    }
+
+    uint64_t send(PyUmi& umi, uint64_t n, double rate = -1);
+
+  private:
+    std::discrete_distribution<uint32_t> make_dist(const std::vector<double>& weights, size_t n,
+        std::string name) {
+
+        // uses the first "n" weights, which must not all be zero
+        std::vector<double> w(n, 0);
+        std::copy_n(weights.begin(), std::min(n, weights.size()), w.begin());
+
+        if (std::all_of(w.begin(), w.end(), [](double x) { return x <= 0; })) {
+            throw std::runtime_error(
+                "No " + name + " values allowed by the weights given and max_bytes.");
+        }
+
+        return std::discrete_distribution<uint32_t>(w.begin(), w.end());
+    }
+
+    uint64_t random_addr(uint64_t min, uint64_t max, uint32_t nbytes, uint64_t align,
+        const char* name) {
+
+        // first and last aligned addresses at which "nbytes" bytes fit
+        uint64_t first = (min + (align - 1)) & ~(align - 1);
+        if ((first < min) || (max < first) || ((max - first) < (nbytes - 1))) {
+            throw std::runtime_error(std::string(name) + " range is too small for the packet.");
+        }
+        uint64_t last = (max - (nbytes - 1)) & ~(align - 1);
+
+        uint64_t k = std::uniform_int_distribution<uint64_t>(0, (last - first) / align)(m_rng);
+        return first + (k * align);
+    }
+
+    std::mt19937_64 m_rng;
+
+    std::vector<uint32_t> m_opcodes;
+    std::vector<double> m_opcode_weights;
+    std::vector<double> m_sizes;
+    std::vector<double> m_lens;
+    std::discrete_distribution<uint32_t> m_opcode_dist;
+    std::discrete_distribution<uint32_t> m_size_dist;
+    std::vector<std::discrete_distribution<uint32_t>> m_len_dists;
+    std::discrete_distribution<uint32_t> m_atype_dist;
+    uint32_t m_max_bytes;
+
+    uint64_t m_dstaddr_min;
+    uint64_t m_dstaddr_max;
+    uint64_t m_srcaddr_min;
+    uint64_t m_srcaddr_max;
+    int64_t m_align;
+
+    uint32_t m_qos;
+    uint32_t m_prot;
+    uint32_t m_eom;
+    uint32_t m_eof;
+    uint32_t m_ex;
+};
+
+uint64_t PyUmiGenerator::send(PyUmi& umi, uint64_t n, double rate) {
+    // sends "n" packets to a PyUmi, at up to "rate" packets per second if rate
+    // is positive.  returns once all of the packets have been sent.
+
+    ObjectLock lock(umi.m_mutex);
+
+    umi.wait_all();
+    umi.flush();
+
+    py::gil_scoped_release release;
+    SignalPoller signals;
+
+    auto period = std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+        std::chrono::duration<double>((rate > 0) ? (1.0 / rate) : 0));
+    auto slack = std::chrono::microseconds(SB_MAX_RATE_QUANTUM_US);
+    auto slice = std::chrono::microseconds(SB_SIGNAL_POLL_US);
+    auto next_time = std::chrono::steady_clock::now();
+
+    umi_packet p;
+
+    for (uint64_t i = 0; i < n; i++) {
+        next(p);
+
+        if (rate > 0) {
+            // keep to the average rate, sleeping while ahead of it.  small
+            // delays are made up for, but after a stall (e.g., a full queue)
+            // the schedule restarts from now, as in max_rate_tick(), so that
+            // sending doesn't burst to catch up.
+            auto now = std::chrono::steady_clock::now();
+            if (now > (next_time + slack)) {
+                next_time = now;
+            }
+            while (now < next_time) {
+                std::this_thread::sleep_for(
+                    std::min<std::chrono::steady_clock::duration>(next_time - now, slice));
+                signals.poll();
+                now = std::chrono::steady_clock::now();
+            }
+            next_time += period;
+        }
+
+        UmiTransaction req(p.cmd, p.dstaddr, p.srcaddr, p.data, sizeof(p.data));
+        int spins = 0;
+        while (!umisb_send<UmiTransaction>(req, umi.m_tx, false)) {
+            if (!umi.m_tx.is_active()) {
+                return i;
+            }
+            signals.poll();
+            umi.m_tx.wait(spins);
+        }
+    }
+
+    return n;
+}
+
+// PyUmiLoopback: checks a block that may split and merge UMI packets, such as
+// a FIFO or a splitter, by sending packets into it through a PyUmi and checking
+// that the packets received back are equivalent under the UMI split/merge
+// rules.  packets sent are merged as far as possible and then kept in a ring
+// of "history" entries until they are matched; when the ring is full, sending
+// stops until more packets have been received, so that memory use is bounded
+// no matter how many packets are checked.  everything runs in C++ with the GIL
+// released, so the Python interpreter isn't involved in each packet.
+
+class PyUmiLoopback {
+  public:
+    PyUmiLoopback(PyUmi& umi, uint32_t history = 1024, uint64_t seed = 0)
+        : m_umi(umi), m_hist(std::max(history, 1u)), m_random(seed) {
+
+        m_head = 0;
+        m_count = 0;
+        m_tx_open = false;
+        m_rx_open = false;
+        m_sent = 0;
+        m_checked = 0;
+    }
+
+    void send_batch(py::array packets) {
+        // sends the packets in a NumPy array of type umi_packet_dtype(),
+        // checking packets received along the way.  returns once all of the
+        // packets have been sent; call finish() to wait for the rest.
+
+        py::array arr =
+            py::module_::import("numpy").attr("ascontiguousarray")(packets, umi_packet_dtype());
+
+        const umi_packet* p = (const umi_packet*)arr.data();
+        size_t n = arr.size();
+
+        for (size_t i = 0; i < n; i++) {
+            check_packet(p[i]);
+        }
+
+        run(n, [&](size_t i) -> const umi_packet& { return p[i]; });
+    }
+
+    void send_random(uint64_t n, uint32_t max_bytes = UMI_PACKET_DATA_BYTES) {
+        // sends "n" random packets from a generator with the default arguments
+
+        m_random.set_max_bytes(max_bytes);
+        send_generated(m_random, n);
+    }
+
+    void send_generated(PyUmiGenerator& gen, uint64_t n) {
+        // sends "n" packets from a PyUmiGenerator
+
+        umi_packet p;
+        uint64_t generated = 0;
+
+        run(n, [&](size_t i) -> const umi_packet& {
+            // the same packet is returned until it has been sent
+            if (generated == i) {
+                gen.next(p);
+                generated++;
+            }
+            return p;
+        });
+    }
+
+    void finish() {
+        // waits until all of the packets sent have been received and checked
+
+        ObjectLock lock(m_umi.m_mutex);
 
-        if (max_bytes < bytes_per_elem) {
-            throw std::runtime_error("max_bytes must be greater than or equal to bytes_per_elem.");
-        }
+        py::gil_scoped_release release;
+        SignalPoller signals;
 
-        // create a buffer to hold the result
-        py::array result = alloc_pybind_array(num, bytes_per_elem);
+        if (m_tx_open) {
+            // the last packet goes into the history even if more could be
+            // merged into it, once there is room for it
+            while (m_count == m_hist.size()) {
+                try_recv();
+                signals.poll();
+            }
+            push_tx();
+        }
 
-        if (num == 0) {
-            // nothing to read, so just return the empty array
-            return result;
+        while (m_count > 0) {
+            try_recv();
+            signals.poll();
         }
+    }
 
-        // otherwise get the data pointer and read the data in
-        // power-of-two chunks, with the size of each chunk being the
-        // largest that is possible while remaining aligned, and
-        // without exceeding the number of remaining bytes.
+    uint64_t sent() {
+        return m_sent;
+    }
 
-        py::buffer_info info = py::buffer(result).request();
-        uint8_t* ptr = (uint8_t*)info.ptr;
+    uint64_t checked() {
+        return m_checked;
+    }
 
-        // determine the size of individual items
-        uint32_t size = highest_bit(bytes_per_elem);
+  private:
+    template <typename F> void run(size_t n, F packet) {
+        // sends "n" packets, given by packet(i), receiving and checking
+        // packets whenever possible
 
-        // determine the maximum length of an individual packet
-        uint32_t max_len = max_bytes / bytes_per_elem;
+        ObjectLock lock(m_umi.m_mutex);
 
-        // used to keep track of responses
-        uint32_t to_recv = num;
-        uint64_t expected_addr = srcaddr;
+        // other traffic from this PyUmi would be mixed up with the loopback
+        m_umi.wait_all();
+        m_umi.flush();
 
-        while ((num > 0) || (to_recv > 0)) {
-            if (num > 0) {
-                // send read request
-                uint32_t len = std::min(num, max_len);
-                uint32_t eom = (len == num) ? 1 : 0;
-                uint32_t cmd = umi_pack(UMI_REQ_READ, 0, size, len - 1, eom, 1, qos, prot);
-                UmiTransaction request(cmd, addr, srcaddr);
-                if (umisb_send<UmiTransaction>(request, m_tx, false)) {
-                    // update pointers
-                    num -= len;
-                    addr += len << size;
-                    srcaddr += len << size;
-                }
+        py::gil_scoped_release release;
+        SignalPoller signals;
+
+        size_t i = 0;
+        while (i < n) {
+            if (try_send(packet(i))) {
+                i++;
             }
+            try_recv();
+            signals.poll();
+        }
+    }
 
-            if (to_recv > 0) {
-                // get read response
-                uint32_t max_resp_bytes = to_recv << size;
-                UmiTransaction resp(0, 0, 0, ptr, max_resp_bytes);
-                if (umisb_recv<UmiTransaction>(resp, m_rx, false)) {
-                    // check that the reply makes sense
-                    umisb_check_resp<UmiTransaction>(resp, UMI_RESP_READ, size, to_recv,
-                        expected_addr, error);
+    bool try_send(const umi_packet& p) {
+        // packets that can't be merged into the current one start a new
+        // entry in the history, which has to wait for room in the ring
+        bool push = m_tx_open && !m_tx.can_merge(p);
+        if (push && (m_count == m_hist.size())) {
+            return false;
+        }
 
-                    // update pointers
-                    ptr += (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
-                    expected_addr += (umi_len(resp.cmd) + 1) << umi_size(resp.cmd);
-                    to_recv -= (umi_len(resp.cmd) + 1);
-                }
-            }
+        UmiTransaction req(p.cmd, p.dstaddr, p.srcaddr, (uint8_t*)p.data, sizeof(p.data));
+        if (!umisb_send<UmiTransaction>(req, m_umi.m_tx, false)) {
+            return false;
+        }
 
-            // make sure there aren't outside signals trying to interrupt
-            check_signals();
+        if (push) {
+            push_tx();
         }
 
-        return result;
+        if (m_tx_open) {
+            m_tx.merge(p);
+        } else {
+            m_tx.assign(p);
+            m_tx_open = true;
+        }
+
+        m_sent++;
+        return true;
     }
 
-    py::array atomic(uint64_t addr, py::array_t<uint8_t> data, uint32_t opcode,
-        uint64_t srcaddr = 0, uint32_t qos = 0, uint32_t prot = 0, bool error = true) {
-        // input validation
+    bool try_recv() {
+        // a packet received that nothing more can be merged into has to wait
+        // for the packets sent to catch up before anything else is received
+        if (m_rx_open && m_rx.closed() && (m_count == 0)) {
+            return false;
+        }
 
-        uint32_t num = data.nbytes();
+        uint8_t buf[UMI_PACKET_DATA_BYTES];
+        UmiTransaction resp(0, 0, 0, buf, sizeof(buf));
+        if (!umisb_recv<UmiTransaction>(resp, m_umi.m_rx, false)) {
+            return false;
+        }
 
-        if (num == 0) {
-            // nothing to read, so just return the empty array
-            return py::array_t<uint8_t>(0);
+        umi_packet p;
+        p.cmd = resp.cmd;
+        p.dstaddr = resp.dstaddr;
+        p.srcaddr = resp.srcaddr;
+        memcpy(p.data, buf, sizeof(p.data));
+
+        if (!m_rx_open) {
+            m_rx.assign(p);
+            m_rx_open = true;
+        } else if (!m_rx.merge(p)) {
+            UmiLoopbackEntry rxp;
+            rxp.assign(p);
+            mismatch(rxp);
         }
 
-        uint32_t size = highest_bit(num);
+        check();
+        return true;
+    }
 
-        if (size > 3) {
-            throw std::runtime_error("Atomic operand must be 8 bytes or fewer.");
+    void push_tx() {
+        std::swap(m_hist[(m_head + m_count) % m_hist.size()], m_tx);
+        m_count++;
+        m_tx_open = false;
+        check();
+    }
+
+    void check() {
+        // compares the packet received so far with the oldest packet sent
+
+        if (!m_rx_open || (m_count == 0)) {
+            return;
         }
 
-        if (num != (1 << size)) {
-            throw std::runtime_error(
-                "Width of atomic operand must be a power of two number of bytes.");
+        UmiLoopbackEntry& expected = m_hist[m_head];
+
+        if (m_rx.matches(expected)) {
+            m_head = (m_head + 1) % m_hist.size();
+            m_count--;
+            m_rx_open = false;
+            m_checked++;
+        } else if (m_rx.closed()) {
+            // nothing more can be merged into the packet received, so it
+            // will never match
+            mismatch(m_rx);
         }
+    }
 
-        // format the request
-        uint32_t cmd = umi_pack(UMI_REQ_ATOMIC, opcode, size, 0, 1, 1, qos, prot);
-        PyUmiPacket request(cmd, addr, srcaddr, data);
+    void mismatch(UmiLoopbackEntry& rxp) {
+        std::stringstream stream;
+        stream << "Mismatch after " << m_checked << " matching packets." << std::endl;
+        // packets received before the oldest packet sent was added to the
+        // history belong to the packet still being merged
+        UmiLoopbackEntry& expected = (m_count > 0) ? m_hist[m_head] : m_tx;
+        stream << "* Expected *" << std::endl << umi_transaction_as_str(expected);
+        stream << std::endl << "* Received *" << std::endl;
+        if (m_rx_open && (&rxp != &m_rx)) {
+            stream << umi_transaction_as_str(m_rx) << std::endl << "* followed by *" << std::endl;
+        }
+        stream << umi_transaction_as_str(rxp);
+        throw std::runtime_error(stream.str());
+    }
 
-        // send the request
-        umisb_send<PyUmiPacket>(request, m_tx, true, &check_signals);
+    void check_packet(const umi_packet& p) {
+        uint32_t opcode = umi_opcode(p.cmd);
+        if (has_umi_data(opcode) &&
+            (((umi_len(p.cmd) + 1) << umi_size(p.cmd)) > UMI_PACKET_DATA_BYTES)) {
+            throw std::runtime_error("(len+1)<<size cannot exceed the data size of a umi_packet.");
+        }
+    }
 
-        // get the response
-        PyUmiPacket resp;
-        umisb_recv<PyUmiPacket>(resp, m_rx, true, &check_signals);
+    PyUmi& m_umi;
 
-        // check that the response makes sense
-        umisb_check_resp(resp, UMI_RESP_READ, size, 1, srcaddr, error);
+    // packets sent, merged, and waiting to be matched
+    std::vector<UmiLoopbackEntry> m_hist;
+    size_t m_head;
+    size_t m_count;
 
-        // return the result of the operation
-        return resp.data;
-    }
+    // packets being merged on each side
+    UmiLoopbackEntry m_tx;
+    bool m_tx_open;
+    UmiLoopbackEntry m_rx;
+    bool m_rx_open;
 
-  private:
-    SBTX m_tx;
-    SBRX m_rx;
+    PyUmiGenerator m_random;
+    uint64_t m_sent;
+    uint64_t m_checked;
 };
 
 // convenience function to delete old queues from previous runs
@@ -773,6 +2961,77 @@ void delete_queues(const std::vector<std::string>& uri_list) {
     }
 }
 
+py::object queue_stats(std::string uri) {
+    // returns the performance counters of an existing queue, which
+    // may be in use by other processes, or None if there is no such queue
+    spsc_queue_stats stats;
+
+    if (!spsc_read_stats(uri.c_str(), &stats)) {
+        return py::none();
+    }
+
+    return stats_to_dict(stats);
+}
+
+py::object queue_info(std::string uri) {
+    // returns the layout of an existing queue and the processes attached
+    // to it, or None if the queue doesn't exist or has no valid header
+    spsc_queue_header hdr;
+
+    if (!spsc_read_header(uri.c_str(), &hdr)) {
+        return py::none();
+    }
+
+    py::dict info;
+    info["version"] = hdr.version;
+    info["capacity"] = hdr.capacity;
+    info["packet_size"] = hdr.packet_size;
+    info["data_size"] = sb_data_size(hdr.packet_size);
+    info["tx_pid"] = hdr.tx_pid;
+    info["rx_pid"] = hdr.rx_pid;
+    return info;
+}
+
+void configure_governor(std::string uri, double max_rate = -1, long max_lag = -1) {
+    // creates a rate governor for simulators to join, or changes the budget
+    // of an existing one (see governor.h)
+    uint64_t rate = (max_rate > 0) ? (uint64_t)(max_rate + 0.5) : 0;
+    int64_t lag = (max_lag > 0) ? max_lag : 0;
+
+    if (!sb_governor_configure(uri.c_str(), rate, lag)) {
+        throw std::runtime_error("Could not configure rate governor " + uri);
+    }
+}
+
+py::object governor_info(std::string uri) {
+    // returns the budget of a rate governor and the progress of each of
+    // its members, or None if there is no such governor
+    sb_governor_shared* shm = sb_governor_map(uri.c_str(), false);
+
+    if (!shm) {
+        return py::none();
+    } else if (shm->magic != SB_GOVERNOR_MAGIC) {
+        munmap(shm, sizeof(sb_governor_shared));
+        return py::none();
+    }
+
+    py::dict info;
+    info["max_rate"] = shm->max_rate;
+    info["max_lag"] = shm->max_lag;
+
+    py::dict members;
+    for (int i = 0; i < shm->n_slots; i++) {
+        int32_t pid = __atomic_load_n(&shm->members[i].pid, __ATOMIC_ACQUIRE);
+        if (pid > 0) {
+            members[py::int_(pid)] = __atomic_load_n(&shm->members[i].cycles, __ATOMIC_RELAXED);
+        }
+    }
+    info["members"] = members;
+
+    munmap(shm, sizeof(sb_governor_shared));
+    return info;
+}
+
 // doc strings for important/commonly used pybind functions below
 char* PySbTx_init_docstring = "Parameters\n"
                               "----------\n"
@@ -780,7 +3039,25 @@ char* PySbTx_init_docstring = "Parameters\n"
                               "\tName of the queue for the Tx object\n"
                               "fresh: bool, optional\n"
                               "\tIf True, the queue specified by the `uri` parameter"
-                              " will get cleared before executing the simulation.";
+                              " will get cleared before executing the simulation.\n"
+                              "packet_size: int, optional\n"
+                              "\tSize of each packet in bytes, which must be the same"
+                              " on both sides of the queue.  Defaults to 64 (52 bytes"
+                              " of data per packet).\n"
+                              "spin_budget: int, optional\n"
+                              "\tNumber of times a blocking operation retries before"
+                              " sleeping until the other side makes progress.  Defaults"
+                              " to -1, meaning never sleep.\n"
+                              "capacity: int, optional\n"
+                              "\tNumber of packets that the queue can hold.  Defaults"
+                              " to 0, meaning as many as fit in one page.\n"
+                              "hugepages: bool, optional\n"
+                              "\tIf True, back the queue with 2 MiB huge pages, which"
+                              " reduces TLB misses for large queues.\n"
+                              "mpsc: bool, optional\n"
+                              "\tIf True, allow several PySbTx objects (in this process or"
+                              " others) to send to the same queue.  All of them must set"
+                              " this.  Defaults to False.";
 
 char* PySbTx_send_docstring = "Parameters\n"
                               "----------\n"
@@ -796,7 +3073,21 @@ char* PySbRx_init_docstring = "Parameters\n"
                               "\tName of the queue for the Rx object\n"
                               "fresh: bool, optional\n"
                               "\tIf True, the queue specified by the `uri` parameter"
-                              " will get cleared before executing the simulation.";
+                              " will get cleared before executing the simulation.\n"
+                              "packet_size: int, optional\n"
+                              "\tSize of each packet in bytes, which must be the same"
+                              " on both sides of the queue.  Defaults to 64 (52 bytes"
+                              " of data per packet).\n"
+                              "spin_budget: int, optional\n"
+                              "\tNumber of times a blocking operation retries before"
+                              " sleeping until the other side makes progress.  Defaults"
+                              " to -1, meaning never sleep.\n"
+                              "capacity: int, optional\n"
+                              "\tNumber of packets that the queue can hold.  Defaults"
+                              " to 0, meaning as many as fit in one page.\n"
+                              "hugepages: bool, optional\n"
+                              "\tIf True, back the queue with 2 MiB huge pages, which"
+                              " reduces TLB misses for large queues.";
 
 char* PySbRx_recv_docstring =
     "Parameters\n"
@@ -811,6 +3102,102 @@ char* PySbRx_recv_docstring =
     "\tReturns a UMI packet. If `blocking` is false, None will be returned"
     " If a packet cannot be read immediately.";
 
+char* PySbTx_send_many_docstring =
+    "Sends a batch of packets much faster than calling send() for each one, by copying them into"
+    " the queue in bursts without holding the GIL.\n"
+    "Parameters\n"
+    "----------\n"
+    "packets: numpy.ndarray\n"
+    "\tStructured array of packets with the fields of dtype (destination, flags, and data)\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until all of the packets have been sent.\n"
+    "Returns\n"
+    "-------\n"
+    "int\n"
+    "\tNumber of packets sent, which is less than len(packets) only if `blocking` is false and"
+    " the queue filled up.";
+
+char* PySbRx_recv_many_docstring =
+    "Receives a batch of packets much faster than calling recv() for each one, by copying them"
+    " out of the queue in bursts without holding the GIL.\n"
+    "Parameters\n"
+    "----------\n"
+    "max_n: int\n"
+    "\tMaximum number of packets to receive\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until at least one packet can be read.\n"
+    "Returns\n"
+    "-------\n"
+    "numpy.ndarray\n"
+    "\tStructured array of packets with the fields of dtype (destination, flags, and data),"
+    " which is empty if `blocking` is false and no packet could be read.";
+
+char* PySb_dtype_docstring =
+    "Returns the NumPy structured type of packets in the queue, as used by send_many() and"
+    " recv_many(): a uint32 destination, uint32 flags, and a uint8 data array.";
+
+char* PySbRx_recv_into_docstring =
+    "Same as recv(), but stores the packet received in an existing PySbPacket rather than"
+    " creating a new one.  The packet's data array is reused if it is writeable, contiguous, and"
+    " has one byte per data byte of the queue's packets, so a polling loop can receive without"
+    " allocating anything.\n"
+    "Parameters\n"
+    "----------\n"
+    "py_packet: PySbPacket\n"
+    "\tPacket to store the result in\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until a packet can be read.\n"
+    "Returns\n"
+    "-------\n"
+    "bool\n"
+    "\tTrue if a packet was received, or False if `blocking` is false and a packet could not be"
+    " read immediately.";
+
+char* PySbTx_add_tap_docstring =
+    "Copies every packet sent from now on to another queue, so that a monitor can observe the"
+    " traffic with a PySbRx, without consuming it.  Packets are dropped rather than slowing down"
+    " the link if the monitor falls behind.\n"
+    "Parameters\n"
+    "----------\n"
+    "uri: str\n"
+    "\tName of the queue that packets are copied to\n"
+    "capacity: int, optional\n"
+    "\tNumber of packets that the tap queue can hold.  Defaults to 0, meaning the capacity"
+    " of the existing queue, or one page worth of packets for a new queue.";
+
+char* PySb_stats_docstring =
+    "Returns a dictionary with the performance counters of the queue, which are shared by both"
+    " sides of the queue: the number of packets enqueued and dequeued, the number of sends that"
+    " found the queue full, the number of receives that found the queue empty, and the most"
+    " packets seen in the queue at once (high_water).";
+
+char* PySbQueueSet_add_docstring =
+    "Adds a PySbRx, which is ready when it has a packet to receive, or a PySbTx, which is ready"
+    " when it has room for another packet.  The queue must not be closed while it is in the"
+    " set.  For a PyUmi, the `tx` argument selects whether its transmit queue or its receive"
+    " queue is added.\n"
+    "Returns\n"
+    "-------\n"
+    "int\n"
+    "\tIndex of the queue in the set, as reported by ready().";
+
+char* PySbQueueSet_wait_docstring =
+    "Waits until any queue in the set is ready.  Sets of more than 128 queues (127 if fileno() is"
+    " used) are polled every 50 microseconds rather than woken up directly.\n"
+    "Parameters\n"
+    "----------\n"
+    "timeout: float, optional\n"
+    "\tMaximum time to wait, in seconds.  Defaults to -1, meaning to wait indefinitely.\n"
+    "Returns\n"
+    "-------\n"
+    "bool\n"
+    "\tTrue if a queue is ready, or False if the timeout expired first.";
+
+char* PySbQueueSet_fileno_docstring =
+    "Returns a file descriptor that becomes readable when any queue in the set is ready, e.g."
+    " for asyncio's loop.add_reader().  Once it has become readable, call rearm() after"
+    " servicing the queues to be notified again.";
+
 char* PyUmi_init_docstring =
     "Parameters\n"
     "----------\n"
@@ -821,27 +3208,60 @@ char* PyUmi_init_docstring =
     "\tName of the switchboard queue that read() and recv() will receive UMI packets from."
     " Defaults to None, meaning “unused”.\n"
     "fresh: bool, optional\n"
-    "\tIf true, the `tx_uri` and `rx_uri` will be cleared prior to running";
-
-char* PyUmi_send_docstring = "Parameters\n"
-                             "----------\n"
-                             "py_packet: PySbPacket\n"
-                             "\tUMI packet to send\n"
-                             "blocking: bool, optional\n"
-                             "\tIf true, the function will pause execution until the"
-                             " packet has been successfully sent.";
-
-char* PyUmi_recv_docstring = "Parameters\n"
-                             "----------\n"
-                             "blocking: bool, optional\n"
-                             "\tIf true, the function will pause execution until a packet"
-                             "can be read. If false, the function will return None if a packet"
-                             "cannot be read immediately\n"
-                             "Returns\n"
-                             "-------\n"
-                             "PySbPacket\n"
-                             "\tReturns a UMI packet. If `blocking` is false, None will be returned"
-                             " If a packet cannot be read immediately.";
+    "\tIf true, the `tx_uri` and `rx_uri` will be cleared prior to running\n"
+    "spin_budget: int, optional\n"
+    "\tNumber of times a blocking send() or recv() retries before sleeping until the"
+    " other side of the queue makes progress.  Defaults to -1, meaning never sleep.\n"
+    "capacity: int, optional\n"
+    "\tNumber of packets that each queue can hold.  Defaults to 0, meaning as many as"
+    " fit in one page.\n"
+    "hugepages: bool, optional\n"
+    "\tIf True, back the queues with 2 MiB huge pages.";
+
+char* PyUmi_send_docstring =
+    "Sends a UMI packet.  Transactions started with start_read(), start_write(), and"
+    " start_atomic() are completed first, so that the packet doesn't go out ahead of their"
+    " requests.\n"
+    "Parameters\n"
+    "----------\n"
+    "py_packet: PySbPacket\n"
+    "\tUMI packet to send\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until the"
+    " packet has been successfully sent.";
+
+char* PyUmi_recv_docstring =
+    "Receives a UMI packet.  Transactions started with start_read(), start_write(), and"
+    " start_atomic() are completed first, even if `blocking` is false, so that their responses"
+    " aren't taken by this call.\n"
+    "Parameters\n"
+    "----------\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until a packet"
+    "can be read. If false, the function will return None if a packet"
+    "cannot be read immediately\n"
+    "Returns\n"
+    "-------\n"
+    "PySbPacket\n"
+    "\tReturns a UMI packet. If `blocking` is false, None will be returned"
+    " If a packet cannot be read immediately.";
+
+char* PyUmi_recv_into_docstring =
+    "Same as recv(), but stores the transaction received in an existing PyUmiPacket rather than"
+    " creating a new one.  The packet's data array is reused, so it must be writeable, contiguous,"
+    " and large enough for the transactions received; a packet without a data array is given one"
+    " that holds the largest UMI packet.\n"
+    "Parameters\n"
+    "----------\n"
+    "py_packet: PyUmiPacket\n"
+    "\tPacket to store the result in\n"
+    "blocking: bool, optional\n"
+    "\tIf true, the function will pause execution until a transaction can be read.\n"
+    "Returns\n"
+    "-------\n"
+    "bool\n"
+    "\tTrue if a transaction was received, or False if `blocking` is false and a transaction"
+    " could not be read immediately.";
 
 char* PyUmi_write_docstring =
     "Parameters\n"
@@ -902,6 +3322,249 @@ char* PyUmi_read_docstring =
     "error: bool, optional\n"
     "\tIf true, error out upon receiving an unexpected UMI response.\n";
 
+char* PyUmi_read_into_docstring =
+    "Same as read(), but reads into an existing array rather than allocating a new one.  One"
+    " element is read per entry of `out`, with the element size taken from its data type.\n"
+    "Parameters\n"
+    "----------\n"
+    "addr: int\n"
+    "\tAddress to read from\n"
+    "out: numpy.ndarray\n"
+    "\tWriteable, contiguous array of 1, 2, 4, or 8 byte integers that receives the data\n"
+    "srcaddr: int, optional\n"
+    "\tThe UMI source address used for the read transaction\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, error out upon receiving an unexpected UMI response.";
+
+char* PyUmi_read_many_docstring =
+    "Reads from many addresses, sending the requests for all of them back to back rather than"
+    " waiting for the responses to each address before moving on.  Returns the elements read"
+    " from all of the addresses in a single flat array.\n"
+    "Parameters\n"
+    "----------\n"
+    "addrs: numpy.ndarray\n"
+    "\tThe 64-bit addresses read from\n"
+    "counts: numpy.ndarray\n"
+    "\tNumber of elements read from each address\n"
+    "bytes_per_elem: int, optional\n"
+    "\tSize of each element in bytes (1, 2, 4, or 8)\n"
+    "srcaddr: int, optional\n"
+    "\tThe UMI source address used for the read transactions\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, error out upon receiving an unexpected UMI response.";
+
+char* PyUmi_write_many_docstring =
+    "Writes to many addresses, sending the requests for all of them back to back rather than"
+    " waiting for the responses to each address before moving on.\n"
+    "Parameters\n"
+    "----------\n"
+    "addrs: numpy.ndarray\n"
+    "\tThe 64-bit addresses written to\n"
+    "counts: numpy.ndarray\n"
+    "\tNumber of elements written to each address\n"
+    "data: numpy.ndarray\n"
+    "\tContiguous array of 1, 2, 4, or 8 byte integers holding the elements written to each"
+    " address in turn\n"
+    "srcaddr: int, optional\n"
+    "\tThe UMI source address used for the write transactions\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "posted: bool, optional\n"
+    "\tIf True, posted writes are used, so no write responses are expected.\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, error out upon receiving an unexpected UMI response.";
+
+char* PyUmi_start_read_docstring =
+    "Same as read(), but returns a PyUmiFuture right away rather than waiting for the read"
+    " responses, so that several transactions can be outstanding at once.  The data read is"
+    " returned by the result() method of the future.\n"
+    "Parameters\n"
+    "----------\n"
+    "addr: int\n"
+    "\tThe 64-bit address read from\n"
+    "num: int\n"
+    "\tNumber of elements read\n"
+    "bytes_per_elem: int\n"
+    "\tSize of each element in bytes (1, 2, 4, or 8)\n"
+    "srcaddr: int, optional\n"
+    "\tThe UMI source address used for the read transaction, to which the tag of each"
+    " request is added\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, result() raises an error if an unexpected UMI response was received.";
+
+char* PyUmi_start_write_docstring =
+    "Same as write(), but returns a PyUmiFuture right away rather than waiting for the write"
+    " responses, so that several transactions can be outstanding at once.  The data is"
+    " copied, so the array can be reused right away.\n"
+    "Parameters\n"
+    "----------\n"
+    "addr: int\n"
+    "\t64-bit address that will be written to\n"
+    "data: numpy.ndarray\n"
+    "\tContiguous array of 1, 2, 4, or 8 byte integers\n"
+    "srcaddr: int, optional\n"
+    "\tUMI source address used for the write transaction, to which the tag of each request"
+    " is added\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "posted: bool, optional\n"
+    "\tIf True, posted writes are used, so no write responses are expected.\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, result() raises an error if an unexpected UMI response was received.";
+
+char* PyUmi_set_max_outstanding_docstring =
+    "Sets the number of requests that transactions started with start_read(), start_write(),"
+    " and start_atomic() can have outstanding at once.  Each of those requests is tagged by"
+    " adding a number from 0 to max_outstanding-1, shifted left by `tag_shift`, to its source"
+    " address, so that responses can be matched up with requests even if they arrive out of"
+    " order.  The bits of the source address used for the tag should be ones that the"
+    " responses are not routed by.\n"
+    "Parameters\n"
+    "----------\n"
+    "max_outstanding: int\n"
+    "\tMaximum number of outstanding requests\n"
+    "tag_shift: int, optional\n"
+    "\tPosition of the tag in the source address";
+
+char* PyUmi_set_write_combining_docstring =
+    "Enables write combining if `buffer_bytes` is nonzero.  Posted writes of up to that many"
+    " bytes to adjacent addresses are then held back and combined, so that they are sent in as"
+    " few UMI packets as possible.  Writes are combined under the same rules as"
+    " PyUmiPacket.merge(), except that they need the same srcaddr rather than consecutive ones."
+    "  Held writes are sent when `buffer_bytes` have been combined, when a write comes in that"
+    " can't be combined with them (including one that overlaps them), before any other"
+    " transaction, and when flush() is called.\n"
+    "Parameters\n"
+    "----------\n"
+    "buffer_bytes: int\n"
+    "\tMaximum number of bytes combined, or 0 to disable write combining\n"
+    "timeout: float, optional\n"
+    "\tIf positive, held writes are also sent once the first of them is older than this many"
+    " seconds.  This is checked whenever the PyUmi is used (e.g., by send(), recv(), or"
+    " PyUmiFuture.done()), so flush() should still be called before the host goes idle.";
+
+char* PyUmiGenerator_init_docstring =
+    "Generates random UMI packets in C++.  With the default arguments, the fields of the packets"
+    " have the same distribution as with random_umi_packet(), except that addresses at which a"
+    " packet wouldn't fit are left out.\n"
+    "Parameters\n"
+    "----------\n"
+    "seed: int, optional\n"
+    "\tSeed of the random number generator\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of data bytes in each packet\n"
+    "opcodes: dict, optional\n"
+    "\tRelative weights of opcodes, e.g. {UmiCmd.UMI_REQ_WRITE: 3, UmiCmd.UMI_REQ_READ: 1}."
+    "  By default, the opcodes used by random_umi_packet() are equally likely.\n"
+    "sizes: list of float, optional\n"
+    "\tRelative weights of each SIZE, starting from 0.  By default, all sizes that fit in"
+    " max_bytes are equally likely.\n"
+    "lens: list of float, optional\n"
+    "\tRelative weights of each LEN, starting from 0.  Lengths that don't fit in max_bytes"
+    " are left out.  By default, all lengths that fit are equally likely.\n"
+    "atypes: list of float, optional\n"
+    "\tRelative weights of each ATYPE of atomic requests, starting from 0"
+    " (UMI_REQ_ATOMICADD).  By default, ATYPE is always 0, as with random_umi_packet().\n"
+    "dstaddr_min: int, optional\n"
+    "\tLowest destination address of a packet\n"
+    "dstaddr_max: int, optional\n"
+    "\tHighest destination address of a byte in a packet\n"
+    "srcaddr_min: int, optional\n"
+    "\tLowest source address of a packet\n"
+    "srcaddr_max: int, optional\n"
+    "\tHighest source address of a byte in a packet\n"
+    "align: int, optional\n"
+    "\tAlignment of addresses in bytes, which must be a power of two.  By default,"
+    " addresses are aligned to the word size.\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "eom: int, optional\n"
+    "\tEnd of Message bit in the UMI command\n"
+    "eof: int, optional\n"
+    "\tEnd of Frame bit in the UMI command\n"
+    "ex: int, optional\n"
+    "\tExclusive access bit in the UMI command";
+
+char* PyUmi_load_file_docstring =
+    "Writes the contents of a file to memory, starting at `addr`.  The file is memory-mapped"
+    " and streamed out, rather than read into memory first, so that large images can be"
+    " loaded at the bandwidth of the queue.  Returns the number of bytes written.\n"
+    "Parameters\n"
+    "----------\n"
+    "path: str\n"
+    "\tPath of the file\n"
+    "addr: int\n"
+    "\t64-bit address that the data is written to\n"
+    "offset: int, optional\n"
+    "\tOffset in the file of the first byte written\n"
+    "nbytes: int, optional\n"
+    "\tNumber of bytes written; by default, the rest of the file is written.\n"
+    "srcaddr: int, optional\n"
+    "\tUMI source address used for the write transactions\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "posted: bool, optional\n"
+    "\tIf True (the default), posted writes are used, so no write responses are expected.\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "progressbar: bool, optional\n"
+    "\tIf True, the progress of the writes will be displayed in the terminal.\n"
+    "error: bool, optional\n"
+    "\tIf true, error out upon receiving an unexpected UMI response.";
+
+char* PyUmi_dump_file_docstring =
+    "Reads `nbytes` bytes of memory, starting at `addr`, into a file, which is created or"
+    " overwritten.  The file is memory-mapped, so that the data read goes straight to it."
+    "  Returns the number of bytes read.\n"
+    "Parameters\n"
+    "----------\n"
+    "path: str\n"
+    "\tPath of the file\n"
+    "addr: int\n"
+    "\t64-bit address that the data is read from\n"
+    "nbytes: int\n"
+    "\tNumber of bytes read\n"
+    "srcaddr: int, optional\n"
+    "\tUMI source address used for the read transactions\n"
+    "max_bytes: int, optional\n"
+    "\tMaximum number of bytes used in each UMI transaction\n"
+    "qos: int, optional\n"
+    "\t4-bit Quality of Service field in the UMI Command\n"
+    "prot: int, optional\n"
+    "\t2-bit protection mode field in the UMI command\n"
+    "error: bool, optional\n"
+    "\tIf true, error out upon receiving an unexpected UMI response.";
+
 char* PyUmi_atomic_docstring =
     "Parameters\n"
     "----------\n"
@@ -960,19 +3623,52 @@ PYBIND11_MODULE(_switchboard, m) {
         .def(py::self != py::self);
 
     py::class_<PySbTx>(m, "PySbTx")
-        .def(py::init<std::string, bool, double>(), py::arg("uri") = "", py::arg("fresh") = false,
-            py::arg("max_rate") = -1)
+        .def(py::init<std::string, bool, double, size_t, int, size_t, bool, bool>(),
+            py::arg("uri") = "", py::arg("fresh") = false, py::arg("max_rate") = -1,
+            py::arg("packet_size") = 0, py::arg("spin_budget") = -1, py::arg("capacity") = 0,
+            py::arg("hugepages") = false, py::arg("mpsc") = false)
         .def("init", &PySbTx::init, PySbTx_init_docstring, py::arg("uri") = "",
-            py::arg("fresh") = false, py::arg("max_rate") = -1)
+            py::arg("fresh") = false, py::arg("max_rate") = -1, py::arg("packet_size") = 0,
+            py::arg("spin_budget") = -1, py::arg("capacity") = 0, py::arg("hugepages") = false,
+            py::arg("mpsc") = false)
         .def("send", &PySbTx::send, PySbTx_send_docstring, py::arg("py_packet"),
-            py::arg("blocking") = true);
+            py::arg("blocking") = true)
+        .def("send_many", &PySbTx::send_many, PySbTx_send_many_docstring, py::arg("packets"),
+            py::arg("blocking") = true)
+        .def_property_readonly("dtype", &PySbTx::dtype, PySb_dtype_docstring)
+        .def("stats", &PySbTx::stats, PySb_stats_docstring)
+        .def("add_tap", &PySbTx::add_tap, PySbTx_add_tap_docstring, py::arg("uri"),
+            py::arg("capacity") = 0);
 
     py::class_<PySbRx>(m, "PySbRx")
-        .def(py::init<std::string, bool, double>(), py::arg("uri") = "", py::arg("fresh") = false,
-            py::arg("max_rate") = -1)
+        .def(py::init<std::string, bool, double, size_t, int, size_t, bool>(), py::arg("uri") = "",
+            py::arg("fresh") = false, py::arg("max_rate") = -1, py::arg("packet_size") = 0,
+            py::arg("spin_budget") = -1, py::arg("capacity") = 0, py::arg("hugepages") = false)
         .def("init", &PySbRx::init, PySbRx_init_docstring, py::arg("uri") = "",
-            py::arg("fresh") = false, py::arg("max_rate") = -1)
-        .def("recv", &PySbRx::recv, PySbRx_recv_docstring, py::arg("blocking") = true);
+            py::arg("fresh") = false, py::arg("max_rate") = -1, py::arg("packet_size") = 0,
+            py::arg("spin_budget") = -1, py::arg("capacity") = 0, py::arg("hugepages") = false)
+        .def("recv", &PySbRx::recv, PySbRx_recv_docstring, py::arg("blocking") = true)
+        .def("recv_into", &PySbRx::recv_into, PySbRx_recv_into_docstring, py::arg("py_packet"),
+            py::arg("blocking") = true)
+        .def("recv_many", &PySbRx::recv_many, PySbRx_recv_many_docstring, py::arg("max_n"),
+            py::arg("blocking") = true)
+        .def_property_readonly("dtype", &PySbRx::dtype, PySb_dtype_docstring)
+        .def("stats", &PySbRx::stats, PySb_stats_docstring);
+
+    py::class_<PySbQueueSet>(m, "PySbQueueSet")
+        .def(py::init<>())
+        .def("add", &PySbQueueSet::add_rx, PySbQueueSet_add_docstring, py::arg("queue"),
+            py::keep_alive<1, 2>())
+        .def("add", &PySbQueueSet::add_tx, PySbQueueSet_add_docstring, py::arg("queue"),
+            py::keep_alive<1, 2>())
+        .def("add", &PySbQueueSet::add_umi, PySbQueueSet_add_docstring, py::arg("queue"),
+            py::arg("tx"), py::keep_alive<1, 2>())
+        .def("wait", &PySbQueueSet::wait, PySbQueueSet_wait_docstring, py::arg("timeout") = -1)
+        .def("ready", &PySbQueueSet::ready, "Returns the indices of the queues that are ready.")
+        .def("clear", &PySbQueueSet::clear, "Removes all queues from the set.")
+        .def("fileno", &PySbQueueSet::fileno, PySbQueueSet_fileno_docstring)
+        .def("rearm", &PySbQueueSet::rearm,
+            "Allows the descriptor returned by fileno() to become readable again.");
 
     py::class_<PySbTxPcie>(m, "PySbTxPcie")
         .def(py::init<std::string, int, int, std::string>(), py::arg("uri") = "",
@@ -987,13 +3683,18 @@ PYBIND11_MODULE(_switchboard, m) {
             py::arg("bar_num") = 0, py::arg("bdf") = "");
 
     py::class_<PyUmi>(m, "PyUmi")
-        .def(py::init<std::string, std::string, bool, double>(), py::arg("tx_uri") = "",
-            py::arg("rx_uri") = "", py::arg("fresh") = false, py::arg("max_rate") = -1)
+        .def(py::init<std::string, std::string, bool, double, int, size_t, bool>(),
+            py::arg("tx_uri") = "", py::arg("rx_uri") = "", py::arg("fresh") = false,
+            py::arg("max_rate") = -1, py::arg("spin_budget") = -1, py::arg("capacity") = 0,
+            py::arg("hugepages") = false)
         .def("init", &PyUmi::init, PyUmi_init_docstring, py::arg("tx_uri") = "",
-            py::arg("rx_uri") = "", py::arg("fresh") = false, py::arg("max_rate") = -1)
+            py::arg("rx_uri") = "", py::arg("fresh") = false, py::arg("max_rate") = -1,
+            py::arg("spin_budget") = -1, py::arg("capacity") = 0, py::arg("hugepages") = false)
         .def("send", &PyUmi::send, PyUmi_send_docstring, py::arg("py_packet"),
             py::arg("blocking") = true)
         .def("recv", &PyUmi::recv, PyUmi_recv_docstring, py::arg("blocking") = true)
+        .def("recv_into", &PyUmi::recv_into, PyUmi_recv_into_docstring, py::arg("py_packet"),
+            py::arg("blocking") = true)
         .def("write", &PyUmi::write, PyUmi_write_docstring, py::arg("addr"), py::arg("data"),
             py::arg("srcaddr") = 0, py::arg("max_bytes") = 32, py::arg("posted") = false,
             py::arg("qos") = 0, py::arg("prot") = 0, py::arg("progressbar") = false,
@@ -1001,9 +3702,100 @@ PYBIND11_MODULE(_switchboard, m) {
         .def("read", &PyUmi::read, PyUmi_read_docstring, py::arg("addr"), py::arg("num"),
             py::arg("bytes_per_elem") = 1, py::arg("srcaddr") = 0, py::arg("max_bytes") = 32,
             py::arg("qos") = 0, py::arg("prot") = 0, py::arg("error") = true)
+        .def("read_into", &PyUmi::read_into, PyUmi_read_into_docstring, py::arg("addr"),
+            py::arg("out"), py::arg("srcaddr") = 0, py::arg("max_bytes") = 32, py::arg("qos") = 0,
+            py::arg("prot") = 0, py::arg("error") = true)
+        .def("read_many", &PyUmi::read_many, PyUmi_read_many_docstring, py::arg("addrs"),
+            py::arg("counts"), py::arg("bytes_per_elem") = 1, py::arg("srcaddr") = 0,
+            py::arg("max_bytes") = 32, py::arg("qos") = 0, py::arg("prot") = 0,
+            py::arg("error") = true)
+        .def("write_many", &PyUmi::write_many, PyUmi_write_many_docstring, py::arg("addrs"),
+            py::arg("counts"), py::arg("data"), py::arg("srcaddr") = 0, py::arg("max_bytes") = 32,
+            py::arg("posted") = false, py::arg("qos") = 0, py::arg("prot") = 0,
+            py::arg("error") = true)
+        .def("load_file", &PyUmi::load_file, PyUmi_load_file_docstring, py::arg("path"),
+            py::arg("addr"), py::arg("offset") = 0, py::arg("nbytes") = -1, py::arg("srcaddr") = 0,
+            py::arg("max_bytes") = 32, py::arg("posted") = true, py::arg("qos") = 0,
+            py::arg("prot") = 0, py::arg("progressbar") = false, py::arg("error") = true)
+        .def("dump_file", &PyUmi::dump_file, PyUmi_dump_file_docstring, py::arg("path"),
+            py::arg("addr"), py::arg("nbytes"), py::arg("srcaddr") = 0, py::arg("max_bytes") = 32,
+            py::arg("qos") = 0, py::arg("prot") = 0, py::arg("error") = true)
         .def("atomic", &PyUmi::atomic, PyUmi_atomic_docstring, py::arg("addr"), py::arg("data"),
             py::arg("opcode"), py::arg("srcaddr") = 0, py::arg("qos") = 0, py::arg("prot") = 0,
-            py::arg("error") = true);
+            py::arg("error") = true)
+        .def("start_read", &PyUmi::start_read, PyUmi_start_read_docstring, py::arg("addr"),
+            py::arg("num"), py::arg("bytes_per_elem") = 1, py::arg("srcaddr") = 0,
+            py::arg("max_bytes") = 32, py::arg("qos") = 0, py::arg("prot") = 0,
+            py::arg("error") = true)
+        .def("start_write", &PyUmi::start_write, PyUmi_start_write_docstring, py::arg("addr"),
+            py::arg("data"), py::arg("srcaddr") = 0, py::arg("max_bytes") = 32,
+            py::arg("posted") = false, py::arg("qos") = 0, py::arg("prot") = 0,
+            py::arg("error") = true)
+        .def("start_atomic", &PyUmi::start_atomic,
+            "Same as atomic(), but returns a PyUmiFuture right away rather than waiting for the"
+            " response.",
+            py::arg("addr"), py::arg("data"), py::arg("opcode"), py::arg("srcaddr") = 0,
+            py::arg("qos") = 0, py::arg("prot") = 0, py::arg("error") = true)
+        .def("set_max_outstanding", &PyUmi::set_max_outstanding,
+            PyUmi_set_max_outstanding_docstring, py::arg("max_outstanding"),
+            py::arg("tag_shift") = PYUMI_TAG_SHIFT)
+        .def("set_write_combining", &PyUmi::set_write_combining,
+            PyUmi_set_write_combining_docstring, py::arg("buffer_bytes"), py::arg("timeout") = -1)
+        .def("flush", &PyUmi::flush, "Sends any writes held for write combining.")
+        .def("wait_all", &PyUmi::wait_all,
+            "Waits for all transactions started with start_read(), start_write(), and"
+            " start_atomic() to complete.")
+        .def("futures_waiting", &PyUmi::futures_waiting,
+            "Returns a pair (tx, rx) saying whether transactions started with start_read(),"
+            " start_write(), and start_atomic() are waiting for room in the TX queue and for"
+            " responses from the RX queue, respectively.");
+
+    py::class_<PyUmiGenerator>(m, "PyUmiGenerator")
+        .def(py::init<uint64_t, uint32_t, py::dict, std::vector<double>, std::vector<double>,
+                 std::vector<double>, uint64_t, uint64_t, uint64_t, uint64_t, int64_t, uint32_t,
+                 uint32_t, uint32_t, uint32_t, uint32_t>(),
+            PyUmiGenerator_init_docstring, py::arg("seed") = 0, py::arg("max_bytes") = 32,
+            py::arg("opcodes") = py::dict(), py::arg("sizes") = std::vector<double>(),
+            py::arg("lens") = std::vector<double>(), py::arg("atypes") = std::vector<double>(),
+            py::arg("dstaddr_min") = 0, py::arg("dstaddr_max") = UINT64_MAX,
+            py::arg("srcaddr_min") = 0, py::arg("srcaddr_max") = UINT64_MAX, py::arg("align") = -1,
+            py::arg("qos") = 0, py::arg("prot") = 0, py::arg("eom") = 1, py::arg("eof") = 1,
+            py::arg("ex") = 0)
+        .def("fill", &PyUmiGenerator::fill,
+            "Returns a NumPy array of `n` random packets of type umi_packet_dtype().", py::arg("n"))
+        .def("send", &PyUmiGenerator::send,
+            "Sends `n` random packets to a PyUmi, at up to `rate` packets per second if `rate`"
+            " is positive.  Returns the number of packets sent.",
+            py::arg("umi"), py::arg("n"), py::arg("rate") = -1);
+
+    py::class_<PyUmiLoopback>(m, "PyUmiLoopback")
+        .def(py::init<PyUmi&, uint32_t, uint64_t>(), py::arg("umi"), py::arg("history") = 1024,
+            py::arg("seed") = 0, py::keep_alive<1, 2>())
+        .def("send_batch", &PyUmiLoopback::send_batch,
+            "Sends the packets in a NumPy array of type umi_packet_dtype(), checking packets"
+            " received along the way.  Returns once all of the packets have been sent.",
+            py::arg("packets"))
+        .def("send_random", &PyUmiLoopback::send_random,
+            "Sends `n` random packets, with the fields distributed as with a PyUmiGenerator"
+            " created with the default arguments, checking packets received along the way."
+            "  Returns once all of the packets have been sent.",
+            py::arg("n"), py::arg("max_bytes") = 32)
+        .def("send_generated", &PyUmiLoopback::send_generated,
+            "Sends `n` packets from a PyUmiGenerator, checking packets received along the way."
+            "  Returns once all of the packets have been sent.",
+            py::arg("generator"), py::arg("n"))
+        .def("finish", &PyUmiLoopback::finish,
+            "Waits until all of the packets sent have been received and checked.")
+        .def_property_readonly("sent", &PyUmiLoopback::sent, "Number of packets sent.")
+        .def_property_readonly("checked", &PyUmiLoopback::checked,
+            "Number of packets (after merging) received and checked.");
+
+    py::class_<PyUmiFuture>(m, "PyUmiFuture")
+        .def("done", &PyUmiFuture::done,
+            "Returns True if the transaction has completed, without waiting.")
+        .def("result", &PyUmiFuture::result,
+            "Waits for the transaction to complete, and then returns the data read, or None for"
+            " writes.  Raises an error if an unexpected response was received.");
 
     m.def("umi_opcode_to_str", &umi_opcode_to_str,
         "Returns a string representation of a UMI opcode");
@@ -1011,6 +3803,39 @@ PYBIND11_MODULE(_switchboard, m) {
     m.def("delete_queue", &delete_queue, "Deletes an old queue.");
     m.def("delete_queues", &delete_queues, "Deletes a old queues specified in a list.");
 
+    m.def("queue_stats", &queue_stats,
+        "Returns the performance counters of an existing queue, or None if there is no such"
+        " queue.",
+        py::arg("uri"));
+
+    m.def("queue_info", &queue_info,
+        "Returns a dictionary describing an existing queue, or None if there is no such queue.",
+        py::arg("uri"));
+
+    m.def("configure_governor", &configure_governor,
+        "Creates a rate governor that simulators named by the SB_GOVERNOR environment variable"
+        " join, or changes the budget of an existing one.  max_rate is the total clock rate in Hz"
+        " shared evenly by the members, and max_lag is the number of cycles that any member may"
+        " run ahead of the slowest one.  Non-positive values mean no limit.",
+        py::arg("uri"), py::arg("max_rate") = -1, py::arg("max_lag") = -1);
+
+    m.def("governor_info", &governor_info,
+        "Returns a dictionary with the budget of a rate governor and the cycle count of each"
+        " member, keyed by process ID, or None if there is no such governor.",
+        py::arg("uri"));
+
+    m.def("sb_packet_dtype", &sb_packet_dtype,
+        "Returns the NumPy structured type of packets carrying the given number of data bytes,"
+        " as used by PySbTx.send_many() and PySbRx.recv_many().",
+        py::arg("data_size") = SB_DATA_SIZE);
+
+    m.def("umi_packet_dtype", &umi_packet_dtype,
+        "Returns the NumPy structured type of UMI packets, as used by PyUmiLoopback.send_batch().");
+
+    m.def("sb_packet_size", &sb_packet_size,
+        "Returns the packet size needed to carry the given number of data bytes per packet.",
+        py::arg("data_size"));
+
     m.def("umi_pack", &umi_pack, "Returns a UMI command with the given parameters.",
         py::arg("opcode") = 0, py::arg("atype") = 0, py::arg("size") = 0, py::arg("len") = 0,
         py::arg("eom") = 1, py::arg("eof") = 1, py::arg("qos") = 0, py::arg("prot") = 0,
@@ -12,10 +12,13 @@ except ImportError:
 from ._switchboard import (PySbPacket, delete_queue, umi_opcode_to_str,
     PySbTx, PySbRx, UmiCmd, PySbTxPcie, PySbRxPcie, PyUmiPacket, umi_pack,
     umi_opcode, umi_size, umi_len, umi_atype, umi_qos, umi_prot, umi_eom,
-    umi_eof, umi_ex, UmiAtomic, delete_queues)
+    umi_eof, umi_ex, UmiAtomic, delete_queues, sb_packet_size, sb_packet_dtype, queue_info,
+    queue_stats, PySbQueueSet, configure_governor, governor_info, PyUmiFuture, PyUmiLoopback,
+    PyUmiGenerator, umi_packet_dtype)
 
-from .umi import UmiTxRx, random_umi_packet
-from .util import binary_run, ProcessCollection
+from .umi import UmiTxRx, UmiFuture, random_umi_packet
+from .util import (binary_run, ProcessCollection, set_queue_root, queue_path, set_affinity,
+    numa_nodes)
 from .icarus import icarus_build_vpi, icarus_run
 from .sbdut import SbDut
 from .loopback import umi_loopback
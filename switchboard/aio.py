@@ -0,0 +1,298 @@
+# asyncio interface for switchboard queues
+
+# Copyright (c) 2024 Zero ASIC Corporation
+# This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+# Coroutines waiting on queues are woken up through the file descriptor of a
+# PySbQueueSet, which a background thread in the C++ library signals when any
+# queue in the set is ready.  Only the queues that some coroutine is waiting
+# on are kept in the set, so that a queue holding packets that nobody has
+# asked for yet doesn't keep waking up the event loop.
+#
+# Transactions that are made up of several sends and receives (e.g., AXI
+# writes) are written once, as generators that yield Send and Recv steps,
+# and then run either with blocking calls (run_steps) or from a coroutine
+# (run_steps_async).  Coroutines running transactions on the same interface
+# take turns, so that they don't receive each other's responses.
+
+import asyncio
+import weakref
+
+from collections import namedtuple
+
+import numpy as np
+
+from ._switchboard import PySbQueueSet, PyUmi
+
+# maximum number of data bytes in a UMI packet (UMI_PACKET_DATA_BYTES in C++)
+UMI_PACKET_DATA_BYTES = 32
+
+Send = namedtuple('Send', ['queue', 'packet'])
+Recv = namedtuple('Recv', ['queue'])
+
+_watchers = weakref.WeakKeyDictionary()
+
+
+class QueueWatcher:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """
+        Wakes up coroutines running in "loop" when the queues that they
+        are waiting on are ready.  Normally obtained with get_watcher()
+        rather than created directly.
+        """
+
+        # the loop is only referred to weakly, so that the watcher (which is
+        # kept in a dictionary keyed by the loop) doesn't keep it alive
+        self._loop = weakref.ref(loop)
+        self.queue_set = PySbQueueSet()
+
+        # maps (id(queue), tx) to [queue, tx, futures waiting on it], in
+        # the order that the queues were added to the queue set
+        self.waiters = {}
+
+        # maps the owner of transactions run with run_steps_async() to the
+        # lock that makes them run one at a time
+        self.locks = weakref.WeakKeyDictionary()
+
+        loop.add_reader(self.queue_set.fileno(), self._on_ready)
+
+    async def wait(self, *targets):
+        """
+        Waits until any of the targets is ready.  Each target is a pair
+        (queue, tx), where queue is a PySbTx, PySbRx, or PyUmi, and tx
+        says whether to wait for room to send (True) or for a packet to
+        receive (False).  A target can become unready again before the
+        caller gets to it, so the caller should retry and wait again.
+        """
+
+        fut = self._loop().create_future()
+        keys = []
+
+        try:
+            for queue, tx in targets:
+                key = (id(queue), bool(tx))
+                if key not in self.waiters:
+                    self._add(queue, tx)
+                    self.waiters[key] = [queue, bool(tx), set()]
+                self.waiters[key][2].add(fut)
+                keys.append(key)
+
+            # queues are often made ready by other coroutines running in the
+            # same loop, which can be woken up right away rather than after a
+            # round trip through the background thread
+            self._wake_ready()
+
+            await fut
+        finally:
+            removed = False
+            for key in keys:
+                entry = self.waiters.get(key)
+                if entry is not None:
+                    entry[2].discard(fut)
+                    if not entry[2]:
+                        del self.waiters[key]
+                        removed = True
+            if removed:
+                self._rebuild()
+
+    def lock(self, owner) -> asyncio.Lock:
+        """
+        Returns the lock for transactions on "owner" (e.g., an AxiTxRx),
+        creating it the first time.
+        """
+
+        lock = self.locks.get(owner)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[owner] = lock
+        return lock
+
+    def close(self):
+        loop = self._loop()
+        if loop is not None and not loop.is_closed():
+            loop.remove_reader(self.queue_set.fileno())
+        self.queue_set.clear()
+        for entry in self.waiters.values():
+            for fut in entry[2]:
+                if not fut.done():
+                    fut.cancel()
+        self.waiters.clear()
+
+    def _rebuild(self):
+        # queues can only be removed from a queue set by clearing it, after
+        # which the remaining queues are added back in order
+        self.queue_set.clear()
+        for queue, tx, _ in self.waiters.values():
+            self._add(queue, tx)
+
+    def _add(self, queue, tx):
+        if isinstance(queue, PyUmi):
+            self.queue_set.add(queue, tx=tx)
+        else:
+            self.queue_set.add(queue)
+
+    def _wake_ready(self):
+        entries = list(self.waiters.values())
+        removed = False
+
+        for idx in self.queue_set.ready():
+            queue, tx, futs = entries[idx]
+            for fut in futs:
+                if not fut.done():
+                    fut.set_result(None)
+            self.waiters.pop((id(queue), tx), None)
+            removed = True
+
+        if removed:
+            self._rebuild()
+
+    def _on_ready(self):
+        self._wake_ready()
+        self.queue_set.rearm()
+
+
+def get_watcher(loop: asyncio.AbstractEventLoop = None) -> QueueWatcher:
+    """
+    Returns the QueueWatcher for the given event loop, which defaults to
+    the running loop, creating it the first time.
+    """
+
+    if loop is None:
+        loop = asyncio.get_running_loop()
+
+    watcher = _watchers.get(loop)
+    if watcher is None:
+        watcher = QueueWatcher(loop)
+        _watchers[loop] = watcher
+
+    return watcher
+
+
+async def send(tx, packet):
+    """
+    Sends a packet to a PySbTx, or a PyUmiPacket to a PyUmi, yielding to
+    other coroutines while the queue is full.
+    """
+
+    while not tx.send(packet, False):
+        await get_watcher().wait((tx, True))
+
+
+async def recv(rx):
+    """
+    Receives a packet from a PySbRx, or a PyUmiPacket from a PyUmi,
+    yielding to other coroutines while the queue is empty.
+    """
+
+    while True:
+        packet = rx.recv(False)
+        if packet is not None:
+            return packet
+        await get_watcher().wait((rx, False))
+
+
+def run_steps(steps):
+    """
+    Runs a transaction generator that yields Send and Recv steps, using
+    blocking sends and receives, and returns the generator's result.
+    """
+
+    value = None
+
+    try:
+        while True:
+            step = steps.send(value)
+            if isinstance(step, Send):
+                step.queue.send(step.packet, True)
+                value = None
+            else:
+                value = step.queue.recv(True)
+    except StopIteration as e:
+        return e.value
+
+
+async def run_steps_async(steps, owner=None):
+    """
+    Same as run_steps(), but awaits each send and receive.  Transactions
+    that are run with the same "owner" (normally the interface object that
+    they belong to) are run one at a time, since the responses that they
+    receive can't otherwise be told apart.
+    """
+
+    if owner is not None:
+        async with get_watcher().lock(owner):
+            return await run_steps_async(steps)
+
+    value = None
+
+    try:
+        while True:
+            step = steps.send(value)
+            if isinstance(step, Send):
+                await send(step.queue, step.packet)
+                value = None
+            else:
+                value = await recv(step.queue)
+    except StopIteration as e:
+        return e.value
+
+
+# UMI transactions, mirroring PyUmi.write(), PyUmi.read_into(), and
+# PyUmi.atomic().  they are started with PyUmi.start_write(), start_read(),
+# and start_atomic(), so that responses are matched up with their requests
+# by the same code that handles the futures returned by those methods,
+# even when several coroutines have transactions outstanding on the same
+# PyUmi at once.
+
+async def umi_wait(umi, future):
+    """
+    Awaits a PyUmiFuture returned by umi.start_read(), start_write(), or
+    start_atomic(), and returns its result.
+    """
+
+    watcher = get_watcher()
+
+    while not future.done():
+        tx, rx = umi.futures_waiting()
+        targets = []
+        if tx:
+            targets.append((umi, True))
+        if rx:
+            targets.append((umi, False))
+        if targets:
+            await watcher.wait(*targets)
+        else:
+            # the transaction was held up by another one that has since
+            # completed, so just let other coroutines run before checking again
+            await asyncio.sleep(0)
+
+    return future.result()
+
+
+async def umi_write(umi, addr, data, srcaddr=0, max_bytes=UMI_PACKET_DATA_BYTES,
+    posted=False, qos=0, prot=0, error=True):
+
+    data = np.ascontiguousarray(data)
+    await umi_wait(umi, umi.start_write(addr, data, srcaddr, max_bytes, posted, qos, prot, error))
+
+
+async def umi_read_into(umi, addr, out, srcaddr=0, max_bytes=UMI_PACKET_DATA_BYTES, qos=0,
+    prot=0, error=True):
+
+    if not (out.flags.writeable and out.flags.c_contiguous):
+        raise RuntimeError('Array read into must be writeable and contiguous.')
+
+    result = await umi_wait(umi, umi.start_read(addr, out.size, out.itemsize, srcaddr,
+        max_bytes, qos, prot, error))
+
+    out.reshape(-1).view(np.uint8)[:] = result.view(np.uint8)
+
+
+async def umi_atomic(umi, addr, data, opcode, srcaddr=0, qos=0, prot=0, error=True):
+    if data.nbytes == 0:
+        return np.empty((0,), dtype=np.uint8)
+
+    result = await umi_wait(umi, umi.start_atomic(addr, data.view(np.uint8), opcode, srcaddr,
+        qos, prot, error))
+
+    return result.view(np.uint8)
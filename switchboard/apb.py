@@ -9,6 +9,7 @@ from math import floor, ceil, log2
 from numbers import Integral
 
 from ._switchboard import PySbPacket, PySbTx, PySbRx
+from .aio import Send, Recv, run_steps, run_steps_async
 
 
 class ApbTxRx:
@@ -21,7 +22,9 @@ class ApbTxRx:
         prot: int = 0,
         slv_err_expected: bool = False,
         queue_suffix: str = '.q',
-        max_rate: float = -1
+        max_rate: float = -1,
+        capacity: int = 0,
+        hugepages: bool = False
     ):
         """
         Parameters
@@ -46,6 +49,11 @@ class ApbTxRx:
             File extension/suffix to use when naming switchboard queues that carry
             APB transactions.  For example, if set to ".queue", the write address
             queue name will be "{uri}-aw.queue"
+        capacity: int, optional
+            Number of packets that each queue can hold.  Defaults to 0, meaning as
+            many as fit in one page.
+        hugepages: bool, optional
+            If True, back the queues with 2 MiB huge pages.
         """
 
         # check data types
@@ -69,8 +77,9 @@ class ApbTxRx:
         self.default_slv_err_expected = slv_err_expected
 
         # create the queues
-        self.apb_req = PySbTx(f'{uri}_apb_req{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.apb_resp = PySbRx(f'{uri}_apb_resp{queue_suffix}', fresh=fresh, max_rate=max_rate)
+        kwargs = dict(max_rate=max_rate, capacity=capacity, hugepages=hugepages)
+        self.apb_req = PySbTx(f'{uri}_apb_req{queue_suffix}', fresh=fresh, **kwargs)
+        self.apb_resp = PySbRx(f'{uri}_apb_resp{queue_suffix}', fresh=fresh, **kwargs)
 
     @property
     def strb_width(self):
@@ -116,6 +125,25 @@ class ApbTxRx:
         )
         return slv_err
 
+    async def write_async(
+        self,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        slv_err_expected: bool = None
+    ):
+        """
+        Same as write(), but awaits the queues rather than blocking on them.
+        """
+        (rd_data, slv_err) = await self.transaction_async(
+            write=True,
+            addr=addr,
+            data=data,
+            prot=prot,
+            slv_err_expected=slv_err_expected
+        )
+        return slv_err
+
     def read(
         self,
         addr: Integral,
@@ -152,6 +180,24 @@ class ApbTxRx:
         )
         return rd_data
 
+    async def read_async(
+        self,
+        addr: Integral,
+        prot: Integral = None,
+        resp_expected: str = None
+    ):
+        """
+        Same as read(), but awaits the queues rather than blocking on them.
+        """
+        (rd_data, slv_err) = await self.transaction_async(
+            write=False,
+            addr=addr,
+            data=None,
+            prot=prot,
+            slv_err_expected=resp_expected
+        )
+        return rd_data
+
     def transaction(
         self,
         write: bool,
@@ -185,6 +231,31 @@ class ApbTxRx:
             slv_err: True if SLVERR was received, False otherwise.
         """
 
+        return run_steps(self._transaction(write, addr, data, prot, slv_err_expected))
+
+    async def transaction_async(
+        self,
+        write: bool,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        slv_err_expected: bool = None
+    ):
+        """
+        Same as transaction(), but awaits the queues rather than blocking on them.
+        """
+
+        return await run_steps_async(
+            self._transaction(write, addr, data, prot, slv_err_expected), self)
+
+    def _transaction(
+        self,
+        write: bool,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        slv_err_expected: bool = None
+    ):
         # set defaults
 
         if prot is None:
@@ -248,10 +319,10 @@ class ApbTxRx:
         pack[data_bytes + addr_bytes:] = header
         pack = PySbPacket(data=pack, flags=1, destination=0)
         # Transmit request
-        self.apb_req.send(pack, True)
+        yield Send(self.apb_req, pack)
 
         # wait for response
-        pack = self.apb_resp.recv(True)
+        pack = yield Recv(self.apb_resp)
         pack = pack.data.tobytes()
         pack = int.from_bytes(pack, 'little')
 
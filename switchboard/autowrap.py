@@ -12,7 +12,7 @@ from .axil import AxiLiteTxRx
 from switchboard.apb import ApbTxRx
 from .bitvector import slice_to_msb_lsb
 
-from ._switchboard import PySbTx, PySbRx
+from ._switchboard import PySbTx, PySbRx, sb_packet_size, delete_queues
 
 
 class WireExpr:
@@ -607,6 +607,7 @@ def autowrap(
 
     lines += [
         tab + 'string uri_sb_value;',
+        tab + 'integer capacity_sb_value;',
         '',
         tab + 'initial begin',
         (2 * tab) + '/* verilator lint_off IGNOREDRETURN */'
@@ -623,10 +624,22 @@ def autowrap(
 
             lines += [
                 (2 * tab) + f'if($value$plusargs("{wire}=%s", uri_sb_value)) begin',
-                (3 * tab) + f'{wire}_sb_inst.init(uri_sb_value);',
-                (2 * tab) + 'end'
+                (3 * tab) + 'capacity_sb_value = 0;',
+                (3 * tab) + f"void'($value$plusargs(\"{wire}_capacity=%d\", capacity_sb_value));",
+                (3 * tab) + f'{wire}_sb_inst.init(uri_sb_value, capacity_sb_value);',
             ]
 
+            # outputs can be tapped, copying the traffic to another queue
+
+            if (value['type'] in ['sb', 'umi']) and direction_is_output(value['direction']):
+                lines += [
+                    (3 * tab) + f'if($value$plusargs("{wire}_tap=%s", uri_sb_value)) begin',
+                    (4 * tab) + f'{wire}_sb_inst.add_tap(uri_sb_value);',
+                    (3 * tab) + 'end'
+                ]
+
+            lines += [(2 * tab) + 'end']
+
     lines += [
         (2 * tab) + '/* verilator lint_on IGNOREDRETURN */',
         tab + 'end'
@@ -844,7 +857,11 @@ def normalize_intf_type(type):
         raise ValueError(f'Unsupported interface type: "{type}"')
 
 
-def create_intf_objs(intf_defs, fresh=True, max_rate=-1):
+def create_intf_objs(intf_defs, fresh=True, max_rate=-1, placed=()):
+    # "placed" is a collection of URIs of queues that have been created
+    # already (see SbNetwork.place_queues), which are kept even if "fresh"
+    # is set.
+
     intf_objs = {}
 
     umi_txrx = {}
@@ -877,6 +894,10 @@ def create_intf_objs(intf_defs, fresh=True, max_rate=-1):
                     # use default if not set for this particular interface
                     umi_txrx[txrx]['max_rate'] = max_rate
 
+                for key in ['capacity', 'hugepages']:
+                    if value.get(key, None) is not None:
+                        umi_txrx[txrx][key] = value[key]
+
                 direction = value['direction']
 
                 if direction.lower() in ['i', 'in', 'input']:
@@ -886,12 +907,22 @@ def create_intf_objs(intf_defs, fresh=True, max_rate=-1):
                 else:
                     raise Exception(f'Unsupported UMI direction: {direction}')
             else:
-                intf_objs[name] = create_intf_obj(value, fresh=fresh, max_rate=max_rate)
+                intf_objs[name] = create_intf_obj(value,
+                    fresh=fresh and (value['uri'] not in placed), max_rate=max_rate)
         else:
-            intf_objs[name] = create_intf_obj(value, fresh=fresh, max_rate=max_rate)
+            intf_objs[name] = create_intf_obj(value,
+                fresh=fresh and (value['uri'] not in placed), max_rate=max_rate)
 
     for key, value in umi_txrx.items():
-        intf_objs[key] = UmiTxRx(**value, fresh=fresh)
+        uris = [value[k] for k in ['tx_uri', 'rx_uri'] if value[k] is not None]
+
+        if fresh and any(uri in placed for uri in uris):
+            # only one of the two queues was placed, so the other is
+            # deleted here rather than by the UmiTxRx constructor
+            delete_queues([uri for uri in uris if uri not in placed])
+            intf_objs[key] = UmiTxRx(**value, fresh=False)
+        else:
+            intf_objs[key] = UmiTxRx(**value, fresh=fresh)
 
     return intf_objs
 
@@ -909,6 +940,14 @@ def create_intf_obj(value, fresh=True, max_rate=-1):
             # use default if not set for this particular interface
             kwargs['max_rate'] = max_rate
 
+        for key in ['capacity', 'hugepages']:
+            if value.get(key, None) is not None:
+                kwargs[key] = value[key]
+
+        # must match the packet size chosen by the RTL side, which
+        # is derived from the interface width in the same way
+        kwargs['packet_size'] = sb_packet_size((value['dw'] + 7) // 8)
+
         if direction_is_input(direction):
             obj = PySbTx(value['uri'], fresh=fresh, **kwargs)
         elif direction_is_output(direction):
@@ -924,6 +963,10 @@ def create_intf_obj(value, fresh=True, max_rate=-1):
             # use default if not set for this particular interface
             kwargs['max_rate'] = max_rate
 
+        for key in ['capacity', 'hugepages']:
+            if value.get(key, None) is not None:
+                kwargs[key] = value[key]
+
         if direction_is_input(direction):
             obj = UmiTxRx(tx_uri=value['uri'], fresh=fresh, **kwargs)
         elif direction_is_output(direction):
@@ -951,6 +994,10 @@ def create_intf_obj(value, fresh=True, max_rate=-1):
             # use default if not set for this particular interface
             kwargs['max_rate'] = max_rate
 
+        for key in ['capacity', 'hugepages']:
+            if value.get(key, None) is not None:
+                kwargs[key] = value[key]
+
         if direction_is_subordinate(direction):
             obj = AxiTxRx(uri=value['uri'], data_width=value['dw'],
                 addr_width=value['aw'], id_width=value['idw'], **kwargs)
@@ -968,6 +1015,10 @@ def create_intf_obj(value, fresh=True, max_rate=-1):
             # use default if not set for this particular interface
             kwargs['max_rate'] = max_rate
 
+        for key in ['capacity', 'hugepages']:
+            if value.get(key, None) is not None:
+                kwargs[key] = value[key]
+
         if direction_is_subordinate(direction):
             obj = AxiLiteTxRx(uri=value['uri'], data_width=value['dw'],
                 addr_width=value['aw'], **kwargs)
@@ -985,6 +1036,10 @@ def create_intf_obj(value, fresh=True, max_rate=-1):
             # use default if not set for this particular interface
             kwargs['max_rate'] = max_rate
 
+        for key in ['capacity', 'hugepages']:
+            if value.get(key, None) is not None:
+                kwargs[key] = value[key]
+
         if direction_is_subordinate(direction):
             obj = ApbTxRx(
                 uri=value['uri'],
@@ -9,6 +9,7 @@ from math import floor, ceil, log2
 from numbers import Integral
 
 from ._switchboard import PySbPacket, PySbTx, PySbRx
+from .aio import Send, Recv, run_steps, run_steps_async
 
 
 class AxiTxRx:
@@ -25,7 +26,9 @@ class AxiTxRx:
         max_beats: int = 256,
         resp_expected: str = 'OKAY',
         queue_suffix: str = '.q',
-        max_rate: float = -1
+        max_rate: float = -1,
+        capacity: int = 0,
+        hugepages: bool = False
     ):
         """
         Parameters
@@ -67,6 +70,11 @@ class AxiTxRx:
             File extension/suffix to use when naming switchboard queues that carry
             AXI transactions.  For example, if set to ".queue", the write address
             queue name will be "{uri}-aw.queue"
+        capacity: int, optional
+            Number of packets that each queue can hold.  Defaults to 0, meaning as
+            many as fit in one page.
+        hugepages: bool, optional
+            If True, back the queues with 2 MiB huge pages.
         """
 
         # check data types
@@ -98,11 +106,12 @@ class AxiTxRx:
         self.default_resp_expected = resp_expected
 
         # create the queues
-        self.aw = PySbTx(f'{uri}-aw{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.w = PySbTx(f'{uri}-w{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.b = PySbRx(f'{uri}-b{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.ar = PySbTx(f'{uri}-ar{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.r = PySbRx(f'{uri}-r{queue_suffix}', fresh=fresh, max_rate=max_rate)
+        kwargs = dict(max_rate=max_rate, capacity=capacity, hugepages=hugepages)
+        self.aw = PySbTx(f'{uri}-aw{queue_suffix}', fresh=fresh, **kwargs)
+        self.w = PySbTx(f'{uri}-w{queue_suffix}', fresh=fresh, **kwargs)
+        self.b = PySbRx(f'{uri}-b{queue_suffix}', fresh=fresh, **kwargs)
+        self.ar = PySbTx(f'{uri}-ar{queue_suffix}', fresh=fresh, **kwargs)
+        self.r = PySbRx(f'{uri}-r{queue_suffix}', fresh=fresh, **kwargs)
 
     @property
     def strb_width(self):
@@ -157,6 +166,35 @@ class AxiTxRx:
             'SLVERR', or 'DECERR'.
         """
 
+        return run_steps(self._write(addr, data, prot, id, size, max_beats, resp_expected))
+
+    async def write_async(
+        self,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        id: Integral = None,
+        size: Integral = None,
+        max_beats: Integral = None,
+        resp_expected: str = None
+    ):
+        """
+        Same as write(), but awaits the queues rather than blocking on them.
+        """
+
+        return await run_steps_async(self._write(addr, data, prot, id, size, max_beats,
+            resp_expected), self)
+
+    def _write(
+        self,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        id: Integral = None,
+        size: Integral = None,
+        max_beats: Integral = None,
+        resp_expected: str = None
+    ):
         # set defaults
 
         if prot is None:
@@ -244,8 +282,8 @@ class AxiTxRx:
             assert 1 <= beats <= max_beats
 
             # transmit the write address
-            self.aw.send(self.pack_addr(addr & addr_mask, prot=prot, size=size,
-                len=beats - 1, id=id), True)
+            yield Send(self.aw, self.pack_addr(addr & addr_mask, prot=prot, size=size,
+                len=beats - 1, id=id))
 
             for beat in range(beats):
                 # find the offset into the data bus for this beat.  bytes below
@@ -269,14 +307,14 @@ class AxiTxRx:
                     last = 1
                 else:
                     last = 0
-                self.w.send(self.pack_w(data, strb=strb, last=last), True)
+                yield Send(self.w, self.pack_w(data, strb=strb, last=last))
 
                 # increment pointers
                 bytes_sent += bytes_this_beat
                 addr += bytes_this_beat
 
             # wait for response
-            resp, id = self.unpack_b(self.b.recv(True))
+            resp, id = self.unpack_b((yield Recv(self.b)))
 
             # decode the response
             resp = decode_resp(resp)
@@ -344,6 +382,38 @@ class AxiTxRx:
             Value read, as an arbitrary-size Python integer.
         """
 
+        return run_steps(self._read(addr, num_or_dtype, dtype, prot, id, size, max_beats,
+            resp_expected))
+
+    async def read_async(
+        self,
+        addr: Integral,
+        num_or_dtype,
+        dtype=np.uint8,
+        prot: Integral = None,
+        id: Integral = None,
+        size: Integral = None,
+        max_beats: Integral = None,
+        resp_expected: str = None
+    ):
+        """
+        Same as read(), but awaits the queues rather than blocking on them.
+        """
+
+        return await run_steps_async(self._read(addr, num_or_dtype, dtype, prot, id, size,
+            max_beats, resp_expected), self)
+
+    def _read(
+        self,
+        addr: Integral,
+        num_or_dtype,
+        dtype=np.uint8,
+        prot: Integral = None,
+        id: Integral = None,
+        size: Integral = None,
+        max_beats: Integral = None,
+        resp_expected: str = None
+    ):
         # set defaults
 
         if prot is None:
@@ -415,8 +485,8 @@ class AxiTxRx:
             assert 1 <= beats <= max_beats
 
             # transmit read address
-            self.ar.send(self.pack_addr(addr & addr_mask, prot=prot, size=size,
-                len=beats - 1, id=id), True)
+            yield Send(self.ar, self.pack_addr(addr & addr_mask, prot=prot, size=size,
+                len=beats - 1, id=id))
 
             for _ in range(beats):
                 # find the offset into the data bus for this beat.  bytes below
@@ -427,7 +497,7 @@ class AxiTxRx:
                 bytes_this_beat = min(bytes_to_read - bytes_read, (1 << size) - offset)
 
                 # wait for response
-                data, resp, id, last = self.unpack_r(self.r.recv(True))
+                data, resp, id, last = self.unpack_r((yield Recv(self.r)))
                 retval[bytes_read:bytes_read + bytes_this_beat] = \
                     data = data[offset:offset + bytes_this_beat]
 
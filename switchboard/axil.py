@@ -9,6 +9,7 @@ from math import floor, ceil, log2
 from numbers import Integral
 
 from ._switchboard import PySbPacket, PySbTx, PySbRx
+from .aio import Send, Recv, run_steps, run_steps_async
 
 
 class AxiLiteTxRx:
@@ -21,7 +22,9 @@ class AxiLiteTxRx:
         prot: int = 0,
         resp_expected: str = 'OKAY',
         queue_suffix: str = '.q',
-        max_rate: float = -1
+        max_rate: float = -1,
+        capacity: int = 0,
+        hugepages: bool = False
     ):
         """
         Parameters
@@ -51,6 +54,11 @@ class AxiLiteTxRx:
             File extension/suffix to use when naming switchboard queues that carry
             AXI transactions.  For example, if set to ".queue", the write address
             queue name will be "{uri}-aw.queue"
+        capacity: int, optional
+            Number of packets that each queue can hold.  Defaults to 0, meaning as
+            many as fit in one page.
+        hugepages: bool, optional
+            If True, back the queues with 2 MiB huge pages.
         """
 
         # check data types
@@ -74,11 +82,12 @@ class AxiLiteTxRx:
         self.default_resp_expected = resp_expected
 
         # create the queues
-        self.aw = PySbTx(f'{uri}-aw{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.w = PySbTx(f'{uri}-w{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.b = PySbRx(f'{uri}-b{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.ar = PySbTx(f'{uri}-ar{queue_suffix}', fresh=fresh, max_rate=max_rate)
-        self.r = PySbRx(f'{uri}-r{queue_suffix}', fresh=fresh, max_rate=max_rate)
+        kwargs = dict(max_rate=max_rate, capacity=capacity, hugepages=hugepages)
+        self.aw = PySbTx(f'{uri}-aw{queue_suffix}', fresh=fresh, **kwargs)
+        self.w = PySbTx(f'{uri}-w{queue_suffix}', fresh=fresh, **kwargs)
+        self.b = PySbRx(f'{uri}-b{queue_suffix}', fresh=fresh, **kwargs)
+        self.ar = PySbTx(f'{uri}-ar{queue_suffix}', fresh=fresh, **kwargs)
+        self.r = PySbRx(f'{uri}-r{queue_suffix}', fresh=fresh, **kwargs)
 
     @property
     def strb_width(self):
@@ -117,6 +126,28 @@ class AxiLiteTxRx:
             'SLVERR', or 'DECERR'.
         """
 
+        return run_steps(self._write(addr, data, prot, resp_expected))
+
+    async def write_async(
+        self,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        resp_expected: str = None
+    ):
+        """
+        Same as write(), but awaits the queues rather than blocking on them.
+        """
+
+        return await run_steps_async(self._write(addr, data, prot, resp_expected), self)
+
+    def _write(
+        self,
+        addr: Integral,
+        data,
+        prot: Integral = None,
+        resp_expected: str = None
+    ):
         # set defaults
 
         if prot is None:
@@ -195,17 +226,17 @@ class AxiLiteTxRx:
             pack = pack.to_bytes((self.addr_width + 3 + 7) // 8, 'little')
             pack = np.frombuffer(pack, dtype=np.uint8)
             pack = PySbPacket(data=pack, flags=1, destination=0)
-            self.aw.send(pack, True)
+            yield Send(self.aw, pack)
 
             # write data and strobe
             pack = np.empty((data_bytes + strb_bytes,), dtype=np.uint8)
             pack[offset:offset + bytes_this_cycle] = data_this_cycle
             pack[data_bytes:data_bytes + strb_bytes] = strb
             pack = PySbPacket(data=pack, flags=1, destination=0)
-            self.w.send(pack, True)
+            yield Send(self.w, pack)
 
             # wait for response
-            pack = self.b.recv(True)
+            pack = yield Recv(self.b)
             pack = pack.data.tobytes()
             pack = int.from_bytes(pack, 'little')
 
@@ -263,6 +294,31 @@ class AxiLiteTxRx:
             Value read, as an arbitrary-size Python integer.
         """
 
+        return run_steps(self._read(addr, num_or_dtype, dtype, prot, resp_expected))
+
+    async def read_async(
+        self,
+        addr: Integral,
+        num_or_dtype,
+        dtype=np.uint8,
+        prot: Integral = None,
+        resp_expected: str = None
+    ):
+        """
+        Same as read(), but awaits the queues rather than blocking on them.
+        """
+
+        return await run_steps_async(
+            self._read(addr, num_or_dtype, dtype, prot, resp_expected), self)
+
+    def _read(
+        self,
+        addr: Integral,
+        num_or_dtype,
+        dtype=np.uint8,
+        prot: Integral = None,
+        resp_expected: str = None
+    ):
         # set defaults
 
         if prot is None:
@@ -316,10 +372,10 @@ class AxiLiteTxRx:
             pack = pack.to_bytes((self.addr_width + 3 + 7) // 8, 'little')
             pack = np.frombuffer(pack, dtype=np.uint8)
             pack = PySbPacket(data=pack, flags=1, destination=0)
-            self.ar.send(pack, True)
+            yield Send(self.ar, pack)
 
             # wait for response
-            pack = self.r.recv(True)
+            pack = yield Recv(self.r)
             data = pack.data[offset:offset + bytes_this_cycle]
             resp = pack.data[data_bytes] & 0b11
 
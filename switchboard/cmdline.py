@@ -12,6 +12,8 @@ def get_cmdline_args(
     fast: bool = False,
     single_netlist: bool = False,
     threads: int = None,
+    network_rate: float = -1,
+    max_lag: int = -1,
     extra_args: dict = None
 ):
     """
@@ -49,6 +51,17 @@ def get_cmdline_args(
         for performance modeling when latencies are large and/or variable.  A value of
         "-1" means that the rate-limiting feature is disabled.
 
+    network_rate: float, optional
+        If provided, the maximum real-world rate that all of the simulators in a
+        distributed network are allowed to run at together, in Hz.  The rate is divided
+        evenly among the simulators that are running.  A value of "-1" means that this
+        feature is disabled.
+
+    max_lag: int, optional
+        If provided, the maximum number of cycles that a simulator in a distributed
+        network is allowed to run ahead of the slowest one.  A value of "-1" means that
+        this feature is disabled.
+
     start_delay: float, optional
         If provided, the real-world time to delay before the first clock tick in the
         simulation.  Can be useful to make sure that programs start at approximately
@@ -103,6 +116,14 @@ def get_cmdline_args(
     parser.add_argument('--max-rate', type=float, default=max_rate,
         help='Maximum real-world rate that the simulation is allowed to run at, in Hz.')
 
+    parser.add_argument('--network-rate', type=float, default=network_rate,
+        help='Maximum real-world rate that all simulators in a network are allowed to run at'
+        ' together, in Hz.')
+
+    parser.add_argument('--max-lag', type=int, default=max_lag,
+        help='Maximum number of cycles that a simulator in a network is allowed to run ahead'
+        ' of the slowest one.')
+
     parser.add_argument('--start-delay', type=float, default=start_delay,
         help='Delay before starting simulation, in seconds.  Can be useful to prevent'
         ' simulations from stepping on each others toes when starting up.')
@@ -0,0 +1,262 @@
+// Simulation rate governor implemented over shared-memory
+
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// A governor is a small shared-memory file that the simulators in a network
+// join when they start.  It holds a clock rate budget for the whole network,
+// which is divided evenly among the simulators that are running, and a limit
+// on how many cycles any simulator may get ahead of the slowest one, so that
+// a simulator feeding a congested part of the network doesn't run far ahead
+// of it.  Each member publishes its cycle count every so often; members are
+// identified by their process ID, so that the slots of processes that exit
+// without leaving can be reclaimed.  Only simulators join (from their clock
+// tick); TCP bridges don't have a clock, and are paced by their queues.
+
+#ifndef SB_GOVERNOR_H__
+#define SB_GOVERNOR_H__
+
+#include <errno.h>
+#include <signal.h>
+
+#include "spsc_queue.h"
+
+// Environment variable naming the governor that simulators should join.
+// The name is resolved like a queue name (see SPSC_QUEUE_ROOT_ENV).
+#define SB_GOVERNOR_ENV "SB_GOVERNOR"
+
+#define SB_GOVERNOR_MAGIC 0x31474253 // "SBG1"
+#define SB_GOVERNOR_MAX_MEMBERS 256
+
+// How often a member that is too far ahead checks whether it can go on.
+#define SB_GOVERNOR_POLL_US 100
+
+// Each member only writes its own slot, which has a cache line to itself.
+// A slot is free if its pid is 0, and is being claimed if its pid is -1.
+typedef struct sb_governor_member {
+    int32_t pid __attribute__((__aligned__(SPSC_QUEUE_CACHE_LINE_SIZE)));
+    uint64_t cycles __attribute__((__aligned__(8)));
+} sb_governor_member;
+
+typedef struct sb_governor_shared {
+    uint32_t magic;
+    int32_t n_slots;   // number of slots that have ever been used
+    uint64_t max_rate; // cycles per second for all members together; 0 means no limit
+    int64_t max_lag;   // cycles a member may be ahead of the slowest; 0 means no limit
+    sb_governor_member members[SB_GOVERNOR_MAX_MEMBERS];
+} sb_governor_shared;
+
+typedef struct sb_governor {
+    sb_governor_shared* shm;
+    sb_governor_member* self;
+} sb_governor;
+
+static inline sb_governor_shared* sb_governor_map(const char* name, bool create) {
+    sb_governor_shared* shm = NULL;
+    struct stat st;
+    char* path;
+    void* p;
+    int fd;
+
+    path = spsc_queue_path(name, create);
+    if (!path) {
+        return NULL;
+    }
+
+    fd = open(path, O_RDWR | (create ? O_CREAT : 0), S_IRUSR | S_IWUSR);
+    free(path);
+    if (fd < 0) {
+        return NULL;
+    }
+
+    if (fstat(fd, &st) == 0) {
+        if ((size_t)st.st_size < sizeof(sb_governor_shared)) {
+            if (!create || (ftruncate(fd, sizeof(sb_governor_shared)) < 0)) {
+                close(fd);
+                return NULL;
+            }
+        }
+
+        p = mmap(NULL, sizeof(sb_governor_shared), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (p != MAP_FAILED) {
+            shm = (sb_governor_shared*)p;
+        }
+    }
+
+    close(fd);
+    return shm;
+}
+
+// Creates a governor, or changes the budget of an existing one.  Members
+// pick up the new budget the next time that they check in.
+static inline bool sb_governor_configure(const char* name, uint64_t max_rate, int64_t max_lag) {
+    sb_governor_shared* shm = sb_governor_map(name, true);
+
+    if (!shm) {
+        return false;
+    }
+
+    __atomic_store_n(&shm->max_rate, max_rate, __ATOMIC_RELAXED);
+    __atomic_store_n(&shm->max_lag, max_lag, __ATOMIC_RELAXED);
+    __atomic_store_n(&shm->magic, SB_GOVERNOR_MAGIC, __ATOMIC_RELEASE);
+
+    munmap(shm, sizeof(sb_governor_shared));
+    return true;
+}
+
+static inline bool sb_governor_alive(int32_t pid) {
+    return (kill(pid, 0) == 0) || (errno == EPERM);
+}
+
+// Returns the slowest member other than "self", or NULL if there is none.
+static inline sb_governor_member* sb_governor_slowest(sb_governor_shared* shm,
+    sb_governor_member* self) {
+    sb_governor_member* slowest = NULL;
+    uint64_t min_cycles = 0;
+    int n_slots = __atomic_load_n(&shm->n_slots, __ATOMIC_ACQUIRE);
+    int i;
+
+    for (i = 0; i < n_slots; i++) {
+        sb_governor_member* m = &shm->members[i];
+        if ((m != self) && (__atomic_load_n(&m->pid, __ATOMIC_ACQUIRE) > 0)) {
+            uint64_t cycles = __atomic_load_n(&m->cycles, __ATOMIC_RELAXED);
+            if (!slowest || (cycles < min_cycles)) {
+                slowest = m;
+                min_cycles = cycles;
+            }
+        }
+    }
+
+    return slowest;
+}
+
+// Joins the governor with the given name, returning NULL if it doesn't
+// exist or is full.  The new member starts out level with the slowest
+// existing member, so that it doesn't hold the others back.
+static inline sb_governor* sb_governor_join(const char* name) {
+    sb_governor_shared* shm;
+    sb_governor_member* slowest;
+    sb_governor* gov;
+    int32_t n_slots;
+    int32_t used;
+    int i;
+
+    shm = sb_governor_map(name, false);
+    if (!shm) {
+        return NULL;
+    }
+
+    if (__atomic_load_n(&shm->magic, __ATOMIC_ACQUIRE) != SB_GOVERNOR_MAGIC) {
+        goto err;
+    }
+
+    gov = (sb_governor*)malloc(sizeof(sb_governor));
+    if (!gov) {
+        goto err;
+    }
+    gov->shm = shm;
+    gov->self = NULL;
+
+    for (i = 0; (i < SB_GOVERNOR_MAX_MEMBERS) && !gov->self; i++) {
+        int32_t pid = __atomic_load_n(&shm->members[i].pid, __ATOMIC_ACQUIRE);
+        if ((pid == 0) || ((pid > 0) && !sb_governor_alive(pid))) {
+            if (__atomic_compare_exchange_n(&shm->members[i].pid, &pid, -1, false, __ATOMIC_ACQUIRE,
+                    __ATOMIC_RELAXED)) {
+                gov->self = &shm->members[i];
+            }
+        }
+    }
+
+    if (!gov->self) {
+        free(gov);
+        goto err;
+    }
+
+    // make sure that other members scan the slot before it is marked as taken
+    used = (gov->self - shm->members) + 1;
+    n_slots = __atomic_load_n(&shm->n_slots, __ATOMIC_RELAXED);
+    while (n_slots < used) {
+        __atomic_compare_exchange_n(&shm->n_slots, &n_slots, used, true, __ATOMIC_RELEASE,
+            __ATOMIC_RELAXED);
+    }
+
+    slowest = sb_governor_slowest(shm, gov->self);
+    __atomic_store_n(&gov->self->cycles,
+        slowest ? __atomic_load_n(&slowest->cycles, __ATOMIC_RELAXED) : 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&gov->self->pid, getpid(), __ATOMIC_RELEASE);
+
+    return gov;
+
+err:
+    munmap(shm, sizeof(sb_governor_shared));
+    return NULL;
+}
+
+static inline void sb_governor_leave(sb_governor* gov) {
+    if (!gov) {
+        return;
+    }
+
+    __atomic_store_n(&gov->self->pid, 0, __ATOMIC_RELEASE);
+    munmap(gov->shm, sizeof(sb_governor_shared));
+    free(gov);
+}
+
+// Returns this member's share of the rate budget as a minimum period per
+// cycle in nanoseconds, or -1 if there is no budget.  Typical shares are
+// around a microsecond, so whole microseconds would be too coarse.
+static inline long sb_governor_period_ns(sb_governor* gov) {
+    uint64_t max_rate = __atomic_load_n(&gov->shm->max_rate, __ATOMIC_RELAXED);
+    int n_slots = __atomic_load_n(&gov->shm->n_slots, __ATOMIC_ACQUIRE);
+    int members = 0;
+    long period_ns;
+    int i;
+
+    if (max_rate == 0) {
+        return -1;
+    }
+
+    for (i = 0; i < n_slots; i++) {
+        if (__atomic_load_n(&gov->shm->members[i].pid, __ATOMIC_RELAXED) > 0) {
+            members++;
+        }
+    }
+
+    // a period of zero would mean no limit
+    period_ns = (members * 1.0e9 / max_rate) + 0.5;
+    return (period_ns > 0) ? period_ns : 1;
+}
+
+// Publishes that this member has run "cycles" more cycles, and then sleeps
+// for as long as it is too far ahead of the slowest member.  Members whose
+// processes have exited without leaving are removed along the way.
+static inline void sb_governor_sync(sb_governor* gov, uint64_t cycles) {
+    uint64_t own = __atomic_load_n(&gov->self->cycles, __ATOMIC_RELAXED) + cycles;
+    __atomic_store_n(&gov->self->cycles, own, __ATOMIC_RELAXED);
+
+    while (true) {
+        int64_t max_lag = __atomic_load_n(&gov->shm->max_lag, __ATOMIC_RELAXED);
+        if (max_lag <= 0) {
+            return;
+        }
+
+        sb_governor_member* slowest = sb_governor_slowest(gov->shm, gov->self);
+        if (!slowest) {
+            return;
+        }
+
+        int32_t pid = __atomic_load_n(&slowest->pid, __ATOMIC_RELAXED);
+        if (own <= (__atomic_load_n(&slowest->cycles, __ATOMIC_RELAXED) + max_lag)) {
+            return;
+        }
+
+        if ((pid > 0) && !sb_governor_alive(pid)) {
+            __atomic_compare_exchange_n(&slowest->pid, &pid, 0, false, __ATOMIC_RELAXED,
+                __ATOMIC_RELAXED);
+        } else {
+            usleep(SB_GOVERNOR_POLL_US);
+        }
+    }
+}
+
+#endif // SB_GOVERNOR_H__
@@ -0,0 +1,112 @@
+// Multiple Producer Single Consumer Queue implemented over shared-memory
+
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// The queue has the same layout as an SPSC queue, and is received from with
+// the usual spsc_recv() family of functions, so the consumer doesn't need to
+// know that there are several producers.  Producers claim slots by advancing
+// the shared "claim" sequence number, write their packets, and then publish
+// them by advancing the head pointer in the order that the slots were claimed.
+// This means that a producer that is descheduled between claiming a slot and
+// publishing it holds up the other producers until it resumes.
+//
+// Every producer of a queue must use these functions.  The claim sequence
+// number counts up without wrapping around, so that a compare-and-swap can't
+// succeed on a stale value after the queue has wrapped around.
+
+#ifndef MPSC_QUEUE_H__
+#define MPSC_QUEUE_H__
+
+#include <sched.h>
+
+#include "spsc_queue.h"
+
+// Must be called by each producer after opening a queue.  If a queue that was
+// previously used with a single producer is opened with multiple producers,
+// the claim sequence number starts from the current head pointer.
+static inline void mpsc_init(spsc_queue* q) {
+    uint64_t claim = 0;
+    int32_t head;
+
+    __atomic_load(&q->shm->head, &head, __ATOMIC_ACQUIRE);
+
+    if (head != 0) {
+        __atomic_compare_exchange_n(&q->shm->claim, &claim, (uint64_t)head, false, __ATOMIC_RELAXED,
+            __ATOMIC_RELAXED);
+    }
+}
+
+// Claims the next slot in the queue, returning false if the queue is full.
+static inline bool mpsc_claim(spsc_queue* q, uint64_t* claim) {
+    int32_t next;
+    int32_t tail;
+
+    *claim = __atomic_load_n(&q->shm->claim, __ATOMIC_ACQUIRE);
+
+    do {
+        next = (*claim + 1) % q->capacity;
+
+        // unlike with a single producer, the tail pointer can't be cached,
+        // since other producers may have claimed slots past the cached value.
+        // it has to be read after the claim sequence number, so that the two
+        // are consistent if the compare-and-swap below succeeds, which is
+        // why the claim sequence number is read with acquire ordering.
+        __atomic_load(&q->shm->tail, &tail, __ATOMIC_ACQUIRE);
+        if (next == tail) {
+            __atomic_fetch_add(&q->shm->tx_counters.full, 1, __ATOMIC_RELAXED);
+            return false;
+        }
+    } while (!__atomic_compare_exchange_n(&q->shm->claim, claim, *claim + 1, true, __ATOMIC_ACQUIRE,
+        __ATOMIC_ACQUIRE));
+
+    return true;
+}
+
+// Publishes the packet written into a claimed slot, once the packets in all
+// of the slots claimed before it have been published.
+static inline void mpsc_publish(spsc_queue* q, uint64_t claim) {
+    int32_t head = claim % q->capacity;
+    int32_t next_head = (claim + 1) % q->capacity;
+
+    while (__atomic_load_n(&q->shm->head, __ATOMIC_ACQUIRE) != head) {
+        sched_yield();
+    }
+
+    __atomic_fetch_add(&q->shm->tx_counters.enqueued, 1, __ATOMIC_RELAXED);
+    __atomic_store(&q->shm->head, &next_head, __ATOMIC_RELEASE);
+    spsc_wake_rx(q);
+}
+
+static inline bool mpsc_send(spsc_queue* q, void* buf, size_t size) {
+    uint64_t claim;
+
+    assert(size <= (size_t)q->packet_size);
+
+    if (!mpsc_claim(q, &claim)) {
+        return false;
+    }
+
+    memcpy(spsc_slot(q, claim % q->capacity), buf, size);
+    mpsc_publish(q, claim);
+
+    return true;
+}
+
+// Sleeps until the queue might have room for another packet, or until
+// "timeout_us" microseconds have passed.  Several producers can wait at
+// once, so the waiting flag counts the number of producers waiting.
+static inline void mpsc_wait_not_full(spsc_queue* q, long timeout_us) {
+    uint64_t claim;
+    int32_t tail;
+
+    __atomic_fetch_add(&q->shm->tx_waiting, 1, __ATOMIC_SEQ_CST);
+    claim = __atomic_load_n(&q->shm->claim, __ATOMIC_SEQ_CST);
+    tail = __atomic_load_n(&q->shm->tail, __ATOMIC_SEQ_CST);
+    if ((int32_t)((claim + 1) % q->capacity) == tail) {
+        spsc_futex_wait(&q->shm->tail, tail, timeout_us);
+    }
+    __atomic_fetch_sub(&q->shm->tx_waiting, 1, __ATOMIC_RELAXED);
+}
+
+#endif // MPSC_QUEUE_H__
@@ -60,8 +60,21 @@ int main(int argc, char* argv[]) {
         return 1;
     }
 
+    // queues that kept packets from being routed on the last pass over
+    // the RX connections, so that the router can sleep until one of them
+    // is ready rather than polling all of them.  the set is only built
+    // when a pass routed nothing, so that passes that move traffic don't
+    // pay for it.
+    SBQueueSet blocked;
+    std::vector<SBRX*> blocked_rx;
+    std::vector<SBTX*> blocked_tx;
+
     sb_packet p;
     while (true) {
+        bool routed = false;
+        blocked_rx.clear();
+        blocked_tx.clear();
+
         // loop over all RX connection
         for (auto& rx : rxconn) {
             if (rx->is_active()) {
@@ -75,14 +88,30 @@ int main(int argc, char* argv[]) {
                         // the RX queue if the send is successful
                         if (txconn[routing_table[p.destination]]->send(p)) {
                             rx->recv();
+                            routed = true;
+                        } else {
+                            blocked_tx.push_back(txconn[routing_table[p.destination]].get());
                         }
                     } else {
                         printf("ERROR: Cannot route packet.\n");
                         return 1;
                     }
+                } else {
+                    blocked_rx.push_back(rx.get());
                 }
             }
         }
+
+        if (!routed) {
+            blocked.clear();
+            for (SBRX* rx : blocked_rx) {
+                blocked.add(*rx);
+            }
+            for (SBTX* tx : blocked_tx) {
+                blocked.add(*tx);
+            }
+            blocked.wait(SB_WAIT_TIMEOUT_US);
+        }
     }
 
     return 0;
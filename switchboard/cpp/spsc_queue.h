@@ -7,15 +7,24 @@
 #define SPSC_QUEUE_H__
 
 #include <assert.h>
+#include <errno.h>
 #include <fcntl.h>
 #include <stdbool.h>
+#include <stddef.h>
 #include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <sys/mman.h>
+#include <sys/stat.h>
 #include <unistd.h>
 
+#ifdef __linux__
+#include <linux/futex.h>
+#include <sys/syscall.h>
+#include <time.h>
+#endif
+
 #ifdef __cplusplus
 #include <atomic>
 using namespace std;
@@ -28,12 +37,84 @@ using namespace std;
 #define MAP_POPULATE 0
 #endif
 
+// Default size of each packet slot.  Queues opened with spsc_open_sized()
+// can use larger slots, which are always a multiple of the cache line size.
 #define SPSC_QUEUE_MAX_PACKET_SIZE 64
 #define SPSC_QUEUE_CACHE_LINE_SIZE 64
 
+// Size that mappings are rounded up to when a queue is opened with
+// huge pages, e.g. on a hugetlbfs mount such as /dev/hugepages.
+#define SPSC_QUEUE_HUGEPAGE_SIZE (2 * 1024 * 1024)
+
+// Queue header identification.  The magic number reads "SBQ1" in memory;
+// the version is bumped whenever the shared-memory layout changes.
+#define SPSC_QUEUE_MAGIC 0x31514253
+#define SPSC_QUEUE_MAGIC_BUSY 0xffffffff
+#define SPSC_QUEUE_VERSION 1
+
+// Environment variable naming the directory where queues with relative
+// names are created, e.g. a directory in /dev/shm, so that queue files are
+// kept in memory even if the working directory is on a network file system.
+#define SPSC_QUEUE_ROOT_ENV "SB_QUEUE_ROOT"
+
+// How long spsc_wait_any() sleeps at a time when it can't sleep on all of
+// its queues at once, in microseconds.
+#define SPSC_QUEUE_POLL_US 50
+
+// Describes the layout of a queue, so that both sides of a queue (and tools
+// that inspect queues) can check that they agree on it.  Filled in by
+// whichever side creates the queue; "magic" is written last.
+typedef struct spsc_queue_header {
+    uint32_t magic;
+    uint32_t version;
+    uint32_t packet_size;
+    uint32_t capacity;
+    int32_t tx_pid;
+    int32_t rx_pid;
+} spsc_queue_header;
+
+// Performance counters, which are kept separately for each side of the
+// queue.  Each side only writes its own counters, which are in the cache
+// line that it already writes, so they are updated with plain loads and
+// stores rather than atomic read-modify-write operations.
+typedef struct spsc_queue_tx_counters {
+    uint64_t enqueued; // packets sent
+    uint64_t full;     // sends that failed because the queue was full
+} spsc_queue_tx_counters;
+
+typedef struct spsc_queue_rx_counters {
+    uint64_t dequeued;   // packets received
+    uint64_t empty;      // receives that failed because the queue was empty
+    uint64_t high_water; // most packets seen in the queue at once
+} spsc_queue_rx_counters;
+
+// Snapshot of both sets of counters, as returned by spsc_get_stats().
+typedef struct spsc_queue_stats {
+    uint64_t enqueued;
+    uint64_t dequeued;
+    uint64_t full;
+    uint64_t empty;
+    uint64_t high_water;
+} spsc_queue_stats;
+
+// The FPGA queue logic writes the first 8 bytes of the head and tail cache
+// lines, so any other fields in those lines must start at an offset of 8
+// or more.  The header only changes when a queue is opened, so it shares
+// the head cache line rather than adding a line before the packets, which
+// would move them from where the FPGA expects them.  Each waiting flag is
+// placed in the cache line of the pointer that the waiter is sleeping on,
+// since that is the line the other side writes when it publishes.  The
+// counters are also placed in the line written by the side that updates
+// them.  They aren't updated by the FPGA.
 typedef struct spsc_queue_shared {
     int32_t head __attribute__((__aligned__(SPSC_QUEUE_CACHE_LINE_SIZE)));
+    int32_t rx_waiting __attribute__((__aligned__(8)));
+    spsc_queue_header header __attribute__((__aligned__(8)));
+    spsc_queue_tx_counters tx_counters __attribute__((__aligned__(8)));
+    uint64_t claim __attribute__((__aligned__(8))); // used by mpsc_queue.h
     int32_t tail __attribute__((__aligned__(SPSC_QUEUE_CACHE_LINE_SIZE)));
+    int32_t tx_waiting __attribute__((__aligned__(8)));
+    spsc_queue_rx_counters rx_counters __attribute__((__aligned__(8)));
     uint32_t packets[1][SPSC_QUEUE_MAX_PACKET_SIZE / 4]
         __attribute__((__aligned__(SPSC_QUEUE_CACHE_LINE_SIZE)));
 } spsc_queue_shared;
@@ -44,24 +125,40 @@ typedef struct spsc_queue {
     spsc_queue_shared* shm;
     char* name;
     int capacity;
+    int packet_size;
 
     bool unmap_at_close;
+    bool hugepages;
 } spsc_queue;
 
-// Returns the capacity of a queue given a specific mapsize.
-static inline int spsc_capacity(size_t mapsize) {
-    spsc_queue* q = NULL;
+// Returns the slot size actually used for a requested packet size: zero
+// selects the default, and other sizes are rounded up to a whole number
+// of cache lines so that every slot stays cache-line aligned.
+static inline size_t spsc_packet_size(size_t packet_size) {
+    if (packet_size == 0) {
+        return SPSC_QUEUE_MAX_PACKET_SIZE;
+    }
+
+    return ((packet_size + SPSC_QUEUE_CACHE_LINE_SIZE - 1) / SPSC_QUEUE_CACHE_LINE_SIZE) *
+           SPSC_QUEUE_CACHE_LINE_SIZE;
+}
+
+// Returns the capacity of a queue given a specific mapsize and packet size.
+static inline int spsc_capacity_sized(size_t mapsize, size_t packet_size) {
+    size_t offset = offsetof(spsc_queue_shared, packets);
     int capacity;
 
-    if (mapsize < sizeof(*q->shm)) {
+    packet_size = spsc_packet_size(packet_size);
+
+    if (mapsize < offset) {
         return 0;
     }
 
-    // Start with the size of the shared area. This includes the
-    // control members + one packet.
-    mapsize -= sizeof(*q->shm);
+    // Remove the control members at the start of the shared area,
+    // leaving only the space for packets.
+    mapsize -= offset;
 
-    capacity = mapsize / sizeof(q->shm->packets[0]) + 1;
+    capacity = mapsize / packet_size;
 
     if (capacity < 2) {
         // Capacities less than 2 are invalid.
@@ -71,31 +168,225 @@ static inline int spsc_capacity(size_t mapsize) {
     return capacity;
 }
 
-static inline size_t spsc_mapsize(int capacity) {
-    spsc_queue* q = NULL;
+// Returns the capacity of a queue given a specific mapsize.
+static inline int spsc_capacity(size_t mapsize) {
+    return spsc_capacity_sized(mapsize, SPSC_QUEUE_MAX_PACKET_SIZE);
+}
+
+static inline size_t spsc_mapsize_sized(int capacity, size_t packet_size) {
     size_t mapsize;
 
     assert(capacity >= 2);
 
-    // Start with the size of the shared area. This includes the
-    // control members + one packet.
-    mapsize = sizeof(*q->shm);
-    // Add additional packets.
-    mapsize += sizeof(q->shm->packets[0]) * (capacity - 1);
+    // Start with the control members at the start of the shared area.
+    mapsize = offsetof(spsc_queue_shared, packets);
+    // Add the packets.
+    mapsize += spsc_packet_size(packet_size) * capacity;
 
     return mapsize;
 }
 
-static inline spsc_queue* spsc_open_mem(const char* name, size_t capacity, void* mem) {
+static inline size_t spsc_mapsize(int capacity) {
+    return spsc_mapsize_sized(capacity, SPSC_QUEUE_MAX_PACKET_SIZE);
+}
+
+// Returns the size of the mapping actually used for an open queue.
+static inline size_t spsc_queue_mapsize(spsc_queue* q) {
+    size_t mapsize = spsc_mapsize_sized(q->capacity, q->packet_size);
+
+    if (q->hugepages) {
+        mapsize = ((mapsize + SPSC_QUEUE_HUGEPAGE_SIZE - 1) / SPSC_QUEUE_HUGEPAGE_SIZE) *
+                  SPSC_QUEUE_HUGEPAGE_SIZE;
+    }
+
+    return mapsize;
+}
+
+// Returns a pointer to the packet slot at a given index.
+static inline void* spsc_slot(spsc_queue* q, int idx) {
+    return (uint8_t*)q->shm->packets + (size_t)idx * q->packet_size;
+}
+
+// Sleeps until the value at "addr" might differ from "val", or until
+// "timeout_us" microseconds have passed.  Spurious wakeups are possible.
+static inline void spsc_futex_wait(int32_t* addr, int32_t val, long timeout_us) {
+#ifdef __linux__
+    struct timespec ts;
+
+    ts.tv_sec = timeout_us / 1000000;
+    ts.tv_nsec = (timeout_us % 1000000) * 1000;
+
+    // not FUTEX_PRIVATE_FLAG, since the queue is shared between processes
+    syscall(SYS_futex, addr, FUTEX_WAIT, val, &ts, NULL, 0);
+#else
+    (void)addr;
+    (void)val;
+    usleep(timeout_us);
+#endif
+}
+
+static inline void spsc_futex_wake(int32_t* addr) {
+#ifdef __linux__
+    // wake up all waiters, since there can be several senders
+    // sleeping on a queue with multiple producers (see mpsc_queue.h)
+    syscall(SYS_futex, addr, FUTEX_WAKE, INT32_MAX, NULL, NULL, 0);
+#else
+    (void)addr;
+#endif
+}
+
+// Called after publishing a new head or tail pointer, to wake up the other
+// side if it is sleeping.  The waiting flag is read without a full fence,
+// to keep the fast path cheap, so a wakeup can occasionally be missed;
+// this is why waits always have a timeout.
+static inline void spsc_wake_rx(spsc_queue* q) {
+    if (__atomic_load_n(&q->shm->rx_waiting, __ATOMIC_RELAXED)) {
+        spsc_futex_wake(&q->shm->head);
+    }
+}
+
+static inline void spsc_wake_tx(spsc_queue* q) {
+    if (__atomic_load_n(&q->shm->tx_waiting, __ATOMIC_RELAXED)) {
+        spsc_futex_wake(&q->shm->tail);
+    }
+}
+
+// Returns the path of the file for the queue with the given name, which
+// the caller must free, or NULL if memory couldn't be allocated.  Relative
+// names are placed in the directory named by SB_QUEUE_ROOT, if it is set,
+// and that directory is created if "create" is true.
+static inline char* spsc_queue_path(const char* name, bool create) {
+    const char* root = getenv(SPSC_QUEUE_ROOT_ENV);
+    char* path;
+
+    if (!root || !root[0] || (name[0] == '/')) {
+        return strdup(name);
+    }
+
+    if (create) {
+        // errors other than the directory existing show up when the
+        // queue file is opened
+        mkdir(root, S_IRWXU);
+    }
+
+    path = (char*)malloc(strlen(root) + strlen(name) + 2);
+    if (path) {
+        sprintf(path, "%s/%s", root, name);
+    }
+    return path;
+}
+
+// Reads the header of an existing queue file, returning false if the file
+// doesn't start with a valid header (e.g., if it is empty or was created by
+// an older version of switchboard).
+static inline bool spsc_read_header_fd(int fd, spsc_queue_header* hdr) {
+    ssize_t n;
+
+    n = pread(fd, hdr, sizeof *hdr, offsetof(spsc_queue_shared, header));
+
+    return (n == (ssize_t)sizeof *hdr) && (hdr->magic == SPSC_QUEUE_MAGIC);
+}
+
+static inline bool spsc_read_header(const char* name, spsc_queue_header* hdr) {
+    char* path;
+    bool valid;
+    int fd;
+
+    path = spsc_queue_path(name, false);
+    fd = path ? open(path, O_RDONLY) : -1;
+    free(path);
+    if (fd < 0) {
+        return false;
+    }
+
+    valid = spsc_read_header_fd(fd, hdr);
+    close(fd);
+
+    return valid;
+}
+
+// Checks that a queue header matches the layout requested when opening it.
+static inline bool spsc_check_header(const char* name, spsc_queue_header* hdr, size_t capacity,
+    size_t packet_size) {
+    if (hdr->version != SPSC_QUEUE_VERSION) {
+        fprintf(stderr, "%s: unsupported queue version %u (expected %u)\n", name, hdr->version,
+            SPSC_QUEUE_VERSION);
+        return false;
+    }
+
+    if (hdr->capacity != capacity) {
+        fprintf(stderr, "%s: queue capacity is %u, but %zu was requested\n", name, hdr->capacity,
+            capacity);
+        return false;
+    }
+
+    if (hdr->packet_size != packet_size) {
+        fprintf(stderr, "%s: queue packet size is %u, but %zu was requested\n", name,
+            hdr->packet_size, packet_size);
+        return false;
+    }
+
+    return true;
+}
+
+// Fills in the header of a newly created queue, or validates the header of
+// an existing one.  The magic number is claimed atomically, so that if both
+// sides create the queue at the same time, one of them checks the header
+// written by the other.  If "adopt_capacity" is set, the capacity of the
+// queue wasn't specified, and the capacity in the other side's header is
+// taken rather than checked, in which case the caller has to remap the
+// queue if q->capacity changed.
+static inline bool spsc_init_header(spsc_queue* q, bool adopt_capacity) {
+    spsc_queue_header* hdr = &q->shm->header;
+    uint32_t magic = 0;
+
+    if (__atomic_compare_exchange_n(&hdr->magic, &magic, SPSC_QUEUE_MAGIC_BUSY, false,
+            __ATOMIC_ACQUIRE, __ATOMIC_ACQUIRE)) {
+        hdr->version = SPSC_QUEUE_VERSION;
+        hdr->packet_size = q->packet_size;
+        hdr->capacity = q->capacity;
+        __atomic_store_n(&hdr->magic, SPSC_QUEUE_MAGIC, __ATOMIC_RELEASE);
+        return true;
+    }
+
+    while (magic == SPSC_QUEUE_MAGIC_BUSY) {
+        usleep(1);
+        magic = __atomic_load_n(&hdr->magic, __ATOMIC_ACQUIRE);
+    }
+
+    if (magic != SPSC_QUEUE_MAGIC) {
+        fprintf(stderr, "%s: not a switchboard queue\n", q->name);
+        return false;
+    }
+
+    if (adopt_capacity && (hdr->version == SPSC_QUEUE_VERSION)) {
+        q->capacity = hdr->capacity;
+    }
+
+    return spsc_check_header(q->name, hdr, q->capacity, q->packet_size);
+}
+
+// Opens a queue, with the mapping rounded up to a whole number of huge
+// pages if "hugepages" is set.  The queue file then has to be on hugetlbfs
+// for explicit huge pages; otherwise, transparent huge pages are requested
+// for the mapping, which takes effect if they are enabled for shmem.
+//
+// If the queue already exists, its header must match the requested capacity
+// and packet size.  A capacity of zero means to use the capacity of the
+// existing queue, or one page worth of default-size packets for a new queue.
+static inline spsc_queue* spsc_open_base(const char* name, size_t capacity, size_t packet_size,
+    bool hugepages, void* mem) {
+    spsc_queue_header hdr;
     spsc_queue* q = NULL;
+    char* path = NULL;
+    bool valid = false;
+    bool guessed = false;
+    struct stat st;
     size_t mapsize;
     void* p;
     int fd = -1;
     int r;
 
-    // Compute the size of the SHM mapping.
-    mapsize = spsc_mapsize(capacity);
-
     // Allocate a cache-line aligned spsc-queue.
     r = posix_memalign(&p, SPSC_QUEUE_CACHE_LINE_SIZE, sizeof(spsc_queue));
     if (r) {
@@ -105,20 +396,70 @@ static inline spsc_queue* spsc_open_mem(const char* name, size_t capacity, void*
     q = (spsc_queue*)p;
     memset(q, 0, sizeof *q);
 
-    p = mem;
-    if (!mem) {
-        fd = open(name, O_RDWR | O_CREAT, S_IRUSR | S_IWUSR);
+    packet_size = spsc_packet_size(packet_size);
+    q->name = strdup(name);
+
+    if (mem) {
+        hdr = ((spsc_queue_shared*)mem)->header;
+        valid = (hdr.magic == SPSC_QUEUE_MAGIC);
+    } else {
+        path = spsc_queue_path(name, true);
+        if (!path) {
+            goto err;
+        }
+
+        fd = open(path, O_RDWR | O_CREAT, S_IRUSR | S_IWUSR);
         if (fd < 0) {
-            perror(name);
+            perror(path);
             goto err;
         }
+        free(path);
+        path = NULL;
 
-        r = ftruncate(fd, mapsize);
+        valid = spsc_read_header_fd(fd, &hdr);
+    }
+
+    // Take the capacity from an existing queue if it isn't specified.
+    // Otherwise, make sure that it matches before resizing the file.
+    if (valid) {
+        if (capacity == 0) {
+            capacity = hdr.capacity;
+        }
+        if (!spsc_check_header(name, &hdr, capacity, packet_size)) {
+            goto err;
+        }
+    }
+
+    // If another opener is creating the queue with a different capacity at
+    // the same time, its header wins; see spsc_init_header().
+    if (capacity == 0) {
+        capacity = spsc_capacity(getpagesize());
+        guessed = true;
+    }
+
+    // Compute the size of the SHM mapping.
+    q->capacity = capacity;
+    q->packet_size = packet_size;
+    q->hugepages = hugepages;
+    mapsize = spsc_queue_mapsize(q);
+
+    p = mem;
+    if (!mem) {
+        r = fstat(fd, &st);
         if (r < 0) {
-            perror("ftruncate");
+            perror("fstat");
             goto err;
         }
 
+        // Only resize the file if it is too small, e.g. if it was just created.
+        if ((size_t)st.st_size < mapsize) {
+            r = ftruncate(fd, mapsize);
+            if (r < 0) {
+                perror("ftruncate");
+                goto err;
+            }
+        }
+
         // Map a shared file-backed mapping for the SHM area.
         // This will always be page-aligned.
         p = mmap(NULL, mapsize, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_POPULATE, fd, 0);
@@ -128,14 +469,63 @@ static inline spsc_queue* spsc_open_mem(const char* name, size_t capacity, void*
             goto err;
         }
 
-        // We can now close the fd without affecting active mmaps.
-        close(fd);
+#ifdef MADV_HUGEPAGE
+        if (hugepages) {
+            // Best effort, since this fails harmlessly on hugetlbfs or if
+            // transparent huge pages aren't available.
+            madvise(p, mapsize, MADV_HUGEPAGE);
+        }
+#endif
+
         q->unmap_at_close = true;
     }
 
     q->shm = (spsc_queue_shared*)p;
-    q->name = strdup(name);
-    q->capacity = capacity;
+
+    if (!spsc_init_header(q, guessed)) {
+        if (q->unmap_at_close) {
+            munmap(p, mapsize);
+        }
+        goto err;
+    }
+
+    // Map the queue again if its capacity was taken from the other side's
+    // header.  The other side sized the file before writing the header, but
+    // this side may have shrunk it since, if both resized it at once.
+    if (q->unmap_at_close && (spsc_queue_mapsize(q) != mapsize)) {
+        munmap(p, mapsize);
+        mapsize = spsc_queue_mapsize(q);
+
+        r = fstat(fd, &st);
+        if ((r == 0) && ((size_t)st.st_size < mapsize)) {
+            r = ftruncate(fd, mapsize);
+        }
+        if (r < 0) {
+            perror("ftruncate");
+            goto err;
+        }
+
+        p = mmap(NULL, mapsize, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_POPULATE, fd, 0);
+
+        if (p == MAP_FAILED) {
+            perror("mmap");
+            goto err;
+        }
+
+#ifdef MADV_HUGEPAGE
+        if (hugepages) {
+            madvise(p, mapsize, MADV_HUGEPAGE);
+        }
+#endif
+
+        q->shm = (spsc_queue_shared*)p;
+    }
+
+    if (fd >= 0) {
+        // We can now close the fd without affecting active mmaps.
+        close(fd);
+        fd = -1;
+    }
 
     /* In case we're opening a pre-existing queue, pick up where we left off. */
     __atomic_load(&q->shm->tail, &q->cached_tail, __ATOMIC_RELAXED);
@@ -146,22 +536,57 @@ err:
     if (fd > 0) {
         close(fd);
     }
+    free(path);
+    if (q) {
+        free(q->name);
+    }
     free(q);
     return NULL;
 }
 
+// Record the process on each side of a queue, for tools that inspect it.
+static inline void spsc_set_tx_pid(spsc_queue* q) {
+    __atomic_store_n(&q->shm->header.tx_pid, getpid(), __ATOMIC_RELAXED);
+}
+
+static inline void spsc_set_rx_pid(spsc_queue* q) {
+    __atomic_store_n(&q->shm->header.rx_pid, getpid(), __ATOMIC_RELAXED);
+}
+
+static inline spsc_queue* spsc_open_mem_sized(const char* name, size_t capacity, size_t packet_size,
+    void* mem) {
+    return spsc_open_base(name, capacity, packet_size, false, mem);
+}
+
+static inline spsc_queue* spsc_open_mem(const char* name, size_t capacity, void* mem) {
+    return spsc_open_mem_sized(name, capacity, SPSC_QUEUE_MAX_PACKET_SIZE, mem);
+}
+
 static inline int spsc_mlock(spsc_queue* q) {
-    size_t mapsize = spsc_mapsize(q->capacity);
+    size_t mapsize = spsc_queue_mapsize(q);
 
     return mlock(q->shm, mapsize);
 }
 
+static inline spsc_queue* spsc_open_sized(const char* name, size_t capacity, size_t packet_size) {
+    return spsc_open_mem_sized(name, capacity, packet_size, NULL);
+}
+
+static inline spsc_queue* spsc_open_huge(const char* name, size_t capacity, size_t packet_size) {
+    return spsc_open_base(name, capacity, packet_size, true, NULL);
+}
+
 static inline spsc_queue* spsc_open(const char* name, size_t capacity) {
     return spsc_open_mem(name, capacity, NULL);
 }
 
 static inline void spsc_remove_shmfile(const char* name) {
-    remove(name);
+    char* path = spsc_queue_path(name, false);
+
+    if (path) {
+        remove(path);
+        free(path);
+    }
 }
 
 static inline void spsc_close(spsc_queue* q) {
@@ -171,7 +596,7 @@ static inline void spsc_close(spsc_queue* q) {
         return;
     }
 
-    mapsize = spsc_mapsize(q->capacity);
+    mapsize = spsc_queue_mapsize(q);
 
     // We've already closed the file-descriptor. We now need to munmap the mmap.
     if (q->unmap_at_close) {
@@ -196,13 +621,73 @@ static inline int spsc_size(spsc_queue* q) {
     return size;
 }
 
+// Adds to a counter that is only written by one side of the queue.
+static inline void spsc_count(uint64_t* counter, uint64_t n) {
+    __atomic_store_n(counter, __atomic_load_n(counter, __ATOMIC_RELAXED) + n, __ATOMIC_RELAXED);
+}
+
+// Called by the receiver to refresh its copy of the head pointer.  Since
+// this happens whenever the receiver catches up with its copy, the number
+// of packets in the queue at this point is used for the high-water mark.
+static inline void spsc_refresh_head(spsc_queue* q, int tail) {
+    uint64_t size;
+
+    __atomic_load(&q->shm->head, &q->cached_head, __ATOMIC_ACQUIRE);
+
+    size =
+        (q->cached_head >= tail) ? (q->cached_head - tail) : (q->cached_head - tail + q->capacity);
+    if (size > __atomic_load_n(&q->shm->rx_counters.high_water, __ATOMIC_RELAXED)) {
+        __atomic_store_n(&q->shm->rx_counters.high_water, size, __ATOMIC_RELAXED);
+    }
+}
+
+static inline void spsc_shm_stats(spsc_queue_shared* shm, spsc_queue_stats* stats) {
+    stats->enqueued = __atomic_load_n(&shm->tx_counters.enqueued, __ATOMIC_RELAXED);
+    stats->dequeued = __atomic_load_n(&shm->rx_counters.dequeued, __ATOMIC_RELAXED);
+    stats->full = __atomic_load_n(&shm->tx_counters.full, __ATOMIC_RELAXED);
+    stats->empty = __atomic_load_n(&shm->rx_counters.empty, __ATOMIC_RELAXED);
+    stats->high_water = __atomic_load_n(&shm->rx_counters.high_water, __ATOMIC_RELAXED);
+}
+
+static inline void spsc_get_stats(spsc_queue* q, spsc_queue_stats* stats) {
+    spsc_shm_stats(q->shm, stats);
+}
+
+// Reads the counters of a queue without opening it, e.g. to monitor queues
+// used by other processes.  Returns false if the file isn't a valid queue.
+static inline bool spsc_read_stats(const char* name, spsc_queue_stats* stats) {
+    spsc_queue_shared shm;
+    char* path;
+    ssize_t n;
+    int fd;
+
+    path = spsc_queue_path(name, false);
+    fd = path ? open(path, O_RDONLY) : -1;
+    free(path);
+    if (fd < 0) {
+        return false;
+    }
+
+    // only the control members at the start of the shared area are read
+    n = pread(fd, &shm, offsetof(spsc_queue_shared, packets), 0);
+    close(fd);
+
+    if ((n != (ssize_t)offsetof(spsc_queue_shared, packets)) ||
+        (shm.header.magic != SPSC_QUEUE_MAGIC)) {
+        return false;
+    }
+
+    spsc_shm_stats(&shm, stats);
+    return true;
+}
+
 static inline bool spsc_send(spsc_queue* q, void* buf, size_t size) {
     // get pointer to head
     int head;
 
     __atomic_load(&q->shm->head, &head, __ATOMIC_RELAXED);
 
-    assert(size <= sizeof q->shm->packets[0]);
+    assert(size <= (size_t)q->packet_size);
 
     // compute the head pointer
     int next_head = head + 1;
@@ -214,15 +699,18 @@ static inline bool spsc_send(spsc_queue* q, void* buf, size_t size) {
     if (next_head == q->cached_tail) {
         __atomic_load(&q->shm->tail, &q->cached_tail, __ATOMIC_ACQUIRE);
         if (next_head == q->cached_tail) {
+            spsc_count(&q->shm->tx_counters.full, 1);
             return false;
         }
     }
 
     // otherwise write in the packet
-    memcpy(q->shm->packets[head], buf, size);
+    memcpy(spsc_slot(q, head), buf, size);
 
     // and update the head pointer
+    spsc_count(&q->shm->tx_counters.enqueued, 1);
     __atomic_store(&q->shm->head, &next_head, __ATOMIC_RELEASE);
+    spsc_wake_rx(q);
 
     return true;
 }
@@ -232,18 +720,19 @@ static inline bool spsc_recv_base(spsc_queue* q, void* buf, size_t size, bool po
     int tail;
     __atomic_load(&q->shm->tail, &tail, __ATOMIC_RELAXED);
 
-    assert(size <= sizeof q->shm->packets[0]);
+    assert(size <= (size_t)q->packet_size);
 
     // if the queue is empty, bail out
     if (tail == q->cached_head) {
-        __atomic_load(&q->shm->head, &q->cached_head, __ATOMIC_ACQUIRE);
+        spsc_refresh_head(q, tail);
         if (tail == q->cached_head) {
+            spsc_count(&q->shm->rx_counters.empty, 1);
             return false;
         }
     }
 
     // otherwise read out the packet
-    memcpy(buf, q->shm->packets[tail], size);
+    memcpy(buf, spsc_slot(q, tail), size);
 
     if (pop) {
         // and update the read pointer
@@ -251,12 +740,121 @@ static inline bool spsc_recv_base(spsc_queue* q, void* buf, size_t size, bool po
         if (tail == q->capacity) {
             tail = 0;
         }
+        spsc_count(&q->shm->rx_counters.dequeued, 1);
         __atomic_store(&q->shm->tail, &tail, __ATOMIC_RELEASE);
+        spsc_wake_tx(q);
     }
 
     return true;
 }
 
+// Sends up to "n" packets, each "size" bytes long and stored back-to-back
+// in "buf", publishing them with a single update of the head pointer.
+// Returns the number of packets sent, which is less than "n" if the
+// queue does not have enough room for all of them.
+static inline int spsc_send_burst(spsc_queue* q, void* buf, size_t size, int n) {
+    int head;
+    int room;
+    int count;
+    int i;
+    uint8_t* src = (uint8_t*)buf;
+
+    __atomic_load(&q->shm->head, &head, __ATOMIC_RELAXED);
+
+    assert(size <= (size_t)q->packet_size);
+
+    // determine how many packets can be written, only re-reading the shared
+    // tail pointer if the cached copy suggests that there isn't enough room
+    room = q->cached_tail - head - 1;
+    if (room < 0) {
+        room += q->capacity;
+    }
+    if (room < n) {
+        __atomic_load(&q->shm->tail, &q->cached_tail, __ATOMIC_ACQUIRE);
+        room = q->cached_tail - head - 1;
+        if (room < 0) {
+            room += q->capacity;
+        }
+    }
+
+    count = (n < room) ? n : room;
+    if (count < n) {
+        spsc_count(&q->shm->tx_counters.full, 1);
+    }
+    if (count <= 0) {
+        return 0;
+    }
+
+    // write in the packets
+    for (i = 0; i < count; i++) {
+        memcpy(spsc_slot(q, head), src, size);
+        src += size;
+        head++;
+        if (head == q->capacity) {
+            head = 0;
+        }
+    }
+
+    // and publish all of them at once
+    spsc_count(&q->shm->tx_counters.enqueued, count);
+    __atomic_store(&q->shm->head, &head, __ATOMIC_RELEASE);
+    spsc_wake_rx(q);
+
+    return count;
+}
+
+// Receives up to "n" packets into "buf", storing them back-to-back with
+// "size" bytes per packet, and releases their slots with a single update
+// of the tail pointer.  Returns the number of packets received.
+static inline int spsc_recv_burst(spsc_queue* q, void* buf, size_t size, int n) {
+    int tail;
+    int avail;
+    int count;
+    int i;
+    uint8_t* dst = (uint8_t*)buf;
+
+    __atomic_load(&q->shm->tail, &tail, __ATOMIC_RELAXED);
+
+    assert(size <= (size_t)q->packet_size);
+
+    // determine how many packets can be read, only re-reading the shared
+    // head pointer if the cached copy suggests that there aren't enough
+    avail = q->cached_head - tail;
+    if (avail < 0) {
+        avail += q->capacity;
+    }
+    if (avail < n) {
+        spsc_refresh_head(q, tail);
+        avail = q->cached_head - tail;
+        if (avail < 0) {
+            avail += q->capacity;
+        }
+    }
+
+    count = (n < avail) ? n : avail;
+    if (count <= 0) {
+        spsc_count(&q->shm->rx_counters.empty, 1);
+        return 0;
+    }
+
+    // read out the packets
+    for (i = 0; i < count; i++) {
+        memcpy(dst, spsc_slot(q, tail), size);
+        dst += size;
+        tail++;
+        if (tail == q->capacity) {
+            tail = 0;
+        }
+    }
+
+    // and release all of the slots at once
+    spsc_count(&q->shm->rx_counters.dequeued, count);
+    __atomic_store(&q->shm->tail, &tail, __ATOMIC_RELEASE);
+    spsc_wake_tx(q);
+
+    return count;
+}
+
 static inline bool spsc_recv(spsc_queue* q, void* buf, size_t size) {
     return spsc_recv_base(q, buf, size, true);
 }
@@ -264,4 +862,247 @@ static inline bool spsc_recv(spsc_queue* q, void* buf, size_t size) {
 static inline bool spsc_recv_peek(spsc_queue* q, void* buf, size_t size) {
     return spsc_recv_base(q, buf, size, false);
 }
+
+// Returns a pointer to the next free slot in the queue, so that a packet
+// can be written in place, or NULL if the queue is full.  The packet is
+// not visible to the receiver until spsc_commit() is called, and calling
+// spsc_reserve() again before then returns the same slot.
+static inline void* spsc_reserve(spsc_queue* q) {
+    int head;
+
+    __atomic_load(&q->shm->head, &head, __ATOMIC_RELAXED);
+
+    // compute the head pointer
+    int next_head = head + 1;
+    if (next_head == q->capacity) {
+        next_head = 0;
+    }
+
+    // if the queue is full, bail out
+    if (next_head == q->cached_tail) {
+        __atomic_load(&q->shm->tail, &q->cached_tail, __ATOMIC_ACQUIRE);
+        if (next_head == q->cached_tail) {
+            spsc_count(&q->shm->tx_counters.full, 1);
+            return NULL;
+        }
+    }
+
+    return spsc_slot(q, head);
+}
+
+// Publishes the packet written into the slot returned by spsc_reserve().
+static inline void spsc_commit(spsc_queue* q) {
+    int head;
+
+    __atomic_load(&q->shm->head, &head, __ATOMIC_RELAXED);
+
+    head++;
+    if (head == q->capacity) {
+        head = 0;
+    }
+    spsc_count(&q->shm->tx_counters.enqueued, 1);
+    __atomic_store(&q->shm->head, &head, __ATOMIC_RELEASE);
+    spsc_wake_rx(q);
+}
+
+// Returns a pointer to the oldest packet in the queue, so that it can be
+// read in place, or NULL if the queue is empty.  The slot remains owned
+// by the receiver until spsc_release() is called.
+static inline void* spsc_peek(spsc_queue* q) {
+    int tail;
+
+    __atomic_load(&q->shm->tail, &tail, __ATOMIC_RELAXED);
+
+    // if the queue is empty, bail out
+    if (tail == q->cached_head) {
+        spsc_refresh_head(q, tail);
+        if (tail == q->cached_head) {
+            spsc_count(&q->shm->rx_counters.empty, 1);
+            return NULL;
+        }
+    }
+
+    return spsc_slot(q, tail);
+}
+
+// Frees the slot returned by spsc_peek(), handing it back to the sender.
+static inline void spsc_release(spsc_queue* q) {
+    int tail;
+
+    __atomic_load(&q->shm->tail, &tail, __ATOMIC_RELAXED);
+
+    tail++;
+    if (tail == q->capacity) {
+        tail = 0;
+    }
+    spsc_count(&q->shm->rx_counters.dequeued, 1);
+    __atomic_store(&q->shm->tail, &tail, __ATOMIC_RELEASE);
+    spsc_wake_tx(q);
+}
+
+// Sleeps until the queue might have room for another packet, or until
+// "timeout_us" microseconds have passed.  Meant to be called by the sender
+// in place of spinning after spsc_send() or spsc_reserve() fails.
+static inline void spsc_wait_not_full(spsc_queue* q, long timeout_us) {
+    int32_t head;
+    int32_t tail;
+
+    __atomic_load(&q->shm->head, &head, __ATOMIC_RELAXED);
+
+    int next_head = head + 1;
+    if (next_head == q->capacity) {
+        next_head = 0;
+    }
+
+    // announce that we're waiting before checking one last time, so that
+    // the receiver sees the flag if it frees a slot after the check.  the
+    // flag is a count, since spsc_wait_any_or() may be waiting on the same
+    // queue from another thread.
+    __atomic_fetch_add(&q->shm->tx_waiting, 1, __ATOMIC_SEQ_CST);
+    tail = __atomic_load_n(&q->shm->tail, __ATOMIC_SEQ_CST);
+    if (next_head == tail) {
+        spsc_futex_wait(&q->shm->tail, tail, timeout_us);
+    }
+    __atomic_fetch_sub(&q->shm->tx_waiting, 1, __ATOMIC_RELAXED);
+}
+
+// Sleeps until the queue might not be empty, or until "timeout_us"
+// microseconds have passed.  Meant to be called by the receiver in place
+// of spinning after spsc_recv() or spsc_peek() fails.
+static inline void spsc_wait_not_empty(spsc_queue* q, long timeout_us) {
+    int32_t head;
+    int32_t tail;
+
+    __atomic_load(&q->shm->tail, &tail, __ATOMIC_RELAXED);
+
+    // as above, announce that we're waiting before the last check
+    __atomic_fetch_add(&q->shm->rx_waiting, 1, __ATOMIC_SEQ_CST);
+    head = __atomic_load_n(&q->shm->head, __ATOMIC_SEQ_CST);
+    if (head == tail) {
+        spsc_futex_wait(&q->shm->head, head, timeout_us);
+    }
+    __atomic_fetch_sub(&q->shm->rx_waiting, 1, __ATOMIC_RELAXED);
+}
+
+// Returns true if a packet could be received from the queue.
+static inline bool spsc_can_recv(spsc_queue* q) {
+    return __atomic_load_n(&q->shm->head, __ATOMIC_SEQ_CST) !=
+           __atomic_load_n(&q->shm->tail, __ATOMIC_SEQ_CST);
+}
+
+// Returns true if a packet could be sent to the queue by a single producer.
+static inline bool spsc_can_send(spsc_queue* q) {
+    int next_head = __atomic_load_n(&q->shm->head, __ATOMIC_SEQ_CST) + 1;
+    if (next_head == q->capacity) {
+        next_head = 0;
+    }
+    return next_head != __atomic_load_n(&q->shm->tail, __ATOMIC_SEQ_CST);
+}
+
+// Sleeps until any of the "n_rx" queues in "rx_qs" might not be empty, or
+// any of the "n_tx" queues in "tx_qs" might have room for another packet,
+// or until "timeout_us" microseconds have passed.  This lets one thread
+// serve many queues without polling each of them in turn.  On Linux, all
+// of the head and tail pointers are waited on at once with futex_waitv;
+// elsewhere, or if there are more than FUTEX_WAITV_MAX (128) pointers to
+// wait on, counting "wake", this falls back to polling the queues every
+// SPSC_QUEUE_POLL_US, so a wakeup can take that long to be noticed.
+//
+// If "wake" isn't NULL, the wait also ends once the value that it points
+// to differs from "wake_val", so that another thread of the same process
+// can cut the wait short by changing it and calling spsc_futex_wake(),
+// e.g. when the set of queues being waited on has changed.
+static inline void spsc_wait_any_or(spsc_queue** rx_qs, int n_rx, spsc_queue** tx_qs, int n_tx,
+    int32_t* wake, int32_t wake_val, long timeout_us) {
+    int n_wake = wake ? 1 : 0;
+    bool ready = false;
+    bool waited = false;
+    int i;
+
+    // announce that we're waiting before checking whether any queue is
+    // ready, for the same reason as in spsc_wait_not_full()
+    for (i = 0; i < n_rx; i++) {
+        __atomic_fetch_add(&rx_qs[i]->shm->rx_waiting, 1, __ATOMIC_SEQ_CST);
+    }
+    for (i = 0; i < n_tx; i++) {
+        __atomic_fetch_add(&tx_qs[i]->shm->tx_waiting, 1, __ATOMIC_SEQ_CST);
+    }
+
+#if defined(__linux__) && defined(SYS_futex_waitv)
+    if ((n_rx + n_tx + n_wake) <= FUTEX_WAITV_MAX) {
+        struct futex_waitv waiters[FUTEX_WAITV_MAX];
+        struct timespec ts;
+
+        memset(waiters, 0, sizeof(waiters));
+
+        // each queue is waited on with the pointer that the other side
+        // advances, using the value that was checked for readiness
+        for (i = 0; (i < n_rx) && !ready; i++) {
+            int32_t head = __atomic_load_n(&rx_qs[i]->shm->head, __ATOMIC_SEQ_CST);
+            ready = spsc_can_recv(rx_qs[i]);
+            waiters[i].uaddr = (uintptr_t)&rx_qs[i]->shm->head;
+            waiters[i].val = (uint32_t)head;
+            waiters[i].flags = FUTEX_32;
+        }
+        for (i = 0; (i < n_tx) && !ready; i++) {
+            int32_t tail = __atomic_load_n(&tx_qs[i]->shm->tail, __ATOMIC_SEQ_CST);
+            ready = spsc_can_send(tx_qs[i]);
+            waiters[n_rx + i].uaddr = (uintptr_t)&tx_qs[i]->shm->tail;
+            waiters[n_rx + i].val = (uint32_t)tail;
+            waiters[n_rx + i].flags = FUTEX_32;
+        }
+        if (wake && !ready) {
+            ready = (__atomic_load_n(wake, __ATOMIC_SEQ_CST) != wake_val);
+            waiters[n_rx + n_tx].uaddr = (uintptr_t)wake;
+            waiters[n_rx + n_tx].val = (uint32_t)wake_val;
+            waiters[n_rx + n_tx].flags = FUTEX_32;
+        }
+
+        if (!ready) {
+            // futex_waitv only takes an absolute timeout
+            clock_gettime(CLOCK_MONOTONIC, &ts);
+            ts.tv_sec += timeout_us / 1000000;
+            ts.tv_nsec += (timeout_us % 1000000) * 1000;
+            if (ts.tv_nsec >= 1000000000) {
+                ts.tv_sec++;
+                ts.tv_nsec -= 1000000000;
+            }
+
+            // not FUTEX_PRIVATE_FLAG, since the queues are shared between
+            // processes.  returning early because a pointer had already
+            // moved on, or because of a signal, counts as a spurious wakeup.
+            long rc =
+                syscall(SYS_futex_waitv, waiters, n_rx + n_tx + n_wake, 0, &ts, CLOCK_MONOTONIC);
+            waited = (rc == 0) || (errno != ENOSYS);
+        }
+    }
+#endif
+
+    if (!ready && !waited) {
+        for (i = 0; (i < n_rx) && !ready; i++) {
+            ready = spsc_can_recv(rx_qs[i]);
+        }
+        for (i = 0; (i < n_tx) && !ready; i++) {
+            ready = spsc_can_send(tx_qs[i]);
+        }
+        if (wake && !ready) {
+            ready = (__atomic_load_n(wake, __ATOMIC_SEQ_CST) != wake_val);
+        }
+        if (!ready) {
+            usleep(timeout_us < SPSC_QUEUE_POLL_US ? timeout_us : SPSC_QUEUE_POLL_US);
+        }
+    }
+
+    for (i = 0; i < n_rx; i++) {
+        __atomic_fetch_sub(&rx_qs[i]->shm->rx_waiting, 1, __ATOMIC_RELAXED);
+    }
+    for (i = 0; i < n_tx; i++) {
+        __atomic_fetch_sub(&tx_qs[i]->shm->tx_waiting, 1, __ATOMIC_RELAXED);
+    }
+}
+
+static inline void spsc_wait_any(spsc_queue** rx_qs, int n_rx, spsc_queue** tx_qs, int n_tx,
+    long timeout_us) {
+    spsc_wait_any_or(rx_qs, n_rx, tx_qs, n_tx, NULL, 0, timeout_us);
+}
 #endif // _SPSC_QUEUE
@@ -4,18 +4,26 @@
 #ifndef __SWITCHBOARD_HPP__
 #define __SWITCHBOARD_HPP__
 
+#include <algorithm>
 #include <array>
+#include <atomic>
 #include <chrono>
+#include <condition_variable>
 #include <cstdio>
+#include <mutex>
 #include <stdexcept>
 #include <string>
 #include <thread>
 #include <vector>
 
+#include "governor.h"
+#include "mpsc_queue.h"
 #include "spsc_queue.h"
 
-// packet type
-// TODO: make size runtime programmable
+// packet type.  SB_DATA_SIZE is the data size of a packet in a queue
+// with the default packet size; queues can be created with larger packets
+// (see sb_packet_size), in which case the data field extends past the
+// end of this struct.
 #define SB_DATA_SIZE 52
 struct sb_packet {
     uint32_t destination;
@@ -28,34 +36,129 @@ struct sb_packet {
     uint8_t data[SB_DATA_SIZE];
 } __attribute__((packed));
 
+// data size of packets in a queue with the given packet size.  the same
+// number of bytes is reserved for the destination and flags (and unused
+// padding) as with the default packet size, so that default-size queues
+// carry SB_DATA_SIZE bytes of data.
+static inline size_t sb_data_size(size_t packet_size) {
+    return spsc_packet_size(packet_size) - (spsc_packet_size(0) - SB_DATA_SIZE);
+}
+
+// returns the packet size needed to carry "data_size" bytes of data
+// in each packet.  widths that fit in an sb_packet use the default size.
+static inline size_t sb_packet_size(size_t data_size) {
+    return spsc_packet_size(data_size + (spsc_packet_size(0) - SB_DATA_SIZE));
+}
+
+// longest time that a blocking send or receive sleeps before checking the
+// queue again, which bounds the delay if a wakeup is missed (e.g., if the
+// other side of the queue is not switchboard software)
+#define SB_WAIT_TIMEOUT_US 1000
+
+// max_rate_tick() only reads the clock once enough operations have gone by
+// to take at least this long at the target rate, and so sleeps for about
+// this long at a time when running ahead of the target rate.
+#define SB_MAX_RATE_QUANTUM_US 100
+
 static inline long max_rate_timestamp_us() {
     return std::chrono::duration_cast<std::chrono::microseconds>(
-        std::chrono::high_resolution_clock::now().time_since_epoch())
+        std::chrono::steady_clock::now().time_since_epoch())
         .count();
 }
 
-static inline void max_rate_tick(long& last_us, long min_period_us) {
-    if (min_period_us > 0) {
-        // measure the time now
+static inline void max_rate_tick_ns(long& t_us, long& ops, long& rem_ns, long min_period_ns) {
+    // token-bucket rate limiter, called once per operation.  "t_us" is the
+    // time that the operations counted so far are scheduled to be done by,
+    // "ops" counts operations that haven't been added to "t_us" yet, and
+    // "rem_ns" holds the nanoseconds of the schedule that didn't add up to
+    // a whole microsecond.  all are state kept by the caller; "t_us" starts
+    // out as -1.
+
+    if (min_period_ns > 0) {
+        if (t_us == -1) {
+            t_us = max_rate_timestamp_us();
+            ops = 0;
+            rem_ns = 0;
+            return;
+        }
+
+        ops++;
+
+        if ((ops * min_period_ns) < (SB_MAX_RATE_QUANTUM_US * 1000)) {
+            return;
+        }
+
+        // schedule the batch of operations, sleeping if they were done
+        // ahead of schedule.  small delays, such as oversleeping, are made
+        // up for in the next batch, but if the operations fell further
+        // behind, the schedule restarts from now, so that a slow stretch
+        // isn't followed by a long burst of operations at full speed.
+
+        long ns = (ops * min_period_ns) + rem_ns;
+        t_us += ns / 1000;
+        rem_ns = ns % 1000;
+        ops = 0;
 
         long now_us = max_rate_timestamp_us();
 
-        // sleep if needed
+        if (t_us > now_us) {
+            std::this_thread::sleep_for(std::chrono::microseconds(t_us - now_us));
+        } else if ((now_us - t_us) > SB_MAX_RATE_QUANTUM_US) {
+            t_us = now_us;
+            rem_ns = 0;
+        }
+    }
+}
 
-        if (last_us != -1) {
-            long dt_us = now_us - last_us;
+static inline void max_rate_tick(long& t_us, long& ops, long min_period_us) {
+    // same as max_rate_tick_ns(), for a period in whole microseconds,
+    // which never leaves a remainder
+    long rem_ns = 0;
+    max_rate_tick_ns(t_us, ops, rem_ns, (min_period_us > 0) ? (min_period_us * 1000) : -1);
+}
 
-            if (dt_us < min_period_us) {
-                long sleep_us = min_period_us - dt_us;
-                std::this_thread::sleep_for(std::chrono::microseconds(sleep_us));
+// clock_rate_tick() checks in with the governor once per this many cycles
+#define SB_GOVERNOR_BATCH 256
+
+static inline void clock_rate_tick(long& t_us, long& ops, long min_period_us) {
+    // called once per simulated clock cycle.  works like max_rate_tick(),
+    // but if the SB_GOVERNOR environment variable names a governor (see
+    // governor.h), the process joins it, runs no faster than its share of
+    // the governor's budget, and waits when it gets too far ahead of the
+    // other members.  the membership lasts until the process exits.
+
+    static sb_governor* gov = NULL;
+    static bool joined = false;
+    static long cycles = 0;
+    static long share_ns = -1;
+    static long rem_ns = 0;
+
+    if (!joined) {
+        const char* name = getenv(SB_GOVERNOR_ENV);
+        if (name && name[0]) {
+            gov = sb_governor_join(name);
+            if (!gov) {
+                fprintf(stderr, "Could not join rate governor %s\n", name);
+            } else {
+                share_ns = sb_governor_period_ns(gov);
+                // leave on exit, so that the other members don't wait on a
+                // process that has finished but hasn't been reaped yet
+                atexit([] { sb_governor_leave(gov); });
             }
         }
+        joined = true;
+    }
 
-        // update the time stamp.  it is not enough to set last_us = now_us,
-        // due to the sleep_for invocation
-
-        last_us = max_rate_timestamp_us();
+    if (gov && (++cycles >= SB_GOVERNOR_BATCH)) {
+        sb_governor_sync(gov, cycles);
+        share_ns = sb_governor_period_ns(gov);
+        cycles = 0;
     }
+
+    // the share is usually a fraction of a microsecond off from a whole
+    // number, so the remainder is carried from one batch to the next
+    long min_period_ns = (min_period_us > 0) ? (min_period_us * 1000) : -1;
+    max_rate_tick_ns(t_us, ops, rem_ns, std::max(min_period_ns, share_ns));
 }
 
 static inline void start_delay(double value) {
@@ -67,30 +170,34 @@ static inline void start_delay(double value) {
 
 class SB_base {
   public:
-    SB_base() : m_active(false), m_q(NULL) {}
+    SB_base() : m_active(false), m_spin_budget(-1), m_q(NULL) {}
 
     virtual ~SB_base() {
         deinit();
     }
 
-    void init(std::string uri, size_t capacity = 0, bool fresh = false, double max_rate = -1) {
-        init(uri.c_str(), capacity, fresh, max_rate);
+    void init(std::string uri, size_t capacity = 0, bool fresh = false, double max_rate = -1,
+        size_t packet_size = 0, bool hugepages = false) {
+        init(uri.c_str(), capacity, fresh, max_rate, packet_size, hugepages);
     }
 
-    void init(const char* uri, size_t capacity = 0, bool fresh = false, double max_rate = -1) {
-        // Default to one page of capacity
-        if (capacity == 0) {
-            capacity = spsc_capacity(getpagesize());
-        }
-
+    void init(const char* uri, size_t capacity = 0, bool fresh = false, double max_rate = -1,
+        size_t packet_size = 0, bool hugepages = false) {
         // delete old queue if "fresh" is set
         if (fresh) {
             spsc_remove_shmfile(uri);
         }
 
-        m_q = spsc_open(uri, capacity);
+        // a capacity of zero means to use the capacity of an existing queue,
+        // or to create a queue with as many packets as fit in one page
+        m_q = spsc_open_base(uri, capacity, packet_size, hugepages, NULL);
+        if (!m_q) {
+            throw std::runtime_error(std::string("Could not open SB queue ") + uri);
+        }
         m_active = true;
+        on_open();
         m_timestamp_us = -1;
+        m_rate_ops = 0;
 
         set_max_rate(max_rate);
     }
@@ -115,6 +222,24 @@ class SB_base {
         return m_q->capacity;
     }
 
+    int get_packet_size(void) {
+        check_active();
+        return m_q->packet_size;
+    }
+
+    int get_data_size(void) {
+        return sb_data_size(get_packet_size());
+    }
+
+    spsc_queue_stats get_stats(void) {
+        // returns the performance counters of the queue, which are shared
+        // by both sides of the queue
+        spsc_queue_stats stats;
+        check_active();
+        spsc_get_stats(m_q, &stats);
+        return stats;
+    }
+
     void* get_shm_handle(void) {
         check_active();
         return m_q->shm;
@@ -128,42 +253,211 @@ class SB_base {
         }
     }
 
+    void set_spin_budget(int spin_budget) {
+        // sets the number of times that blocking operations retry before
+        // going to sleep until the other side of the queue makes progress.
+        // a negative value (the default) means to keep retrying.
+        m_spin_budget = spin_budget;
+    }
+
   protected:
+    friend class SBQueueSet;
+
+    // called after the queue is opened, for setup specific to one side
+    virtual void on_open(void) {}
+
     void check_active(void) {
         if (!m_active) {
             throw std::runtime_error("Using an uninitialized SB queue!");
         }
     }
 
+    bool spin_budget_exhausted(int& spins) {
+        return (m_spin_budget >= 0) && (spins++ >= m_spin_budget);
+    }
+
     bool m_auto_deinit;
     bool m_active;
+    int m_spin_budget;
     long m_min_period_us;
     long m_timestamp_us;
+    long m_rate_ops;
     spsc_queue* m_q;
 };
 
 class SBTX : public SB_base {
   public:
-    SBTX() {}
+    SBTX() : m_multi_producer(false), m_reserved(NULL) {}
+
+    ~SBTX() {
+        remove_taps();
+    }
+
+    void add_tap(const char* uri, size_t capacity = 0) {
+        // copies every packet sent from now on to the queue "uri", so that
+        // a monitor can observe the traffic by receiving from that queue.
+        // packets are dropped if the monitor falls behind (they are counted
+        // as "full" in the tap queue's stats), so the link is never slowed
+        // down by the monitor.  a capacity of zero means to use the capacity
+        // of the tap queue if it exists already.  must be called after init().
+        // with multiple producers, each of them sends to the tap, so the tap
+        // is treated as a queue with multiple producers as well.
+        check_active();
+        spsc_queue* tap = spsc_open_base(uri, capacity, m_q->packet_size, false, NULL);
+        if (!tap) {
+            throw std::runtime_error(std::string("Could not open SB tap queue ") + uri);
+        }
+        if (m_multi_producer) {
+            mpsc_init(tap);
+        }
+        m_taps.push_back(tap);
+    }
+
+    void add_tap(std::string uri, size_t capacity = 0) {
+        add_tap(uri.c_str(), capacity);
+    }
+
+    void remove_taps(void) {
+        for (spsc_queue* tap : m_taps) {
+            spsc_close(tap);
+        }
+        m_taps.clear();
+    }
+
+    void set_multi_producer(bool multi_producer) {
+        // allows several SBTX objects, in the same process or in different
+        // processes, to send to the same queue (see mpsc_queue.h).  all of
+        // the senders have to enable this.  must be called before init().
+        m_multi_producer = multi_producer;
+    }
+
+    bool is_multi_producer() {
+        return m_multi_producer;
+    }
 
     bool send(sb_packet& p) {
+        return send(&p, sizeof p);
+    }
+
+    bool send(const void* p, size_t nbytes) {
+        // sends a packet of up to get_packet_size() bytes, formatted
+        // like an sb_packet with a longer data field
+        check_active();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+
+        bool success;
+        if (m_multi_producer) {
+            success = mpsc_send(m_q, (void*)p, nbytes);
+        } else {
+            success = spsc_send(m_q, (void*)p, nbytes);
+        }
+
+        if (success) {
+            tap(p, nbytes);
+        }
+
+        return success;
+    }
+
+    int send_burst(sb_packet* p, int n) {
+        // sends up to "n" packets from the array "p", returning the number
+        // that were actually sent.  all of the packets sent are published
+        // at once, and the call counts as a single operation for max_rate.
+        // with multiple producers, the packets are published one at a time.
+        return send_burst(p, sizeof *p, n);
+    }
+
+    int send_burst(const void* p, size_t nbytes, int n) {
+        // same as above, for packets of "nbytes" bytes stored back-to-back,
+        // formatted like an sb_packet with a longer data field
+        check_active();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+
+        const uint8_t* src = (const uint8_t*)p;
+
+        int count = 0;
+        if (m_multi_producer) {
+            while ((count < n) && mpsc_send(m_q, (void*)(src + (count * nbytes)), nbytes)) {
+                count++;
+            }
+        } else {
+            count = spsc_send_burst(m_q, (void*)src, nbytes, n);
+        }
+
+        for (int i = 0; i < count; i++) {
+            tap(src + (i * nbytes), nbytes);
+        }
+
+        return count;
+    }
+
+    void send_burst_blocking(sb_packet* p, int n) {
+        int spins = 0;
+
+        while (n > 0) {
+            int count = send_burst(p, n);
+
+            p += count;
+            n -= count;
+
+            if (n > 0) {
+                wait(spins);
+            }
+        }
+    }
+
+    sb_packet* reserve() {
+        // returns a pointer to the next free slot in the queue, where a
+        // packet can be built in place before calling commit(), or NULL
+        // if the queue is full.  the packet may be up to get_packet_size()
+        // bytes long.  not supported with multiple producers.
+        check_active();
+        check_single_producer();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+        m_reserved = (sb_packet*)spsc_reserve(m_q);
+        return m_reserved;
+    }
+
+    void commit() {
+        // sends the packet built in the slot returned by reserve()
         check_active();
-        max_rate_tick(m_timestamp_us, m_min_period_us);
-        return spsc_send(m_q, &p, sizeof p);
+        check_single_producer();
+        if (!m_reserved) {
+            throw std::runtime_error("commit() called without a slot from reserve()");
+        }
+        tap(m_reserved, m_q->packet_size);
+        spsc_commit(m_q);
+        m_reserved = NULL;
     }
 
     void send_blocking(sb_packet& p) {
         bool success = false;
+        int spins = 0;
 
         while (!success) {
             success = send(p);
 
-            if ((!success) && (m_min_period_us == -1)) {
-                // maintain old behavior if max_rate isn't specified,
-                // i.e. yield on every iteration that the send isn't
-                // successful
-                std::this_thread::yield();
+            if (!success) {
+                wait(spins);
+            }
+        }
+    }
+
+    void wait(int& spins) {
+        // called after an unsuccessful send in a blocking loop, with "spins"
+        // starting at zero for each packet.  once the spin budget is used
+        // up, this sleeps until the receiver frees up space in the queue.
+        if (spin_budget_exhausted(spins)) {
+            if (m_multi_producer) {
+                mpsc_wait_not_full(m_q, SB_WAIT_TIMEOUT_US);
+            } else {
+                spsc_wait_not_full(m_q, SB_WAIT_TIMEOUT_US);
             }
+        } else if (m_min_period_us == -1) {
+            // maintain old behavior if max_rate isn't specified,
+            // i.e. yield on every iteration that the send isn't
+            // successful
+            std::this_thread::yield();
         }
     }
 
@@ -171,6 +465,44 @@ class SBTX : public SB_base {
         check_active();
         return spsc_size(m_q) == 0;
     }
+
+  protected:
+    void on_open(void) override {
+        spsc_set_tx_pid(m_q);
+        if (m_multi_producer) {
+            mpsc_init(m_q);
+        }
+    }
+
+    void tap(const void* p, size_t nbytes) {
+        // never blocks, so packets are dropped if a tap queue is full
+        for (spsc_queue* tap : m_taps) {
+            if (m_multi_producer) {
+                mpsc_send(tap, (void*)p, nbytes);
+            } else {
+                spsc_send(tap, (void*)p, nbytes);
+            }
+        }
+    }
+
+    void check_single_producer(void) {
+        if (m_multi_producer) {
+            throw std::runtime_error("Zero-copy sends are not supported with multiple producers");
+        }
+    }
+
+    bool m_multi_producer;
+    sb_packet* m_reserved;
+    std::vector<spsc_queue*> m_taps;
+};
+
+// SBTX for a queue that other SBTX_mpsc objects send to as well
+
+class SBTX_mpsc : public SBTX {
+  public:
+    SBTX_mpsc() {
+        set_multi_producer(true);
+    }
 };
 
 class SBRX : public SB_base {
@@ -179,37 +511,339 @@ class SBRX : public SB_base {
 
     bool recv(sb_packet& p) {
         check_active();
-        max_rate_tick(m_timestamp_us, m_min_period_us);
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
         return spsc_recv(m_q, &p, sizeof p);
     }
 
+    bool recv(void* p, size_t nbytes) {
+        // receives the first "nbytes" bytes of a packet, which may be
+        // up to get_packet_size() bytes long
+        check_active();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+        return spsc_recv(m_q, p, nbytes);
+    }
+
     bool recv() {
         check_active();
         sb_packet dummy_p;
-        max_rate_tick(m_timestamp_us, m_min_period_us);
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
         return spsc_recv(m_q, &dummy_p, sizeof dummy_p);
     }
 
     void recv_blocking(sb_packet& p) {
         bool success = false;
+        int spins = 0;
 
         while (!success) {
             success = recv(p);
 
-            if ((!success) && (m_min_period_us == -1)) {
-                // maintain old behavior if max_rate isn't specified,
-                // i.e. yield on every iteration that the send isn't
-                // successful
-                std::this_thread::yield();
+            if (!success) {
+                wait(spins);
             }
         }
     }
 
+    void wait(int& spins) {
+        // called after an unsuccessful receive in a blocking loop, with
+        // "spins" starting at zero for each packet.  once the spin budget
+        // is used up, this sleeps until the sender publishes a packet.
+        if (spin_budget_exhausted(spins)) {
+            spsc_wait_not_empty(m_q, SB_WAIT_TIMEOUT_US);
+        } else if (m_min_period_us == -1) {
+            // maintain old behavior if max_rate isn't specified,
+            // i.e. yield on every iteration that the receive isn't
+            // successful
+            std::this_thread::yield();
+        }
+    }
+
+    int recv_burst(sb_packet* p, int n) {
+        // receives up to "n" packets into the array "p", returning the
+        // number that were actually received.  the call counts as a single
+        // operation for max_rate.
+        return recv_burst(p, sizeof *p, n);
+    }
+
+    int recv_burst(void* p, size_t nbytes, int n) {
+        // same as above, storing the first "nbytes" bytes of each packet
+        // back-to-back in "p"
+        check_active();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+        return spsc_recv_burst(m_q, p, nbytes, n);
+    }
+
     bool recv_peek(sb_packet& p) {
         check_active();
-        max_rate_tick(m_timestamp_us, m_min_period_us);
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
         return spsc_recv_peek(m_q, &p, sizeof p);
     }
+
+    sb_packet* peek() {
+        // returns a pointer to the oldest packet in the queue, which can be
+        // read in place until release() is called, or NULL if the queue
+        // is empty
+        check_active();
+        max_rate_tick(m_timestamp_us, m_rate_ops, m_min_period_us);
+        return (sb_packet*)spsc_peek(m_q);
+    }
+
+    void release() {
+        // frees the packet returned by peek()
+        check_active();
+        spsc_release(m_q);
+    }
+
+    bool can_recv() {
+        // returns true if there is a packet to receive.  unlike the
+        // other methods, this doesn't count as an operation for max_rate,
+        // so it can be polled while waiting for a packet.
+        check_active();
+        return spsc_can_recv(m_q);
+    }
+
+  protected:
+    void on_open(void) override {
+        spsc_set_rx_pid(m_q);
+    }
+};
+
+// SBQueueSet: lets one thread wait until any of several queues is ready,
+// meaning that an SBRX might have a packet to receive, or that an SBTX might
+// have room for another packet, rather than polling each queue in turn.
+// Queues are referred to by the index returned when they were added, and
+// must stay initialized for as long as they are in the set.
+//
+// Sleeping until a queue is ready takes a single futex_waitv call, which is
+// limited to 128 queues (127 when fileno() is used, since the background
+// thread also waits for changes to the set).  Larger sets still work, but
+// are polled every SPSC_QUEUE_POLL_US instead, like on systems without
+// futex_waitv; split them into several sets to keep the faster wakeups.
+
+class SBQueueSet {
+  public:
+    SBQueueSet() : m_changes(0), m_armed(true), m_stop(false) {
+        m_pipe[0] = -1;
+        m_pipe[1] = -1;
+    }
+
+    ~SBQueueSet() {
+        if (m_notifier.joinable()) {
+            m_stop = true;
+            m_cv.notify_all();
+            changed();
+            m_notifier.join();
+        }
+        if (m_pipe[0] != -1) {
+            close(m_pipe[0]);
+            close(m_pipe[1]);
+        }
+    }
+
+    int add(SBRX& rx) {
+        return add(rx, false);
+    }
+
+    int add(SBTX& tx) {
+        // the claim sequence number, rather than the head pointer, says
+        // whether a queue with multiple producers is full
+        if (tx.is_multi_producer()) {
+            throw std::runtime_error(
+                "Queues with multiple producers can't be added to a queue set");
+        }
+        return add(tx, true);
+    }
+
+    void clear(void) {
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_queues.clear();
+            m_is_tx.clear();
+            m_rx_qs.clear();
+            m_tx_qs.clear();
+        }
+        changed();
+
+        // once the background thread is done with its copies of the queue
+        // lists, the queues that were in the set can be closed
+        if (m_notifier.joinable()) {
+            std::lock_guard<std::mutex> busy(m_busy);
+        }
+    }
+
+    size_t size(void) {
+        return m_queues.size();
+    }
+
+    bool is_ready(int idx) {
+        spsc_queue* q = m_queues.at(idx)->m_q;
+        return m_is_tx[idx] ? spsc_can_send(q) : spsc_can_recv(q);
+    }
+
+    std::vector<int> ready(void) {
+        // returns the indices of the queues that are ready
+        std::vector<int> retval;
+        for (size_t i = 0; i < m_queues.size(); i++) {
+            if (is_ready(i)) {
+                retval.push_back(i);
+            }
+        }
+        return retval;
+    }
+
+    bool wait(long timeout_us = -1) {
+        // sleeps until any queue in the set is ready, returning true, or
+        // until "timeout_us" microseconds have passed, returning false.
+        // a negative timeout means to wait for as long as it takes.
+        auto start = std::chrono::steady_clock::now();
+
+        while (!any_ready(m_rx_qs, m_tx_qs)) {
+            long sleep_us = SB_WAIT_TIMEOUT_US;
+
+            if (timeout_us >= 0) {
+                auto elapsed = std::chrono::steady_clock::now() - start;
+                long elapsed_us =
+                    std::chrono::duration_cast<std::chrono::microseconds>(elapsed).count();
+                if (elapsed_us >= timeout_us) {
+                    return false;
+                }
+                sleep_us = std::min(sleep_us, timeout_us - elapsed_us);
+            }
+
+            spsc_wait_any(m_rx_qs.data(), m_rx_qs.size(), m_tx_qs.data(), m_tx_qs.size(), sleep_us);
+        }
+
+        return true;
+    }
+
+    int fileno(void) {
+        // returns a file descriptor that becomes readable when any queue
+        // in the set is ready, for use with select(), poll(), or an event
+        // loop.  a background thread watches the queues; after it signals
+        // the descriptor, it doesn't do so again until rearm() is called.
+        if (m_pipe[0] == -1) {
+            if (pipe(m_pipe) != 0) {
+                throw std::runtime_error("Could not create a pipe for a queue set");
+            }
+            fcntl(m_pipe[0], F_SETFL, O_NONBLOCK);
+            fcntl(m_pipe[1], F_SETFL, O_NONBLOCK);
+            m_notifier = std::thread(&SBQueueSet::notify_loop, this);
+        }
+        return m_pipe[0];
+    }
+
+    void rearm(void) {
+        // called once the queues have been serviced after the descriptor
+        // returned by fileno() became readable
+        char buf[64];
+        ssize_t n;
+        do {
+            n = read(m_pipe[0], buf, sizeof(buf));
+        } while (n > 0);
+
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_armed = true;
+        }
+        m_cv.notify_all();
+    }
+
+  private:
+    int add(SB_base& sb, bool is_tx) {
+        sb.check_active();
+
+        int idx;
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_queues.push_back(&sb);
+            m_is_tx.push_back(is_tx);
+            if (is_tx) {
+                m_tx_qs.push_back(sb.m_q);
+            } else {
+                m_rx_qs.push_back(sb.m_q);
+            }
+            idx = m_queues.size() - 1;
+        }
+        changed();
+        return idx;
+    }
+
+    void changed(void) {
+        // wakes up the background thread if it is sleeping on an outdated
+        // list of queues, so that queues added to the set are watched
+        // right away rather than after SB_WAIT_TIMEOUT_US.  without a
+        // background thread, there is no one to wake up, so the system
+        // call is skipped.
+        __atomic_fetch_add(&m_changes, 1, __ATOMIC_SEQ_CST);
+        if (m_notifier.joinable()) {
+            spsc_futex_wake(&m_changes);
+        }
+    }
+
+    static bool any_ready(std::vector<spsc_queue*>& rx_qs, std::vector<spsc_queue*>& tx_qs) {
+        for (spsc_queue* q : rx_qs) {
+            if (spsc_can_recv(q)) {
+                return true;
+            }
+        }
+        for (spsc_queue* q : tx_qs) {
+            if (spsc_can_send(q)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    void notify_loop(void) {
+        // works on copies of the queue lists, so that queues can be added
+        // to the set while this thread is sleeping
+        std::vector<spsc_queue*> rx_qs;
+        std::vector<spsc_queue*> tx_qs;
+        int32_t changes;
+
+        while (!m_stop) {
+            {
+                std::unique_lock<std::mutex> lock(m_mutex);
+                m_cv.wait_for(lock, std::chrono::microseconds(SB_WAIT_TIMEOUT_US),
+                    [this] { return m_armed || m_stop; });
+                if (!m_armed) {
+                    continue;
+                }
+            }
+
+            // held while the copies are in use; see clear()
+            std::lock_guard<std::mutex> busy(m_busy);
+            {
+                std::lock_guard<std::mutex> lock(m_mutex);
+                changes = __atomic_load_n(&m_changes, __ATOMIC_SEQ_CST);
+                rx_qs = m_rx_qs;
+                tx_qs = m_tx_qs;
+            }
+
+            if (any_ready(rx_qs, tx_qs)) {
+                m_armed = false;
+                if (write(m_pipe[1], "", 1) < 0) {
+                    // the pipe is already readable
+                }
+            } else {
+                spsc_wait_any_or(rx_qs.data(), rx_qs.size(), tx_qs.data(), tx_qs.size(), &m_changes,
+                    changes, SB_WAIT_TIMEOUT_US);
+            }
+        }
+    }
+
+    std::vector<SB_base*> m_queues;
+    std::vector<bool> m_is_tx;
+    std::vector<spsc_queue*> m_rx_qs;
+    std::vector<spsc_queue*> m_tx_qs;
+
+    int32_t m_changes;
+    int m_pipe[2];
+    std::thread m_notifier;
+    std::mutex m_mutex;
+    std::mutex m_busy;
+    std::condition_variable m_cv;
+    std::atomic<bool> m_armed;
+    std::atomic<bool> m_stop;
 };
 
 static inline void delete_shared_queue(const char* name) {
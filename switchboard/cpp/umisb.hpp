@@ -236,26 +236,21 @@ static inline bool umisb_send(T& x, SBTX& tx, bool blocking = true, void (*loop)
         return false;
     }
 
-    // load fields into an SB packet
-
-    sb_packet p;
-    umi_packet* up = (umi_packet*)p.data;
-
-    up->cmd = x.cmd;
-    up->dstaddr = x.dstaddr;
-    up->srcaddr = x.srcaddr;
+    // check the data size before claiming a slot in the queue
 
     uint32_t opcode = umi_opcode(x.cmd);
 
+    size_t nbytes = 0;
+
     if ((opcode == UMI_REQ_READ) || (opcode == UMI_REQ_RDMA) || (opcode == UMI_RESP_WRITE)) {
         // do nothing, since there isn't data to copy
     } else {
         uint32_t size = umi_size(x.cmd);
         uint32_t len = umi_len(x.cmd);
 
-        size_t nbytes = (len + 1) << size;
+        nbytes = (len + 1) << size;
 
-        if (nbytes > sizeof(up->data)) {
+        if (nbytes > UMI_PACKET_DATA_BYTES) {
             throw std::runtime_error(
                 "umisb_send: (len+1)<<size cannot exceed the data size of a umi_packet.");
         }
@@ -264,31 +259,68 @@ static inline bool umisb_send(T& x, SBTX& tx, bool blocking = true, void (*loop)
             throw std::runtime_error(
                 "umisb_send: (len+1)<<size cannot exceed the data size of a UmiTransaction.");
         }
-
-        memcpy(up->data, x.ptr(), nbytes);
     }
 
-    bool header_sent = tx.send(p);
-    if ((!blocking) && (!header_sent)) {
-        return false;
-    }
+    // with a single producer, get a slot in the queue to build the SB
+    // packet in place.  slots can't be reserved with multiple producers,
+    // so the packet is built on the stack and copied into the queue.
 
-    // if we reach this point, we're committed to send out the whole UMI
-    // transaction, which may span multiple packets
+    sb_packet mp;
+    sb_packet* p;
 
-    // finish sending the header packet
-    if (!header_sent) {
-        bool success = false;
+    if (tx.is_multi_producer()) {
+        p = &mp;
+    } else {
+        p = tx.reserve();
+        if ((!blocking) && (!p)) {
+            return false;
+        }
 
-        while (!success) {
-            success = tx.send(p);
+        // if we reach this point, we're committed to send out the whole UMI
+        // transaction, so wait for a slot if there wasn't one available
 
+        int spins = 0;
+        while (!p) {
             if (loop) {
                 loop();
             }
+
+            tx.wait(spins);
+            p = tx.reserve();
         }
     }
 
+    // load fields into the SB packet
+
+    umi_packet* up = (umi_packet*)p->data;
+
+    up->cmd = x.cmd;
+    up->dstaddr = x.dstaddr;
+    up->srcaddr = x.srcaddr;
+
+    if (nbytes > 0) {
+        memcpy(up->data, x.ptr(), nbytes);
+    }
+
+    if (tx.is_multi_producer()) {
+        if (!tx.send(mp)) {
+            if (!blocking) {
+                return false;
+            }
+
+            int spins = 0;
+            do {
+                if (loop) {
+                    loop();
+                }
+
+                tx.wait(spins);
+            } while (!tx.send(mp));
+        }
+    } else {
+        tx.commit();
+    }
+
     // if we reach this point, we succeeded in sending the packet
     return true;
 }
@@ -301,29 +333,27 @@ static inline bool umisb_recv(T& x, SBRX& rx, bool blocking = true, void (*loop)
         return false;
     }
 
-    // get a response
-
-    sb_packet p;
+    // get a response, which is read in place from the queue
 
-    if (!blocking) {
-        if (!rx.recv(p)) {
-            return false;
-        }
-    } else {
-        bool success = false;
+    sb_packet* p = rx.peek();
 
-        while (!success) {
-            success = rx.recv(p);
+    if ((!blocking) && (!p)) {
+        return false;
+    }
 
-            if (loop) {
-                loop();
-            }
+    int spins = 0;
+    while (!p) {
+        if (loop) {
+            loop();
         }
+
+        rx.wait(spins);
+        p = rx.peek();
     }
 
     // if we get to this point, there is valid data in "p"
 
-    umi_packet* up = (umi_packet*)p.data;
+    umi_packet* up = (umi_packet*)p->data;
 
     // read information from the packet
 
@@ -345,12 +375,16 @@ static inline bool umisb_recv(T& x, SBRX& rx, bool blocking = true, void (*loop)
 
         size_t nbytes = (len + 1) << size;
 
+        // the packet is consumed even if it can't be stored
+
         if (nbytes > sizeof(up->data)) {
+            rx.release();
             throw std::runtime_error(
                 "umisb_recv: (len+1)<<size cannot exceed the data size of a umi_packet.");
         }
 
         if (nbytes > x.nbytes()) {
+            rx.release();
             throw std::runtime_error(
                 "umisb_recv: (len+1)<<size cannot exceed the data size of a UmiTransaction.");
         }
@@ -358,6 +392,8 @@ static inline bool umisb_recv(T& x, SBRX& rx, bool blocking = true, void (*loop)
         memcpy(x.ptr(), up->data, nbytes);
     }
 
+    rx.release();
+
     return true;
 }
 
@@ -13,11 +13,16 @@
 #ifdef __cplusplus
 extern "C" {
 #endif
-extern void pi_sb_rx_init(int* id, const char* uri, int width);
-extern void pi_sb_tx_init(int* id, const char* uri, int width);
+extern void pi_sb_rx_init(int* id, const char* uri, int width, int capacity);
+extern void pi_sb_tx_init(int* id, const char* uri, int width, int capacity);
+extern void pi_sb_tx_add_tap(int id, const char* uri, int capacity);
 extern void pi_sb_recv(int id, svBitVecVal* rdata, svBitVecVal* rdest, svBit* rlast, int* success);
 extern void pi_sb_send(int id, const svBitVecVal* sdata, const svBitVecVal* sdest, svBit slast,
     int* success);
+extern void pi_sb_recv_wide(int id, svBitVecVal* rdata, svBitVecVal* rdest, svBit* rlast,
+    int* success);
+extern void pi_sb_send_wide(int id, const svBitVecVal* sdata, const svBitVecVal* sdest, svBit slast,
+    int* success);
 extern void pi_time_taken(double* t);
 #ifdef __cplusplus
 }
@@ -27,39 +32,55 @@ static std::vector<std::unique_ptr<SBRX>> rxconn;
 static std::vector<std::unique_ptr<SBTX>> txconn;
 static std::vector<int> rxwidth;
 static std::vector<int> txwidth;
+static std::vector<std::vector<uint8_t>> rxbuf;
+static std::vector<std::vector<uint8_t>> txbuf;
 
-void pi_sb_rx_init(int* id, const char* uri, int width) {
+void pi_sb_rx_init(int* id, const char* uri, int width, int capacity) {
     rxconn.push_back(std::unique_ptr<SBRX>(new SBRX()));
-    rxconn.back()->init(uri);
+    rxconn.back()->init(uri, capacity, false, -1, sb_packet_size(width));
 
     // record the width of this connection
     rxwidth.push_back(width);
 
+    // allocate a buffer for packets on this connection
+    rxbuf.push_back(std::vector<uint8_t>(rxconn.back()->get_packet_size()));
+
     // assign the ID of this connection
     *id = rxconn.size() - 1;
 }
 
-void pi_sb_tx_init(int* id, const char* uri, int width) {
+void pi_sb_tx_init(int* id, const char* uri, int width, int capacity) {
     txconn.push_back(std::unique_ptr<SBTX>(new SBTX()));
-    txconn.back()->init(uri);
+    txconn.back()->init(uri, capacity, false, -1, sb_packet_size(width));
 
     // record the width of this connection
     txwidth.push_back(width);
 
+    // allocate a buffer for packets on this connection
+    txbuf.push_back(std::vector<uint8_t>(txconn.back()->get_packet_size()));
+
     // assign the ID of this connection
     *id = txconn.size() - 1;
 }
 
+void pi_sb_tx_add_tap(int id, const char* uri, int capacity) {
+    // make sure this is a valid id
+    assert(id < txconn.size());
+
+    // copy packets sent on this connection to the queue "uri"
+    txconn[id]->add_tap(uri, capacity);
+}
+
 void pi_sb_recv(int id, svBitVecVal* rdata, svBitVecVal* rdest, svBit* rlast, int* success) {
     // make sure this is a valid id
     assert(id < rxconn.size());
 
     // try to receive an inbound packet
-    sb_packet p;
-    if (rxconn[id]->recv(p)) {
-        memcpy(rdata, p.data, rxwidth[id]);
-        *rdest = p.destination;
-        *rlast = p.last ? 1 : 0;
+    sb_packet* p = (sb_packet*)rxbuf[id].data();
+    if (rxconn[id]->recv(p, rxbuf[id].size())) {
+        memcpy(rdata, p->data, rxwidth[id]);
+        *rdest = p->destination;
+        *rlast = p->last ? 1 : 0;
         *success = 1;
     } else {
         *success = 0;
@@ -72,19 +93,33 @@ void pi_sb_send(int id, const svBitVecVal* sdata, const svBitVecVal* sdest, svBi
     assert(id < txconn.size());
 
     // form the outbound packet
-    sb_packet p;
-    memcpy(p.data, sdata, txwidth[id]);
-    p.destination = *sdest;
-    p.last = slast;
+    sb_packet* p = (sb_packet*)txbuf[id].data();
+    memcpy(p->data, sdata, txwidth[id]);
+    p->destination = *sdest;
+    p->last = slast;
 
     // try to send the packet
-    if (txconn[id]->send(p)) {
+    if (txconn[id]->send(p, txbuf[id].size())) {
         *success = 1;
     } else {
         *success = 0;
     }
 }
 
+// the "wide" variants are imported in SystemVerilog with a larger data
+// width, for interfaces that don't fit in a regular sb_packet.  a separate
+// name is needed because a DPI function can only be imported with one
+// signature; on the C side, the implementation is the same.
+
+void pi_sb_recv_wide(int id, svBitVecVal* rdata, svBitVecVal* rdest, svBit* rlast, int* success) {
+    pi_sb_recv(id, rdata, rdest, rlast, success);
+}
+
+void pi_sb_send_wide(int id, const svBitVecVal* sdata, const svBitVecVal* sdest, svBit slast,
+    int* success) {
+    pi_sb_send(id, sdata, sdest, slast, success);
+}
+
 void pi_time_taken(double* t) {
     static std::chrono::steady_clock::time_point start_time;
     static std::chrono::steady_clock::time_point stop_time;
@@ -102,18 +137,20 @@ void pi_start_delay(double value) {
     start_delay(value);
 }
 
-void pi_max_rate_tick(svBitVecVal* t_us_vec, svBitVecVal* min_period_us_vec) {
+void pi_max_rate_tick(svBitVecVal* t_us_vec, svBitVecVal* ops_vec, svBitVecVal* min_period_us_vec) {
     // WARNING: not tested yet since Icarus Verilog uses VPI and Verilator
     // uses max_rate_tick in main(), not through DPI
 
-    // retrieve the previous timestamp and minimum period
-    long t_us, min_period_us;
+    // retrieve the rate limiter state and minimum period
+    long t_us, ops, min_period_us;
     memcpy(&t_us, t_us_vec, 8);
+    memcpy(&ops, ops_vec, 8);
     memcpy(&min_period_us, min_period_us_vec, 8);
 
     // call the underlying switchboard function
-    max_rate_tick(t_us, min_period_us);
+    clock_rate_tick(t_us, ops, min_period_us);
 
-    // store the new timestamp
+    // store the new rate limiter state
     memcpy(t_us_vec, &t_us, 8);
+    memcpy(ops_vec, &ops, 8);
 }
@@ -13,23 +13,32 @@ class UmiGpioInput:
         self.max_bytes = max_bytes
         self.umi = umi
 
-    def _read(self):
+    def _read_args(self):
         # determine the number of bytes to read
         nbytes = (self.width // 8)
         if (self.width % 8) != 0:
             nbytes += 1
 
-        # read the bytes
-        return BitVector.frombytes(
-            self.umi.read(
-                addr=self.dstaddr,
-                num_or_dtype=nbytes,
-                dtype=np.uint8,
-                srcaddr=self.srcaddr,
-                max_bytes=self.max_bytes
-            )
+        return dict(
+            addr=self.dstaddr,
+            num_or_dtype=nbytes,
+            dtype=np.uint8,
+            srcaddr=self.srcaddr,
+            max_bytes=self.max_bytes
         )
 
+    def _read(self):
+        return BitVector.frombytes(self.umi.read(**self._read_args()))
+
+    async def read_async(self, key=slice(None)):
+        """
+        Same as indexing the input (e.g., gpio.i[7:0]), but awaits the read
+        rather than blocking on it.  Reads the whole input by default.
+        """
+
+        bv = BitVector.frombytes(await self.umi.read_async(**self._read_args()))
+        return bv.__getitem__(key=key)
+
     def __str__(self):
         return str(self._read())
 
@@ -50,19 +59,20 @@ class UmiGpioOutput:
         self.max_bytes = max_bytes
         self.umi = umi
 
-        self.bv = BitVector(init)
+        # init=None skips the initial write, e.g. when the output is driven with
+        # write_async() from a coroutine
+        self.bv = BitVector(0 if init is None else init)
 
         if init is not None:
             self._write()
 
-    def _write(self):
+    def _write_args(self):
         # determine the number of bytes to write
         nbytes = (self.width // 8)
         if (self.width % 8) != 0:
             nbytes += 1
 
-        # write the bytes
-        self.umi.write(
+        return dict(
             addr=self.dstaddr,
             data=self.bv.tobytes(n=nbytes),
             srcaddr=self.srcaddr,
@@ -70,10 +80,22 @@ class UmiGpioOutput:
             posted=self.posted
         )
 
+    def _write(self):
+        self.umi.write(**self._write_args())
+
     def __setitem__(self, key, value):
         self.bv.__setitem__(key=key, value=value)
         self._write()
 
+    async def write_async(self, key, value):
+        """
+        Same as assigning to the output (e.g., gpio.o[7:0] = 42), but awaits
+        the write rather than blocking on it.
+        """
+
+        self.bv.__setitem__(key=key, value=value)
+        await self.umi.write_async(**self._write_args())
+
     # read functions provided for convenience
 
     def __str__(self):
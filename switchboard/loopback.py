@@ -3,6 +3,10 @@
 # Copyright (c) 2024 Zero ASIC Corporation
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+import random
+import numpy as np
+
+from itertools import islice
 from numbers import Integral
 from typing import Iterable, Iterator, Union
 
@@ -12,146 +16,160 @@ except ModuleNotFoundError:
     tqdm = None
 
 from .umi import UmiTxRx, random_umi_packet
+from ._switchboard import PyUmiLoopback, PyUmiGenerator, umi_packet_dtype
+
+# number of packets handed to the C++ loopback engine at a time, which sets
+# how often the progress bar is updated
+CHUNK_SIZE = 1 << 16
 
 
 def umi_loopback(
     umi: UmiTxRx,
-    packets: Union[Integral, Iterable, Iterator] = 10,
+    packets: Union[Integral, Iterable, Iterator, np.ndarray] = 10,
+    history: int = 1024,
+    seed: int = None,
+    generator: PyUmiGenerator = None,
     **kwargs
 ):
     """
     Performs a loopback test by sending packets into a block and checking that
     the packets received back are equivalent under the UMI split/merge rules.
 
+    Packets are sent, merged, and compared in C++ (see PyUmiLoopback), so the
+    test runs at the rate of the block being tested rather than the rate of the
+    Python interpreter.
+
     Parameters
     ----------
     umi: UmiTxRx
     packets:
-        Can be a number, a list of packets, or a generator.
+        Can be a number, a NumPy array of packets, a list of packets, or a generator.
 
         - If this is a number, it represents the number of packets to send,
-          which are generated with random_umi_packet. Any remaining arguments
-          are passed directly to random_umi_packet.
+          which are generated randomly.  Any remaining arguments are passed
+          directly to random_umi_packet; if there are none other than max_bytes,
+          the packets are generated in C++ by a PyUmiGenerator, whose fields
+          have the same distribution, except that addresses at which a packet
+          wouldn't fit are left out.  To
+          generate packets in C++ with another distribution, pass a
+          PyUmiGenerator as `generator`.
+        - If this is a NumPy array of type umi_packet_dtype(), then it contains
+          the packets to send, which are handed to C++ without creating a
+          PyUmiPacket for each one.
         - If this is an iterable (list, tuple, etc.), then it represents a list
           of packets to use for the test.  This is helpful if you want to use a very
           specific sequence of transactions.
         - This can also be an iterator, which might be convenient if you want to
           send a very large number of packets without having to store them
           all in memory at once, e.g. (random_umi_packet() for _ in range(1000000))
+    history: int, optional
+        Maximum number of packets sent that are waiting to be received back.
+        Sending pauses when this many are outstanding, so that memory use is
+        bounded however many packets are sent.  The block under test must be
+        able to return packets without more than this many outstanding.
+    generator: PyUmiGenerator, optional
+        Generator of the random packets sent, if `packets` is a number.
+    seed: int, optional
+        Seed used for the packets generated in C++, unless `generator` is given.
+        By default, it is drawn from Python's random module, so random.seed()
+        makes the test repeatable.
 
     Raises
     ------
     ValueError
         If the number of packets is not positive or if the `packets` argument is empty
-    Exception
+    RuntimeError
         If a received packet does not match the corresponding transmitted packet
 
     """
 
+    if seed is None:
+        seed = random.getrandbits(64)
+
+    loopback = PyUmiLoopback(umi.umi, history=history, seed=seed)
+
     # input validation
 
     if isinstance(packets, Integral):
         if packets <= 0:
             raise ValueError(f'The number of packets must be positive (got packets={packets}).')
+        total = packets
+        if generator is not None:
+            chunks = _send_generated(loopback, generator, packets)
+        elif set(kwargs) <= {'max_bytes'}:
+            chunks = _send_random(loopback, packets, **kwargs)
         else:
-            total = packets
-            packets = (random_umi_packet(**kwargs) for _ in range(packets))
-    elif isinstance(packets, Iterable):
+            chunks = _send_packets(loopback,
+                (random_umi_packet(**kwargs) for _ in range(packets)))
+    elif isinstance(packets, np.ndarray):
+        total = packets.size
+        chunks = _send_batch(loopback, packets.ravel())
+    elif isinstance(packets, (Iterable, Iterator)):
         if isinstance(packets, (list, tuple)):
             total = len(packets)
         else:
-            total = float('inf')
-        packets = iter(packets)
-    elif isinstance(packets, Iterator):
-        total = float('inf')
+            total = None
+        chunks = _send_packets(loopback, iter(packets))
     else:
         raise TypeError(f'Unsupported type for packets: {type(packets)}')
 
-    tx_sets = []  # kept for debug purposes
-    tx_hist = []
-
-    tx_set = None
-    tx_partial = None
-
-    rx_set = None  # kept for debug purposes
-    rx_partial = None
-
     if tqdm is not None:
         pbar = tqdm(total=total)
     else:
         pbar = None
 
-    # get the first element
-    try:
-        txp = next(packets)
+    # each step of "chunks" sends another chunk of packets
+
+    for _ in chunks:
         if pbar is not None:
-            pbar.update(0)
-    except StopIteration:
+            pbar.update(loopback.sent - pbar.n)
+
+    if loopback.sent == 0:
         raise ValueError('The argument "packets" is empty.')
 
-    while (txp is not None) or (len(tx_hist) > 0):
-        # send data
-        if txp is not None:
-            if umi.send(txp, blocking=False):
-                if tx_partial is not None:
-                    if not tx_partial.merge(txp):
-                        tx_hist.append(tx_partial)
-                        tx_sets.append(tx_set)
-                        tx_start_new = True
-                    else:
-                        tx_set.append(txp)
-                        tx_start_new = False
-                else:
-                    tx_start_new = True
-
-                if tx_start_new:
-                    tx_partial = txp
-                    tx_set = [txp]
-
-                try:
-                    txp = next(packets)
-                except StopIteration:
-                    txp = None
-
-                if txp is None:
-                    # if this is the last packet, add it to the history
-                    # even if the merge was successful
-                    tx_hist.append(tx_partial)
-                    tx_sets.append(tx_set)
-
-        # receive data
-        if len(tx_hist) > 0:
-            rxp = umi.recv(blocking=False)
-            if rxp is not None:
-                # try to merge into an existing partial packet
-                if rx_partial is not None:
-                    if not rx_partial.merge(rxp):
-                        print('=== Mismatch detected ===')
-                        for i, p in enumerate(tx_sets[0]):
-                            print(f'* TX[{i}] *')
-                            print(p)
-                        print('---')
-                        for i, p in enumerate(rx_set):
-                            print(f'* RX[{i}] *')
-                            print(p)
-                        print('=========================')
-                        raise Exception('Mismatch!')
-                    else:
-                        rx_set.append(rxp)
-                else:
-                    rx_partial = rxp
-                    rx_set = [rxp]
-
-                # at this point it is guaranteed there is something in
-                # rx_partial, so compare it to the expected outbound packet
-                if rx_partial == tx_hist[0]:
-                    tx_hist.pop(0)
-                    tx_sets.pop(0)
-                    rx_partial = None
-                    rx_set = None
-
-                    if pbar is not None:
-                        pbar.update()
+    loopback.finish()
 
     if pbar is not None:
         pbar.close()
+
+
+def _send_random(loopback, total, max_bytes=32):
+    for k in range(0, total, CHUNK_SIZE):
+        loopback.send_random(min(CHUNK_SIZE, total - k), max_bytes=max_bytes)
+        yield
+
+
+def _send_generated(loopback, generator, total):
+    for k in range(0, total, CHUNK_SIZE):
+        loopback.send_generated(generator, min(CHUNK_SIZE, total - k))
+        yield
+
+
+def _send_batch(loopback, batch):
+    for k in range(0, batch.size, CHUNK_SIZE):
+        loopback.send_batch(batch[k:k + CHUNK_SIZE])
+        yield
+
+
+def _send_packets(loopback, packets):
+    # converts PyUmiPackets to batches for the C++ loopback engine
+
+    while True:
+        chunk = list(islice(packets, CHUNK_SIZE))
+
+        if len(chunk) == 0:
+            return
+
+        batch = np.zeros(len(chunk), dtype=umi_packet_dtype())
+
+        for k, p in enumerate(chunk):
+            data = np.ascontiguousarray(p.data).view(np.uint8).ravel()
+            data = data[:batch['data'].shape[1]]
+
+            batch[k]['cmd'] = p.cmd
+            batch[k]['dstaddr'] = p.dstaddr
+            batch[k]['srcaddr'] = p.srcaddr
+            batch[k]['data'][:data.size] = data
+
+        loopback.send_batch(batch)
+        yield
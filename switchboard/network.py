@@ -1,6 +1,8 @@
 # Copyright (c) 2024 Zero ASIC Corporation
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+import os
+
 from typing import Set
 
 from pathlib import Path
@@ -12,13 +14,14 @@ from .sbdut import SbDut
 from .axi import axi_uris
 from .apb import apb_uris
 from .autowrap import (directions_are_compatible, normalize_intf_type,
-    type_is_umi, type_is_sb, create_intf_objs, type_is_axi, type_is_axil, type_is_apb,
-    autowrap, flip_intf, normalize_direction, WireExpr, types_are_compatible)
+    type_is_umi, type_is_sb, create_intf_objs, create_intf_obj, type_is_axi, type_is_axil,
+    type_is_apb, autowrap, flip_intf, normalize_direction, WireExpr, types_are_compatible)
 from .cmdline import get_cmdline_args
 from .sbtcp import start_tcp_bridge
-from .util import ProcessCollection
+from .util import (ProcessCollection, default_queue_root, queue_path, GOVERNOR_ENV,
+    cpu_order, numa_nodes, resolve_affinity, set_affinity)
 
-from ._switchboard import delete_queues
+from ._switchboard import delete_queues, queue_stats, configure_governor
 
 from siliconcompiler import Design
 
@@ -119,7 +122,7 @@ class SbInst:
 
         for name, value in block.intf_defs.items():
             if value['type'] != 'plusarg':
-                self.mapping[name] = dict(uri=None, wire=None)
+                self.mapping[name] = dict(uri=None, wire=None, capacity=None, tap=None)
             width = block.intf_defs[name].get('width', None)
             self.__setattr__(name, SbIntf(inst=self, name=name, width=width))
 
@@ -198,7 +201,9 @@ class SbNetwork:
         args=None,
         single_netlist: bool = False,
         threads: int = None,
-        name: str = None
+        name: str = None,
+        network_rate: float = -1,
+        max_lag: int = -1
     ):
 
         self.insts = {}
@@ -211,11 +216,14 @@ class SbNetwork:
 
         self.tcp_intfs = {}
 
+        # place queues the same way as SbDut, before any blocks are created
+        default_queue_root()
+
         if cmdline:
             self.args = get_cmdline_args(tool=tool, trace=trace, trace_type=trace_type,
                 frequency=frequency, period=period, fast=fast, max_rate=max_rate,
                 start_delay=start_delay, single_netlist=single_netlist, threads=threads,
-                extra_args=extra_args)
+                network_rate=network_rate, max_lag=max_lag, extra_args=extra_args)
         elif args is not None:
             self.args = args
 
@@ -229,6 +237,8 @@ class SbNetwork:
             max_rate = self.args.max_rate
             start_delay = self.args.start_delay
             single_netlist = self.args.single_netlist
+            network_rate = self.args.network_rate
+            max_lag = self.args.max_lag
         else:
             # create args object to pass down to SbDut
             from types import SimpleNamespace
@@ -241,7 +251,9 @@ class SbNetwork:
                 period=period,
                 max_rate=max_rate,
                 start_delay=start_delay,
-                threads=threads
+                threads=threads,
+                network_rate=network_rate,
+                max_lag=max_lag
             )
 
         # save settings
@@ -256,6 +268,8 @@ class SbNetwork:
         self.period = period
         self.max_rate = max_rate
         self.start_delay = start_delay
+        self.network_rate = network_rate
+        self.max_lag = max_lag
 
         self.single_netlist = single_netlist
 
@@ -274,7 +288,7 @@ class SbNetwork:
 
             def cleanup_func(uri_set=self.uri_set):
                 if len(uri_set) > 0:
-                    delete_queues(list(uri_set))
+                    delete_queues([queue_path(uri) for uri in uri_set])
 
             atexit.register(cleanup_func)
 
@@ -311,7 +325,11 @@ class SbNetwork:
         # return the instance object
         return self.insts[name]
 
-    def connect(self, a, b, uri=None, wire=None):
+    def connect(self, a, b, uri=None, wire=None, capacity=None, tap=None):
+        # "tap" is the URI of a queue that receives a copy of every packet sent
+        # over this connection, for monitoring.  packets are dropped from the
+        # copy if its reader falls behind, so a tap never slows down the link.
+
         # convert integer inputs into constant datatype
         if isinstance(a, Integral):
             a = ConstIntf(value=a)
@@ -376,16 +394,27 @@ class SbNetwork:
         if (not self.single_netlist) and (type_a != 'gpio') and (type_b != 'gpio'):
             self.register_uri(type=type_a, uri=uri)
 
+        if tap is not None:
+            assert type_is_sb(type_a) or type_is_umi(type_a), \
+                'Only SB and UMI connections can be tapped'
+            assert not self.single_netlist, \
+                'Internal connections of a single-netlist network cannot be tapped'
+            self.register_uri(type=type_a, uri=tap)
+
         # tell both instances what they are connected to
 
         if (type_a != 'gpio') and (type_b != 'gpio'):
             if not isinstance(a, TcpIntf):
                 a.inst.mapping[a.name]['wire'] = wire
                 a.inst.mapping[a.name]['uri'] = uri
+                a.inst.mapping[a.name]['capacity'] = capacity
+                a.inst.mapping[a.name]['tap'] = tap
 
             if not isinstance(b, TcpIntf):
                 b.inst.mapping[b.name]['wire'] = wire
                 b.inst.mapping[b.name]['uri'] = uri
+                b.inst.mapping[b.name]['capacity'] = capacity
+                b.inst.mapping[b.name]['tap'] = tap
         else:
             if input.inst.mapping[input.name]['wire'] is None:
                 expr = WireExpr(input.intf_def['width'])
@@ -497,7 +526,8 @@ class SbNetwork:
             for block in unique_blocks:
                 block.build()
 
-    def external(self, intf, name=None, txrx=None, uri=None, wire=None):
+    def external(self, intf, name=None, txrx=None, uri=None, wire=None, capacity=None,
+        tap=None):
         # make a copy of the interface definition since we will be modifying it
 
         assert intf.intf_def is not None, 'Cannot infer interface type'
@@ -520,14 +550,27 @@ class SbNetwork:
 
         intf_def['uri'] = uri
 
+        if capacity is not None:
+            intf_def['capacity'] = capacity
+
+        # outputs of the network can be tapped (see connect)
+
+        if tap is not None:
+            assert type_is_sb(type) or type_is_umi(type), \
+                'Only SB and UMI interfaces can be tapped'
+            intf_def['tap'] = tap
+
         # register the URI to make sure it doesn't collide with anything else
 
         self.register_uri(type=type, uri=uri)
 
+        if tap is not None:
+            self.register_uri(type=type, uri=tap)
+
         # propagate information about the URI mapping
 
         if not isinstance(intf, TcpIntf):
-            intf.inst.mapping[intf.name] = dict(uri=uri, wire=wire)
+            intf.inst.mapping[intf.name] = dict(uri=uri, wire=wire, capacity=capacity, tap=tap)
             intf.inst.external.add(intf.name)
 
         # set txrx
@@ -556,7 +599,8 @@ class SbNetwork:
 
         return name
 
-    def simulate(self, start_delay=None, run=None, intf_objs=True, plusargs=None):
+    def simulate(self, start_delay=None, run=None, intf_objs=True, plusargs=None,
+        affinity=None, driver_affinity=None):
 
         # set defaults
 
@@ -566,6 +610,12 @@ class SbNetwork:
         if plusargs is None:
             plusargs = []
 
+        # decide which CPUs each process runs on (see plan_affinity)
+
+        plan = self.plan_affinity(affinity=affinity, driver_affinity=driver_affinity)
+
+        set_affinity(plan.get(None))
+
         # create interface objects
 
         if self.single_netlist:
@@ -583,7 +633,8 @@ class SbNetwork:
                 start_delay=start_delay,
                 run=run,
                 intf_objs=intf_objs,
-                plusargs=plusargs
+                plusargs=plusargs,
+                affinity=plan.get('*')
             )
 
             self.process_collection.add(process)
@@ -591,8 +642,15 @@ class SbNetwork:
             if intf_objs:
                 self.intfs = self.single_netlist_dut.intfs
         else:
+            placed = self.place_queues(plan)
+
             if intf_objs:
-                self.intfs = create_intf_objs(self.intf_defs)
+                # queues that were just placed must not be created again
+                self.intfs = create_intf_objs(self.intf_defs, placed=placed)
+
+            # share the clock rate budget among the simulators, if any
+            if ((self.network_rate or 0) > 0) or ((self.max_lag or 0) > 0):
+                self.start_governor()
 
             if start_delay is not None:
                 import time
@@ -612,6 +670,8 @@ class SbNetwork:
 
                 for intf_name, props in inst.mapping.items():
                     block.intf_defs[intf_name]['uri'] = props['uri']
+                    block.intf_defs[intf_name]['capacity'] = props['capacity']
+                    block.intf_defs[intf_name]['tap'] = props['tap']
 
                 # calculate the start delay for this process by measuring the
                 # time left until the start delay for the whole network is over
@@ -636,17 +696,194 @@ class SbNetwork:
                     inst_plusargs = plusargs
 
                 process = block.simulate(start_delay=start_delay, run=inst.name,
-                    intf_objs=False, plusargs=inst_plusargs)
+                    intf_objs=False, plusargs=inst_plusargs, affinity=plan.get(inst.name))
 
                 self.process_collection.add(process)
 
         # start TCP bridges as needed
-        for tcp_kwargs in self.tcp_intfs.values():
-            process = start_tcp_bridge(**tcp_kwargs)
+        for key, tcp_kwargs in self.tcp_intfs.items():
+            process = start_tcp_bridge(**tcp_kwargs, affinity=plan.get(key))
             self.process_collection.add(process)
 
         return self.process_collection
 
+    def plan_affinity(self, affinity=None, driver_affinity=None):
+        """
+        Returns a dictionary mapping each process of the network to the list of CPUs that it
+        should be pinned to.  Simulators are keyed by instance name (or "*" in single-netlist
+        mode), TCP bridges by their (host, port, mode) tuple, and the Python driver by None.
+        Processes without an entry are not pinned.
+
+        affinity may be "auto" (see auto_affinity), a dictionary mapping instance names to
+        CPUs, with "tcp" for the TCP bridges and "*" for everything else, or CPUs for all
+        processes to share (see resolve_affinity).  driver_affinity may be CPUs for the driver,
+        or "auto" to place the driver next to the simulators that it talks to, which requires
+        affinity="auto".
+        """
+
+        if affinity == 'auto':
+            plan = self.auto_affinity(driver=(driver_affinity == 'auto'))
+        else:
+            if driver_affinity == 'auto':
+                raise ValueError('driver_affinity="auto" requires affinity="auto".')
+
+            plan = {}
+
+            if self.single_netlist:
+                names = ['*']
+            else:
+                names = list(self.insts) + list(self.tcp_intfs)
+
+            for name in names:
+                if isinstance(affinity, dict):
+                    default = affinity.get('*', None)
+
+                    if name in self.tcp_intfs:
+                        value = affinity.get('tcp', default)
+                    else:
+                        value = affinity.get(name, default)
+                else:
+                    value = affinity
+
+                plan[name] = resolve_affinity(value)
+
+        if driver_affinity not in [None, 'auto']:
+            plan[None] = resolve_affinity(driver_affinity)
+
+        return {name: cpus for name, cpus in plan.items() if cpus is not None}
+
+    def auto_affinity(self, driver=False):
+        # assigns CPUs to the simulators and TCP bridges (and the Python
+        # driver, if driver is True) so that processes connected by a queue
+        # run on neighboring CPUs, which share caches.  processes are visited
+        # breadth-first, starting from the ones that talk to the driver, and
+        # handed out CPUs in the order given by cpu_order().  simulators get
+        # one CPU per thread.
+
+        order = []
+
+        if driver:
+            order.append((None, 1))
+
+        if self.single_netlist:
+            order.append(('*', getattr(self.single_netlist_dut, 'threads', None) or 1))
+        else:
+            # find the processes that use each queue
+
+            users = {}
+
+            for inst in self.insts.values():
+                for props in inst.mapping.values():
+                    if props['uri'] is not None:
+                        users.setdefault(props['uri'], []).append(inst.name)
+
+            for key, tcp_kwargs in self.tcp_intfs.items():
+                for entry in tcp_kwargs.get('inputs', []) + tcp_kwargs.get('outputs', []):
+                    uri = entry[1] if isinstance(entry, tuple) else entry
+                    users.setdefault(uri, []).append(key)
+
+            neighbors = {}
+
+            for names in users.values():
+                for name in names:
+                    neighbors.setdefault(name, []).extend(
+                        other for other in names if other != name)
+
+            # visit the processes breadth-first
+
+            starts = [name for name, inst in self.insts.items() if inst.external]
+            starts += list(self.insts) + list(self.tcp_intfs)
+
+            visited = []
+
+            for start in starts:
+                if start in visited:
+                    continue
+
+                k = len(visited)
+                visited.append(start)
+
+                while k < len(visited):
+                    for name in neighbors.get(visited[k], []):
+                        if name not in visited:
+                            visited.append(name)
+                    k += 1
+
+            for name in visited:
+                if name in self.insts:
+                    order.append((name, getattr(self.insts[name].block, 'threads', None) or 1))
+                else:
+                    order.append((name, 1))
+
+        # hand out CPUs, wrapping around if there are more threads than CPUs
+
+        cpus = cpu_order()
+
+        plan = {}
+
+        k = 0
+
+        for name, nthreads in order:
+            plan[name] = sorted(set(cpus[(k + i) % len(cpus)] for i in range(nthreads)))
+            k += nthreads
+
+        return plan
+
+    def place_queues(self, plan):
+        # creates the SB and UMI queues received by simulators while this
+        # process runs on the receiving simulator's CPUs.  since memory is
+        # allocated on the NUMA node of the CPU that first touches it, and
+        # queues are filled in when they are created, this places each queue
+        # on the node of the simulator that polls it the most.  returns the
+        # set of URIs of the queues that were placed.
+
+        placed = set()
+
+        if (not plan) or (len(numa_nodes()) < 2):
+            return placed
+
+        saved = os.sched_getaffinity(0)
+
+        try:
+            for inst in self.insts.values():
+                cpus = plan.get(inst.name, None)
+
+                if cpus is None:
+                    continue
+
+                for name, props in inst.mapping.items():
+                    intf_def = inst.block.intf_defs[name]
+                    type = intf_def['type']
+
+                    if (props['uri'] is None) or not (type_is_sb(type) or type_is_umi(type)):
+                        continue
+
+                    if normalize_direction(type, intf_def['direction']) != 'input':
+                        continue
+
+                    os.sched_setaffinity(0, cpus)
+
+                    create_intf_obj(dict(intf_def, uri=props['uri'], capacity=props['capacity']))
+
+                    placed.add(props['uri'])
+        finally:
+            os.sched_setaffinity(0, saved)
+
+        return placed
+
+    def start_governor(self, uri='governor.sbg'):
+        # creates a rate governor (see configure_governor) that the simulators
+        # launched from now on join, since they inherit SB_GOVERNOR.  it
+        # divides network_rate evenly among them and keeps each within
+        # max_lag cycles of the slowest one.
+
+        if uri not in self.uri_set:
+            self.register_uri(type='sb', uri=uri)
+
+        configure_governor(uri, max_rate=self.network_rate, max_lag=self.max_lag)
+
+        os.environ[GOVERNOR_ENV] = uri
+
     def terminate(
         self,
         stop_timeout=10,
@@ -688,6 +925,22 @@ class SbNetwork:
         if fresh:
             delete_queues(list(uris))
 
+    def queue_stats(self):
+        # returns a dictionary mapping the URI of each queue in the network to
+        # its performance counters (see PySbTx.stats()), which can be used to
+        # find congested links while the network is running.  queues that have
+        # not been created yet are omitted.
+
+        retval = {}
+
+        for uri in sorted(self.uri_set):
+            stats = queue_stats(uri)
+
+            if stats is not None:
+                retval[uri] = stats
+
+        return retval
+
     def make_dut(self, *args, **kwargs):
         # argument customizations
 
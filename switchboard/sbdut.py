@@ -20,10 +20,12 @@ from typing import List, Dict, Any, Union
 from .switchboard import path as sb_path
 from .icarus import icarus_build_vpi, icarus_find_vpi, icarus_run
 from .verilator_run import verilator_run
-from .util import plusargs_to_args, binary_run, ProcessCollection
+from .util import (plusargs_to_args, binary_run, ProcessCollection, default_queue_root,
+    queue_path)
 from .ams import make_ams_spice_wrapper, make_ams_verilog_wrapper, parse_spice_subckts
 from .autowrap import (normalize_clocks, normalize_interfaces, normalize_resets, normalize_tieoffs,
-    normalize_parameters, create_intf_objs, type_is_axi, type_is_axil, type_is_apb)
+    normalize_parameters, create_intf_objs, type_is_axi, type_is_axil, type_is_apb,
+    direction_is_output)
 from .cmdline import get_cmdline_args
 from .apb import apb_uris
 from .axi import axi_uris
@@ -200,6 +202,10 @@ class SbDut(Sim):
 
         self.intfs = {}
 
+        # keep queue files in memory, in a directory for this run, unless
+        # the user has chosen where they go (see set_queue_root)
+        default_queue_root()
+
         # keep track of processes started
         self.process_collection = ProcessCollection()
 
@@ -357,7 +363,8 @@ class SbDut(Sim):
         max_rate: float = None,
         start_delay: float = None,
         run: str = None,
-        intf_objs: bool = True
+        intf_objs: bool = True,
+        affinity=None
     ) -> subprocess.Popen:
         """
         Parameters
@@ -383,6 +390,11 @@ class SbDut(Sim):
         period: float, optional
             If provided, the period of the clock generated in the testbench,
             in seconds.
+
+        affinity: int or str or list, optional
+            If provided, the CPUs that the simulator is pinned to, either as a CPU
+            number, a list of CPU numbers, a string like "0-3,8", or a string like
+            "node:1" for all CPUs of a NUMA node.
         """
 
         # set up interfaces if needed
@@ -449,6 +461,15 @@ class SbDut(Sim):
             if (wire is not None) and (uri is not None):
                 plusargs += [(wire, uri)]
 
+                # queue capacity must match on the RTL side
+                if value.get('capacity', None) is not None:
+                    plusargs += [(f'{wire}_capacity', value['capacity'])]
+
+                # copy the traffic of an output to a monitoring queue
+                if (value.get('tap', None) is not None) and \
+                        direction_is_output(value['direction']):
+                    plusargs += [(f'{wire}_tap', value['tap'])]
+
         # run-specific configurations (if running the same simulator build multiple times
         # in parallel)
 
@@ -480,7 +501,8 @@ class SbDut(Sim):
                 sim,
                 plusargs=plusargs,
                 modules=modules,
-                extra_args=args + extra_args
+                extra_args=args + extra_args,
+                affinity=affinity
             )
         else:
             # make sure that the simulator was built with tracing enabled
@@ -492,12 +514,14 @@ class SbDut(Sim):
                 p = verilator_run(
                     sim,
                     plusargs=plusargs,
-                    args=args
+                    args=args,
+                    affinity=affinity
                 )
             else:
                 p = binary_run(
                     sim,
-                    args=plusargs_to_args(plusargs) + args
+                    args=plusargs_to_args(plusargs) + args,
+                    affinity=affinity
                 )
 
         # Add newly created Popen object to subprocess list
@@ -511,7 +535,8 @@ class SbDut(Sim):
         import atexit
         from ._switchboard import delete_queues
 
-        def cleanup_func(uris=self.get_uris()):
+        # paths are resolved now, in case the queue root changes later
+        def cleanup_func(uris=[queue_path(uri) for uri in self.get_uris()]):
             if len(uris) > 0:
                 delete_queues(uris)
 
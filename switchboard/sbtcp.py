@@ -16,7 +16,8 @@ import socket
 import argparse
 import numpy as np
 
-from switchboard import PySbRx, PySbTx, PySbPacket
+from switchboard import PySbRx, PySbTx, PySbPacket, PySbQueueSet
+from switchboard.util import set_affinity
 
 SB_PACKET_SIZE_BYTES = 60
 
@@ -50,8 +51,15 @@ def tcp2sb(outputs, conn):
 def sb2tcp(inputs, conn):
     tcp_data_to_send = bytes([])
 
+    # used to sleep until any input has a packet, rather than polling
+    # the inputs while they are all empty
+    queue_set = PySbQueueSet()
+    for _, sbrx in inputs:
+        queue_set.add(sbrx)
+
     while True:
         # get a switchboard packet
+        misses = 0
         while True:
             # select input and queue its next run as last
             destination, sbrx = inputs.pop(0)
@@ -65,6 +73,11 @@ def sb2tcp(inputs, conn):
                     p.destination = destination
                 break
 
+            misses += 1
+            if misses == len(inputs):
+                queue_set.wait()
+                misses = 0
+
         # convert the switchboard packet to bytes
         tcp_data_to_send = sb2bytes(p)
 
@@ -255,8 +268,14 @@ def parse_rule(rule):
     return retval
 
 
+def run_with_affinity(target, affinity, **kwargs):
+    # runs a bridge in a process that is pinned to the given CPUs
+    set_affinity(affinity)
+    target(**kwargs)
+
+
 def start_tcp_bridge(inputs=None, outputs=None, host='localhost', port=5555,
-    quiet=True, max_rate=None, mode='auto', run_once=False):
+    quiet=True, max_rate=None, mode='auto', run_once=False, affinity=None):
 
     kwargs = dict(
         host=host,
@@ -286,6 +305,10 @@ def start_tcp_bridge(inputs=None, outputs=None, host='localhost', port=5555,
 
     assert target is not None, 'Could not determine whether to run the bridge as a client or server'
 
+    if affinity is not None:
+        kwargs = dict(target=target, affinity=affinity, **kwargs)
+        target = run_with_affinity
+
     import multiprocessing
 
     p = multiprocessing.Process(target=target, kwargs=kwargs, daemon=True)
@@ -313,6 +336,8 @@ def get_parser():
         ' queues are read or written.')
     parser.add_argument('--run-once', action='store_true', help="Process only one connection"
         " in server mode, then exit.")
+    parser.add_argument('--affinity', type=str, default=None, help='CPUs to run the bridge on,'
+        ' for example 0-3,8 or node:1 for all CPUs of a NUMA node.')
 
     return parser
 
@@ -323,6 +348,8 @@ def main():
     parser = get_parser()
     args = parser.parse_args()
 
+    set_affinity(args.affinity)
+
     # main logic
 
     if args.outputs is not None:
@@ -15,12 +15,28 @@ def inspect(file, format):
     import shutil
     import tempfile
 
+    from switchboard import queue_info, queue_path
+
+    # resolve the name once, so that the header that is read and the
+    # queue that is copied are the same file
+    file = queue_path(file)
+
+    # use the layout recorded in the queue header, if there is one
+    info = queue_info(file)
+
+    if info is not None:
+        print(f'# capacity: {info["capacity"]}, packet size: {info["packet_size"]},'
+            f' tx pid: {info["tx_pid"]}, rx pid: {info["rx_pid"]}')
+        packet_size = info['packet_size']
+    else:
+        packet_size = 0
+
     with tempfile.NamedTemporaryFile() as temp:
         shutil.copyfile(file, temp.name)
 
         if format == 'sb':
             from switchboard import PySbRx
-            rx = PySbRx(temp.name, fresh=False)
+            rx = PySbRx(temp.name, fresh=False, packet_size=packet_size)
         elif format == 'umi':
             from switchboard import UmiTxRx
             rx = UmiTxRx(rx_uri=temp.name, fresh=False)
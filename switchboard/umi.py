@@ -3,12 +3,15 @@
 # Copyright (c) 2024 Zero ASIC Corporation
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+import time
 import random
+import struct
 import numpy as np
 
 from numbers import Integral
 from typing import Iterable, Union, Dict
 
+from . import aio
 from ._switchboard import (PyUmi, PyUmiPacket, umi_pack, UmiCmd, UmiAtomic)
 from .gpio import UmiGpio
 
@@ -21,7 +24,9 @@ class UmiTxRx:
     def __init__(self, tx_uri: str = None, rx_uri: str = None,
         srcaddr: Union[int, Dict[str, int]] = 0, posted: bool = False,
         max_bytes: int = None, fresh: bool = False, error: bool = True,
-        max_rate: float = -1):
+        max_rate: float = -1, spin_budget: int = -1, capacity: int = 0,
+        hugepages: bool = False, max_outstanding: int = 64, tag_shift: int = 8,
+        write_combining: int = 0, write_combining_timeout: float = None):
         """
         Parameters
         ----------
@@ -55,6 +60,35 @@ class UmiTxRx:
            cleared before executing the simulation.
         error: bool, optional
             If True, error out upon receiving an unexpected UMI response.
+        spin_budget: int, optional
+            Number of times that a blocking send() or recv() retries
+            before sleeping until the other side of the queue makes
+            progress.  Defaults to -1, meaning "never sleep".
+        capacity: int, optional
+            Number of packets that each queue can hold.  Defaults to
+            0, meaning as many as fit in one page.
+        hugepages: bool, optional
+            If True, back the queues with 2 MiB huge pages.
+        max_outstanding: int, optional
+            Number of requests that transactions started with start_read(),
+            start_write(), and start_atomic() can have outstanding at once.
+            Defaults to 64.
+        tag_shift: int, optional
+            Each of those requests is tagged by adding a number below
+            max_outstanding, shifted left by tag_shift, to its srcaddr, so
+            that responses can be matched up with requests.  Defaults to 8.
+        write_combining: int, optional
+            If nonzero, posted writes of up to this many bytes to adjacent
+            addresses are held back and combined into as few UMI packets as
+            possible.  Held writes are sent before any other transaction
+            (including a write that overlaps them), when this many bytes have
+            been combined, and when flush() is called.  Defaults to 0,
+            meaning "disabled".
+        write_combining_timeout: float, optional
+            If provided, held writes are also sent once the first of them is
+            older than this many seconds.  This is only checked when the
+            UmiTxRx is used, so flush() should still be called before the
+            host goes idle.
         """
 
         if tx_uri is None:
@@ -63,7 +97,13 @@ class UmiTxRx:
         if rx_uri is None:
             rx_uri = ""
 
-        self.umi = PyUmi(tx_uri, rx_uri, fresh, max_rate=max_rate)
+        self.umi = PyUmi(tx_uri, rx_uri, fresh, max_rate=max_rate, spin_budget=spin_budget,
+            capacity=capacity, hugepages=hugepages)
+        self.umi.set_max_outstanding(max_outstanding, tag_shift)
+
+        if write_combining:
+            self.umi.set_write_combining(write_combining,
+                -1 if write_combining_timeout is None else write_combining_timeout)
 
         if srcaddr is not None:
             # convert srcaddr default to a dictionary if necessary
@@ -209,6 +249,45 @@ class UmiTxRx:
 
         return self.umi.recv(blocking)
 
+    def recv_into(self, p, blocking=True) -> bool:
+        """
+        Same as recv(), but stores the UMI packet received in an existing PyUmiPacket, so that
+        a polling loop doesn't allocate a new packet each time.
+
+        Parameters
+        ----------
+        p: PyUmiPacket
+            The packet that the result is stored in.  Its data array is reused, so it must be
+            large enough for the packets received; if it doesn't have one, it is given one that
+            can hold any UMI packet.
+        blocking: bool, optional
+            If True, the function will wait until a UMI packet can be read.
+
+        Returns
+        -------
+        bool
+            True if a packet was received.  Only False if `blocking` is False and no UMI
+            packet could be read immediately.
+        """
+
+        return self.umi.recv_into(p, blocking)
+
+    async def send_async(self, p):
+        """
+        Sends a UMI transaction (PyUmiPacket), yielding to other coroutines
+        while the transmit queue is full.
+        """
+
+        await aio.send(self.umi, p)
+
+    async def recv_async(self) -> PyUmiPacket:
+        """
+        Returns the next UMI packet received, yielding to other coroutines
+        while the receive queue is empty.
+        """
+
+        return await aio.recv(self.umi)
+
     def write(self, addr, data, srcaddr=None, max_bytes=None,
         posted=None, qos=0, prot=0, progressbar=False, check_alignment=True,
         error=None):
@@ -256,6 +335,29 @@ class UmiTxRx:
             If True, error out upon receiving an unexpected UMI response.
         """
 
+        write_data, srcaddr, max_bytes, posted, error = self._write_args(addr, data,
+            srcaddr, max_bytes, posted, check_alignment, error)
+
+        # perform write
+        self.umi.write(addr, write_data, srcaddr, max_bytes,
+            posted, qos, prot, progressbar, error)
+
+    async def write_async(self, addr, data, srcaddr=None, max_bytes=None,
+        posted=None, qos=0, prot=0, check_alignment=True, error=None):
+        """
+        Same as write(), but awaits the queues rather than blocking on them,
+        so that other coroutines can run while the write is in flight.
+        """
+
+        write_data, srcaddr, max_bytes, posted, error = self._write_args(addr, data,
+            srcaddr, max_bytes, posted, check_alignment, error)
+
+        await aio.umi_write(self.umi, addr, write_data, srcaddr, max_bytes,
+            posted, qos, prot, error)
+
+    def _write_args(self, addr, data, srcaddr, max_bytes, posted, check_alignment, error):
+        # fills in the defaults for write() and formats the data to be written
+
         # set defaults
 
         if max_bytes is None:
@@ -301,9 +403,7 @@ class UmiTxRx:
             if not addr_aligned(addr=addr, align=size):
                 raise ValueError(f'addr=0x{addr:x} misaligned for size={size}')
 
-        # perform write
-        self.umi.write(addr, write_data, srcaddr, max_bytes,
-            posted, qos, prot, progressbar, error)
+        return write_data, srcaddr, max_bytes, posted, error
 
     def write_readback(self, addr, value, mask=None, srcaddr=None, dtype=None,
         posted=True, write_srcaddr=None, check_alignment=True, error=None):
@@ -439,6 +539,41 @@ class UmiTxRx:
             specified by `dtype` or `num_or_dtype`
         """
 
+        num, bytes_per_elem, srcaddr, max_bytes, error = self._read_args(addr, num_or_dtype,
+            dtype, srcaddr, max_bytes, check_alignment, error)
+
+        result = self.umi.read(addr, num, bytes_per_elem, srcaddr, max_bytes,
+            qos, prot, error)
+
+        if isinstance(num_or_dtype, (type, np.dtype)):
+            return result.view(num_or_dtype)[0]
+        else:
+            return result
+
+    async def read_async(self, addr, num_or_dtype, dtype=np.uint8, srcaddr=None,
+        max_bytes=None, qos=0, prot=0, check_alignment=True, error=None):
+        """
+        Same as read(), but awaits the queues rather than blocking on them,
+        so that other coroutines can run while the read is in flight.
+        """
+
+        num, bytes_per_elem, srcaddr, max_bytes, error = self._read_args(addr, num_or_dtype,
+            dtype, srcaddr, max_bytes, check_alignment, error)
+
+        result = np.empty((num,), dtype=size2dtype(nbytes2size(bytes_per_elem)))
+
+        await aio.umi_read_into(self.umi, addr, result, srcaddr, max_bytes,
+            qos, prot, error)
+
+        if isinstance(num_or_dtype, (type, np.dtype)):
+            return result.view(num_or_dtype)[0]
+        else:
+            return result
+
+    def _read_args(self, addr, num_or_dtype, dtype, srcaddr, max_bytes, check_alignment, error):
+        # fills in the defaults for read() and works out the number and size of
+        # the elements to be read
+
         # set defaults
 
         if max_bytes is None:
@@ -468,13 +603,548 @@ class UmiTxRx:
             if not addr_aligned(addr=addr, align=size):
                 raise ValueError(f'addr=0x{addr:x} misaligned for size={size}')
 
-        result = self.umi.read(addr, num, bytes_per_elem, srcaddr, max_bytes,
+        return num, bytes_per_elem, srcaddr, max_bytes, error
+
+    def read_into(self, addr, out, srcaddr=None, max_bytes=None, qos=0, prot=0,
+        check_alignment=True, error=None):
+        """
+        Same as read(), but reads into an existing numpy array rather than allocating a new one,
+        which avoids an allocation per read in polling loops.
+
+        Parameters
+        ----------
+        addr: int
+            The 64-bit address read from
+
+        out: numpy integer array
+            Writeable, contiguous array that receives the data, with one element read per
+            entry.  The element size is taken from its datatype.
+
+        srcaddr: int, optional
+           The UMI source address used for the read transaction.
+
+        max_bytes: int, optional
+            Indicates the maximum number of bytes that can be used for any individual UMI
+            transaction. If not specified, this defaults to the value of `max_bytes`
+            provided in the UmiTxRx constructor, which in turn defaults to 32.
+
+        qos: int, optional
+            4-bit Quality of Service field used in the UMI command
+
+        prot: int, optional
+            2-bit Protection mode field used in the UMI command
+
+        error: bool, optional
+            If True, error out upon receiving an unexpected UMI response.
+        """
+
+        # set defaults
+
+        if max_bytes is None:
+            max_bytes = self.default_max_bytes
+
+        max_bytes = int(max_bytes)
+
+        if srcaddr is None:
+            srcaddr = self.def_read_srcaddr
+
+        srcaddr = int(srcaddr)
+
+        if error is None:
+            error = self.default_error
+
+        error = bool(error)
+
+        if check_alignment:
+            size = nbytes2size(out.itemsize)
+            if not addr_aligned(addr=addr, align=size):
+                raise ValueError(f'addr=0x{addr:x} misaligned for size={size}')
+
+        self.umi.read_into(addr, out, srcaddr, max_bytes, qos, prot, error)
+
+    async def read_into_async(self, addr, out, srcaddr=None, max_bytes=None, qos=0, prot=0,
+        check_alignment=True, error=None):
+        """
+        Same as read_into(), but awaits the queues rather than blocking on them.
+        """
+
+        if max_bytes is None:
+            max_bytes = self.default_max_bytes
+
+        if srcaddr is None:
+            srcaddr = self.def_read_srcaddr
+
+        if error is None:
+            error = self.default_error
+
+        if check_alignment:
+            size = nbytes2size(out.itemsize)
+            if not addr_aligned(addr=addr, align=size):
+                raise ValueError(f'addr=0x{addr:x} misaligned for size={size}')
+
+        await aio.umi_read_into(self.umi, addr, out, int(srcaddr), int(max_bytes), qos, prot,
+            bool(error))
+
+    def start_read(self, addr, num_or_dtype, dtype=np.uint8, srcaddr=None,
+        max_bytes=None, qos=0, prot=0, check_alignment=True, error=None):
+        """
+        Same as read(), but returns a UmiFuture right away rather than waiting for the read
+        responses, so that independent transactions don't have to wait for each other.
+        The data read is returned by the future's result() method.  Up to `max_outstanding`
+        requests (see the UmiTxRx constructor) are sent at once; the rest are sent as
+        responses come back.  Blocking transactions such as read() and write() first wait
+        for all of the transactions that have been started to complete.
+        """
+
+        num, bytes_per_elem, srcaddr, max_bytes, error = self._read_args(addr, num_or_dtype,
+            dtype, srcaddr, max_bytes, check_alignment, error)
+
+        future = self.umi.start_read(addr, num, bytes_per_elem, srcaddr, max_bytes,
             qos, prot, error)
 
         if isinstance(num_or_dtype, (type, np.dtype)):
-            return result.view(num_or_dtype)[0]
+            return UmiFuture(future, lambda result: result.view(num_or_dtype)[0])
+        else:
+            return UmiFuture(future)
+
+    def start_write(self, addr, data, srcaddr=None, max_bytes=None,
+        posted=None, qos=0, prot=0, check_alignment=True, error=None):
+        """
+        Same as write(), but returns a UmiFuture right away rather than waiting for the
+        write responses.  The future's result() method returns None once all of the
+        responses have arrived.  The data is copied, so it can be modified right away.
+        """
+
+        write_data, srcaddr, max_bytes, posted, error = self._write_args(addr, data,
+            srcaddr, max_bytes, posted, check_alignment, error)
+
+        return UmiFuture(self.umi.start_write(addr, np.ascontiguousarray(write_data),
+            srcaddr, max_bytes, posted, qos, prot, error))
+
+    def start_atomic(self, addr, data, opcode, srcaddr=None, qos=0, prot=0, error=None):
+        """
+        Same as atomic(), but returns a UmiFuture right away rather than waiting for the
+        response.  The future's result() method returns the original value at addr.
+        """
+
+        if srcaddr is None:
+            srcaddr = self.def_atomic_srcaddr
+
+        if error is None:
+            error = self.default_error
+
+        if isinstance(opcode, str):
+            opcode = getattr(UmiAtomic, f'UMI_REQ_ATOMIC{opcode.upper()}')
+
+        if isinstance(data, np.integer):
+            atomic_data = np.array(data, ndmin=1).view(np.uint8)
+            future = self.umi.start_atomic(addr, atomic_data, opcode, int(srcaddr), qos, prot,
+                bool(error))
+            return UmiFuture(future, lambda result: result.view(data.dtype)[0])
         else:
+            raise TypeError("The data provided to atomic should be of a numpy integer type"
+                " so that the transaction size can be determined")
+
+    def flush(self):
+        """
+        Sends any posted writes held back for write combining (see the
+        `write_combining` argument of the constructor).
+        """
+
+        self.umi.flush()
+
+    def wait_all(self):
+        """
+        Waits for all of the transactions started with start_read(), start_write(),
+        and start_atomic() to complete.
+        """
+
+        self.umi.wait_all()
+
+    def read_many(self, addrs, num_or_dtype, dtype=np.uint8, srcaddr=None, max_bytes=None,
+        qos=0, prot=0, check_alignment=True, error=None):
+        """
+        Reads from many addresses at once.  The read requests for all of the addresses are
+        sent back to back, rather than waiting for the responses to one address before
+        reading the next, which makes reading many small scattered values (e.g., descriptors)
+        much faster than calling read() for each of them.
+
+        Parameters
+        ----------
+        addrs: numpy integer array or list of ints
+            The 64-bit addresses read from
+
+        num_or_dtype: int, array of ints, or numpy integer datatype
+            If a plain int, the number of elements of type `dtype` read from each address.
+            If an array of ints, the number of elements read from each address in turn.
+            If a numpy integer datatype (np.uint8, np.uint16, etc.), a single element of that
+            type is read from each address.
+
+        dtype: numpy integer datatype, optional
+            Type of the elements read if `num_or_dtype` is not a datatype.
+
+        srcaddr: int, optional
+           The UMI source address used for the read transactions.
+
+        max_bytes: int, optional
+            Indicates the maximum number of bytes that can be used for any individual UMI
+            transaction. If not specified, this defaults to the value of `max_bytes`
+            provided in the UmiTxRx constructor, which in turn defaults to 32.
+
+        qos: int, optional
+            4-bit Quality of Service field used in the UMI command
+
+        prot: int, optional
+            2-bit Protection mode field used in the UMI command
+
+        check_alignment: bool, optional
+            If true, an exception will be raised if any of the addresses is not aligned to
+            the size of the elements read.
+
+        error: bool, optional
+            If True, error out upon receiving an unexpected UMI response.
+
+        Returns
+        -------
+        numpy integer array or list of numpy integer arrays
+            If `num_or_dtype` is a datatype, a 1D array with the element read from each
+            address.  If it is a plain int, a 2D array with one row per address.  Otherwise,
+            a list with the array read from each address.
+        """
+
+        addrs = np.ascontiguousarray(addrs, dtype=np.uint64).ravel()
+
+        if isinstance(num_or_dtype, (type, np.dtype)):
+            dtype = num_or_dtype
+            counts = np.ones(addrs.shape, dtype=np.uint32)
+        else:
+            counts = np.ascontiguousarray(np.broadcast_to(
+                np.asarray(num_or_dtype, dtype=np.uint32), addrs.shape))
+
+        bytes_per_elem = np.dtype(dtype).itemsize
+
+        srcaddr, max_bytes, error = self._many_args(addrs, bytes_per_elem, srcaddr,
+            max_bytes, check_alignment, error)
+
+        result = self.umi.read_many(addrs, counts, bytes_per_elem, srcaddr, max_bytes,
+            qos, prot, error).view(dtype)
+
+        if isinstance(num_or_dtype, (type, np.dtype)):
             return result
+        elif isinstance(num_or_dtype, Integral):
+            return result.reshape(addrs.size, num_or_dtype)
+        else:
+            return np.split(result, np.cumsum(counts[:-1], dtype=np.int64))
+
+    def write_many(self, addrs, data, srcaddr=None, max_bytes=None, posted=None, qos=0,
+        prot=0, check_alignment=True, error=None):
+        """
+        Writes to many addresses at once.  The write requests for all of the addresses are
+        sent back to back, rather than waiting for the write responses to one address before
+        writing the next.
+
+        Parameters
+        ----------
+        addrs: numpy integer array or list of ints
+            The 64-bit addresses written to
+
+        data: numpy integer array or list of numpy integer arrays
+            If a 1D array, one element is written to each address.  If a 2D array, each row
+            is written to the corresponding address.  If a list of arrays, each array is
+            written to the corresponding address; the arrays must all have elements of the
+            same size.
+
+        srcaddr: int, optional
+            UMI source address used for the write transactions.
+
+        max_bytes: int, optional
+            Indicates the maximum number of bytes that can be used for any individual UMI
+            transaction. If not specified, this defaults to the value of `max_bytes`
+            provided in the UmiTxRx constructor, which in turn defaults to 32.
+
+        posted: bool, optional
+            If True, posted writes are used, so no write responses are expected.
+
+        qos: int, optional
+            4-bit Quality of Service field in UMI Command
+
+        prot: int, optional
+            2-bit protection mode field in UMI command
+
+        check_alignment: bool, optional
+            If true, an exception will be raised if any of the addresses is not aligned to
+            the size of the elements written.
+
+        error: bool, optional
+            If True, error out upon receiving an unexpected UMI response.
+        """
+
+        addrs = np.ascontiguousarray(addrs, dtype=np.uint64).ravel()
+
+        if isinstance(data, np.ndarray):
+            if data.ndim == 1:
+                counts = np.ones(data.shape, dtype=np.uint32)
+            elif data.ndim == 2:
+                counts = np.full(data.shape[:1], data.shape[1], dtype=np.uint32)
+            else:
+                raise ValueError(f'Can only write 1D or 2D arrays (got ndim={data.ndim})')
+            write_data = np.ascontiguousarray(data).ravel()
+        elif isinstance(data, (list, tuple)):
+            arrays = [np.atleast_1d(elem).ravel() for elem in data]
+            if len(set(elem.itemsize for elem in arrays)) > 1:
+                raise ValueError('All of the arrays written must have the same element size')
+            counts = np.array([elem.size for elem in arrays], dtype=np.uint32)
+            if len(arrays) > 0:
+                write_data = np.concatenate([elem.view(arrays[0].dtype) for elem in arrays])
+            else:
+                write_data = np.empty((0,), dtype=np.uint8)
+        else:
+            raise TypeError(f"Unknown data type: {type(data)}")
+
+        if not np.issubdtype(write_data.dtype, np.integer):
+            raise ValueError('Can only write integer dtypes such as uint8, uint16, etc.'
+                f'  (got dtype "{write_data.dtype}")')
+
+        if counts.size != addrs.size:
+            raise ValueError(f'Got data for {counts.size} addresses, but {addrs.size}'
+                ' addresses')
+
+        if posted is None:
+            posted = self.default_posted
+
+        srcaddr, max_bytes, error = self._many_args(addrs, write_data.itemsize,
+            self.def_write_srcaddr if srcaddr is None else srcaddr, max_bytes,
+            check_alignment, error)
+
+        self.umi.write_many(addrs, counts, write_data, srcaddr, max_bytes, bool(posted),
+            qos, prot, error)
+
+    def gather(self, addr, indices, dtype=np.uint8, **kwargs):
+        """
+        Reads the elements with the given indices from an array of `dtype` elements
+        starting at `addr`, returning them as a 1D array.  Keyword arguments are passed
+        on to read_many().
+
+        Parameters
+        ----------
+        addr: int
+            The 64-bit address of the start of the array
+
+        indices: numpy integer array or list of ints
+            Indices of the elements read
+
+        dtype: numpy integer datatype, optional
+            Type of the elements of the array
+        """
+
+        dtype = np.dtype(dtype)
+        addrs = addr + np.asarray(indices, dtype=np.uint64) * np.uint64(dtype.itemsize)
+
+        return self.read_many(addrs, dtype, **kwargs)
+
+    def scatter(self, addr, indices, values, **kwargs):
+        """
+        Writes `values` to the elements with the given indices of an array starting
+        at `addr`, with the size of the array elements taken from the datatype of
+        `values`.  Keyword arguments are passed on to write_many().
+
+        Parameters
+        ----------
+        addr: int
+            The 64-bit address of the start of the array
+
+        indices: numpy integer array or list of ints
+            Indices of the elements written
+
+        values: numpy integer array
+            Values written, one per index
+        """
+
+        values = np.atleast_1d(values).ravel()
+        addrs = addr + np.asarray(indices, dtype=np.uint64) * np.uint64(values.itemsize)
+
+        self.write_many(addrs, values, **kwargs)
+
+    def load_image(self, path, base=0, srcaddr=None, max_bytes=None, posted=True, qos=0,
+        prot=0, progressbar=False, error=None, verbose=False):
+        """
+        Loads a memory image into the UMI target.  If the file is an ELF executable,
+        each of its loadable segments is written to `base` plus the segment's physical
+        address, with the part of the segment not present in the file (e.g., .bss)
+        filled with zeros.  Otherwise, the contents of the file are written to `base`.
+
+        The file is memory-mapped and streamed out in C++ with back-to-back writes, so
+        images much larger than memory can be loaded at the bandwidth of the queue.
+
+        Parameters
+        ----------
+        path: str or Path
+            Path of the ELF file or raw binary image
+        base: int, optional
+            The 64-bit address that the image is loaded at
+        srcaddr: int, optional
+            The UMI source address used for the write transactions.  This is sometimes
+            needed to make sure the response will get routed to the right place.
+        max_bytes: int, optional
+            Indicates the maximum number of bytes that can be used for any individual UMI
+            transaction.
+        posted: bool, optional
+            If True (the default), use posted writes, for which no responses are expected.
+        qos: int, optional
+            4-bit Quality of Service field used in the UMI command
+        prot: int, optional
+            2-bit Protection mode field used in the UMI command
+        progressbar: bool, optional
+            If True, the number of packets written will be displayed via a progressbar
+            in the terminal.
+        error: bool, optional
+            If true, error out upon receiving an unexpected UMI response.
+        verbose: bool, optional
+            If True, print the number of bytes loaded and the throughput achieved.
+
+        Returns
+        -------
+        The number of bytes written.
+        """
+
+        path = str(path)
+        srcaddr, max_bytes, posted, error = self._image_args(srcaddr, max_bytes, posted, error)
+
+        start = time.time()
+        total = 0
+
+        segments = elf_load_segments(path)
+
+        if segments is None:
+            total += self.umi.load_file(path, base, srcaddr=srcaddr, max_bytes=max_bytes,
+                posted=posted, qos=qos, prot=prot, progressbar=progressbar, error=error)
+        else:
+            for paddr, offset, filesz, memsz in segments:
+                addr = base + paddr
+
+                if filesz > 0:
+                    total += self.umi.load_file(path, addr, offset=offset, nbytes=filesz,
+                        srcaddr=srcaddr, max_bytes=max_bytes, posted=posted, qos=qos,
+                        prot=prot, progressbar=progressbar, error=error)
+
+                # zero-fill the rest of the segment, one piece at a time so that
+                # a large .bss doesn't need a buffer of the same size
+                zeros = np.zeros(min(memsz - filesz, 1 << 20), dtype=np.uint8)
+                for zaddr in range(addr + filesz, addr + memsz, max(zeros.size, 1)):
+                    n = min(zeros.size, addr + memsz - zaddr)
+                    self.umi.write(zaddr, zeros[:n], srcaddr, max_bytes, posted, qos, prot,
+                        progressbar, error)
+                    total += n
+
+        # make sure that posted writes held back for write combining go out, so
+        # that the image is complete when this function returns
+        self.umi.flush()
+
+        if verbose:
+            self._print_image_rate('Loaded', total, start)
+
+        return total
+
+    def dump_image(self, addr, nbytes, path, srcaddr=None, max_bytes=None, qos=0, prot=0,
+        error=None, verbose=False):
+        """
+        Reads `nbytes` bytes of memory starting at `addr` into a raw binary file, which is
+        created or overwritten.  The file is memory-mapped, so that the data read goes
+        straight to it, and the read requests are sent back to back.
+
+        Parameters
+        ----------
+        addr: int
+            The 64-bit address of the first byte read
+        nbytes: int
+            The number of bytes read
+        path: str or Path
+            Path of the file written
+        srcaddr: int, optional
+            The UMI source address used for the read transactions.  This is sometimes
+            needed to make sure the response will get routed to the right place.
+        max_bytes: int, optional
+            Indicates the maximum number of bytes that can be used for any individual UMI
+            transaction.
+        qos: int, optional
+            4-bit Quality of Service field used in the UMI command
+        prot: int, optional
+            2-bit Protection mode field used in the UMI command
+        error: bool, optional
+            If true, error out upon receiving an unexpected UMI response.
+        verbose: bool, optional
+            If True, print the number of bytes dumped and the throughput achieved.
+
+        Returns
+        -------
+        The number of bytes read.
+        """
+
+        if srcaddr is None:
+            srcaddr = self.def_read_srcaddr
+
+        srcaddr, max_bytes, _, error = self._image_args(srcaddr, max_bytes, False, error)
+
+        start = time.time()
+
+        total = self.umi.dump_file(str(path), addr, nbytes, srcaddr=srcaddr,
+            max_bytes=max_bytes, qos=qos, prot=prot, error=error)
+
+        if verbose:
+            self._print_image_rate('Dumped', total, start)
+
+        return total
+
+    def _image_args(self, srcaddr, max_bytes, posted, error):
+        # fills in the defaults for load_image() and dump_image()
+
+        if srcaddr is None:
+            srcaddr = self.def_write_srcaddr
+
+        if max_bytes is None:
+            max_bytes = self.default_max_bytes
+
+        if posted is None:
+            posted = self.default_posted
+
+        if error is None:
+            error = self.default_error
+
+        return int(srcaddr), int(max_bytes), bool(posted), bool(error)
+
+    @staticmethod
+    def _print_image_rate(action, total, start):
+        elapsed = time.time() - start
+        rate = (total / elapsed) if elapsed > 0 else float('inf')
+        print(f'{action} {total} bytes in {elapsed:.3f} s ({rate / 1e6:.1f} MB/s)')
+
+    def _many_args(self, addrs, bytes_per_elem, srcaddr, max_bytes, check_alignment, error):
+        # fills in the defaults for read_many() and write_many() and checks the
+        # alignment of the addresses
+
+        if max_bytes is None:
+            max_bytes = self.default_max_bytes
+
+        max_bytes = int(max_bytes)
+
+        if srcaddr is None:
+            srcaddr = self.def_read_srcaddr
+
+        srcaddr = int(srcaddr)
+
+        if error is None:
+            error = self.default_error
+
+        error = bool(error)
+
+        if check_alignment:
+            size = nbytes2size(bytes_per_elem)
+            misaligned = np.flatnonzero(addrs & np.uint64(bytes_per_elem - 1))
+            if misaligned.size > 0:
+                raise ValueError(f'addr=0x{int(addrs[misaligned[0]]):x} misaligned for'
+                    f' size={size}')
+
+        return srcaddr, max_bytes, error
 
     def atomic(self, addr, data, opcode, srcaddr=None, qos=0, prot=0, error=None):
         """
@@ -541,6 +1211,69 @@ class UmiTxRx:
             raise TypeError("The data provided to atomic should be of a numpy integer type"
                 " so that the transaction size can be determined")
 
+    async def atomic_async(self, addr, data, opcode, srcaddr=None, qos=0, prot=0, error=None):
+        """
+        Same as atomic(), but awaits the queues rather than blocking on them.
+        """
+
+        if srcaddr is None:
+            srcaddr = self.def_atomic_srcaddr
+
+        if error is None:
+            error = self.default_error
+
+        if isinstance(opcode, str):
+            opcode = getattr(UmiAtomic, f'UMI_REQ_ATOMIC{opcode.upper()}')
+
+        if isinstance(data, np.integer):
+            atomic_data = np.array(data, ndmin=1).view(np.uint8)
+            result = await aio.umi_atomic(self.umi, addr, atomic_data, opcode, int(srcaddr),
+                qos, prot, bool(error))
+            return result.view(data.dtype)[0]
+        else:
+            raise TypeError("The data provided to atomic should be of a numpy integer type"
+                " so that the transaction size can be determined")
+
+
+class UmiFuture:
+    def __init__(self, future, convert=None):
+        """
+        Result of a transaction started with UmiTxRx.start_read(), start_write(), or
+        start_atomic(), which is available once all of the responses to the transaction
+        have arrived.
+
+        Parameters
+        ----------
+        future: PyUmiFuture
+            Future returned by PyUmi
+        convert: callable, optional
+            Applied to the result of `future` before it is returned
+        """
+
+        self.future = future
+        self.convert = convert
+
+    def done(self) -> bool:
+        """
+        Returns True if the transaction has completed, without waiting.
+        """
+
+        return self.future.done()
+
+    def result(self):
+        """
+        Waits for the transaction to complete, and then returns the data read, or None
+        for writes.  Raises an exception if an unexpected UMI response was received and
+        the transaction was started with error=True.
+        """
+
+        result = self.future.result()
+
+        if self.convert is not None:
+            result = self.convert(result)
+
+        return result
+
 
 def size2dtype(size: int, signed: bool = False, float: bool = False):
     if float:
@@ -591,6 +1324,51 @@ def addr_aligned(addr: Integral, align: Integral) -> bool:
     return ((addr >> align) << align) == addr
 
 
+def elf_load_segments(path):
+    """
+    Returns a list of (paddr, offset, filesz, memsz) tuples describing the loadable
+    segments of an ELF file, or None if the file isn't an ELF file.  Only the
+    headers are read, so that the segments themselves can be streamed out of the
+    file by PyUmi.load_file().
+    """
+
+    with open(path, 'rb') as f:
+        ident = f.read(16)
+
+        if (len(ident) < 16) or (ident[:4] != b'\x7fELF'):
+            return None
+
+        is64 = (ident[4] == 2)
+        endian = '<' if (ident[5] == 1) else '>'
+
+        if is64:
+            fmt = endian + 'HHIQQQIHHHHHH'
+        else:
+            fmt = endian + 'HHIIIIIHHHHHH'
+
+        (_, _, _, _, phoff, _, _, _, phentsize, phnum, _, _, _) = struct.unpack(
+            fmt, f.read(struct.calcsize(fmt)))
+
+        segments = []
+
+        for k in range(phnum):
+            f.seek(phoff + k * phentsize)
+
+            if is64:
+                fmt = endian + 'IIQQQQQQ'
+                (p_type, _, offset, _, paddr, filesz, memsz, _) = struct.unpack(
+                    fmt, f.read(struct.calcsize(fmt)))
+            else:
+                fmt = endian + 'IIIIIIII'
+                (p_type, offset, _, paddr, filesz, memsz, _, _) = struct.unpack(
+                    fmt, f.read(struct.calcsize(fmt)))
+
+            if (p_type == 1) and (memsz > 0):  # PT_LOAD
+                segments.append((paddr, offset, filesz, memsz))
+
+    return segments
+
+
 def random_int_value(name, value, min, max, align=None):
     # determine the length of the transaction
 
@@ -3,10 +3,21 @@
 # Copyright (c) 2024 Zero ASIC Corporation
 # This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+import os
+import glob
 import atexit
+import shutil
 import signal
 import subprocess
 import shlex
+import tempfile
+
+# environment variable naming the directory where queues with relative URIs
+# are created; read by the C++ library whenever a queue is opened
+QUEUE_ROOT_ENV = 'SB_QUEUE_ROOT'
+
+# environment variable naming the rate governor that simulators join
+GOVERNOR_ENV = 'SB_GOVERNOR'
 
 
 def plusargs_to_args(plusargs):
@@ -24,8 +35,173 @@ def plusargs_to_args(plusargs):
     return args
 
 
+def set_queue_root(root='/dev/shm', namespace=True):
+    """
+    Sets the directory where queues with relative URIs (such as "to_rtl.q") are created, by this
+    process and by processes that it starts afterwards.  The default places queues in memory,
+    which avoids slow startup when the working directory is on a network file system.
+
+    If namespace is True, queues are placed in a new subdirectory of root that is removed when
+    this process exits, so that simultaneous runs can use the same URIs.  Returns the directory
+    that queues will be created in.
+    """
+
+    root = os.path.abspath(root)
+
+    if namespace:
+        root = tempfile.mkdtemp(prefix=f'switchboard-{os.getpid()}-', dir=root)
+        atexit.register(shutil.rmtree, root, ignore_errors=True)
+    else:
+        os.makedirs(root, exist_ok=True)
+
+    os.environ[QUEUE_ROOT_ENV] = root
+
+    return root
+
+
+def default_queue_root():
+    # unless a queue root has already been chosen (for example by a parent
+    # process), place queues in a directory for this run in /dev/shm, if it
+    # is available.  setting SB_QUEUE_ROOT to an empty string keeps queues
+    # in the working directory.
+
+    if QUEUE_ROOT_ENV not in os.environ:
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            set_queue_root('/dev/shm')
+
+    return queue_root()
+
+
+def queue_root():
+    # returns the directory where queues with relative URIs are created,
+    # or None if they are created in the working directory
+    return os.environ.get(QUEUE_ROOT_ENV) or None
+
+
+def queue_path(uri):
+    """
+    Returns the path of the file backing the queue with the given URI.
+    """
+
+    root = queue_root()
+
+    if (root is None) or os.path.isabs(uri):
+        return uri
+    else:
+        return os.path.join(root, uri)
+
+
+def parse_cpu_list(spec):
+    # parses a list of CPUs in the format used by taskset and sysfs, such
+    # as "0-3,8,10-11"
+
+    cpus = []
+
+    for part in str(spec).split(','):
+        part = part.strip()
+
+        if not part:
+            continue
+
+        if '-' in part:
+            start, stop = part.split('-')
+            cpus += list(range(int(start), int(stop) + 1))
+        else:
+            cpus.append(int(part))
+
+    return cpus
+
+
+def numa_nodes():
+    """
+    Returns a dictionary mapping each NUMA node to the list of CPUs in that node that this
+    process is allowed to run on.  Hosts without NUMA information are treated as a single node.
+    """
+
+    allowed = os.sched_getaffinity(0)
+
+    nodes = {}
+
+    for path in glob.glob('/sys/devices/system/node/node*/cpulist'):
+        node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+
+        with open(path, 'r') as f:
+            cpus = [cpu for cpu in parse_cpu_list(f.read()) if cpu in allowed]
+
+        if cpus:
+            nodes[node] = cpus
+
+    if not nodes:
+        nodes[0] = sorted(allowed)
+
+    return nodes
+
+
+def cpu_order():
+    # returns the CPUs that this process is allowed to run on, ordered so
+    # that hyperthreads of the same core are next to each other, followed
+    # by the other cores of the same package and NUMA node.  processes
+    # placed on consecutive CPUs in this order share as much cache as the
+    # host allows.
+
+    node_of = {cpu: node for node, cpus in numa_nodes().items() for cpu in cpus}
+
+    def key(cpu):
+        ids = []
+
+        for name in ['physical_package_id', 'core_id']:
+            try:
+                with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/{name}', 'r') as f:
+                    ids.append(int(f.read()))
+            except (OSError, ValueError):
+                ids.append(cpu)
+
+        return (node_of[cpu], *ids, cpu)
+
+    return sorted(node_of, key=key)
+
+
+def resolve_affinity(affinity):
+    """
+    Returns the list of CPUs described by affinity, which may be a CPU number, a list of CPU
+    numbers, a string listing CPUs like "0-3,8", or a string like "node:1" for all CPUs of a
+    NUMA node.  If affinity is None, None is returned.
+    """
+
+    if affinity is None:
+        return None
+    elif isinstance(affinity, int):
+        return [affinity]
+    elif isinstance(affinity, str):
+        if affinity.startswith('node:'):
+            node = int(affinity[len('node:'):])
+            nodes = numa_nodes()
+            if node not in nodes:
+                raise ValueError(f'NUMA node {node} has no CPUs that can be used.')
+            return nodes[node]
+        else:
+            return parse_cpu_list(affinity)
+    else:
+        return [int(cpu) for cpu in affinity]
+
+
+def set_affinity(affinity, pid=0):
+    """
+    Pins a process (by default, this one) to the CPUs described by affinity (see
+    resolve_affinity).  This is useful for keeping the Python process that drives a
+    simulation near the simulator that it talks to.  Returns the list of CPUs.
+    """
+
+    cpus = resolve_affinity(affinity)
+
+    if cpus is not None:
+        os.sched_setaffinity(pid, cpus)
+
+    return cpus
+
+
 def binary_run(bin, args=None, stop_timeout=10, use_sigint=False,
-    quiet=False, print_command=False, cwd=None, env=None):
+    quiet=False, print_command=False, cwd=None, env=None, affinity=None):
 
     cmd = []
 
@@ -45,6 +221,12 @@ def binary_run(bin, args=None, stop_timeout=10, use_sigint=False,
         kwargs['stdout'] = subprocess.DEVNULL
         kwargs['stderr'] = subprocess.DEVNULL
 
+    cpus = resolve_affinity(affinity)
+    if cpus is not None:
+        # pin the process before it starts running, so that any threads
+        # that it creates are pinned as well
+        kwargs['preexec_fn'] = lambda: os.sched_setaffinity(0, cpus)
+
     p = subprocess.Popen(cmd, cwd=cwd, env=env, **kwargs)
 
     def stop_bin(p=p, stop_timeout=stop_timeout, use_sigint=use_sigint):
@@ -121,10 +121,11 @@ int main(int argc, char** argv, char** env) {
     // Main loop
 
     long t_us = -1;
+    long rate_ops = 0;
     long min_period_us = (1.0e6 / max_rate) + 0.5;
 
     while (!(contextp->gotFinish() || got_sigint)) {
-        max_rate_tick(t_us, min_period_us);
+        clock_rate_tick(t_us, rate_ops, min_period_us);
 
         contextp->timeInc(duration0);
         top->clk = 1;
@@ -28,32 +28,55 @@ module queue_to_sb_sim #(
 
     // SBDW must be a multiple of 32 (constrained by VPI driver,
     // which transfers data in 32-bit chunks)
-    localparam SBDW = 416;
+
+    // wider interfaces use queues with a larger packet size, and are
+    // limited to SBDW_WIDE bits (the width of the "wide" DPI functions)
+    localparam SBDW_NARROW = 416;
+    localparam SBDW_WIDE = 8192;
+    localparam SBDW = (DW > SBDW_NARROW) ? SBDW_WIDE : SBDW_NARROW;
 
     `ifdef __ICARUS__
         `define SB_EXT_FUNC(x) $``x``
         `define SB_START_FUNC task
         `define SB_END_FUNC endtask
         `define SB_VAR_BIT reg
+        `define SB_RECV_FUNC $pi_sb_recv
     `else
         `define SB_EXT_FUNC(x) x
         `define SB_START_FUNC function void
         `define SB_END_FUNC endfunction
         `define SB_VAR_BIT var bit
+        `define SB_RECV_FUNC sb_recv
 
         import "DPI-C" function void pi_sb_rx_init(output int id,
-            input string uri, input int width);
-        import "DPI-C" function void pi_sb_recv(input int id, output bit [SBDW-1:0] rdata,
+            input string uri, input int width, input int capacity);
+        import "DPI-C" function void pi_sb_recv(input int id, output bit [SBDW_NARROW-1:0] rdata,
+            output bit [31:0] rdest, output bit rlast, output int success);
+        import "DPI-C" function void pi_sb_recv_wide(input int id,
+            output bit [SBDW_WIDE-1:0] rdata, output bit [31:0] rdest, output bit rlast,
+            output int success);
+
+        function void sb_recv(input int id, output bit [SBDW-1:0] rdata,
             output bit [31:0] rdest, output bit rlast, output int success);
+            bit [SBDW_NARROW-1:0] rdata_narrow;
+            bit [SBDW_WIDE-1:0] rdata_wide;
+            if (SBDW > SBDW_NARROW) begin
+                pi_sb_recv_wide(id, rdata_wide, rdest, rlast, success);
+                rdata = SBDW'(rdata_wide);
+            end else begin
+                pi_sb_recv(id, rdata_narrow, rdest, rlast, success);
+                rdata = SBDW'(rdata_narrow);
+            end
+        endfunction
     `endif
 
     // internal signals
 
     integer id = -1;
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        `SB_EXT_FUNC(pi_sb_rx_init)(id, uri, (DW + 7)/8);
+        `SB_EXT_FUNC(pi_sb_rx_init)(id, uri, (DW + 7)/8, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
@@ -99,7 +122,7 @@ module queue_to_sb_sim #(
                     // try to receive a packet
                     if (id != -1) begin
                         /* verilator lint_off IGNOREDRETURN */
-                        `SB_EXT_FUNC(pi_sb_recv)(id, rdata, rdest, rlast, success);
+                        `SB_RECV_FUNC(id, rdata, rdest, rlast, success);
                         /* verilator lint_on IGNOREDRETURN */
                     end else begin
                         /* verilator lint_off BLKSEQ */
@@ -130,7 +153,7 @@ module queue_to_sb_sim #(
                     // try to receive a packet
                     if (id != -1) begin
                         /* verilator lint_off IGNOREDRETURN */
-                        `SB_EXT_FUNC(pi_sb_recv)(id, rdata, rdest, rlast, success);
+                        `SB_RECV_FUNC(id, rdata, rdest, rlast, success);
                         /* verilator lint_on IGNOREDRETURN */
                     end else begin
                         /* verilator lint_off BLKSEQ */
@@ -170,6 +193,7 @@ module queue_to_sb_sim #(
     `undef SB_START_FUNC
     `undef SB_END_FUNC
     `undef SB_VAR_BIT
+    `undef SB_RECV_FUNC
 
 endmodule
 
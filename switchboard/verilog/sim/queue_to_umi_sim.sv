@@ -44,9 +44,9 @@ module queue_to_umi_sim #(
         `define SB_END_FUNC endfunction
     `endif
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        rx_i.init(uri);
+        rx_i.init(uri, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
@@ -102,15 +102,15 @@ module sb_apb_m #(
         `define SB_END_FUNC endfunction
     `endif
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         string s;
 
         /* verilator lint_off IGNOREDRETURN */
         $sformat(s, "%0s_apb_req.q", uri);
-        apb_req_channel.init(s);
+        apb_req_channel.init(s, capacity);
 
         $sformat(s, "%0s_apb_resp.q", uri);
-        apb_resp_channel.init(s);
+        apb_resp_channel.init(s, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
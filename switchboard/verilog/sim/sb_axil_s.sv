@@ -124,24 +124,24 @@ module sb_axil_s #(
         `define SB_END_FUNC endfunction
     `endif
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         string s;
 
         /* verilator lint_off IGNOREDRETURN */
         $sformat(s, "%0s-aw.q", uri);
-        aw_channel.init(s);
+        aw_channel.init(s, capacity);
 
         $sformat(s, "%0s-w.q", uri);
-        w_channel.init(s);
+        w_channel.init(s, capacity);
 
         $sformat(s, "%0s-b.q", uri);
-        b_channel.init(s);
+        b_channel.init(s, capacity);
 
         $sformat(s, "%0s-ar.q", uri);
-        ar_channel.init(s);
+        ar_channel.init(s, capacity);
 
         $sformat(s, "%0s-r.q", uri);
-        r_channel.init(s);
+        r_channel.init(s, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
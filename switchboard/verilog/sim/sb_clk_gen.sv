@@ -36,6 +36,7 @@ module sb_clk_gen #(
 
         import "DPI-C" function void pi_max_rate_tick (
             inout signed [63:0] t_us,
+            inout signed [63:0] rate_ops,
             input signed [63:0] min_period_us
         );
     `endif
@@ -48,6 +49,7 @@ module sb_clk_gen #(
     real start_delay = DEFAULT_START_DELAY;
 
     reg signed [63:0] t_us = -(64'sd1);
+    reg signed [63:0] rate_ops = 64'sd0;
     reg signed [63:0] min_period_us = -(64'sd1);
 
     initial begin
@@ -71,7 +73,7 @@ module sb_clk_gen #(
         `SB_EXT_FUNC(pi_start_delay)(start_delay);
 
         forever begin
-            `SB_EXT_FUNC(pi_max_rate_tick)(t_us, min_period_us);
+            `SB_EXT_FUNC(pi_max_rate_tick)(t_us, rate_ops, min_period_us);
 
             clk_r = 1'b0;
             `SB_DELAY((1.0 - duty_cycle) * period);
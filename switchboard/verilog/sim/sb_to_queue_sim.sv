@@ -29,33 +29,65 @@ module sb_to_queue_sim #(
     // SBDW must be a multiple of 32 (constrained by VPI driver,
     // which transfers data in 32-bit chunks)
 
-    localparam SBDW = 416;
+    // wider interfaces use queues with a larger packet size, and are
+    // limited to SBDW_WIDE bits (the width of the "wide" DPI functions)
+
+    localparam SBDW_NARROW = 416;
+    localparam SBDW_WIDE = 8192;
+    localparam SBDW = (DW > SBDW_NARROW) ? SBDW_WIDE : SBDW_NARROW;
 
     `ifdef __ICARUS__
         `define SB_EXT_FUNC(x) $``x``
         `define SB_START_FUNC task
         `define SB_END_FUNC endtask
+        `define SB_SEND_FUNC $pi_sb_send
     `else
         `define SB_EXT_FUNC(x) x
         `define SB_START_FUNC function void
         `define SB_END_FUNC endfunction
+        `define SB_SEND_FUNC sb_send
 
         import "DPI-C" function void pi_sb_tx_init (output int id,
-            input string uri, input int width);
-        import "DPI-C" function void pi_sb_send (input int id, input bit [SBDW-1:0] sdata,
+            input string uri, input int width, input int capacity);
+        import "DPI-C" function void pi_sb_tx_add_tap (input int id,
+            input string uri, input int capacity);
+        import "DPI-C" function void pi_sb_send (input int id, input bit [SBDW_NARROW-1:0] sdata,
+            input bit [31:0] sdest, input bit slast, output int success);
+        import "DPI-C" function void pi_sb_send_wide (input int id,
+            input bit [SBDW_WIDE-1:0] sdata, input bit [31:0] sdest, input bit slast,
+            output int success);
+
+        function void sb_send(input int id, input bit [SBDW-1:0] sdata,
             input bit [31:0] sdest, input bit slast, output int success);
+            if (SBDW > SBDW_NARROW) begin
+                pi_sb_send_wide(id, SBDW_WIDE'(sdata), sdest, slast, success);
+            end else begin
+                pi_sb_send(id, SBDW_NARROW'(sdata), sdest, slast, success);
+            end
+        endfunction
     `endif
 
     // internal signals
 
     integer id = -1;
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        `SB_EXT_FUNC(pi_sb_tx_init)(id, uri, (DW + 7)/8);
+        `SB_EXT_FUNC(pi_sb_tx_init)(id, uri, (DW + 7)/8, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
+    // copies every packet sent to the queue "uri", dropping packets if
+    // the reader of that queue falls behind.  must be called after init().
+
+    `SB_START_FUNC add_tap(input string uri, input integer capacity=0);
+        if (id != -1) begin
+            /* verilator lint_off IGNOREDRETURN */
+            `SB_EXT_FUNC(pi_sb_tx_add_tap)(id, uri, capacity);
+            /* verilator lint_on IGNOREDRETURN */
+        end
+    `SB_END_FUNC
+
     integer success = 0;
     reg pending = 1'b0;
 
@@ -96,7 +128,7 @@ module sb_to_queue_sim #(
                 // unless the queue they're trying to push to is full.
                 if (id != -1) begin
                     /* verilator lint_off IGNOREDRETURN */
-                    `SB_EXT_FUNC(pi_sb_send)(id, data_padded, dest, last, success);
+                    `SB_SEND_FUNC(id, data_padded, dest, last, success);
                     /* verilator lint_on IGNOREDRETURN */
                 end else begin
                     /* verilator lint_off BLKSEQ */
@@ -133,7 +165,7 @@ module sb_to_queue_sim #(
                 // if there is a packet pending, for the reason given above.
                 if (id != -1) begin
                     /* verilator lint_off IGNOREDRETURN */
-                    `SB_EXT_FUNC(pi_sb_send)(id, sdata, sdest, slast, success);
+                    `SB_SEND_FUNC(id, sdata, sdest, slast, success);
                     /* verilator lint_on IGNOREDRETURN */
                 end else begin
                     /* verilator lint_off BLKSEQ */
@@ -190,6 +222,7 @@ module sb_to_queue_sim #(
     `undef SB_EXT_FUNC
     `undef SB_START_FUNC
     `undef SB_END_FUNC
+    `undef SB_SEND_FUNC
 
 endmodule
 
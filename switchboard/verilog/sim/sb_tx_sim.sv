@@ -33,9 +33,9 @@ module sb_tx_sim #(
         .*
     );
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        tx_i.init(uri);
+        tx_i.init(uri, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
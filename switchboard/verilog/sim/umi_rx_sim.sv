@@ -39,9 +39,9 @@ module umi_rx_sim #(
         .*
     );
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        rx_i.init(uri);
+        rx_i.init(uri, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
@@ -44,9 +44,15 @@ module umi_to_queue_sim #(
         `define SB_END_FUNC endfunction
     `endif
 
-    `SB_START_FUNC init(input string uri);
+    `SB_START_FUNC init(input string uri, input integer capacity=0);
         /* verilator lint_off IGNOREDRETURN */
-        tx_i.init(uri);
+        tx_i.init(uri, capacity);
+        /* verilator lint_on IGNOREDRETURN */
+    `SB_END_FUNC
+
+    `SB_START_FUNC add_tap(input string uri, input integer capacity=0);
+        /* verilator lint_off IGNOREDRETURN */
+        tx_i.add_tap(uri, capacity);
         /* verilator lint_on IGNOREDRETURN */
     `SB_END_FUNC
 
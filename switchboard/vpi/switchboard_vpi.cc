@@ -1,6 +1,7 @@
 // Copyright (c) 2024 Zero ASIC Corporation
 // This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+#include <algorithm>
 #include <chrono>
 #include <memory>
 #include <vector>
@@ -13,6 +14,8 @@ static std::vector<std::unique_ptr<SBRX>> rxconn;
 static std::vector<std::unique_ptr<SBTX>> txconn;
 static std::vector<int> rxwidth;
 static std::vector<int> txwidth;
+static std::vector<std::vector<uint8_t>> rxbuf;
+static std::vector<std::vector<uint8_t>> txbuf;
 static std::chrono::steady_clock::time_point start_time;
 
 PLI_INT32 pi_sb_rx_init(PLI_BYTE8* userdata) {
@@ -25,7 +28,7 @@ PLI_INT32 pi_sb_rx_init(PLI_BYTE8* userdata) {
         vpiHandle systfref;
         systfref = vpi_handle(vpiSysTfCall, NULL);
         args_iter = vpi_iterate(vpiArgument, systfref);
-        for (size_t i = 0; i < 3; i++) {
+        for (size_t i = 0; i < 4; i++) {
             argh.push_back(vpi_scan(args_iter));
         }
     }
@@ -39,10 +42,6 @@ PLI_INT32 pi_sb_rx_init(PLI_BYTE8* userdata) {
         uri = std::string(argval.value.str);
     }
 
-    // initialize the connection
-    rxconn.push_back(std::unique_ptr<SBRX>(new SBRX()));
-    rxconn.back()->init(uri);
-
     // get width
     int width;
     {
@@ -52,9 +51,26 @@ PLI_INT32 pi_sb_rx_init(PLI_BYTE8* userdata) {
         width = argval.value.integer;
     }
 
+    // get capacity (zero means "use the default")
+    int capacity;
+    {
+        t_vpi_value argval;
+        argval.format = vpiIntVal;
+        vpi_get_value(argh[3], &argval);
+        capacity = argval.value.integer;
+    }
+
+    // initialize the connection, using a larger packet size if needed
+    // to fit the requested width
+    rxconn.push_back(std::unique_ptr<SBRX>(new SBRX()));
+    rxconn.back()->init(uri, capacity, false, -1, sb_packet_size(width));
+
     // remember width
     rxwidth.push_back(width);
 
+    // allocate a buffer for packets on this connection
+    rxbuf.push_back(std::vector<uint8_t>(rxconn.back()->get_packet_size()));
+
     // assign the ID of this connection
     {
         t_vpi_value argval;
@@ -80,7 +96,7 @@ PLI_INT32 pi_sb_tx_init(PLI_BYTE8* userdata) {
         vpiHandle systfref;
         systfref = vpi_handle(vpiSysTfCall, NULL);
         args_iter = vpi_iterate(vpiArgument, systfref);
-        for (size_t i = 0; i < 3; i++) {
+        for (size_t i = 0; i < 4; i++) {
             argh.push_back(vpi_scan(args_iter));
         }
     }
@@ -94,10 +110,6 @@ PLI_INT32 pi_sb_tx_init(PLI_BYTE8* userdata) {
         uri = std::string(argval.value.str);
     }
 
-    // initialize the connection
-    txconn.push_back(std::unique_ptr<SBTX>(new SBTX()));
-    txconn.back()->init(uri);
-
     // get width
     int width;
     {
@@ -107,9 +119,26 @@ PLI_INT32 pi_sb_tx_init(PLI_BYTE8* userdata) {
         width = argval.value.integer;
     }
 
+    // get capacity (zero means "use the default")
+    int capacity;
+    {
+        t_vpi_value argval;
+        argval.format = vpiIntVal;
+        vpi_get_value(argh[3], &argval);
+        capacity = argval.value.integer;
+    }
+
+    // initialize the connection, using a larger packet size if needed
+    // to fit the requested width
+    txconn.push_back(std::unique_ptr<SBTX>(new SBTX()));
+    txconn.back()->init(uri, capacity, false, -1, sb_packet_size(width));
+
     // remember width
     txwidth.push_back(width);
 
+    // allocate a buffer for packets on this connection
+    txbuf.push_back(std::vector<uint8_t>(txconn.back()->get_packet_size()));
+
     // assign the ID of this connection
     {
         t_vpi_value argval;
@@ -125,6 +154,58 @@ PLI_INT32 pi_sb_tx_init(PLI_BYTE8* userdata) {
     return 0;
 }
 
+PLI_INT32 pi_sb_tx_add_tap(PLI_BYTE8* userdata) {
+    (void)userdata; // unused
+
+    // get arguments
+    vpiHandle args_iter;
+    std::vector<vpiHandle> argh;
+    {
+        vpiHandle systfref;
+        systfref = vpi_handle(vpiSysTfCall, NULL);
+        args_iter = vpi_iterate(vpiArgument, systfref);
+        for (size_t i = 0; i < 3; i++) {
+            argh.push_back(vpi_scan(args_iter));
+        }
+    }
+
+    // get id
+    int id;
+    {
+        t_vpi_value argval;
+        argval.format = vpiIntVal;
+        vpi_get_value(argh[0], &argval);
+        id = argval.value.integer;
+    }
+
+    // get uri
+    std::string uri;
+    {
+        t_vpi_value argval;
+        argval.format = vpiStringVal;
+        vpi_get_value(argh[1], &argval);
+        uri = std::string(argval.value.str);
+    }
+
+    // get capacity (zero means "use the default")
+    int capacity;
+    {
+        t_vpi_value argval;
+        argval.format = vpiIntVal;
+        vpi_get_value(argh[2], &argval);
+        capacity = argval.value.integer;
+    }
+
+    // copy packets sent on this connection to the queue "uri"
+    txconn[id]->add_tap(uri, capacity);
+
+    // clean up
+    vpi_free_object(args_iter);
+
+    // return value unused?
+    return 0;
+}
+
 PLI_INT32 pi_sb_recv(PLI_BYTE8* userdata) {
     (void)userdata; // unused
 
@@ -151,35 +232,37 @@ PLI_INT32 pi_sb_recv(PLI_BYTE8* userdata) {
 
     // read incoming packet
 
-    sb_packet p;
+    sb_packet* p = (sb_packet*)rxbuf[id].data();
     int success;
-    if (rxconn[id]->recv(p)) {
+    if (rxconn[id]->recv(p, rxbuf[id].size())) {
         success = 1;
 
         t_vpi_value argval;
 
-        // store data
+        // store data.  the vector passed to VPI has to cover the full
+        // width of the Verilog variable, which may be wider than the
+        // data received.
         argval.format = vpiVectorVal;
-        s_vpi_vecval vecval[SB_DATA_SIZE / 4];
-        argval.value.vector = vecval;
+        int vec_words = (vpi_get(vpiSize, argh[1]) + 31) / 32;
+        std::vector<s_vpi_vecval> vecval(vec_words, s_vpi_vecval{0, 0});
+        argval.value.vector = vecval.data();
 
         // determine the number of 32-bit words (rounding up)
-        int num_words = (rxwidth[id] + 3) / 4;
+        int num_words = std::min((rxwidth[id] + 3) / 4, vec_words);
 
         for (int i = 0; i < num_words; i++) {
-            argval.value.vector[i].aval = *((uint32_t*)(&p.data[i * 4]));
-            argval.value.vector[i].bval = 0;
+            argval.value.vector[i].aval = *((uint32_t*)(&p->data[i * 4]));
         }
         vpi_put_value(argh[1], &argval, NULL, vpiNoDelay);
 
         // store destination
         argval.format = vpiIntVal;
-        argval.value.integer = p.destination;
+        argval.value.integer = p->destination;
         vpi_put_value(argh[2], &argval, NULL, vpiNoDelay);
 
         // store last
         argval.format = vpiIntVal;
-        argval.value.integer = p.last ? 1 : 0;
+        argval.value.integer = p->last ? 1 : 0;
         vpi_put_value(argh[3], &argval, NULL, vpiNoDelay);
     } else {
         success = 0;
@@ -225,7 +308,7 @@ PLI_INT32 pi_sb_send(PLI_BYTE8* userdata) {
     }
 
     // get outgoing packet
-    sb_packet p;
+    sb_packet* p = (sb_packet*)txbuf[id].data();
     {
         t_vpi_value argval;
 
@@ -234,26 +317,27 @@ PLI_INT32 pi_sb_send(PLI_BYTE8* userdata) {
         vpi_get_value(argh[1], &argval);
 
         // determine the number of 32-bit words (rounding up)
-        int num_words = (txwidth[id] + 3) / 4;
+        int vec_words = (vpi_get(vpiSize, argh[1]) + 31) / 32;
+        int num_words = std::min((txwidth[id] + 3) / 4, vec_words);
 
         for (int i = 0; i < num_words; i++) {
-            *((uint32_t*)(&p.data[i * 4])) = argval.value.vector[i].aval;
+            *((uint32_t*)(&p->data[i * 4])) = argval.value.vector[i].aval;
         }
 
         // store destination
         argval.format = vpiIntVal;
         vpi_get_value(argh[2], &argval);
-        p.destination = argval.value.integer;
+        p->destination = argval.value.integer;
 
         // store last
         argval.format = vpiIntVal;
         vpi_get_value(argh[3], &argval);
-        p.last = argval.value.integer;
+        p->last = argval.value.integer;
     }
 
     // try to send packet
     int success;
-    if (txconn[id]->send(p)) {
+    if (txconn[id]->send(p, txbuf[id].size())) {
         success = 1;
     } else {
         success = 0;
@@ -350,21 +434,21 @@ PLI_INT32 pi_max_rate_tick(PLI_BYTE8* userdata) {
         vpiHandle systfref;
         systfref = vpi_handle(vpiSysTfCall, NULL);
         args_iter = vpi_iterate(vpiArgument, systfref);
-        for (size_t i = 0; i < 2; i++) {
+        for (size_t i = 0; i < 3; i++) {
             argh.push_back(vpi_scan(args_iter));
         }
     }
 
-    // get the timestamp
-    long t_us = 0;
-    {
+    // get the rate limiter state (timestamp and operation count)
+    long state[2] = {0, 0};
+    for (size_t i = 0; i < 2; i++) {
         t_vpi_value argval;
         argval.format = vpiVectorVal;
-        vpi_get_value(argh[0], &argval);
+        vpi_get_value(argh[i], &argval);
 
-        t_us |= argval.value.vector[1].aval & 0xffffffff;
-        t_us <<= 32;
-        t_us |= argval.value.vector[0].aval & 0xffffffff;
+        state[i] |= argval.value.vector[1].aval & 0xffffffff;
+        state[i] <<= 32;
+        state[i] |= argval.value.vector[0].aval & 0xffffffff;
     }
 
     // get max rate
@@ -372,27 +456,27 @@ PLI_INT32 pi_max_rate_tick(PLI_BYTE8* userdata) {
     {
         t_vpi_value argval;
         argval.format = vpiRealVal;
-        vpi_get_value(argh[1], &argval);
+        vpi_get_value(argh[2], &argval);
         max_rate = argval.value.real;
     }
 
     // call the underlying switchboard function
-    max_rate_tick(t_us, max_rate);
+    clock_rate_tick(state[0], state[1], max_rate);
 
-    // set the timestamp
-    {
+    // set the rate limiter state
+    for (size_t i = 0; i < 2; i++) {
         t_vpi_value argval;
         argval.format = vpiVectorVal;
         s_vpi_vecval vecval[2]; // two 32-bit words
         argval.value.vector = vecval;
 
-        argval.value.vector[0].aval = t_us & 0xffffffff;
+        argval.value.vector[0].aval = state[i] & 0xffffffff;
         argval.value.vector[0].bval = 0;
 
-        argval.value.vector[1].aval = (t_us >> 32) & 0xffffffff;
+        argval.value.vector[1].aval = (state[i] >> 32) & 0xffffffff;
         argval.value.vector[1].bval = 0;
 
-        vpi_put_value(argh[0], &argval, NULL, vpiNoDelay);
+        vpi_put_value(argh[i], &argval, NULL, vpiNoDelay);
     }
 
     // clean up
@@ -416,6 +500,7 @@ PLI_INT32 pi_max_rate_tick(PLI_BYTE8* userdata) {
 
 VPI_REGISTER_FUNC(pi_sb_rx_init)
 VPI_REGISTER_FUNC(pi_sb_tx_init)
+VPI_REGISTER_FUNC(pi_sb_tx_add_tap)
 VPI_REGISTER_FUNC(pi_sb_recv)
 VPI_REGISTER_FUNC(pi_sb_send)
 VPI_REGISTER_FUNC(pi_time_taken)
@@ -424,8 +509,8 @@ VPI_REGISTER_FUNC(pi_max_rate_tick)
 
 void (*vlog_startup_routines[])(void) = {
     VPI_REGISTER_FUNC_NAME(pi_sb_rx_init), VPI_REGISTER_FUNC_NAME(pi_sb_tx_init),
-    VPI_REGISTER_FUNC_NAME(pi_sb_recv), VPI_REGISTER_FUNC_NAME(pi_sb_send),
-    VPI_REGISTER_FUNC_NAME(pi_time_taken), VPI_REGISTER_FUNC_NAME(pi_start_delay),
-    VPI_REGISTER_FUNC_NAME(pi_max_rate_tick),
+    VPI_REGISTER_FUNC_NAME(pi_sb_tx_add_tap), VPI_REGISTER_FUNC_NAME(pi_sb_recv),
+    VPI_REGISTER_FUNC_NAME(pi_sb_send), VPI_REGISTER_FUNC_NAME(pi_time_taken),
+    VPI_REGISTER_FUNC_NAME(pi_start_delay), VPI_REGISTER_FUNC_NAME(pi_max_rate_tick),
     0 // last entry must be 0
 };
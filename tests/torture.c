@@ -3,14 +3,18 @@
 // Copyright (c) 2024 Zero ASIC Corporation
 // This code is licensed under Apache License 2.0 (see LICENSE for details)
 
+#include <fcntl.h>
 #include <inttypes.h>
 #include <pthread.h>
 #include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <sys/types.h>
+#include <sys/wait.h>
 #include <unistd.h>
 
+#include "governor.h"
+#include "mpsc_queue.h"
 #include "spsc_queue.h"
 
 #define D(x)
@@ -34,6 +38,9 @@ struct torture_state {
     pthread_t rx_worker;
     unsigned int seed;
     volatile bool done;
+
+    // sleep instead of spinning when the queue is full/empty
+    bool wait;
 };
 
 static void random_fill(unsigned int* seedp, void* buf, size_t len) {
@@ -61,7 +68,7 @@ void hexdump(const char* prefix, const void* buf, size_t len) {
     putchar('\n');
 }
 
-spsc_queue* torture_open(const char* prefix, size_t capacity) {
+spsc_queue* torture_open_sized(const char* prefix, size_t capacity, size_t packet_size) {
     char name[] = "queue-XXXXYYYY.XXXXYYYY.";
     spsc_queue* q;
     uint64_t pid;
@@ -70,15 +77,40 @@ spsc_queue* torture_open(const char* prefix, size_t capacity) {
     pid = getpid();
     r = snprintf(name, sizeof name, "queue-%s-%" PRIx64, prefix, pid);
     assert(r > 0);
-    q = spsc_open(name, capacity);
+    q = spsc_open_sized(name, capacity, packet_size);
     return q;
 }
 
+spsc_queue* torture_open(const char* prefix, size_t capacity) {
+    return torture_open_sized(prefix, capacity, 0);
+}
+
 void torture_close(spsc_queue* q) {
     spsc_remove_shmfile(q->name);
     spsc_close(q);
 }
 
+// sends stderr to /dev/null while a test provokes errors on purpose,
+// returning the descriptor that torture_quiet_end() restores
+int torture_quiet_begin(void) {
+    int saved;
+    int null;
+
+    fflush(stderr);
+    saved = dup(STDERR_FILENO);
+    null = open("/dev/null", O_WRONLY);
+    assert(saved >= 0 && null >= 0);
+    dup2(null, STDERR_FILENO);
+    close(null);
+    return saved;
+}
+
+void torture_quiet_end(int saved) {
+    fflush(stderr);
+    dup2(saved, STDERR_FILENO);
+    close(saved);
+}
+
 void torture_ping(struct torture_state* ts) {
     uint8_t txbuf[SPSC_QUEUE_MAX_PACKET_SIZE * 2];
     uint8_t rxbuf[SPSC_QUEUE_MAX_PACKET_SIZE * 2];
@@ -231,7 +263,7 @@ void torture_test(struct torture_state* ts) {
 
     printf("%s: ", __func__);
     fflush(NULL);
-    for (i = 0; i < 2 * 1024; i++) {
+    for (i = 0; i < 64; i++) {
         ts->done = false;
 
         ts->tx_capacity = torture_rand_capacity(&ts->seed);
@@ -277,7 +309,7 @@ void torture_test_open(struct torture_state* ts) {
 
     printf("%s: ", __func__);
     fflush(NULL);
-    for (i = 0; i < 32 * 1024; i++) {
+    for (i = 0; i < 256; i++) {
         ts->done = false;
 
         ts->tx_capacity = torture_rand_capacity(&ts->seed);
@@ -306,7 +338,7 @@ void torture_test_open(struct torture_state* ts) {
         torture_close(ts->tx_q);
         torture_close(ts->rx_q);
 
-        if ((i & 63) == 0) {
+        if ((i & 15) == 0) {
             printf(".");
             fflush(NULL);
         }
@@ -314,7 +346,7 @@ void torture_test_open(struct torture_state* ts) {
     printf("done\n");
 }
 
-void torture_test_mapsize(struct torture_state* ts) {
+void torture_test_mapsize(void) {
     int c;
 
     printf("%s: ", __func__);
@@ -335,6 +367,783 @@ void torture_test_mapsize(struct torture_state* ts) {
     printf("done\n");
 }
 
+void torture_test_header(struct torture_state* ts) {
+    spsc_queue_header hdr;
+    unsigned int i;
+    int quiet;
+
+    // the header must not move the packets, since the FPGA expects
+    // them to start after the head and tail cache lines
+    assert(offsetof(spsc_queue_shared, packets) == 2 * SPSC_QUEUE_CACHE_LINE_SIZE);
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+    for (i = 0; i < 64; i++) {
+        size_t packet_size;
+        size_t capacity;
+        spsc_queue* q;
+        spsc_queue* q2;
+
+        packet_size = spsc_packet_size(1 + rand_r(&ts->seed) % (4 * 1024));
+        capacity = 2 + rand_r(&ts->seed) % 1024;
+
+        q = torture_open_sized("header", capacity, packet_size);
+        assert(q);
+
+        assert(spsc_read_header(q->name, &hdr));
+        assert(hdr.magic == SPSC_QUEUE_MAGIC);
+        assert(hdr.version == SPSC_QUEUE_VERSION);
+        assert(hdr.capacity == capacity);
+        assert(hdr.packet_size == packet_size);
+
+        // a capacity of zero picks up the capacity of the existing queue
+        q2 = spsc_open_sized(q->name, 0, packet_size);
+        assert(q2);
+        assert(q2->capacity == (int)capacity);
+        spsc_close(q2);
+
+        // mismatched layouts are refused
+        quiet = torture_quiet_begin();
+        assert(!spsc_open_sized(q->name, capacity + 1, packet_size));
+        assert(!spsc_open_sized(q->name, capacity, packet_size + SPSC_QUEUE_CACHE_LINE_SIZE));
+        torture_quiet_end(quiet);
+
+        torture_close(q);
+
+        if ((i & 7) == 0) {
+            printf(".");
+            fflush(NULL);
+        }
+    }
+    printf("done\n");
+}
+
+struct header_opener {
+    const char* name;
+    size_t packet_size;
+    spsc_queue* q;
+};
+
+void* torture_header_opener(void* arg) {
+    struct header_opener* o = (struct header_opener*)arg;
+
+    o->q = spsc_open_sized(o->name, 0, o->packet_size);
+    return NULL;
+}
+
+void torture_test_header_race(void) {
+    uint8_t buf[SPSC_QUEUE_MAX_PACKET_SIZE] = {0};
+    struct header_opener o;
+    pthread_t opener;
+    size_t capacity;
+    spsc_queue* q;
+    size_t i;
+    int r;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+
+    // a queue is being created with more than the default capacity, but
+    // its header hasn't been written yet when the other side opens it
+    // without a capacity
+    capacity = 4 * spsc_capacity(getpagesize());
+    q = torture_open("header-race", capacity);
+    assert(q);
+    __atomic_store_n(&q->shm->header.magic, SPSC_QUEUE_MAGIC_BUSY, __ATOMIC_RELEASE);
+
+    o.name = q->name;
+    o.packet_size = q->packet_size;
+    r = pthread_create(&opener, NULL, torture_header_opener, &o);
+    assert(r == 0);
+
+    usleep(10000);
+    __atomic_store_n(&q->shm->header.magic, SPSC_QUEUE_MAGIC, __ATOMIC_RELEASE);
+    pthread_join(opener, NULL);
+
+    // the other side takes the capacity from the header, and maps all of it
+    assert(o.q);
+    assert(o.q->capacity == (int)capacity);
+
+    for (i = 0; i < capacity - 1; i++) {
+        memcpy(buf, &i, sizeof i);
+        assert(spsc_send(q, buf, sizeof buf));
+    }
+    for (i = 0; i < capacity - 1; i++) {
+        assert(spsc_recv(o.q, buf, sizeof buf));
+        assert(memcmp(buf, &i, sizeof i) == 0);
+    }
+
+    spsc_close(o.q);
+    torture_close(q);
+    printf("done\n");
+}
+
+void torture_test_stats(struct torture_state* ts) {
+    uint8_t buf[4][SPSC_QUEUE_MAX_PACKET_SIZE] = {0};
+    spsc_queue_stats stats;
+    spsc_queue* q;
+    int capacity;
+    int i;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+
+    capacity = 2 + rand_r(&ts->seed) % 64;
+    q = torture_open("stats", capacity);
+    assert(q);
+
+    // fill the queue, with one send that finds it full
+    for (i = 0; i < capacity - 1; i++) {
+        assert(spsc_send(q, buf[0], sizeof buf[0]));
+    }
+    assert(!spsc_send(q, buf[0], sizeof buf[0]));
+    assert(!spsc_reserve(q));
+
+    // drain it, with one receive that finds it empty
+    for (i = 0; i < capacity - 1; i++) {
+        assert(spsc_recv(q, buf[0], sizeof buf[0]));
+    }
+    assert(!spsc_recv(q, buf[0], sizeof buf[0]));
+    assert(!spsc_peek(q));
+
+    // bursts count each packet
+    assert(spsc_send_burst(q, buf, sizeof buf[0], 1) == 1);
+    assert(spsc_recv_burst(q, buf, sizeof buf[0], 4) == 1);
+
+    spsc_get_stats(q, &stats);
+    assert(stats.enqueued == (uint64_t)capacity);
+    assert(stats.dequeued == (uint64_t)capacity);
+    assert(stats.full == 2);
+    assert(stats.empty == 2);
+    assert(stats.high_water == (uint64_t)(capacity - 1));
+
+    // the same counters can be read without opening the queue
+    memset(&stats, 0, sizeof stats);
+    assert(spsc_read_stats(q->name, &stats));
+    assert(stats.enqueued == (uint64_t)capacity);
+    assert(stats.high_water == (uint64_t)(capacity - 1));
+
+    torture_close(q);
+    printf("done\n");
+}
+
+struct governor_worker {
+    sb_governor* gov;
+    uint64_t cycles;
+    volatile bool done;
+};
+
+void* torture_governor_worker(void* arg) {
+    struct governor_worker* w = (struct governor_worker*)arg;
+
+    sb_governor_sync(w->gov, w->cycles);
+    w->done = true;
+    return NULL;
+}
+
+void torture_test_governor(void) {
+    char name[] = "queue-governor-XXXXYYYY.XXXXYYYY.";
+    struct governor_worker w;
+    sb_governor_shared* shm;
+    sb_governor *a, *b, *c;
+    pthread_t worker;
+    pid_t child;
+    int status;
+    int r;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+
+    r = snprintf(name, sizeof name, "queue-governor-%" PRIx64, (uint64_t)getpid());
+    assert(r > 0);
+    spsc_remove_shmfile(name);
+
+    // there is nothing to join before the governor is configured
+    assert(!sb_governor_join(name));
+
+    assert(sb_governor_configure(name, 1000, 0));
+    a = sb_governor_join(name);
+    b = sb_governor_join(name);
+    assert(a && b && (a->self != b->self));
+    assert(a->self->pid == getpid());
+    assert(b->self->pid == getpid());
+
+    // the rate budget is shared between the members
+    assert(sb_governor_period_ns(a) == 2000000);
+
+    // shares of less than a microsecond aren't rounded to whole microseconds
+    assert(sb_governor_configure(name, 8000000, 0));
+    assert(sb_governor_period_ns(a) == 250);
+    assert(sb_governor_configure(name, 1000, 0));
+
+    // without a max_lag, members never wait for each other
+    sb_governor_sync(a, 1000);
+    assert(a->self->cycles == 1000);
+    assert(b->self->cycles == 0);
+
+    // a new member starts out level with the slowest member
+    assert(sb_governor_configure(name, 0, 10));
+    assert(sb_governor_period_ns(a) == -1);
+    sb_governor_sync(b, 5);
+    c = sb_governor_join(name);
+    assert(c && (c->self->cycles == 5));
+    sb_governor_leave(c);
+    sb_governor_leave(b);
+
+    // a member too far ahead of the slowest waits until it catches up
+    b = sb_governor_join(name);
+    assert(b && (b->self->cycles == 1000));
+    w.gov = a;
+    w.cycles = 20;
+    w.done = false;
+    r = pthread_create(&worker, NULL, torture_governor_worker, &w);
+    assert(r == 0);
+    usleep(20000);
+    assert(!w.done);
+    sb_governor_sync(b, 5);
+    usleep(20000);
+    assert(!w.done);
+    sb_governor_sync(b, 5);
+    pthread_join(worker, NULL);
+    assert(w.done);
+    sb_governor_leave(b);
+
+    // a member that exits without leaving leaves a slot behind...
+    child = fork();
+    assert(child >= 0);
+    if (child == 0) {
+        _exit(sb_governor_join(name) ? 0 : 1);
+    }
+    assert(waitpid(child, &status, 0) == child);
+    assert(WIFEXITED(status) && (WEXITSTATUS(status) == 0));
+
+    shm = sb_governor_map(name, false);
+    assert(shm && (shm->members[1].pid == child));
+    assert(shm->members[1].cycles == 1020);
+
+    // ...that the next member to join takes over
+    b = sb_governor_join(name);
+    assert(b && ((b->self - b->shm->members) == 1));
+    assert(shm->members[1].pid == getpid());
+    sb_governor_leave(b);
+
+    // ...or that a member waiting on it removes
+    child = fork();
+    assert(child >= 0);
+    if (child == 0) {
+        _exit(sb_governor_join(name) ? 0 : 1);
+    }
+    assert(waitpid(child, &status, 0) == child);
+    assert(shm->members[1].pid == child);
+    sb_governor_sync(a, 100);
+    assert(shm->members[1].pid == 0);
+
+    munmap(shm, sizeof(sb_governor_shared));
+    sb_governor_leave(a);
+    spsc_remove_shmfile(name);
+    printf("done\n");
+}
+
+#define MPSC_PRODUCERS 4
+#define MPSC_PACKETS (16 * 1024)
+
+struct mpsc_producer {
+    struct torture_state* ts;
+    uint64_t id;
+};
+
+void* torture_mpsc_tx_worker(void* arg) {
+    struct mpsc_producer* producer = arg;
+    uint64_t buf[SPSC_QUEUE_MAX_PACKET_SIZE / 8] = {0};
+    spsc_queue* q;
+    uint64_t n;
+
+    // each producer has its own handle on the queue
+    q = torture_open("mpsc", producer->ts->tx_capacity);
+    assert(q);
+    mpsc_init(q);
+
+    buf[0] = producer->id;
+    for (n = 0; n < MPSC_PACKETS; n++) {
+        buf[1] = n;
+        while (!mpsc_send(q, buf, sizeof buf)) {
+            if (producer->ts->wait) {
+                mpsc_wait_not_full(q, 1000);
+            }
+        }
+    }
+
+    spsc_close(q);
+    return NULL;
+}
+
+void torture_test_mpsc(struct torture_state* ts) {
+    struct mpsc_producer producers[MPSC_PRODUCERS];
+    pthread_t workers[MPSC_PRODUCERS];
+    uint64_t next[MPSC_PRODUCERS] = {0};
+    uint64_t buf[SPSC_QUEUE_MAX_PACKET_SIZE / 8];
+    spsc_queue_stats stats;
+    uint64_t total;
+    spsc_queue* q;
+    int r;
+    int i;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+
+    ts->tx_capacity = torture_rand_capacity(&ts->seed);
+    q = torture_open("mpsc", ts->tx_capacity);
+    assert(q);
+
+    for (i = 0; i < MPSC_PRODUCERS; i++) {
+        producers[i].ts = ts;
+        producers[i].id = i;
+        r = pthread_create(&workers[i], NULL, torture_mpsc_tx_worker, &producers[i]);
+        assert(r == 0);
+    }
+
+    // packets from different producers are interleaved, but the packets
+    // from each producer must arrive in order
+    for (total = 0; total < MPSC_PRODUCERS * MPSC_PACKETS; total++) {
+        while (!spsc_recv(q, buf, sizeof buf)) {
+            if (ts->wait) {
+                spsc_wait_not_empty(q, 1000);
+            }
+        }
+        assert(buf[0] < MPSC_PRODUCERS);
+        assert(buf[1] == next[buf[0]]);
+        next[buf[0]]++;
+
+        if ((total & 0x3fff) == 0) {
+            printf(".");
+            fflush(NULL);
+        }
+    }
+
+    for (i = 0; i < MPSC_PRODUCERS; i++) {
+        r = pthread_join(workers[i], NULL);
+        assert(r == 0);
+    }
+
+    assert(!spsc_recv(q, buf, sizeof buf));
+    spsc_get_stats(q, &stats);
+    assert(stats.enqueued == total);
+    assert(stats.dequeued == total);
+
+    torture_close(q);
+    printf("done\n");
+}
+
+#define WAIT_ANY_QUEUES 4
+#define WAIT_ANY_PACKETS (16 * 1024)
+
+static spsc_queue* torture_open_any(int idx, size_t capacity) {
+    char prefix[] = "anyX";
+
+    prefix[3] = '0' + idx;
+    return torture_open(prefix, capacity);
+}
+
+void* torture_wait_any_tx_worker(void* arg) {
+    struct torture_state* ts = arg;
+    spsc_queue* qs[WAIT_ANY_QUEUES];
+    uint64_t next[WAIT_ANY_QUEUES] = {0};
+    uint64_t buf[SPSC_QUEUE_MAX_PACKET_SIZE / 8] = {0};
+    unsigned int seed = ts->seed + 1;
+    uint64_t total = 0;
+    int i;
+
+    for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+        qs[i] = torture_open_any(i, ts->tx_capacity);
+        assert(qs[i]);
+    }
+
+    // sends each packet to a random queue with room for it, sleeping
+    // when all of the queues are full
+    while (total < WAIT_ANY_QUEUES * WAIT_ANY_PACKETS) {
+        int start = rand_r(&seed) % WAIT_ANY_QUEUES;
+        bool sent = false;
+
+        for (i = 0; (i < WAIT_ANY_QUEUES) && !sent; i++) {
+            int idx = (start + i) % WAIT_ANY_QUEUES;
+            buf[0] = idx;
+            buf[1] = next[idx];
+            if (spsc_send(qs[idx], buf, sizeof buf)) {
+                next[idx]++;
+                total++;
+                sent = true;
+            }
+        }
+
+        if (!sent) {
+            spsc_wait_any(NULL, 0, qs, WAIT_ANY_QUEUES, 1000);
+        }
+    }
+
+    for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+        spsc_close(qs[i]);
+    }
+    return NULL;
+}
+
+void torture_test_wait_any(struct torture_state* ts) {
+    spsc_queue* qs[WAIT_ANY_QUEUES];
+    uint64_t next[WAIT_ANY_QUEUES] = {0};
+    uint64_t buf[SPSC_QUEUE_MAX_PACKET_SIZE / 8];
+    pthread_t worker;
+    uint64_t total = 0;
+    int r;
+    int i;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+
+    ts->tx_capacity = torture_rand_capacity(&ts->seed);
+    for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+        qs[i] = torture_open_any(i, ts->tx_capacity);
+        assert(qs[i]);
+    }
+
+    // nothing has been sent yet, so this has to time out
+    spsc_wait_any(qs, WAIT_ANY_QUEUES, NULL, 0, 1000);
+    for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+        assert(!spsc_can_recv(qs[i]));
+    }
+
+    r = pthread_create(&worker, NULL, torture_wait_any_tx_worker, ts);
+    assert(r == 0);
+
+    // receives from whichever queues have packets, sleeping when all of
+    // them are empty.  the packets in each queue must arrive in order.
+    while (total < WAIT_ANY_QUEUES * WAIT_ANY_PACKETS) {
+        bool received = false;
+
+        for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+            if (spsc_recv(qs[i], buf, sizeof buf)) {
+                assert(buf[0] == (uint64_t)i);
+                assert(buf[1] == next[i]);
+                next[i]++;
+                total++;
+                received = true;
+
+                if ((total & 0x3fff) == 0) {
+                    printf(".");
+                    fflush(NULL);
+                }
+            }
+        }
+
+        if (!received) {
+            spsc_wait_any(qs, WAIT_ANY_QUEUES, NULL, 0, 1000);
+        }
+    }
+
+    r = pthread_join(worker, NULL);
+    assert(r == 0);
+
+    for (i = 0; i < WAIT_ANY_QUEUES; i++) {
+        assert(!spsc_can_recv(qs[i]));
+        torture_close(qs[i]);
+    }
+    printf("done\n");
+}
+
+#define SIZED_MAX_PACKET_SIZE (4 * 1024)
+
+void torture_test_sized(struct torture_state* ts) {
+    static uint8_t tx_buf[SIZED_MAX_PACKET_SIZE];
+    static uint8_t rx_buf[SIZED_MAX_PACKET_SIZE];
+    unsigned int i;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+    for (i = 0; i < 1024; i++) {
+        size_t packet_size;
+        size_t capacity;
+        spsc_queue* q;
+        int n;
+
+        packet_size = 1 + rand_r(&ts->seed) % SIZED_MAX_PACKET_SIZE;
+        capacity = 2 + rand_r(&ts->seed) % 64;
+
+        // sizes are rounded up to a whole number of cache lines
+        assert(spsc_packet_size(packet_size) >= packet_size);
+        assert((spsc_packet_size(packet_size) % 64) == 0);
+        assert(spsc_capacity_sized(spsc_mapsize_sized(capacity, spsc_packet_size(packet_size)),
+                   spsc_packet_size(packet_size)) == (int)capacity);
+
+        q = torture_open_sized("sized", capacity, packet_size);
+        assert(q);
+        assert(q->capacity == (int)capacity);
+        assert((size_t)q->packet_size == spsc_packet_size(packet_size));
+
+        // pass full-size packets through the queue, wrapping around twice
+        for (n = 0; n < 2 * (int)capacity; n++) {
+            random_fill(&ts->seed, tx_buf, packet_size);
+            if (!spsc_send(q, tx_buf, packet_size)) {
+                break;
+            }
+            assert(spsc_recv(q, rx_buf, packet_size));
+            assert(memcmp(tx_buf, rx_buf, packet_size) == 0);
+        }
+        assert(n == 2 * (int)capacity);
+
+        torture_close(q);
+
+        if ((i & 63) == 0) {
+            printf(".");
+            fflush(NULL);
+        }
+    }
+    printf("done\n");
+}
+
+void torture_test_huge(struct torture_state* ts) {
+    uint8_t tx_buf[SPSC_QUEUE_MAX_PACKET_SIZE];
+    uint8_t rx_buf[SPSC_QUEUE_MAX_PACKET_SIZE];
+    char name[] = "queue-XXXXYYYY.XXXXYYYY.";
+    unsigned int i;
+    int r;
+
+    r = snprintf(name, sizeof name, "queue-huge-%" PRIx64, (uint64_t)getpid());
+    assert(r > 0);
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+    for (i = 0; i < 16; i++) {
+        size_t capacity;
+        spsc_queue* q;
+        int n;
+
+        // large enough to need more than one huge page
+        capacity = 2 + rand_r(&ts->seed) % (64 * 1024);
+
+        q = spsc_open_huge(name, capacity, 0);
+        assert(q);
+        assert(q->capacity == (int)capacity);
+        assert((spsc_queue_mapsize(q) % SPSC_QUEUE_HUGEPAGE_SIZE) == 0);
+        assert(spsc_queue_mapsize(q) >= spsc_mapsize(capacity));
+
+        for (n = 0; n < 2 * (int)capacity; n++) {
+            random_fill(&ts->seed, tx_buf, sizeof tx_buf);
+            assert(spsc_send(q, tx_buf, sizeof tx_buf));
+            assert(spsc_recv(q, rx_buf, sizeof rx_buf));
+            assert(memcmp(tx_buf, rx_buf, sizeof tx_buf) == 0);
+        }
+
+        torture_close(q);
+
+        printf(".");
+        fflush(NULL);
+    }
+    printf("done\n");
+}
+
+#define BURST_MAX 16
+
+void* torture_burst_rx_worker(void* arg) {
+    uint8_t buf[BURST_MAX][SPSC_QUEUE_MAX_PACKET_SIZE];
+    struct torture_state* ts = arg;
+    spsc_queue* rx_q;
+    uint64_t tx_num;
+    unsigned int n;
+    int count;
+    int i;
+
+    rx_q = torture_open("rx", ts->rx_capacity);
+    while (!ts->done || (ts->rx_num < __atomic_load_n(&ts->tx_num, __ATOMIC_ACQUIRE))) {
+        RANDOM_OBJ(&ts->seed, n);
+        n = (n % BURST_MAX) + 1;
+
+        count = spsc_recv_burst(rx_q, buf, SPSC_QUEUE_MAX_PACKET_SIZE, n);
+        assert(count >= 0 && count <= (int)n);
+
+        for (i = 0; i < count; i++) {
+            memcpy(&tx_num, buf[i], sizeof tx_num);
+
+            if (tx_num != ts->rx_num) {
+                printf("tx=%" PRIx64 " pkt=%" PRIx64 " rx=%" PRIx64 "\n", ts->tx_num, tx_num,
+                    ts->rx_num);
+                hexdump("bad-buf", buf[i], SPSC_QUEUE_MAX_PACKET_SIZE);
+                assert(0);
+            }
+            ts->rx_num++;
+        }
+    }
+
+    torture_close(rx_q);
+    return NULL;
+}
+
+void torture_test_burst(struct torture_state* ts) {
+    uint8_t buf[BURST_MAX][SPSC_QUEUE_MAX_PACKET_SIZE];
+    pthread_t rx_worker;
+    unsigned int seed;
+    unsigned int i;
+    unsigned int n;
+    unsigned int j;
+    uint64_t total;
+    int count;
+    int r;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+    for (i = 0; i < 64; i++) {
+        ts->done = false;
+
+        ts->rx_capacity = torture_rand_capacity(&ts->seed);
+        ts->tx_q = torture_open("rx", ts->rx_capacity);
+        assert(ts->tx_q);
+
+        ts->tx_num = 0;
+        ts->rx_num = 0;
+        total = ts->rx_capacity * 4;
+
+        // the worker has its own seed, so that both threads don't
+        // modify the same state
+        seed = ts->seed;
+        RANDOM_OBJ(&seed, ts->seed);
+
+        r = pthread_create(&rx_worker, NULL, torture_burst_rx_worker, ts);
+        assert(!r);
+
+        while (ts->tx_num < total) {
+            RANDOM_OBJ(&seed, n);
+            n = (n % BURST_MAX) + 1;
+            if (n > total - ts->tx_num) {
+                n = total - ts->tx_num;
+            }
+
+            for (j = 0; j < n; j++) {
+                uint64_t tx_num = ts->tx_num + j;
+                RANDOM_OBJ(&seed, buf[j]);
+                memcpy(buf[j], &tx_num, sizeof tx_num);
+            }
+
+            count = spsc_send_burst(ts->tx_q, buf, SPSC_QUEUE_MAX_PACKET_SIZE, n);
+            assert(count >= 0 && count <= (int)n);
+            __atomic_add_fetch(&ts->tx_num, count, __ATOMIC_RELEASE);
+        }
+
+        ts->done = true;
+        r = pthread_join(rx_worker, NULL);
+        assert(r == 0);
+        assert(ts->rx_num == total);
+
+        torture_close(ts->tx_q);
+
+        if ((i & 1) == 0) {
+            printf(".");
+            fflush(NULL);
+        }
+    }
+    printf("done\n");
+}
+
+void* torture_zero_copy_rx_worker(void* arg) {
+    struct torture_state* ts = arg;
+    spsc_queue* rx_q;
+    uint64_t tx_num;
+    uint8_t* p;
+
+    rx_q = torture_open("rx", ts->rx_capacity);
+    while (!ts->done || (ts->rx_num < __atomic_load_n(&ts->tx_num, __ATOMIC_ACQUIRE))) {
+        p = spsc_peek(rx_q);
+        if (!p) {
+            if (ts->wait) {
+                spsc_wait_not_empty(rx_q, 1000);
+            }
+            continue;
+        }
+
+        // peeking again without a release returns the same packet
+        assert(spsc_peek(rx_q) == p);
+
+        memcpy(&tx_num, p, sizeof tx_num);
+        if (tx_num != ts->rx_num) {
+            printf("tx=%" PRIx64 " pkt=%" PRIx64 " rx=%" PRIx64 "\n", ts->tx_num, tx_num,
+                ts->rx_num);
+            hexdump("bad-buf", p, SPSC_QUEUE_MAX_PACKET_SIZE);
+            assert(0);
+        }
+
+        spsc_release(rx_q);
+        ts->rx_num++;
+    }
+
+    torture_close(rx_q);
+    return NULL;
+}
+
+void torture_test_zero_copy(struct torture_state* ts) {
+    pthread_t rx_worker;
+    unsigned int seed;
+    unsigned int i;
+    uint64_t total;
+    uint8_t* p;
+    int r;
+
+    printf("%s: ", __func__);
+    fflush(NULL);
+    for (i = 0; i < 64; i++) {
+        ts->done = false;
+
+        ts->rx_capacity = torture_rand_capacity(&ts->seed);
+        ts->tx_q = torture_open("rx", ts->rx_capacity);
+        assert(ts->tx_q);
+
+        ts->tx_num = 0;
+        ts->rx_num = 0;
+        total = ts->rx_capacity * 4;
+
+        // the worker has its own seed, so that both threads don't
+        // modify the same state
+        seed = ts->seed;
+        RANDOM_OBJ(&seed, ts->seed);
+
+        r = pthread_create(&rx_worker, NULL, torture_zero_copy_rx_worker, ts);
+        assert(!r);
+
+        while (ts->tx_num < total) {
+            p = spsc_reserve(ts->tx_q);
+            if (!p) {
+                if (ts->wait) {
+                    spsc_wait_not_full(ts->tx_q, 1000);
+                }
+                continue;
+            }
+
+            // build the packet in place
+            random_fill(&seed, p, SPSC_QUEUE_MAX_PACKET_SIZE);
+            memcpy(p, &ts->tx_num, sizeof ts->tx_num);
+
+            spsc_commit(ts->tx_q);
+            __atomic_add_fetch(&ts->tx_num, 1, __ATOMIC_RELEASE);
+        }
+
+        ts->done = true;
+        r = pthread_join(rx_worker, NULL);
+        assert(r == 0);
+        assert(ts->rx_num == total);
+
+        torture_close(ts->tx_q);
+
+        if ((i & 1) == 0) {
+            printf(".");
+            fflush(NULL);
+        }
+    }
+    printf("done\n");
+}
+
+void torture_test_wait(struct torture_state* ts) {
+    // same as the zero-copy test, but with both sides sleeping until
+    // the other makes progress, rather than spinning
+    ts->wait = true;
+    torture_test_zero_copy(ts);
+    ts->wait = false;
+}
+
 int main(int argc, char* argv[]) {
     struct torture_state ts = {0};
     unsigned long runs = 1;
@@ -343,11 +1152,22 @@ int main(int argc, char* argv[]) {
         runs = strtoul(argv[1], NULL, 0);
     }
 
-    torture_test_mapsize(&ts);
+    torture_test_mapsize();
+    torture_test_header(&ts);
+    torture_test_header_race();
+    torture_test_stats(&ts);
+    torture_test_governor();
+    torture_test_sized(&ts);
+    torture_test_huge(&ts);
 
     while (runs--) {
         torture_test_open(&ts);
         torture_test(&ts);
+        torture_test_burst(&ts);
+        torture_test_zero_copy(&ts);
+        torture_test_wait(&ts);
+        torture_test_mpsc(&ts);
+        torture_test_wait_any(&ts);
     }
 
     printf("PASS\n");
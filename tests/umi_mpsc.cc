@@ -0,0 +1,72 @@
+// Copyright (c) 2024 Zero ASIC Corporation
+// This code is licensed under Apache License 2.0 (see LICENSE for details)
+
+// sends UMI transactions from several producer threads to one queue with
+// umisb_send(), and checks that the consumer receives all of them, in
+// order for each producer
+
+#include "switchboard.hpp"
+#include "umisb.hpp"
+
+#include <stdexcept>
+#include <thread>
+#include <vector>
+
+#define PRODUCERS 4
+#define TRANSACTIONS 10000
+
+void producer(const char* port, uint64_t id) {
+    SBTX_mpsc tx;
+    tx.init(port);
+
+    for (uint64_t i = 0; i < TRANSACTIONS; i++) {
+        // each write carries its producer in srcaddr and its sequence
+        // number in dstaddr and in its data
+        UmiTransaction x(umi_pack(UMI_REQ_POSTED, 0, 3, 0, 1, 1), i, id, NULL, 8);
+        memcpy(x.ptr(), &i, 8);
+
+        umisb_send<UmiTransaction>(x, tx);
+    }
+}
+
+int main(int argc, char* argv[]) {
+    const char* port = "queue-umi-mpsc";
+    if (argc > 1) {
+        port = argv[1];
+    }
+
+    SBRX rx;
+    rx.init(port, 0, true);
+
+    std::vector<std::thread> threads;
+    for (uint64_t id = 0; id < PRODUCERS; id++) {
+        threads.push_back(std::thread(producer, port, id));
+    }
+
+    std::vector<uint64_t> expected(PRODUCERS, 0);
+
+    for (int i = 0; i < PRODUCERS * TRANSACTIONS; i++) {
+        UmiTransaction x(0, 0, 0, NULL, 8);
+        umisb_recv<UmiTransaction>(x, rx);
+
+        uint64_t value;
+        memcpy(&value, x.ptr(), 8);
+
+        if ((x.srcaddr >= PRODUCERS) || (x.dstaddr != expected[x.srcaddr]) ||
+            (value != expected[x.srcaddr])) {
+            throw std::runtime_error("MISMATCH: " + x.toString());
+        }
+
+        expected[x.srcaddr]++;
+    }
+
+    for (auto& t : threads) {
+        t.join();
+    }
+
+    delete_shared_queue(port);
+
+    printf("PASS\n");
+
+    return 0;
+}